@@ -0,0 +1,97 @@
+"""
+Cost of resolving the cited bibkeys of every entry of a bibliography against the bibliography, in the `bib_deps`
+bootstrap.
+
+Compares the bibkey index (`get_all_bibkeys` + `process_bibentry`, one hash lookup per cited bibkey) with the list of
+bibkeys scanned for every cited bibkey, as was done before, which is quadratic in the size of the bibliography. The
+latter is only timed on a sample of the entries, and extrapolated to the whole bibliography.
+
+The entries are parsed beforehand, as parsing the `\\citet` commands doesn't depend on the size of the bibliography.
+
+Usage:
+    PYTHONPATH='.' python benchmarks/bench_bib_deps_bootstrap.py [--sizes 10000 100000 300000] [--sample 200]
+"""
+
+import argparse
+import random
+import time
+from typing import List
+
+from src.bib_deps.bib_deps_bootstrap import get_all_bibkeys, process_bibentry
+from src.bib_deps.models import BaseBibEntry, ParsedBibEntry
+
+
+def synthetic_parsed_bibentries(n: int, missing_ratio: float = 0.05, seed: int = 0) -> List[ParsedBibEntry]:
+    rng = random.Random(seed)
+    bibkeys = [f"author{i}_a:{1900 + i % 120}" for i in range(n)]
+
+    def cited() -> List[str]:
+        return [
+            f"missing{rng.randrange(n)}:2000" if rng.random() < missing_ratio else rng.choice(bibkeys)
+            for _ in range(rng.choice((0, 0, 1, 2, 3, 5)))
+        ]
+
+    parsed = []
+    for bibkey in bibkeys:
+        further_references_raw = cited()
+        parsed.append(
+            ParsedBibEntry(
+                bibkey=bibkey,
+                title="",
+                notes="",
+                crossref="",
+                further_note="",
+                further_references_raw=further_references_raw,
+                depends_on_raw=further_references_raw + cited(),
+                status="success",
+            )
+        )
+
+    return parsed
+
+
+def legacy_process_bibentry(parsed_bibentry: ParsedBibEntry, all_bibkeys_list: List[str]) -> tuple[str, ...]:
+    return tuple(
+        ",".join(bibkey for bibkey in bibkeys if (bibkey in all_bibkeys_list) == good)
+        for bibkeys in (parsed_bibentry.further_references_raw, parsed_bibentry.depends_on_raw)
+        for good in (True, False)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the resolution of the cited bibkeys in the bib_deps bootstrap."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    parser.add_argument("--sample", type=int, default=200, help="Number of entries timed with the legacy list scan")
+    args = parser.parse_args()
+
+    print(f"{'bibliography':>12} {'index (s)':>10} {'resolve (s)':>12} {'legacy, extrapolated (s)':>25} {'speedup':>8}")
+
+    for size in args.sizes:
+        parsed = synthetic_parsed_bibentries(size)
+        rows = [BaseBibEntry(p.bibkey, p.title, p.notes, p.crossref, p.further_note) for p in parsed]
+
+        start = time.perf_counter()
+        all_bibkeys = get_all_bibkeys(rows)
+        index_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for parsed_bibentry in parsed:
+            process_bibentry(parsed_bibentry, all_bibkeys)
+        resolve_s = time.perf_counter() - start
+
+        all_bibkeys_list = [row.bibkey for row in rows]
+        sample = random.Random(size).sample(parsed, min(args.sample, size))
+        start = time.perf_counter()
+        for parsed_bibentry in sample:
+            legacy_process_bibentry(parsed_bibentry, all_bibkeys_list)
+        legacy_s = (time.perf_counter() - start) * size / len(sample)
+
+        print(
+            f"{size:>12} {index_s:>10.3f} {resolve_s:>12.3f} {legacy_s:>25.1f} {legacy_s / (index_s + resolve_s):>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
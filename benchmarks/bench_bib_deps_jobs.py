@@ -0,0 +1,61 @@
+"""
+Scaling of the `bib_deps` bootstrap (parsing and processing of every entry) with the number of processes (`--jobs`).
+
+The entries are synthetic, with the fields of `bench_citet_scanner.py`, and a share of them with a comment inside a
+citation, which sends them to the TexSoup fallback, as some entries of the bibliography do.
+
+Usage:
+    PYTHONPATH='.' python benchmarks/bench_bib_deps_jobs.py [--entries 20000] [--jobs 1 2 4] [--chunk-size 500]
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import List
+
+from benchmarks.bench_citet_scanner import synthetic_fields
+from src.bib_deps.bib_deps_bootstrap import DEFAULT_CHUNK_SIZE, bootstrap_bibentries, get_all_bibkeys
+from src.bib_deps.models import BaseBibEntry
+
+
+def synthetic_bibentries(n: int, texsoup_ratio: float = 0.05, seed: int = 0) -> List[BaseBibEntry]:
+    rng = random.Random(seed)
+    notes = synthetic_fields(n, seed)
+    return [
+        BaseBibEntry(
+            bibkey=f"author{i}_a:{1900 + i % 120}",
+            title="Title",
+            notes=f"\\citet{{doe_j:2019 % comment\n}} {note}" if rng.random() < texsoup_ratio else note,
+            crossref="",
+            further_note="",
+        )
+        for i, note in enumerate(notes)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the bib_deps bootstrap with a growing number of processes.")
+    parser.add_argument("--entries", type=int, default=20_000)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    rows = synthetic_bibentries(args.entries)
+    all_bibkeys = get_all_bibkeys(rows)
+
+    print(f"{args.entries} entries, {os.cpu_count()} CPUs")
+    print(f"{'jobs':>5} {'time (s)':>9} {'entries/s':>10} {'speedup':>8}")
+
+    baseline_s = None
+    for jobs in args.jobs:
+        start = time.perf_counter()
+        for _ in bootstrap_bibentries(rows, all_bibkeys, jobs, args.chunk_size):
+            pass
+        elapsed = time.perf_counter() - start
+        baseline_s = baseline_s or elapsed
+        print(f"{jobs:>5} {elapsed:>9.2f} {args.entries / elapsed:>10.0f} {baseline_s / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Throughput of the extraction of the cited bibkeys of the `notes`, `title` and `further_note` fields in the `bib_deps`
+bootstrap: the citet scanner (`scan_cite_bibkeys`) vs. a full TexSoup parse of every field, as was done before.
+
+The fields are synthetic, with the citation commands, optional arguments, groups, math, comments and escapes found in
+the bibliography.
+
+Usage:
+    PYTHONPATH='.' python benchmarks/bench_citet_scanner.py [--fields 20000] [--texsoup-fields 2000]
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from src.bib_deps.bib_deps_bootstrap import texsoup_cite_bibkeys
+from src.bib_deps.citet_scanner import scan_cite_bibkeys
+
+
+FRAGMENTS = (
+    "Reprinted in ",
+    "See ",
+    "the second edition of the book, with a new introduction by the author, ",
+    ", pp. 12--34. ",
+    "\\citet{smith_j:2020}",
+    "\\citep[p.~3]{doe_j:2019, roe_r:2001}",
+    "\\citet[see][12]{roe_r:2001a}",
+    "\\citealt{doe_j-roe_r:2019}",
+    "\\emph{Title \\citet{e:2001}}",
+    "\\textit{Title}",
+    "$x^2$ ",
+    "\\%",
+    "\n",
+    "\\'e",
+)
+
+
+def synthetic_fields(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 12))) if rng.random() > 0.3 else ""
+        for _ in range(n)
+    ]
+
+
+def throughput(extract: Callable[[str], object], fields: List[str]) -> tuple[float, float]:
+    """
+    Fields and MB per second.
+    """
+    start = time.perf_counter()
+    for field in fields:
+        extract(field)
+    elapsed = time.perf_counter() - start
+    return len(fields) / elapsed, sum(len(field) for field in fields) / elapsed / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the extraction of the cited bibkeys of the bib_deps fields."
+    )
+    parser.add_argument("--fields", type=int, default=20_000, help="Number of fields read by the scanner")
+    parser.add_argument("--texsoup-fields", type=int, default=2_000, help="Number of fields read by TexSoup")
+    args = parser.parse_args()
+
+    fields = synthetic_fields(args.fields)
+
+    scanner_fields_s, scanner_mb_s = throughput(scan_cite_bibkeys, fields)
+    texsoup_fields_s, texsoup_mb_s = throughput(texsoup_cite_bibkeys, fields[: args.texsoup_fields])
+
+    print(f"{'extractor':>10} {'fields/s':>12} {'MB/s':>8}")
+    print(f"{'scanner':>10} {scanner_fields_s:>12.0f} {scanner_mb_s:>8.2f}")
+    print(f"{'texsoup':>10} {texsoup_fields_s:>12.0f} {texsoup_mb_s:>8.2f}")
+    print(f"speedup: {scanner_fields_s / texsoup_fields_s:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Extraction of the reference divs of a compiled HTML file: streaming extractor vs. BeautifulSoup on the whole file.
+
+The synthetic HTML files mimic the output of `dltc-make offhtml`: a page with a header, and a list of reference divs as produced by Pandoc's citeproc, spread over several chapters as in a batch compilation.
+
+Usage:
+    PYTHONPATH='.' python benchmarks/bench_div_extractor.py [--refs 1000 10000] [--chapters 20]
+"""
+
+import argparse
+import io
+import random
+import time
+from typing import Callable, List
+
+from bs4 import BeautifulSoup, Tag
+
+from src.ref_pipe.div_extractor import get_bibkey_from_div_id, stream_divs
+from src.ref_pipe.models import BibDiv
+
+
+REF_DIV_TEMPLATE = """<div id="ref-c{chapter}-{bibkey}" class="csl-entry" role="listitem">
+{author}. {year}. <span>“{title}.”</span> <em>{journal}</em> {volume} ({number}): {first_page}–{last_page}. <a href="https://doi.org/10.{doi}">https://doi.org/10.{doi}</a>.
+</div>"""
+
+
+def synthetic_html(refs: int, chapters: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = ["theory", "truth", "mind", "knowledge", "language", "reference", "meaning", "belief", "time", "being"]
+
+    chapter_html = []
+    for chapter in range(1, chapters + 1):
+        divs = []
+        for i in range(refs // chapters):
+            author = f"Author{rng.randint(0, 5000)}"
+            year = rng.randint(1900, 2025)
+            divs.append(
+                REF_DIV_TEMPLATE.format(
+                    chapter=chapter,
+                    bibkey=f"{author.lower()}_a:{year}{'abc'[i % 3]}",
+                    author=f"{author}, A. &amp; Other, B.",
+                    year=year,
+                    title=" ".join(rng.choice(words) for _ in range(8)).capitalize(),
+                    journal="Journal of " + rng.choice(words).capitalize(),
+                    volume=rng.randint(1, 80),
+                    number=rng.randint(1, 4),
+                    first_page=rng.randint(1, 300),
+                    last_page=rng.randint(301, 600),
+                    doi=f"{rng.randint(1000, 9999)}/{rng.randint(10**6, 10**7)}",
+                )
+            )
+        chapter_html.append(
+            f'<section id="chapter-{chapter}">\n<h1>Chapter {chapter}</h1>\n'
+            f'<div id="refs" class="references csl-bib-body hanging-indent" role="list">\n{"\n".join(divs)}\n</div>\n</section>'
+        )
+
+    return (
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n<title>HTML References Pipeline</title>\n'
+        "<style>div.csl-entry { clear: both; }</style>\n</head>\n<body>\n"
+        + "\n".join(chapter_html)
+        + "\n</body>\n</html>\n"
+    )
+
+
+def bs_extract_divs(html: str, namespace: str | None) -> List[BibDiv]:
+    soup = BeautifulSoup(html, features="html.parser")
+    bibdivs = []
+    for div in soup.find_all("div"):
+        if not isinstance(div, Tag) or div.get("id") is None:
+            continue
+        div_id = f"{div.get('id')}"
+        if namespace is not None and not div_id.startswith(f"ref-{namespace}-"):
+            continue
+        if get_bibkey_from_div_id(div_id) != "":
+            bibdivs.append(BibDiv(div_id=get_bibkey_from_div_id(div_id), content=div.__str__()))
+    return bibdivs
+
+
+def stream_extract_divs(html: str, namespace: str | None) -> List[BibDiv]:
+    return list(stream_divs(io.StringIO(html), namespace))
+
+
+def best_of(runs: int, extract: Callable[[], List[BibDiv]]) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        extract()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the extraction of reference divs.")
+    parser.add_argument("--refs", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--chapters", type=int, default=20, help="Number of chapters (batch members) per file")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'refs':>8} {'size (MB)':>10} {'namespace':>10} {'bs4 (s)':>9} {'stream (s)':>11} {'speedup':>8}")
+
+    for refs in args.refs:
+        html = synthetic_html(refs, args.chapters)
+
+        for namespace in (None, "c1"):
+            assert stream_extract_divs(html, namespace) == bs_extract_divs(html, namespace)
+
+            bs_s = best_of(args.runs, lambda: bs_extract_divs(html, namespace))
+            stream_s = best_of(args.runs, lambda: stream_extract_divs(html, namespace))
+
+            print(
+                f"{refs:>8} {len(html.encode('utf-8')) / 1e6:>10.2f} {namespace or '-':>10} "
+                f"{bs_s:>9.3f} {stream_s:>11.3f} {bs_s / stream_s:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
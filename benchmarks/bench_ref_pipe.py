@@ -0,0 +1,201 @@
+"""
+End-to-end benchmark of the stages of ref_pipe, on synthetic bibliographies of growing sizes (see `synthetic_bibliography.py`).
+
+Times the loading and validation of the bibliography and of the entities of every supported type, the preparation of the bibliography table, and the per-entity pipeline: the divs (small bib, markdown, compilation with the 'fake' compile backend, div extraction) and the HTML files. No Docker is needed.
+
+The results are written as JSON, with the environment they were measured in, so that runs can be compared (see `--compare`).
+
+Usage:
+    PYTHONPATH='.' python benchmarks/bench_ref_pipe.py [--sizes 10000 100000 1000000] [--entities 50] [--output results.json] [--compare previous.json]
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, TypeVar
+
+import polars as pl
+
+from benchmarks.synthetic_bibliography import ENCODING, ENTITY_TYPES, write_synthetic_inputs
+from src.ref_pipe.compile_backends import FakeBackend
+from src.ref_pipe.filesystem_io import load_bibentities, load_bibliography
+from src.ref_pipe.html_io import gen_html_files
+from src.ref_pipe.prep_divs import gen_bib_html_divs
+from src.ref_pipe.preprocessors import (
+    build_journal_index,
+    build_sort_ranks,
+    load_bibliography_dataframe,
+    prepare_bib_df,
+    preprocess_bibentities,
+)
+from src.sdk.ResultMonad import runwrap
+
+
+T = TypeVar("T")
+
+
+def timed(stages: Dict[str, float], name: str, func: Callable[[], T]) -> T:
+    start = time.perf_counter()
+    out = func()
+    stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+    return out
+
+
+def environment() -> Dict[str, Any]:
+    git_r = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True)
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_r.stdout.strip() if git_r.returncode == 0 else "",
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def bench_size(size: int, n_entities: int, seed: int) -> Dict[str, Any]:
+    stages: Dict[str, float] = {}
+    per_entity_ms: Dict[str, List[float]] = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs = timed(
+            stages, "generate", lambda: write_synthetic_inputs(size, os.path.join(tmp_dir, "inputs"), n_entities, seed)
+        )
+
+        bibliography = timed(stages, "load_bibliography", lambda: runwrap(load_bibliography(inputs.bib_file)))
+        bib_df = timed(stages, "load_table", lambda: load_bibliography_dataframe(inputs.table_file))
+        prepared_df = timed(stages, "prepare_table", lambda: prepare_bib_df(bib_df))
+        journal_index = timed(stages, "journal_index", lambda: build_journal_index(prepared_df))
+        sort_ranks = timed(stages, "sort_ranks", lambda: build_sort_ranks(prepared_df))
+
+        work_dir = os.path.join(tmp_dir, "work")
+        os.makedirs(work_dir)
+        compile_backend = FakeBackend()
+
+        for entity_type in ENTITY_TYPES:
+            bibentities_raw = timed(
+                stages,
+                "load_entities",
+                lambda: runwrap(
+                    load_bibentities(inputs.entity_files[entity_type], ENCODING, entity_type, bibliography)
+                ),
+            )
+            bibentities, _, _ = timed(
+                stages,
+                "preprocess_entities",
+                lambda: runwrap(preprocess_bibentities(inputs.table_file, bibentities_raw, entity_type)),
+            )
+
+            for bibentity in bibentities:
+                start = time.perf_counter()
+
+                bibdiv_dict = timed(
+                    stages,
+                    "divs",
+                    lambda: runwrap(
+                        gen_bib_html_divs(bibentity, bibliography, tmp_dir, tmp_dir, "work", compile_backend)
+                    ),
+                )
+                timed(
+                    stages,
+                    "html",
+                    lambda: runwrap(
+                        gen_html_files(
+                            bibentity,
+                            bibdiv_dict,
+                            os.path.join(tmp_dir, "html"),
+                            entity_type,
+                            prepared_df,
+                            sort_ranks,
+                            journal_index,
+                            bibliography,
+                        )
+                    ),
+                )
+
+                per_entity_ms.setdefault(entity_type, []).append((time.perf_counter() - start) * 1e3)
+
+        bibliography.close()
+
+    return {
+        "size": size,
+        "stages_s": {name: round(seconds, 6) for name, seconds in stages.items()},
+        "entities": {
+            entity_type: {
+                "count": len(timings),
+                "median_ms": round(statistics.median(timings), 3),
+                "max_ms": round(max(timings), 3),
+            }
+            for entity_type, timings in per_entity_ms.items()
+        },
+    }
+
+
+def print_comparison(results: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    previous_runs = {run["size"]: run for run in previous["runs"]}
+
+    print(f"\nCompared to {previous['environment']['timestamp']} ({previous['environment']['commit'][:10]}):")
+    print(f"{'size':>9} {'stage':>20} {'previous (s)':>13} {'now (s)':>10} {'ratio':>7}")
+
+    for run in results["runs"]:
+        previous_run = previous_runs.get(run["size"])
+        if previous_run is None:
+            continue
+        for name, seconds in run["stages_s"].items():
+            previous_seconds = previous_run["stages_s"].get(name)
+            if previous_seconds:
+                print(
+                    f"{run['size']:>9} {name:>20} {previous_seconds:>13.3f} {seconds:>10.3f} {seconds / previous_seconds:>7.2f}"
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the stages of ref_pipe on synthetic bibliographies.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--entities", type=int, default=50, help="Number of entities of each type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=f"bench_ref_pipe-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json",
+        help="Where to write the results, as JSON",
+    )
+    parser.add_argument("--compare", type=str, default="", help="Results of a previous run to compare with")
+    parser.add_argument("--verbose", action="store_true", help="Keep the logs of the pipeline")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    results: Dict[str, Any] = {"environment": environment(), "arguments": vars(args), "runs": []}
+
+    for size in args.sizes:
+        run = bench_size(size, args.entities, args.seed)
+        results["runs"].append(run)
+
+        print(f"\n{size} entries")
+        for name, seconds in run["stages_s"].items():
+            print(f"{name:>20} {seconds:>10.3f} s")
+        for entity_type, entity_stats in run["entities"].items():
+            print(
+                f"{entity_type:>20} {entity_stats['median_ms']:>10.1f} ms per entity (max {entity_stats['max_ms']:.1f} ms, {entity_stats['count']} entities)"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to '{args.output}'.")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
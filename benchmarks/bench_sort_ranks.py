@@ -0,0 +1,101 @@
+"""
+Per-entity cost of sorting the bibkeys of an entity, for growing bibliography sizes.
+
+Compares the precomputed global ranks (`build_sort_ranks` + `sort_bibkeys_for_entity`) with filtering and sorting the
+whole bibliography DataFrame for every entity, as was done before. The cost of the former should not depend on the size
+of the bibliography.
+
+Usage:
+    PYTHONPATH='.' python benchmarks/bench_sort_ranks.py [--sizes 10000 100000 500000] [--entity-size 50]
+"""
+
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, FrozenSet, List
+
+import polars as pl
+
+from src.ref_pipe.html_io import sort_bibkeys_for_entity
+from src.ref_pipe.preprocessors import SORT_ORDERINGS, build_sort_ranks, prepare_bib_df
+
+
+def synthetic_bib_df(n: int, seed: int = 0) -> pl.DataFrame:
+    rng = random.Random(seed)
+    last_names = [f"name{i}" for i in range(2000)]
+    return pl.DataFrame(
+        {
+            "bibkey": [f"author{i}_a:{1900 + i % 120}" for i in range(n)],
+            "title": [f"Title {rng.random()}" for _ in range(n)],
+            "author": [f"{rng.choice(last_names)}, First" if rng.random() > 0.05 else None for _ in range(n)],
+            "journal": [None] * n,
+            "journal-id": [None] * n,
+            "date": [f"{rng.randint(1900, 2025)}" if rng.random() > 0.05 else None for _ in range(n)],
+            "volume": [None] * n,
+            "number": [None] * n,
+            "pages": [None] * n,
+        },
+        schema={
+            "bibkey": pl.String,
+            "title": pl.String,
+            "author": pl.String,
+            "journal": pl.String,
+            "journal-id": pl.String,
+            "date": pl.String,
+            "volume": pl.String,
+            "number": pl.String,
+            "pages": pl.String,
+        },
+    )
+
+
+def legacy_sort(bibkeys: FrozenSet[str], prepared_df: pl.DataFrame) -> tuple[str, ...]:
+    ordering = SORT_ORDERINGS["_rank_default"]
+    filtered = prepared_df.filter(pl.col("bibkey").is_in(bibkeys))
+    sorted_df = filtered.sort(
+        by=list(ordering.by), descending=list(ordering.descending), nulls_last=list(ordering.nulls_last)
+    )
+    return tuple(sorted_df["bibkey"].to_list())
+
+
+def time_per_entity(sort: Callable[[FrozenSet[str]], tuple[str, ...]], entities: List[FrozenSet[str]]) -> float:
+    timings = []
+    for bibkeys in entities:
+        start = time.perf_counter()
+        sort(bibkeys)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the per-entity sorting of bibkeys.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--entity-size", type=int, default=50, help="Number of bibkeys per entity")
+    parser.add_argument("--entities", type=int, default=200, help="Number of entities sorted per size")
+    args = parser.parse_args()
+
+    print(f"{'bibliography':>12} {'prepare (s)':>12} {'legacy (us)':>12} {'ranks (us)':>12} {'speedup':>8}")
+
+    for size in args.sizes:
+        bib_df = synthetic_bib_df(size)
+
+        start = time.perf_counter()
+        prepared_df = prepare_bib_df(bib_df)
+        sort_ranks = build_sort_ranks(prepared_df)
+        prepare_s = time.perf_counter() - start
+
+        rng = random.Random(size)
+        all_bibkeys = prepared_df["bibkey"].to_list()
+        entities = [frozenset(rng.sample(all_bibkeys, args.entity_size)) for _ in range(args.entities)]
+
+        legacy_s = time_per_entity(lambda bibkeys: legacy_sort(bibkeys, prepared_df), entities)
+        ranks_s = time_per_entity(lambda bibkeys: sort_bibkeys_for_entity(bibkeys, sort_ranks, "article"), entities)
+
+        print(
+            f"{size:>12} {prepare_s:>12.2f} {legacy_s * 1e6:>12.1f} {ranks_s * 1e6:>12.1f} {legacy_s / ranks_s:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Rendering of the collapsible HTML of a large journal: streaming writer vs. string concatenation.
+
+Builds a synthetic journal spanning many years, with several volumes per year and several issues per volume, and renders
+it to a file both with `write_struct_html`, which streams the `<details>` structure to the file handle, and by
+concatenating the whole page in memory first, as was done before. Reports the time and the peak memory allocated by
+each.
+
+Usage:
+    PYTHONPATH='.' python benchmarks/bench_struct_html.py [--years 50] [--volumes 4] [--issues 4] [--articles 12]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from src.ref_pipe.html_io import (
+    COLLAPSIBLE_ISSUE_HTML_FORMAT,
+    COLLAPSIBLE_VOLUME_HTML_FORMAT,
+    COLLAPSIBLE_YEAR_HTML_FORMAT,
+    write_struct_html,
+)
+from src.ref_pipe.models import HTMLIssue, HTMLVolume, HTMLYear, TBibDivDict, THTMLCollapsible
+
+
+def synthetic_journal(
+    years: int, volumes: int, issues: int, articles: int, div_size: int
+) -> tuple[THTMLCollapsible, TBibDivDict]:
+    bibdiv_dict: TBibDivDict = {}
+    struct = []
+    for y in range(years):
+        year_contents = []
+        for v in range(volumes):
+            volume_contents = []
+            for i in range(issues):
+                bibkeys = tuple(f"author{y}_{v}_{i}_{a}:{1975 + y}" for a in range(articles))
+                for bibkey in bibkeys:
+                    bibdiv_dict[bibkey] = f'<div id="ref-c1-{bibkey}" class="csl-entry">{"x" * div_size}</div>'
+                volume_contents.append(HTMLIssue(name=f"issue {i + 1}", contents=bibkeys))
+            year_contents.append(HTMLVolume(name=f"{y * volumes + v + 1}", contents=tuple(volume_contents)))
+        struct.append(HTMLYear(name=f"{1975 + y} :: vol. ...", contents=tuple(year_contents)))
+
+    return tuple(struct), bibdiv_dict
+
+
+def concatenated_struct_html(struct: THTMLCollapsible, bibdiv_dict: TBibDivDict) -> str:
+    main_html = ""
+    for year in struct:
+        year_html_contents = ""
+        for volume in year.contents:
+            assert isinstance(volume, HTMLVolume)
+            vol_html_contents = ""
+            for issue in volume.contents:
+                assert isinstance(issue, HTMLIssue)
+                issue_html_contents = ""
+                for bibkey in issue.contents:
+                    issue_html_contents += bibdiv_dict[bibkey]
+                    issue_html_contents += "\n"
+                vol_html_contents += COLLAPSIBLE_ISSUE_HTML_FORMAT.format(name=issue.name, contents=issue_html_contents)
+                vol_html_contents += "\n"
+            year_html_contents += COLLAPSIBLE_VOLUME_HTML_FORMAT.format(name=volume.name, contents=vol_html_contents)
+            year_html_contents += "\n"
+        main_html += COLLAPSIBLE_YEAR_HTML_FORMAT.format(name=year.name, contents=year_html_contents)
+        main_html += "\n"
+
+    return main_html
+
+
+def measure(render: Callable[[str], None], filename: str) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    render(filename)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the rendering of the collapsible HTML of a journal.")
+    parser.add_argument("--years", type=int, default=50)
+    parser.add_argument("--volumes", type=int, default=4, help="Volumes per year")
+    parser.add_argument("--issues", type=int, default=4, help="Issues per volume")
+    parser.add_argument("--articles", type=int, default=12, help="Articles per issue")
+    parser.add_argument("--div-size", type=int, default=400, help="Characters of text in each reference div")
+    args = parser.parse_args()
+
+    struct, bibdiv_dict = synthetic_journal(args.years, args.volumes, args.issues, args.articles, args.div_size)
+
+    def concatenated(filename: str) -> None:
+        html = concatenated_struct_html(struct, bibdiv_dict)
+        with open(filename, "w") as f:
+            f.write(html)
+            f.write("\n")
+
+    def streamed(filename: str) -> None:
+        with open(filename, "w") as f:
+            write_struct_html(f.write, struct, bibdiv_dict)
+            f.write("\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        concatenated_file = os.path.join(tmp_dir, "concatenated.html")
+        streamed_file = os.path.join(tmp_dir, "streamed.html")
+
+        concatenated_s, concatenated_peak = measure(concatenated, concatenated_file)
+        streamed_s, streamed_peak = measure(streamed, streamed_file)
+
+        with open(concatenated_file) as f1, open(streamed_file) as f2:
+            identical = f1.read() == f2.read()
+        size_mb = os.path.getsize(streamed_file) / 1e6
+
+    print(f"{len(bibdiv_dict)} references, {size_mb:.1f} MB of HTML, identical output: {identical}")
+    print(f"{'':>14} {'time (ms)':>10} {'peak (MB)':>10}")
+    print(f"{'concatenated':>14} {concatenated_s * 1e3:>10.1f} {concatenated_peak / 1e6:>10.1f}")
+    print(f"{'streamed':>14} {streamed_s * 1e3:>10.1f} {streamed_peak / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Generator of synthetic, valid inputs for ref_pipe, of configurable size.
+
+Writes to the output directory:
+- `bibliography.bib`: one entry per line, with bibkeys that pass `parse_bibkey` (e.g. `smith_j:2001`, `smith_j-doe_a:1999b`, `smith_j-etal:2020`).
+- `bibliography-table.parquet`: the bibliography table, with the columns used by `prepare_bib_df`. Polars can't write ODS files, but `load_bibliography_dataframe` reads Parquet files too.
+- `<entity_type>.csv`: the entities of each of the `SUPPORTED_ENTITY_TYPES`, with the columns of `EXTERNAL_COLUMN`, in UTF-8.
+
+The distributions aim to look like a real bibliography: a few very prolific authors and many occasional ones, dates skewed towards recent years, a few large journals and many small ones, and most entries being journal articles.
+
+Usage:
+    PYTHONPATH='.' python benchmarks/synthetic_bibliography.py --size 100000 --output-dir /tmp/ref_pipe_bench [--entities 200] [--seed 0]
+"""
+
+import argparse
+import csv
+import os
+import random
+import re
+import string
+from typing import Dict, List, NamedTuple, Tuple
+
+from faker import Faker
+import polars as pl
+
+from src.ref_pipe.filesystem_io import EXTERNAL_COLUMN
+from src.ref_pipe.models import SUPPORTED_ENTITY_TYPES, TSupportedEntity
+
+
+BIB_FILENAME = "bibliography.bib"
+TABLE_FILENAME = "bibliography-table.parquet"
+ENCODING = "utf-8"
+
+MIN_YEAR = 1850
+MAX_YEAR = 2025
+
+ENTITY_TYPES: Tuple[TSupportedEntity, ...] = SUPPORTED_ENTITY_TYPES  # type: ignore[assignment]
+
+# Keeps the bibkeys cells of the entity CSVs under the default field size limit of the `csv` module (131072 characters)
+MAX_MAIN_BIBKEYS = 2000
+
+
+class SyntheticEntry(NamedTuple):
+    bibkey: str
+    entry_type: str
+    authors: Tuple[Tuple[str, str], ...]  # (last name, first name)
+    title: str
+    year: str | None
+    journal_id: str | None
+    volume: str | None
+    number: str | None
+    pages: str | None
+    publisher: str | None
+
+
+class SyntheticInputs(NamedTuple):
+    bib_file: str
+    table_file: str
+    entity_files: Dict[TSupportedEntity, str]
+
+
+def _ascii_lower(name: str) -> str:
+    return re.sub(r"[^a-z]", "", name.lower()) or "anon"
+
+
+def _zipf_weights(n: int, exponent: float = 1.1) -> List[float]:
+    return [1 / (rank**exponent) for rank in range(1, n + 1)]
+
+
+class SyntheticBibliography:
+    """
+    Synthetic bibliography of `size` entries. Fully determined by the seed.
+    """
+
+    def __init__(self, size: int, seed: int = 0) -> None:
+        self.size = size
+        self.rng = random.Random(seed)
+
+        faker = Faker()
+        Faker.seed(seed)
+
+        n_authors = max(10, size // 6)
+        self.authors = [(faker.last_name(), faker.first_name()) for _ in range(min(n_authors, 20_000))]
+        # Past the names Faker gives, more authors only differ by first name
+        while len(self.authors) < n_authors:
+            last, _ = self.authors[len(self.authors) % 20_000]
+            self.authors.append((last, faker.first_name()))
+        self.author_weights = _zipf_weights(n_authors, 0.9)
+
+        self.words = list({faker.word() for _ in range(3000)} | {w.lower() for w in faker.words(2000)})
+
+        n_journals = max(20, size // 400)
+        self.journals = [
+            (
+                f"{i + 1}",
+                f"{faker.city()} {self.rng.choice(['Journal', 'Review', 'Studies', 'Quarterly'])} of {faker.word().title()}",
+            )
+            for i in range(n_journals)
+        ]
+        self.journal_weights = _zipf_weights(n_journals)
+        self.journal_start_years = {journal_id: self.rng.randint(MIN_YEAR, 2000) for journal_id, _ in self.journals}
+
+        n_publishers = max(10, size // 2000)
+        self.publishers = [f"{faker.company()}" for _ in range(n_publishers)]
+        self.publisher_weights = _zipf_weights(n_publishers)
+
+        self.entries = self._generate_entries()
+
+    def _year(self) -> int:
+        return max(MIN_YEAR, MAX_YEAR - int(self.rng.expovariate(1 / 18)))
+
+    def _title(self) -> str:
+        words = self.rng.choices(self.words, k=self.rng.randint(3, 12))
+        return " ".join(words).capitalize()
+
+    def _bibkey(self, authors: Tuple[Tuple[str, str], ...], year: str, used: set[str]) -> str:
+        first_last, first_first = authors[0]
+        author_part = f"{_ascii_lower(first_last)}_{_ascii_lower(first_first)[0]}"
+        if len(authors) == 2:
+            second_last, second_first = authors[1]
+            author_part += f"-{_ascii_lower(second_last)}_{_ascii_lower(second_first)[0]}"
+        elif len(authors) > 2:
+            author_part += "-etal"
+
+        for suffix in ("", *string.ascii_lowercase):
+            bibkey = f"{author_part}:{year}{suffix}"
+            if bibkey not in used:
+                return bibkey
+
+        # More than 27 works with the same key: tell them apart by the initials
+        k = 2
+        while f"{author_part}{k}:{year}" in used:
+            k += 1
+        return f"{author_part}{k}:{year}"
+
+    def _generate_entries(self) -> List[SyntheticEntry]:
+        rng = self.rng
+        used: set[str] = set()
+        entries: List[SyntheticEntry] = []
+
+        author_choices = rng.choices(range(len(self.authors)), weights=self.author_weights, k=self.size * 2)
+        journal_choices = rng.choices(range(len(self.journals)), weights=self.journal_weights, k=self.size)
+        publisher_choices = rng.choices(range(len(self.publishers)), weights=self.publisher_weights, k=self.size)
+
+        for i in range(self.size):
+            n_authors = rng.choices((1, 2, 3, 4), weights=(55, 25, 12, 8))[0]
+            authors = tuple(
+                self.authors[
+                    author_choices[(2 * i + k) % len(author_choices)] if k < 2 else rng.randrange(len(self.authors))
+                ]
+                for k in range(n_authors)
+            )
+
+            r = rng.random()
+            year_int = self._year()
+            year = "forthcoming" if r < 0.01 else f"{year_int}"
+            date = None if r < 0.03 else year
+
+            entry_type = rng.choices(("article", "book", "incollection"), weights=(65, 20, 15))[0]
+            journal_id = volume = number = pages = publisher = None
+
+            if entry_type == "article":
+                journal_id, _ = self.journals[journal_choices[i]]
+                volume = f"{max(1, year_int - self.journal_start_years[journal_id] + 1)}"
+                number = f"{rng.randint(1, 4)}" if rng.random() > 0.1 else None
+                start_page = rng.randint(1, 600)
+                pages = f"{start_page}--{start_page + rng.randint(5, 40)}" if rng.random() > 0.05 else None
+            else:
+                publisher = self.publishers[publisher_choices[i]]
+
+            bibkey = self._bibkey(authors, year, used)
+            used.add(bibkey)
+
+            entries.append(
+                SyntheticEntry(
+                    bibkey=bibkey,
+                    entry_type=entry_type,
+                    authors=authors,
+                    title=self._title(),
+                    year=date,
+                    journal_id=journal_id,
+                    volume=volume,
+                    number=number,
+                    pages=pages,
+                    publisher=publisher,
+                )
+            )
+
+        return entries
+
+    def journal_name(self, journal_id: str) -> str:
+        return self.journals[int(journal_id) - 1][1]
+
+    def bib_line(self, entry: SyntheticEntry) -> str:
+        fields = [
+            f"author = {{{' and '.join(f'{last}, {first}' for last, first in entry.authors)}}}",
+            f"title = {{{entry.title}}}",
+        ]
+        if entry.year is not None:
+            fields.append(f"year = {{{entry.year}}}")
+        if entry.journal_id is not None:
+            fields.append(f"journal = {{{self.journal_name(entry.journal_id)}}}")
+        for name, value in (("volume", entry.volume), ("number", entry.number), ("pages", entry.pages)):
+            if value is not None:
+                fields.append(f"{name} = {{{value}}}")
+        if entry.publisher is not None:
+            fields.append(f"publisher = {{{entry.publisher}}}")
+
+        return f"@{entry.entry_type}{{{entry.bibkey}, {', '.join(fields)}}}\n"
+
+    def table(self) -> pl.DataFrame:
+        entries = self.entries
+        return pl.DataFrame(
+            {
+                "bibkey": [e.bibkey for e in entries],
+                "title": [e.title for e in entries],
+                # Some entries only have editors, which the table doesn't list as authors
+                "author": [
+                    " and ".join(f"{last}, {first}" for last, first in e.authors) if i % 37 else None
+                    for i, e in enumerate(entries)
+                ],
+                "journal": [self.journal_name(e.journal_id) if e.journal_id else None for e in entries],
+                "journal-id": [e.journal_id for e in entries],
+                "date": [e.year for e in entries],
+                "volume": [e.volume for e in entries],
+                "number": [e.number for e in entries],
+                "pages": [e.pages for e in entries],
+            },
+            schema={
+                column: pl.String
+                for column in (
+                    "bibkey",
+                    "title",
+                    "author",
+                    "journal",
+                    "journal-id",
+                    "date",
+                    "volume",
+                    "number",
+                    "pages",
+                )
+            },
+        )
+
+    def _popular_bibkeys(self, k: int) -> List[str]:
+        """
+        Bibkeys cited by an entity: mostly popular entries, as citations concentrate on a few works.
+        """
+        n = len(self.entries)
+        indices = {min(n - 1, int(self.rng.paretovariate(0.6)) - 1) for _ in range(k // 2)}
+        indices |= {self.rng.randrange(n) for _ in range(k - len(indices))}
+        return [self.entries[i].bibkey for i in indices]
+
+    def entity_rows(self, entity_type: TSupportedEntity, n_entities: int) -> List[Dict[str, str]]:
+        """
+        Rows of the entity CSV of the given type, with the columns of `EXTERNAL_COLUMN`.
+        """
+        rng = self.rng
+        columns = EXTERNAL_COLUMN[entity_type]
+        rows: List[Dict[str, str]] = []
+
+        def row(i: int, key: str, main: List[str], further: List[str], depends: List[str]) -> Dict[str, str]:
+            return {
+                columns["id"]: f"{i}",
+                columns["entity_key"]: key,
+                columns["url_endpoint"]: key,
+                columns["main_bibkeys"]: ", ".join(main),
+                columns["further_references"]: ", ".join(further),
+                columns["depends_on"]: ", ".join(depends),
+            }
+
+        def further_and_depends(main: List[str]) -> Tuple[List[str], List[str]]:
+            extra = self._popular_bibkeys(rng.randint(0, 6))
+            return [k for k in extra[: len(extra) // 2] if k not in main], [
+                k for k in extra[len(extra) // 2 :] if k not in main
+            ]
+
+        match entity_type:
+            case "profile":
+                by_author: Dict[Tuple[str, str], List[str]] = {}
+                for entry in self.entries:
+                    by_author.setdefault(entry.authors[0], []).append(entry.bibkey)
+                # The most prolific authors have profiles
+                prolific = sorted(by_author.items(), key=lambda item: -len(item[1]))[:n_entities]
+                for i, ((last, first), bibkeys) in enumerate(prolific, start=1):
+                    rows.append(
+                        row(i, f"{_ascii_lower(first)}-{_ascii_lower(last)}-{i}", bibkeys[:MAX_MAIN_BIBKEYS], [], [])
+                    )
+
+            case "journal":
+                for journal_id, name in self.journals[:n_entities]:
+                    # The main bibkeys of journals come from the bibliography table
+                    rows.append(row(int(journal_id), f"{_ascii_lower(name)}-{journal_id}", [], [], []))
+
+            case "publisher":
+                by_publisher: Dict[str, List[str]] = {}
+                for entry in self.entries:
+                    if entry.publisher is not None:
+                        by_publisher.setdefault(entry.publisher, []).append(entry.bibkey)
+                for i, (publisher, bibkeys) in enumerate(list(by_publisher.items())[:n_entities], start=1):
+                    rows.append(row(i, f"{_ascii_lower(publisher)}-{i}", bibkeys[:MAX_MAIN_BIBKEYS], [], []))
+
+            case "article" | "page":
+                for i in range(1, n_entities + 1):
+                    main = self._popular_bibkeys(rng.randint(5, 80))
+                    further, depends = further_and_depends(main)
+                    rows.append(row(i, f"{entity_type}-{i}", main, further, depends))
+
+        return rows
+
+
+def write_synthetic_inputs(size: int, output_dir: str, n_entities: int = 200, seed: int = 0) -> SyntheticInputs:
+    os.makedirs(output_dir, exist_ok=True)
+
+    bibliography = SyntheticBibliography(size, seed)
+
+    bib_file = os.path.join(output_dir, BIB_FILENAME)
+    with open(bib_file, "w", encoding=ENCODING) as f:
+        f.writelines(bibliography.bib_line(entry) for entry in bibliography.entries)
+
+    table_file = os.path.join(output_dir, TABLE_FILENAME)
+    bibliography.table().write_parquet(table_file)
+
+    entity_files: Dict[TSupportedEntity, str] = {}
+    for entity_type in ENTITY_TYPES:
+        entity_file = os.path.join(output_dir, f"{entity_type}.csv")
+        fieldnames = tuple(EXTERNAL_COLUMN[entity_type].values())
+        with open(entity_file, "w", encoding=ENCODING, newline="") as f:
+            # Some entity types use the same column for two attributes
+            writer = csv.DictWriter(f, fieldnames=tuple(dict.fromkeys(fieldnames)))
+            writer.writeheader()
+            writer.writerows(bibliography.entity_rows(entity_type, n_entities))
+        entity_files[entity_type] = entity_file
+
+    return SyntheticInputs(bib_file=bib_file, table_file=table_file, entity_files=entity_files)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic bibliography and entity CSVs for ref_pipe.")
+    parser.add_argument("--size", type=int, default=10_000, help="Number of bibliography entries")
+    parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument("--entities", type=int, default=200, help="Number of entities of each type")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    inputs = write_synthetic_inputs(args.size, args.output_dir, args.entities, args.seed)
+
+    print(f"Bibliography: {inputs.bib_file}\nTable: {inputs.table_file}")
+    for entity_type, entity_file in inputs.entity_files.items():
+        print(f"{entity_type}: {entity_file}")
+
+
+if __name__ == "__main__":
+    main()
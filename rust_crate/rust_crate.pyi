@@ -1,4 +1,4 @@
-from typing import List, Dict, Set, Tuple
+from typing import Callable, List, Dict, Set, Tuple
 
 def sum_as_string(a: int, b: int) -> str:
     """
@@ -61,4 +61,20 @@ class TransitivelyClosedBibEntry:
 def find_all_repeated_bibentries(entries: list[RustedBibEntry]) -> list[RustedBibEntry]: ...
 def compute_transitive_closures(
     entries: list[RustedBibEntry],
-) -> list[TransitivelyClosedBibEntry]: ...
+    threads: int | None = None,
+    progress: Callable[[int, int], None] | None = None,
+) -> list[TransitivelyClosedBibEntry]:
+    """
+    Transitive closures of the entries, on `threads` threads (one per core by default), with the GIL released.
+    `progress`, if given, is called with the number of entries done and the total, at most once per second, and once at the end.
+    """
+
+def compute_transitive_closures_scc(
+    entries: list[RustedBibEntry],
+    threads: int | None = None,
+    progress: Callable[[int, int], None] | None = None,
+) -> list[TransitivelyClosedBibEntry]:
+    """
+    Same closures as `compute_transitive_closures`, computed once per strongly connected component of the references.
+    The bibkeys of the closures come in the order of the entries.
+    """
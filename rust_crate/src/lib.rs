@@ -6,6 +6,11 @@ use models::{RustedBibEntry, TransitivelyClosedBibEntry};
 pub mod transitive_closure;
 use transitive_closure::{compute_transitive_closures, find_all_repeated_bibentries};
 
+pub mod parallel;
+
+pub mod scc_closure;
+use scc_closure::compute_transitive_closures_scc;
+
 /// Formats the sum of two numbers as string. Test function for this crate that should be callable from python.
 #[pyfunction]
 fn sum_as_string(a: usize, b: usize) -> PyResult<String> {
@@ -20,5 +25,6 @@ fn rust_crate(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_class::<TransitivelyClosedBibEntry>()?;
     m.add_function(wrap_pyfunction!(find_all_repeated_bibentries, m)?)?;
     m.add_function(wrap_pyfunction!(compute_transitive_closures, m)?)?;
+    m.add_function(wrap_pyfunction!(compute_transitive_closures_scc, m)?)?;
     Ok(())
 }
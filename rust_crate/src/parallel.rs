@@ -0,0 +1,227 @@
+//! Order-preserving parallel map on scoped threads, with progress reports from the calling thread.
+
+use std::sync::atomic::{AtomicBool, AtomicUsize, Ordering};
+use std::thread::{self, Thread};
+use std::time::{Duration, Instant};
+
+/// Number of items a thread takes at once.
+const CHUNK_SIZE: usize = 256;
+
+/// Minimum time between two progress reports.
+pub const REPORT_INTERVAL: Duration = Duration::from_secs(1);
+
+/// Number of threads to use: the requested one, or one per available core.
+pub fn thread_count(threads: Option<usize>) -> usize {
+    match threads {
+        Some(n) if n > 0 => n,
+        _ => thread::available_parallelism()
+            .map(|n| n.get())
+            .unwrap_or(1),
+    }
+}
+
+/// Progress reports passed on at most once per `interval` (`REPORT_INTERVAL`, outside of tests).
+pub struct ThrottledReport<F> {
+    report: F,
+    interval: Duration,
+    last_report: Instant,
+}
+
+impl<F, E> ThrottledReport<F>
+where
+    F: FnMut(usize) -> Result<(), E>,
+{
+    pub fn new(report: F, interval: Duration) -> Self {
+        ThrottledReport {
+            report,
+            interval,
+            last_report: Instant::now(),
+        }
+    }
+
+    /// Pass the report on, if the last one is at least `interval` old.
+    pub fn report(&mut self, done: usize) -> Result<(), E> {
+        if self.last_report.elapsed() >= self.interval {
+            self.last_report = Instant::now();
+            (self.report)(done)?;
+        }
+        Ok(())
+    }
+}
+
+/// Counts down the running threads, and wakes up the calling thread when the last one is done, even
+/// if it panicked.
+struct RunningThread<'a> {
+    running: &'a AtomicUsize,
+    caller: &'a Thread,
+}
+
+impl Drop for RunningThread<'_> {
+    fn drop(&mut self) {
+        if self.running.fetch_sub(1, Ordering::AcqRel) == 1 {
+            self.caller.unpark();
+        }
+    }
+}
+
+/// Apply `func` to the items on `threads` threads, and return the results in the order of the items.
+///
+/// The threads take chunks of items as they go, each with its own state, made by `init`. Meanwhile,
+/// the calling thread sleeps until they are done, waking up to call `report` with the number of
+/// items done once per `REPORT_INTERVAL`, and once at the end. If `report` fails, the threads stop
+/// after their current chunk, and the error is returned.
+pub fn parallel_map<T, U, S, E>(
+    items: &[T],
+    threads: usize,
+    init: impl Fn() -> S + Sync,
+    func: impl Fn(&mut S, &T) -> U + Sync,
+    mut report: impl FnMut(usize) -> Result<(), E>,
+) -> Result<Vec<U>, E>
+where
+    T: Sync,
+    U: Send,
+{
+    let chunks: Vec<&[T]> = items.chunks(CHUNK_SIZE).collect();
+    let next_chunk = AtomicUsize::new(0);
+    let done = AtomicUsize::new(0);
+    let cancelled = AtomicBool::new(false);
+
+    let mut chunk_results: Vec<Option<Vec<U>>> = (0..chunks.len()).map(|_| None).collect();
+
+    let worker_count = threads.clamp(1, chunks.len().max(1));
+    let running = AtomicUsize::new(worker_count);
+    let caller = thread::current();
+
+    let error = thread::scope(|scope| {
+        let mut workers = Vec::new();
+        for _ in 0..worker_count {
+            workers.push(scope.spawn(|| {
+                let _running_thread = RunningThread {
+                    running: &running,
+                    caller: &caller,
+                };
+                let mut state = init();
+                let mut results = Vec::new();
+                while !cancelled.load(Ordering::Relaxed) {
+                    let k = next_chunk.fetch_add(1, Ordering::Relaxed);
+                    let Some(chunk) = chunks.get(k) else {
+                        break;
+                    };
+                    results.push((k, chunk.iter().map(|item| func(&mut state, item)).collect()));
+                    done.fetch_add(chunk.len(), Ordering::Relaxed);
+                }
+                results
+            }));
+        }
+
+        // Parking can end early, so the conditions are checked again after each wake-up
+        let mut error = None;
+        let mut next_report = Instant::now() + REPORT_INTERVAL;
+        while running.load(Ordering::Acquire) > 0 {
+            if error.is_some() {
+                thread::park();
+                continue;
+            }
+
+            let now = Instant::now();
+            if now < next_report {
+                thread::park_timeout(next_report - now);
+                continue;
+            }
+
+            next_report = now + REPORT_INTERVAL;
+            if let Err(e) = report(done.load(Ordering::Relaxed)) {
+                cancelled.store(true, Ordering::Relaxed);
+                error = Some(e);
+            }
+        }
+
+        for worker in workers {
+            let results = worker
+                .join()
+                .unwrap_or_else(|panic| std::panic::resume_unwind(panic));
+            for (k, result) in results {
+                chunk_results[k] = Some(result);
+            }
+        }
+
+        error
+    });
+
+    if let Some(e) = error {
+        return Err(e);
+    }
+    report(items.len())?;
+
+    Ok(chunk_results.into_iter().flatten().flatten().collect())
+}
+
+/// Testing
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_parallel_map_keeps_the_order() {
+        let items: Vec<usize> = (0..10_000).collect();
+        let mut reported = Vec::new();
+
+        for threads in [1, 3, 16] {
+            let result = parallel_map(
+                &items,
+                threads,
+                || 0,
+                |calls, item| {
+                    *calls += 1;
+                    item * 2
+                },
+                |done| {
+                    reported.push(done);
+                    Ok::<(), ()>(())
+                },
+            );
+            assert_eq!(result, Ok(items.iter().map(|item| item * 2).collect()));
+            assert_eq!(reported.last(), Some(&items.len()));
+        }
+
+        let empty: Vec<usize> = Vec::new();
+        assert_eq!(
+            parallel_map(&empty, 4, || (), |_, item| *item, |_| Ok::<(), ()>(())),
+            Ok(vec![])
+        );
+    }
+
+    #[test]
+    fn test_parallel_map_returns_as_soon_as_the_threads_are_done() {
+        let items: Vec<usize> = (0..10).collect();
+
+        let start = Instant::now();
+        for _ in 0..100 {
+            let result = parallel_map(&items, 4, || (), |_, item| *item, |_| Ok::<(), ()>(()));
+            assert_eq!(result, Ok(items.clone()));
+        }
+        // No call waits for a timeout: the last thread wakes up the calling one
+        assert!(start.elapsed() < Duration::from_millis(500));
+    }
+
+    #[test]
+    fn test_parallel_map_stops_when_the_report_fails() {
+        let items: Vec<usize> = (0..100_000).collect();
+        let calls = AtomicUsize::new(0);
+
+        let result = parallel_map(
+            &items,
+            2,
+            || (),
+            |_, item| {
+                calls.fetch_add(1, Ordering::Relaxed);
+                thread::sleep(Duration::from_micros(50));
+                *item
+            },
+            |_| Err("interrupted"),
+        );
+
+        assert_eq!(result, Err("interrupted"));
+        assert!(calls.load(Ordering::Relaxed) < items.len());
+    }
+}
@@ -0,0 +1,625 @@
+//! Transitive closures by condensation of the strongly connected components.
+//!
+//! Same output as `compute_transitive_closures` (up to the order of the bibkeys in the closures,
+//! which is the order of the entries here), but the closure of each component is computed once,
+//! from the closures of the components it references, instead of traversing the whole graph again
+//! for every entry.
+
+use pyo3::prelude::*;
+use std::collections::{HashMap, VecDeque};
+
+use crate::models::{RustedBibEntry, TransitivelyClosedBibEntry};
+use crate::parallel::{parallel_map, thread_count, ThrottledReport, REPORT_INTERVAL};
+use crate::transitive_closure::report_progress;
+
+type NodeId = u32;
+
+/// Smallest number of components of a level worth splitting among threads.
+const PARALLEL_LEVEL_SIZE: usize = 1024;
+
+/// Bibkeys interned to integer IDs: first the bibkeys of the entries, in order, then the other
+/// referenced bibkeys, as they are found.
+#[derive(Default)]
+struct Interner<'a> {
+    ids: HashMap<&'a str, NodeId>,
+    keys: Vec<&'a str>,
+}
+
+impl<'a> Interner<'a> {
+    fn intern(&mut self, key: &'a str) -> NodeId {
+        if let Some(&id) = self.ids.get(key) {
+            return id;
+        }
+        let id = self.keys.len() as NodeId;
+        self.ids.insert(key, id);
+        self.keys.push(key);
+        id
+    }
+}
+
+/// Adjacency lists of the nodes, stored contiguously.
+struct Graph {
+    offsets: Vec<usize>,
+    targets: Vec<NodeId>,
+}
+
+impl Graph {
+    fn new(
+        entries: &[RustedBibEntry],
+        entry_of: &[Option<usize>],
+        interner: &Interner,
+        edges: fn(&RustedBibEntry) -> &Vec<String>,
+    ) -> Self {
+        let mut offsets = Vec::with_capacity(entry_of.len() + 1);
+        let mut targets = Vec::new();
+        offsets.push(0);
+        for entry in entry_of {
+            if let Some(i) = entry {
+                targets.extend(
+                    edges(&entries[*i])
+                        .iter()
+                        .map(|key| interner.ids[key.as_str()]),
+                );
+            }
+            offsets.push(targets.len());
+        }
+        Graph { offsets, targets }
+    }
+
+    fn len(&self) -> usize {
+        self.offsets.len() - 1
+    }
+
+    fn successors(&self, node: NodeId) -> &[NodeId] {
+        &self.targets[self.offsets[node as usize]..self.offsets[node as usize + 1]]
+    }
+}
+
+/// Strongly connected components (Tarjan), in reverse topological order: a component comes after
+/// the ones it references. Iterative, so that long chains of references don't overflow the stack.
+fn strongly_connected_components(graph: &Graph) -> (Vec<usize>, Vec<Vec<NodeId>>) {
+    const UNVISITED: usize = usize::MAX;
+
+    let n = graph.len();
+    let mut index = vec![UNVISITED; n];
+    let mut lowlink = vec![0; n];
+    let mut on_stack = vec![false; n];
+    let mut stack: Vec<NodeId> = Vec::new();
+    // Nodes being visited, with the position of the next successor to visit
+    let mut calls: Vec<(NodeId, usize)> = Vec::new();
+    let mut next_index = 0;
+
+    let mut component_of = vec![0; n];
+    let mut components: Vec<Vec<NodeId>> = Vec::new();
+
+    for root in 0..n as NodeId {
+        if index[root as usize] != UNVISITED {
+            continue;
+        }
+
+        index[root as usize] = next_index;
+        lowlink[root as usize] = next_index;
+        next_index += 1;
+        stack.push(root);
+        on_stack[root as usize] = true;
+        calls.push((root, 0));
+
+        while let Some(&(node, position)) = calls.last() {
+            let v = node as usize;
+            let successors = graph.successors(node);
+
+            if position < successors.len() {
+                calls.last_mut().unwrap().1 += 1;
+                let w = successors[position] as usize;
+                if index[w] == UNVISITED {
+                    index[w] = next_index;
+                    lowlink[w] = next_index;
+                    next_index += 1;
+                    stack.push(w as NodeId);
+                    on_stack[w] = true;
+                    calls.push((w as NodeId, 0));
+                } else if on_stack[w] {
+                    lowlink[v] = lowlink[v].min(index[w]);
+                }
+                continue;
+            }
+
+            calls.pop();
+            if let Some(&(parent, _)) = calls.last() {
+                lowlink[parent as usize] = lowlink[parent as usize].min(lowlink[v]);
+            }
+
+            if lowlink[v] == index[v] {
+                let mut component = Vec::new();
+                while let Some(member) = stack.pop() {
+                    on_stack[member as usize] = false;
+                    component_of[member as usize] = components.len();
+                    component.push(member);
+                    if member == node {
+                        break;
+                    }
+                }
+                components.push(component);
+            }
+        }
+    }
+
+    (component_of, components)
+}
+
+/// Components grouped by level in the condensation: 0 for the components that reference no other
+/// one, and one more than the highest level of the components they reference otherwise. The
+/// components of a level don't reference each other, so their closures can be computed in parallel.
+fn component_levels(
+    graph: &Graph,
+    component_of: &[usize],
+    components: &[Vec<NodeId>],
+) -> Vec<Vec<usize>> {
+    let mut level_of = vec![0; components.len()];
+    let mut levels: Vec<Vec<usize>> = Vec::new();
+
+    // In reverse topological order, the components a component references come before it
+    for (c, component) in components.iter().enumerate() {
+        let level = component
+            .iter()
+            .flat_map(|&node| graph.successors(node))
+            .map(|&successor| component_of[successor as usize])
+            .filter(|&d| d != c)
+            .map(|d| level_of[d] + 1)
+            .max()
+            .unwrap_or(0);
+        level_of[c] = level;
+        if level == levels.len() {
+            levels.push(Vec::new());
+        }
+        levels[level].push(c);
+    }
+
+    levels
+}
+
+/// Nodes reachable from the nodes of component `c` through at least one reference, as sorted IDs,
+/// given the closures of the components it references.
+fn component_closure(
+    graph: &Graph,
+    component_of: &[usize],
+    components: &[Vec<NodeId>],
+    closures: &[Vec<NodeId>],
+    c: usize,
+) -> Vec<NodeId> {
+    let component = &components[c];
+
+    let mut referenced: Vec<usize> = component
+        .iter()
+        .flat_map(|&node| graph.successors(node))
+        .map(|&successor| component_of[successor as usize])
+        .collect();
+    referenced.sort_unstable();
+    referenced.dedup();
+
+    let mut closure = Vec::new();
+    for &d in &referenced {
+        if d != c {
+            closure.extend_from_slice(&components[d]);
+            closure.extend_from_slice(&closures[d]);
+        }
+    }
+
+    // A cycle, or a self-reference
+    if component.len() > 1 || referenced.binary_search(&c).is_ok() {
+        closure.extend_from_slice(component);
+    }
+
+    closure.sort_unstable();
+    closure.dedup();
+    closure
+}
+
+/// Closures of all the components, level by level. The levels with enough components are split
+/// among the threads. No entry is done yet, so `report` is called with 0, after each level.
+fn component_closures<E>(
+    graph: &Graph,
+    component_of: &[usize],
+    components: &[Vec<NodeId>],
+    threads: usize,
+    report: &mut ThrottledReport<impl FnMut(usize) -> Result<(), E>>,
+) -> Result<Vec<Vec<NodeId>>, E> {
+    let mut closures: Vec<Vec<NodeId>> = vec![Vec::new(); components.len()];
+
+    for level in component_levels(graph, component_of, components) {
+        let closure_of = |_: &mut (), &c: &usize| {
+            component_closure(graph, component_of, components, &closures, c)
+        };
+        let level_closures = if threads > 1 && level.len() >= PARALLEL_LEVEL_SIZE {
+            parallel_map(&level, threads, || (), closure_of, |_| report.report(0))?
+        } else {
+            level.iter().map(|c| closure_of(&mut (), c)).collect()
+        };
+        report.report(0)?;
+
+        for (c, closure) in level.into_iter().zip(level_closures) {
+            closures[c] = closure;
+        }
+    }
+
+    Ok(closures)
+}
+
+/// Breadth-first traversals from single nodes, reusing the same buffers.
+struct DepthSearch {
+    seen: Vec<usize>,
+    search: usize,
+    queue: VecDeque<(NodeId, usize)>,
+}
+
+impl DepthSearch {
+    fn new(n: usize) -> Self {
+        DepthSearch {
+            seen: vec![0; n],
+            search: 0,
+            queue: VecDeque::new(),
+        }
+    }
+
+    /// Depth reached by the traversal from `start` in `t_close`: the largest distance from `start`
+    /// to the nodes of its closure (to `start` itself, if it's in a cycle). Stops as soon as the
+    /// `closure_len` nodes are found.
+    fn depth(&mut self, graph: &Graph, start: NodeId, closure_len: usize) -> usize {
+        if closure_len == 0 {
+            return 0;
+        }
+
+        self.search += 1;
+        self.queue.clear();
+        self.queue.push_back((start, 0));
+
+        let mut found = 0;
+        let mut max_depth = 0;
+        while let Some((node, depth)) = self.queue.pop_front() {
+            max_depth = depth;
+            for &successor in graph.successors(node) {
+                if self.seen[successor as usize] != self.search {
+                    self.seen[successor as usize] = self.search;
+                    found += 1;
+                    if found == closure_len {
+                        return depth + 1;
+                    }
+                    self.queue.push_back((successor, depth + 1));
+                }
+            }
+        }
+
+        max_depth
+    }
+}
+
+fn closure_s(closure: &[NodeId], keys: &[&str], bibkey: &str) -> String {
+    closure
+        .iter()
+        .map(|&node| keys[node as usize].trim())
+        .filter(|s| !s.is_empty())
+        .filter(|s| s != &bibkey)
+        .collect::<Vec<_>>()
+        .join(",")
+}
+
+/// Interned bibkeys of the entries and of their references, with the entry of each node, if any.
+fn intern_entries(entries: &[RustedBibEntry]) -> (Interner<'_>, Vec<Option<usize>>) {
+    let mut interner = Interner::default();
+
+    // As in the lookup of `compute_transitive_closures`, the last of repeated bibentries wins
+    let mut entry_of: Vec<Option<usize>> = Vec::with_capacity(entries.len());
+    for (i, entry) in entries.iter().enumerate() {
+        let id = interner.intern(&entry.bibkey) as usize;
+        if id == entry_of.len() {
+            entry_of.push(Some(i));
+        } else {
+            entry_of[id] = Some(i);
+        }
+    }
+    for entry in entries {
+        for key in entry
+            .further_references
+            .iter()
+            .chain(entry.depends_on.iter())
+        {
+            interner.intern(key);
+        }
+    }
+    entry_of.resize(interner.keys.len(), None);
+
+    (interner, entry_of)
+}
+
+/// Closures of the entries, on `threads` threads, calling `report` with the number of entries done
+/// as in `parallel_map`. Before the entries, the closures of the components are computed: meanwhile,
+/// `report` is called with 0, at most once per `REPORT_INTERVAL`, between the steps and the levels.
+pub fn scc_transitive_closures<E>(
+    entries: &[RustedBibEntry],
+    threads: usize,
+    mut report: impl FnMut(usize) -> Result<(), E>,
+) -> Result<Vec<TransitivelyClosedBibEntry>, E> {
+    let mut component_report = ThrottledReport::new(&mut report, REPORT_INTERVAL);
+
+    let (interner, entry_of) = intern_entries(entries);
+    component_report.report(0)?;
+
+    let graphs = [
+        Graph::new(entries, &entry_of, &interner, |entry| {
+            &entry.further_references
+        }),
+        Graph::new(entries, &entry_of, &interner, |entry| &entry.depends_on),
+    ];
+    let mut closures = Vec::with_capacity(graphs.len());
+    for graph in &graphs {
+        let (component_of, components) = strongly_connected_components(graph);
+        component_report.report(0)?;
+        let closures_of_components = component_closures(
+            graph,
+            &component_of,
+            &components,
+            threads,
+            &mut component_report,
+        )?;
+        closures.push((component_of, closures_of_components));
+    }
+
+    parallel_map(
+        entries,
+        threads,
+        || DepthSearch::new(interner.keys.len()),
+        |depth_search, entry| {
+            let node = interner.ids[entry.bibkey.as_str()];
+            let bibentry = &entries[entry_of[node as usize].unwrap()];
+
+            let [fr_closure, do_closure] = [0, 1].map(|g| {
+                let (component_of, component_closures) = &closures[g];
+                &component_closures[component_of[node as usize]]
+            });
+            let max_depth_reached = depth_search
+                .depth(&graphs[0], node, fr_closure.len())
+                .max(depth_search.depth(&graphs[1], node, do_closure.len()));
+
+            TransitivelyClosedBibEntry {
+                bibkey: bibentry.bibkey.clone(),
+                title: bibentry.title.clone(),
+                notes: bibentry.notes.clone(),
+                crossref: bibentry.crossref.clone(),
+                further_note: bibentry.further_note.clone(),
+                further_references: bibentry.further_references.join(","),
+                depends_on: bibentry.depends_on.join(","),
+                further_references_closed: closure_s(fr_closure, &interner.keys, &bibentry.bibkey),
+                depends_on_closed: closure_s(do_closure, &interner.keys, &bibentry.bibkey),
+                max_depth_reached,
+                status: "success".to_string(),
+                error_message: "".to_string(),
+            }
+        },
+        report,
+    )
+}
+
+/// Closures of the entries, as `compute_transitive_closures`, on a pool of threads.
+#[pyfunction]
+#[pyo3(signature = (entries, threads=None, progress=None))]
+pub fn compute_transitive_closures_scc(
+    entries: Vec<RustedBibEntry>,
+    py: Python<'_>,
+    threads: Option<usize>,
+    progress: Option<PyObject>,
+) -> PyResult<Vec<TransitivelyClosedBibEntry>> {
+    py.check_signals()?;
+
+    let threads = thread_count(threads);
+    py.allow_threads(|| {
+        scc_transitive_closures(&entries, threads, |done| {
+            report_progress(progress.as_ref(), done, entries.len())
+        })
+    })
+}
+
+/// Testing
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::transitive_closure::t_close;
+    use std::time::Duration;
+
+    fn create_rusted_bibentry(
+        bibkey: &str,
+        further_references: Vec<&str>,
+        depends_on: Vec<&str>,
+    ) -> RustedBibEntry {
+        RustedBibEntry {
+            bibkey: bibkey.to_string(),
+            title: bibkey.to_string(),
+            notes: bibkey.to_string(),
+            crossref: bibkey.to_string(),
+            further_note: bibkey.to_string(),
+            further_references: further_references.iter().map(|s| s.to_string()).collect(),
+            depends_on: depends_on.iter().map(|s| s.to_string()).collect(),
+        }
+    }
+
+    fn closures(entries: &[RustedBibEntry], threads: usize) -> Vec<TransitivelyClosedBibEntry> {
+        scc_transitive_closures(entries, threads, |_| Ok::<(), ()>(())).unwrap()
+    }
+
+    fn sorted_bibkeys(closure: &str) -> Vec<&str> {
+        let mut bibkeys: Vec<&str> = closure.split(',').filter(|s| !s.is_empty()).collect();
+        bibkeys.sort_unstable();
+        bibkeys
+    }
+
+    /// Checks the closures against the ones of `t_close`, whose bibkeys come in no particular order
+    fn assert_same_as_t_close(entries: &[RustedBibEntry]) {
+        let entries_map: HashMap<String, &RustedBibEntry> =
+            entries.iter().map(|e| (e.bibkey.clone(), e)).collect();
+        let mut memo = HashMap::new();
+
+        for (entry, closed) in entries.iter().zip(closures(entries, 1)) {
+            let expected = t_close(&entry.bibkey, &entries_map, &mut memo);
+            assert_eq!(closed.bibkey, expected.bibkey);
+            assert_eq!(
+                sorted_bibkeys(&closed.further_references_closed),
+                sorted_bibkeys(&expected.further_references_closed),
+                "further_references_closed of {}",
+                entry.bibkey
+            );
+            assert_eq!(
+                sorted_bibkeys(&closed.depends_on_closed),
+                sorted_bibkeys(&expected.depends_on_closed),
+                "depends_on_closed of {}",
+                entry.bibkey
+            );
+            assert_eq!(
+                closed.max_depth_reached, expected.max_depth_reached,
+                "max_depth_reached of {}",
+                entry.bibkey
+            );
+            assert_eq!(closed.further_references, expected.further_references);
+            assert_eq!(closed.depends_on, expected.depends_on);
+        }
+    }
+
+    #[test]
+    fn test_cycles() {
+        // A -> A, B -> C -> D -> B -> E, F -> B
+        let entries = vec![
+            create_rusted_bibentry("A", vec!["A"], vec!["A"]),
+            create_rusted_bibentry("B", vec!["C", "E"], vec!["C"]),
+            create_rusted_bibentry("C", vec!["D"], vec![]),
+            create_rusted_bibentry("D", vec!["B"], vec!["missing"]),
+            create_rusted_bibentry("E", vec![], vec![""]),
+            create_rusted_bibentry("F", vec!["B", " B"], vec!["F", "A"]),
+        ];
+
+        let closed = closures(&entries, 1);
+        assert_eq!(closed[0].further_references_closed, "");
+        assert_eq!(closed[0].max_depth_reached, 1);
+        assert_eq!(closed[1].further_references_closed, "C,D,E");
+        assert_eq!(closed[1].max_depth_reached, 3);
+        assert_eq!(closed[5].further_references_closed, "B,C,D,E,B");
+
+        assert_same_as_t_close(&entries);
+    }
+
+    #[test]
+    fn test_long_chain() {
+        // Deep enough to overflow the stack with a recursive traversal
+        let n = 200_000;
+        let bibkeys: Vec<String> = (0..n).map(|i| format!("k{}", i)).collect();
+        let entries: Vec<RustedBibEntry> = (0..n)
+            .map(|i| {
+                let next = if i + 1 < n {
+                    vec![bibkeys[i + 1].as_str()]
+                } else {
+                    vec![]
+                };
+                create_rusted_bibentry(&bibkeys[i], next, vec![])
+            })
+            .collect();
+
+        let closed = closures(&entries[n - 1000..], 1);
+        assert_eq!(closed[0].max_depth_reached, 999);
+
+        let (interner, entry_of) = intern_entries(&entries);
+        let graph = Graph::new(&entries, &entry_of, &interner, |entry| {
+            &entry.further_references
+        });
+        let (component_of, components) = strongly_connected_components(&graph);
+        assert_eq!(components.len(), n);
+        // The end of the chain comes first, as it references no other component
+        assert_eq!(component_of[n - 1], 0);
+        assert_eq!(component_of[0], n - 1);
+    }
+
+    #[test]
+    fn test_random_graphs() {
+        // Linear congruential generator, to not depend on an external crate
+        let mut state: u64 = 42;
+        let mut next = |bound: usize| {
+            state = state
+                .wrapping_mul(6364136223846793005)
+                .wrapping_add(1442695040888963407);
+            ((state >> 33) as usize) % bound
+        };
+
+        for _ in 0..50 {
+            let n = 1 + next(40);
+            let bibkeys: Vec<String> = (0..n + 5).map(|i| format!("k{}", i)).collect();
+            let mut references = || {
+                (0..next(4))
+                    .map(|_| bibkeys[next(n + 5)].as_str())
+                    .collect::<Vec<_>>()
+            };
+            let entries: Vec<RustedBibEntry> = (0..n)
+                .map(|i| create_rusted_bibentry(&bibkeys[i], references(), references()))
+                .collect();
+
+            assert_same_as_t_close(&entries);
+        }
+    }
+
+    #[test]
+    fn test_component_closures_stop_when_the_report_fails() {
+        // A chain, with one component per level
+        let bibkeys: Vec<String> = (0..10).map(|i| format!("k{}", i)).collect();
+        let entries: Vec<RustedBibEntry> = (0..10)
+            .map(|i| {
+                create_rusted_bibentry(
+                    &bibkeys[i],
+                    bibkeys[i + 1..]
+                        .iter()
+                        .take(1)
+                        .map(|s| s.as_str())
+                        .collect(),
+                    vec![],
+                )
+            })
+            .collect();
+        let (interner, entry_of) = intern_entries(&entries);
+        let graph = Graph::new(&entries, &entry_of, &interner, |entry| {
+            &entry.further_references
+        });
+        let (component_of, components) = strongly_connected_components(&graph);
+
+        let mut calls = 0;
+        let mut report = ThrottledReport::new(
+            |done: usize| {
+                assert_eq!(done, 0);
+                calls += 1;
+                if calls == 3 {
+                    Err("interrupted")
+                } else {
+                    Ok(())
+                }
+            },
+            Duration::ZERO,
+        );
+        let result = component_closures(&graph, &component_of, &components, 1, &mut report);
+
+        assert_eq!(result, Err("interrupted"));
+        assert_eq!(calls, 3);
+    }
+
+    #[test]
+    fn test_threads_give_the_same_closures() {
+        // A wide graph, for the levels of the condensation to be split among the threads
+        let n = 20_000;
+        let bibkeys: Vec<String> = (0..n).map(|i| format!("k{}", i)).collect();
+        let entries: Vec<RustedBibEntry> = (0..n)
+            .map(|i| {
+                let references = vec![bibkeys[i / 2].as_str(), bibkeys[i / 3].as_str()];
+                create_rusted_bibentry(&bibkeys[i], references.clone(), references[..1].to_vec())
+            })
+            .collect();
+
+        let expected = closures(&entries, 1);
+        for threads in [2, 8] {
+            for (closed, expected) in closures(&entries, threads).iter().zip(&expected) {
+                assert_eq!(format!("{:?}", closed), format!("{:?}", expected));
+            }
+        }
+    }
+}
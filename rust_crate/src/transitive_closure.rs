@@ -2,6 +2,7 @@ use pyo3::prelude::*;
 use std::collections::{HashMap, HashSet, VecDeque};
 
 use crate::models::{Bibkey, RustedBibEntry, TransitivelyClosedBibEntry};
+use crate::parallel::{parallel_map, thread_count};
 
 #[pyfunction]
 pub fn find_all_repeated_bibentries(entries: Vec<RustedBibEntry>) -> Vec<RustedBibEntry> {
@@ -133,26 +134,46 @@ pub fn t_close(
     closed_entry
 }
 
+/// Report the progress of a closure computation to the optional Python callback, as
+/// `progress(done, total)`, and stop the computation on a signal (e.g., Ctrl-C).
+pub fn report_progress(progress: Option<&PyObject>, done: usize, total: usize) -> PyResult<()> {
+    Python::with_gil(|py| {
+        py.check_signals()?;
+        if let Some(callback) = progress {
+            callback.call1(py, (done, total))?;
+        }
+        Ok(())
+    })
+}
+
+/// Closures of the entries, on `threads` threads (one per core by default), with the GIL released.
+/// `progress`, if given, is called with the number of entries done and the total, at most once per
+/// second, and once at the end.
 #[pyfunction]
+#[pyo3(signature = (entries, threads=None, progress=None))]
 pub fn compute_transitive_closures(
     entries: Vec<RustedBibEntry>,
     py: Python<'_>,
+    threads: Option<usize>,
+    progress: Option<PyObject>,
 ) -> PyResult<Vec<TransitivelyClosedBibEntry>> {
     py.check_signals()?;
 
-    // Build a HashMap for quick lookup of entries by bibkey
-    let entries_map: HashMap<Bibkey, &RustedBibEntry> =
-        entries.iter().map(|e| (e.bibkey.clone(), e)).collect();
-
-    let mut memo = HashMap::new();
-    let mut closed_entries = Vec::new();
-
-    for entry in &entries {
-        let closed_entry = t_close(&entry.bibkey, &entries_map, &mut memo);
-        closed_entries.push(closed_entry);
-    }
-
-    Ok(closed_entries)
+    let threads = thread_count(threads);
+    py.allow_threads(|| {
+        // Build a HashMap for quick lookup of entries by bibkey
+        let entries_map: HashMap<Bibkey, &RustedBibEntry> =
+            entries.iter().map(|e| (e.bibkey.clone(), e)).collect();
+
+        // Each thread has its own memo
+        parallel_map(
+            &entries,
+            threads,
+            HashMap::new,
+            |memo, entry| t_close(&entry.bibkey, &entries_map, memo),
+            |done| report_progress(progress.as_ref(), done, entries.len()),
+        )
+    })
 }
 
 /// Testing
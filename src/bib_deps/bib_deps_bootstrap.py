@@ -3,12 +3,17 @@ This module contains the main functions to process a CSV file with BibTeX entrie
 This first wave is not transitively closed, though, so a further recursive step is needed to get the full dependencies.
 """
 
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
-from typing import Callable
+import itertools
+import multiprocessing
+from typing import Callable, Deque, FrozenSet, Generator, Iterable, List, Tuple
 from TexSoup import TexSoup
 from TexSoup.data import TexNode, BraceGroup
 import csv
 
+from src.bib_deps.citet_scanner import CITE_COMMANDS, scan_cite_bibkeys
 from src.bib_deps.data_repository import load_bibentries
 from src.bib_deps.models import BaseBibEntry, CitetResults, CitetField, ParsedBibEntry, ProcessedBibEntry
 from src.sdk.ResultMonad import Err, runwrap, try_except_wrapper
@@ -18,16 +23,19 @@ from src.sdk.utils import get_logger, lginf, remove_extra_whitespace
 lgr = get_logger("Biblio Dependencies -- Bootstrap")
 
 
-@try_except_wrapper(lgr)
-def get_citet_bibkeys(base_bibentry: BaseBibEntry, citet_field: CitetField) -> list[str]:
+# Number of entries sent at once to a worker process, to amortize the cost of passing them between processes
+DEFAULT_CHUNK_SIZE = 500
 
-    data = getattr(base_bibentry, citet_field)
+# Number of chunks submitted in advance per worker process. Bounds the memory used by results waiting to be written in order.
+IN_FLIGHT_CHUNKS_PER_JOB = 2
 
-    try:
-        # Isolate chaos
-        citet_l = TexSoup(data).find_all('citet')
-    except Exception as e:
-        raise ValueError(f"External dependency error! TexSoup failed for '{citet_field}'.\n{e}")
+
+def texsoup_cite_bibkeys(data: str, commands: FrozenSet[str] = CITE_COMMANDS) -> list[str]:
+    """
+    Slow path of `get_citet_bibkeys`, for the fields that the citet scanner finds ambiguous: a full TexSoup parse of the field.
+    """
+
+    citet_l = TexSoup(data).find_all(sorted(commands))
 
     citets_raw_nested = [citet.args for citet in citet_l if isinstance(citet, TexNode)]
     citets_raw_flat = [item for sublist in citets_raw_nested for item in sublist]
@@ -37,6 +45,22 @@ def get_citet_bibkeys(base_bibentry: BaseBibEntry, citet_field: CitetField) -> l
     return citets_s_flat
 
 
+@try_except_wrapper(lgr)
+def get_citet_bibkeys(base_bibentry: BaseBibEntry, citet_field: CitetField) -> list[str]:
+
+    data = getattr(base_bibentry, citet_field)
+
+    citets = scan_cite_bibkeys(data)
+    if citets is not None:
+        return citets
+
+    try:
+        # Isolate chaos
+        return texsoup_cite_bibkeys(data)
+    except Exception as e:
+        raise ValueError(f"External dependency error! TexSoup failed for '{citet_field}'.\n{e}")
+
+
 def parse_bibentry(base_bibentry: BaseBibEntry) -> ParsedBibEntry:
     error_messages = []
 
@@ -97,25 +121,34 @@ def parse_bibentry(base_bibentry: BaseBibEntry) -> ParsedBibEntry:
     )
 
 
-def get_all_bibkeys(all_in_bibentries: list[BaseBibEntry]) -> list[str]:
+def get_all_bibkeys(all_in_bibentries: list[BaseBibEntry]) -> FrozenSet[str]:
+    """
+    Index of the bibkeys of the bibliography, built once, so that resolving a bibkey is a constant-time lookup.
+    """
 
-    all_bibkeys = [row.bibkey for row in all_in_bibentries]
+    all_bibkeys = frozenset(row.bibkey for row in all_in_bibentries)
 
     return all_bibkeys
 
 
-def process_bibentry(parsed_bibentry: ParsedBibEntry, all_bibkeys_list: list[str]) -> ProcessedBibEntry:
-    further_refs = (
-        (bibkey, 0) if bibkey in all_bibkeys_list else (bibkey, 1) for bibkey in parsed_bibentry.further_references_raw
-    )
-    depends_on = (
-        (bibkey, 0) if bibkey in all_bibkeys_list else (bibkey, 1) for bibkey in parsed_bibentry.depends_on_raw
-    )
+def partition_bibkeys(bibkeys: list[str], all_bibkeys: FrozenSet[str]) -> Tuple[list[str], list[str]]:
+    """
+    Split the bibkeys, in a single pass, into the ones found in the bibliography (good) and the others (bad).
+    """
+
+    good: list[str] = []
+    bad: list[str] = []
+    for bibkey in bibkeys:
+        (good if bibkey in all_bibkeys else bad).append(bibkey)
 
-    further_references_good = [bibkey for bibkey, status in further_refs if status == 0]
-    further_references_bad = [bibkey for bibkey, status in further_refs if status == 1]
-    depends_on_good = [bibkey for bibkey, status in depends_on if status == 0]
-    depends_on_bad = [bibkey for bibkey, status in depends_on if status == 1]
+    return good, bad
+
+
+def process_bibentry(parsed_bibentry: ParsedBibEntry, all_bibkeys: FrozenSet[str]) -> ProcessedBibEntry:
+    further_references_good, further_references_bad = partition_bibkeys(
+        parsed_bibentry.further_references_raw, all_bibkeys
+    )
+    depends_on_good, depends_on_bad = partition_bibkeys(parsed_bibentry.depends_on_raw, all_bibkeys)
 
     return ProcessedBibEntry(
         bibkey=parsed_bibentry.bibkey,
@@ -134,7 +167,7 @@ def process_bibentry(parsed_bibentry: ParsedBibEntry, all_bibkeys_list: list[str
 
 def bib_deps_bootstrap_pipe(
     base_bibentry: BaseBibEntry,
-    all_bibkeys_list: list[str],
+    all_bibkeys: FrozenSet[str],
     process_bibentry_curried: Callable[[ParsedBibEntry], ProcessedBibEntry],
 ) -> ProcessedBibEntry:
 
@@ -142,8 +175,73 @@ def bib_deps_bootstrap_pipe(
     return process_bibentry_curried(parse_bibentry(base_bibentry))
 
 
+# Bibkey index of a worker process, set once when the process starts, instead of being sent with every chunk
+_worker_all_bibkeys: FrozenSet[str] = frozenset()
+
+
+def _init_bootstrap_worker(all_bibkeys: FrozenSet[str]) -> None:
+    global _worker_all_bibkeys
+    _worker_all_bibkeys = all_bibkeys
+
+
+def _bootstrap_chunk(chunk: Tuple[BaseBibEntry, ...]) -> List[ProcessedBibEntry]:
+    return [process_bibentry(parse_bibentry(row), _worker_all_bibkeys) for row in chunk]
+
+
+def bootstrap_bibentries(
+    rows: Iterable[BaseBibEntry],
+    all_bibkeys: FrozenSet[str],
+    jobs: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Generator[ProcessedBibEntry, None, None]:
+    """
+    Bootstrap the entries, and yield them in the order of the input, as they are ready.
+
+    With more than one job, the entries are parsed and processed in chunks of `chunk_size` on a pool of `jobs` processes, each of them receiving the bibkey index only once, when it starts. The entries are consumed lazily, with a bounded number of chunks in flight.
+    """
+    frame = "bootstrap_bibentries"
+
+    if jobs < 1 or chunk_size < 1:
+        raise ValueError("The number of jobs and the chunk size must be positive integers.")
+
+    if jobs == 1:
+        process_bibentry_curried: Callable[[ParsedBibEntry], ProcessedBibEntry] = lambda x: process_bibentry(
+            x, all_bibkeys
+        )
+        for row in rows:
+            yield bib_deps_bootstrap_pipe(row, all_bibkeys, process_bibentry_curried)
+        return None
+
+    lginf(frame, f"Processing with {jobs} processes, in chunks of {chunk_size} entries...", lgr)
+
+    # Not forked, as forking a process with threads (e.g., those of the logging handlers) may deadlock
+    executor = ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_init_bootstrap_worker,
+        initargs=(all_bibkeys,),
+    )
+    pending: Deque[Future[List[ProcessedBibEntry]]] = deque()
+
+    try:
+        for chunk in itertools.batched(rows, chunk_size):
+            pending.append(executor.submit(_bootstrap_chunk, chunk))
+
+            if len(pending) >= jobs * IN_FLIGHT_CHUNKS_PER_JOB:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+    finally:
+        # If the consumer stops early, don't start the chunks that are still waiting
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 @try_except_wrapper(lgr)
-def main_bootstrap(filename: str, encoding: str | None, output_filename: str) -> None:
+def main_bootstrap(
+    filename: str, encoding: str | None, output_filename: str, jobs: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> None:
 
     frame = "main_bootstrap"
     start_datetime = datetime.now()
@@ -156,8 +254,7 @@ def main_bootstrap(filename: str, encoding: str | None, output_filename: str) ->
     all_bibkeys = get_all_bibkeys(rows)
 
     lginf(frame, "Processing the entries [3/5]", lgr)
-    process_bibentry_curried: Callable[[ParsedBibEntry], ProcessedBibEntry] = lambda x: process_bibentry(x, all_bibkeys)
-    processed_rows = (bib_deps_bootstrap_pipe(row, all_bibkeys, process_bibentry_curried) for row in rows)
+    processed_rows = bootstrap_bibentries(rows, all_bibkeys, jobs, chunk_size)
 
     lginf(frame, f"Getting fieldnames for final CSV [4/5]", lgr)
     fieldnames = list(BaseBibEntry.__annotations__.keys()) + list(ProcessedBibEntry.__annotations__.keys())
@@ -165,26 +262,10 @@ def main_bootstrap(filename: str, encoding: str | None, output_filename: str) ->
     lginf(frame, f"Writing the output to '{output_filename}' [5/5]", lgr)
     with open(output_filename, 'w', encoding=encoding) as f:
 
-        result_evaluated = tuple(
-            {
-                "bibkey": row.bibkey,
-                "title": row.title,
-                "notes": row.notes,
-                "crossref": row.crossref,
-                "further_note": row.further_note,
-                "further_references_good": row.further_references_good,
-                "further_references_bad": row.further_references_bad,
-                "depends_on_good": row.depends_on_good,
-                "depends_on_bad": row.depends_on_bad,
-                "status": row.status,
-                "error_message": row.error_message,
-            }
-            for row in processed_rows
-        )
-
+        # Written as the entries are processed, in the order of the input
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows(result_evaluated)
+        writer.writerows(row.dict_dump() for row in processed_rows)
 
     end_datetime = datetime.now()
     total_time = end_datetime - start_datetime
@@ -215,12 +296,29 @@ def cli_main_bootstrap() -> None:
 
     parser.add_argument("-o", "--output-filename", type=str, help="The output CSV file.", required=True)
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of processes parsing the entries in parallel. Defaults to 1 (no parallelism).",
+        default=1,
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help=f"Number of entries sent at once to each process, with --jobs. Defaults to {DEFAULT_CHUNK_SIZE}.",
+        default=DEFAULT_CHUNK_SIZE,
+    )
+
     args = parser.parse_args()
 
     main_bootstrap(
         filename=args.bibliography_file,
         encoding=args.encoding,
         output_filename=args.output_filename,
+        jobs=args.jobs,
+        chunk_size=args.chunk_size,
     )
 
 
@@ -5,24 +5,46 @@ Uses the bootstrap wave of dependencies obtained in the first step, and a custom
 
 import csv
 from datetime import datetime
-from typing import Callable
 from rust_crate import (
     RustedBibEntry,
     find_all_repeated_bibentries,
     compute_transitive_closures,
+    compute_transitive_closures_scc,
 )
 
-from src.bib_deps.bib_deps_bootstrap import bib_deps_bootstrap_pipe, get_all_bibkeys, process_bibentry
+from src.bib_deps.bib_deps_bootstrap import DEFAULT_CHUNK_SIZE, bootstrap_bibentries, get_all_bibkeys
 from src.bib_deps.data_repository import load_bibentries
 from src.sdk.ResultMonad import runwrap, try_except_wrapper
-from src.bib_deps.models import ParsedBibEntry, ProcessedBibEntry, PyTransitivelyClosedBibEntry
+from src.bib_deps.models import PyTransitivelyClosedBibEntry
 from src.sdk.utils import get_logger, lginf
 
 lgr = get_logger("Biblio Dependencies -- Recursive")
 
 
+# Engines computing the transitive closures: a traversal per entry, or once per strongly connected component
+CLOSURE_ENGINES = {
+    "bfs": compute_transitive_closures,
+    "scc": compute_transitive_closures_scc,
+}
+
+
+def log_closure_progress(done: int, total: int) -> None:
+    """
+    Progress callback of the closure engines, which call it at a bounded rate.
+    """
+    lginf("compute_transitive_closures", f"{done}/{total} entries closed ({done / max(total, 1):.0%})", lgr)
+
+
 @try_except_wrapper(lgr)
-def main_recursive(filename: str, encoding: str | None, output_filename: str) -> None:
+def main_recursive(
+    filename: str,
+    encoding: str | None,
+    output_filename: str,
+    jobs: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    closure_engine: str = "bfs",
+    threads: int | None = None,
+) -> None:
 
     frame = "main_recursive"
     start_datetime = datetime.now()
@@ -36,8 +58,7 @@ def main_recursive(filename: str, encoding: str | None, output_filename: str) ->
     all_bibkeys = get_all_bibkeys(rows)
 
     lginf(frame, f"Bootstrapping the entries [3/{ns}]", lgr)
-    process_bibentry_curried: Callable[[ParsedBibEntry], ProcessedBibEntry] = lambda x: process_bibentry(x, all_bibkeys)
-    processed_rows = (bib_deps_bootstrap_pipe(row, all_bibkeys, process_bibentry_curried) for row in rows)
+    processed_rows = bootstrap_bibentries(rows, all_bibkeys, jobs, chunk_size)
 
     rusted_bibentries = [
         RustedBibEntry(
@@ -63,8 +84,10 @@ def main_recursive(filename: str, encoding: str | None, output_filename: str) ->
             f.write("\n".join(buffer))
         return None
 
-    lginf(frame, f"Computing transitive closures [5/{ns}]", lgr)
-    bibentries_with_closures = compute_transitive_closures(rusted_bibentries)
+    lginf(frame, f"Computing transitive closures with the '{closure_engine}' engine [5/{ns}]", lgr)
+    bibentries_with_closures = CLOSURE_ENGINES[closure_engine](
+        rusted_bibentries, threads=threads, progress=log_closure_progress
+    )
 
     lginf(frame, f"Getting fieldnames for final CSV [6/{ns}]", lgr)
     fieldnames = list(PyTransitivelyClosedBibEntry.__annotations__.keys())
@@ -104,9 +127,48 @@ def cli_main() -> None:
 
     parser.add_argument("-o", "--output-filename", type=str, help="The output CSV file.", required=True)
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of processes parsing the entries in parallel. Defaults to 1 (no parallelism).",
+        default=1,
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help=f"Number of entries sent at once to each process, with --jobs. Defaults to {DEFAULT_CHUNK_SIZE}.",
+        default=DEFAULT_CHUNK_SIZE,
+    )
+
+    parser.add_argument(
+        "--closure-engine",
+        type=str,
+        choices=list(CLOSURE_ENGINES),
+        help="How to compute the transitive closures: a traversal per entry ('bfs'), or once per strongly connected component of the references ('scc'). Both give the same closures, up to the order of their bibkeys. Defaults to 'bfs'.",
+        default="bfs",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        help="Number of threads computing the transitive closures. Defaults to one per core.",
+        required=False,
+    )
+
     args = parser.parse_args()
 
-    main_recursive(args.input_csv, args.encoding, args.output_filename)
+    main_recursive(
+        args.input_csv,
+        args.encoding,
+        args.output_filename,
+        args.jobs,
+        args.chunk_size,
+        args.closure_engine,
+        args.threads,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+"""
+Linear-time scanner of the citation commands (`\\citet{...}`, `\\citep{...}`, ...) of a LaTeX field, returning the bibkeys in their brace-group arguments.
+
+It follows the way TexSoup reads these commands, so that both give the same bibkeys (although in the order of the text, while TexSoup gives the ones nested in groups last):
+- The arguments of a command are the brace groups `{...}` and bracket groups `[...]` that follow it, separated by whitespace without a blank line. Only the brace groups hold bibkeys, raw (nested braces and escapes like `\\}` included).
+- Comments (`%` to the end of the line) and escaped characters (`\\%`, `\\{`, `\\\\`, ...) are skipped.
+- Starred commands (`\\citet*`) are other commands.
+
+When the scanner can't be sure of what TexSoup would do (unbalanced groups, comments or commands inside the arguments, verbatim text), it reports the text as ambiguous, and the caller falls back to TexSoup.
+"""
+
+import re
+from typing import FrozenSet, List
+
+from src.sdk.utils import get_logger
+
+
+lgr = get_logger("Biblio Dependencies -- Citet Scanner")
+
+
+CITE_COMMANDS = frozenset({"citet", "citep", "citealt", "citealp", "citeauthor", "citeyear", "citeyearpar"})
+
+_SPECIAL_RE = re.compile(r"[\\%]")
+_COMMAND_NAME_RE = re.compile(r"[a-zA-Z]+\*?")
+_ARGS_SEPARATOR_RE = re.compile(r"[ \t\r\n]*")
+_BRACE_GROUP_SPECIAL_RE = re.compile(r"[\\{}%]")
+_BRACKET_GROUP_SPECIAL_RE = re.compile(r"[\\{}\[\]%]")
+_VERBATIM_RE = re.compile(r"\\verb|\\begin\s*\{\s*(?:verbatim|comment|lstlisting|minted)")
+
+
+class _AmbiguousLatex(ValueError):
+    pass
+
+
+def _skip_escape(text: str, pos: int) -> int:
+    """
+    Position after the command or escaped character starting with the backslash at `pos`.
+    """
+    name = _COMMAND_NAME_RE.match(text, pos + 1)
+    return name.end() if name is not None else pos + 2
+
+
+def _brace_group_end(text: str, pos: int) -> int:
+    """
+    Position after the brace group opening at `pos`.
+    """
+    depth = 0
+    while (special := _BRACE_GROUP_SPECIAL_RE.search(text, pos)) is not None:
+        pos = special.end()
+        match special.group():
+            case "{":
+                depth += 1
+            case "}":
+                depth -= 1
+                if depth == 0:
+                    return pos
+            case "\\":
+                if _COMMAND_NAME_RE.match(text, pos) is not None:
+                    # TexSoup would look for citations inside the argument
+                    raise _AmbiguousLatex(f"Command inside an argument, at offset {pos - 1}.")
+                pos += 1
+            case _:
+                raise _AmbiguousLatex(f"Comment inside an argument, at offset {pos - 1}.")
+
+    raise _AmbiguousLatex("Unterminated brace group.")
+
+
+def _bracket_group_end(text: str, pos: int) -> int:
+    """
+    Position after the bracket group opening at `pos`. Brackets inside braces don't count.
+    """
+    depth = 0
+    pos += 1
+    while (special := _BRACKET_GROUP_SPECIAL_RE.search(text, pos)) is not None:
+        pos = special.end()
+        match special.group():
+            case "{":
+                depth += 1
+            case "}":
+                depth -= 1
+            case "]" if depth == 0:
+                return pos
+            case "[" if depth == 0:
+                raise _AmbiguousLatex(f"Nested bracket group, at offset {pos - 1}.")
+            case "\\":
+                pos = _skip_escape(text, pos - 1)
+            case "%":
+                raise _AmbiguousLatex(f"Comment inside an argument, at offset {pos - 1}.")
+
+    raise _AmbiguousLatex("Unterminated bracket group.")
+
+
+def _scan_arguments(text: str, pos: int, commands: FrozenSet[str], brace_groups: List[str]) -> int:
+    """
+    Append the content of the brace-group arguments of the command ending at `pos` to `brace_groups`, and return the position after the arguments.
+    """
+    while True:
+        separator = _ARGS_SEPARATOR_RE.match(text, pos)
+        assert separator is not None
+        if separator.group().count("\n") > 1 or separator.end() == len(text):
+            return pos
+
+        start = separator.end()
+        match text[start]:
+            case "{":
+                pos = _brace_group_end(text, start)
+                brace_groups.append(text[start + 1 : pos - 1])
+            case "[":
+                # Citations in optional arguments (e.g., '\citet[see also \citealt{x}]{y}') count as well
+                pos = _bracket_group_end(text, start)
+                brace_groups.extend(_scan_brace_groups(text[start + 1 : pos - 1], commands))
+            case "<":
+                raise _AmbiguousLatex(f"Angle bracket argument, at offset {start}.")
+            case _:
+                return pos
+
+
+def scan_cite_bibkeys(text: str, commands: FrozenSet[str] = CITE_COMMANDS) -> List[str] | None:
+    """
+    Bibkeys of the citation commands of the text, in order, split on commas and stripped.
+    None if the text is ambiguous, i.e., it may not be read the same way by TexSoup.
+    """
+    if "\\" not in text:
+        return []
+
+    try:
+        brace_groups = _scan_brace_groups(text, commands)
+    except _AmbiguousLatex as e:
+        lgr.debug(f"Ambiguous LaTeX, falling back to TexSoup: {e}")
+        return None
+
+    return [bibkey.strip() for brace_group in brace_groups for bibkey in brace_group.split(",")]
+
+
+def _scan_brace_groups(text: str, commands: FrozenSet[str]) -> List[str]:
+    if _VERBATIM_RE.search(text) is not None:
+        raise _AmbiguousLatex("Verbatim text.")
+
+    brace_groups: List[str] = []
+    pos = 0
+    while (special := _SPECIAL_RE.search(text, pos)) is not None:
+        pos = special.start()
+
+        if special.group() == "%":
+            newline = text.find("\n", pos)
+            pos = len(text) if newline == -1 else newline + 1
+            continue
+
+        name = _COMMAND_NAME_RE.match(text, pos + 1)
+        if name is None:
+            pos += 2
+            continue
+
+        pos = name.end()
+        if name.group() in commands:
+            pos = _scan_arguments(text, pos, commands, brace_groups)
+
+    return brace_groups
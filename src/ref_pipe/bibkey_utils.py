@@ -1,4 +1,9 @@
-from typing import Iterable, Literal, NamedTuple
+import array
+import mmap
+import re
+from typing import Iterable, Literal, NamedTuple, Sequence
+
+import polars as pl
 
 from src.sdk.utils import get_logger, remove_extra_whitespace
 
@@ -21,82 +26,147 @@ class BibkeyError(NamedTuple):
         return f"'{self.text}' at line {self.position} --- '{self.error}'"
 
 
+# '<first_author>[-<other_authors>]:<year><year_suffix>', the year being made of digits. Without digits, the whole part after ':' is the year (e.g., 'unpub').
+BIBKEY_PATTERN = r"^(?P<first_author>[^:\-]*)(?:-(?P<other_authors>[^:\-]*))?:(?P<year>\d*)(?P<year_suffix>[^:]*)$"
+BIBKEY_RE = re.compile(BIBKEY_PATTERN)
+
+# Same structure as `BIBKEY_PATTERN`, without the captures, for the vectorized checks
+_BIBKEY_STRUCTURE_PATTERN = r"^[^:\-]*(?:-[^:\-]*)?:[^:]*$"
+_YEAR_SUFFIX_PREFIX_PATTERN = r"^[^:]*:\d*"
+_LONG_YEAR_SUFFIX_PATTERN = r":\d*[^\d:][^:]+$"
+
+# Number of bibkeys with an unexpected year suffix listed in the warning about them
+MAX_LISTED_WARNINGS = 20
+
+
+def _bibkey_error_message(text: str) -> str:
+    parts = text.split(":")
+    if len(parts) != 2:
+        return f"Unexpected number of bibkey parts for '{text}': '{parts}'"
+
+    return f"Unexpected bibkey author parts for '{text}': '{parts[0].split('-')}'"
+
+
+def _is_unexpected_year_suffix(year_suffix: str) -> bool:
+    return len(year_suffix) > 1 and "unpub" not in year_suffix and "forthcoming" not in year_suffix
+
+
+def split_bibkey(text: str) -> Bibkey | None:
+    """
+    Return the parts of the bibkey, or None if it doesn't have the standard structure (see `BIBKEY_PATTERN`).
+    Unlike `parse_bibkey`, doesn't warn about unexpected year suffixes.
+    """
+
+    match = BIBKEY_RE.fullmatch(text)
+    if match is None:
+        return None
+
+    first_author, other_authors, year, year_suffix = match.groups()
+
+    if year == "":
+        return Bibkey(first_author=first_author, other_authors=other_authors, year=year_suffix, year_suffix="")
+
+    return Bibkey(first_author=first_author, other_authors=other_authors, year=int(year), year_suffix=year_suffix)
+
+
 def parse_bibkey(text: str, text_position_d: dict[str, int]) -> Bibkey | BibkeyError:
     """
     Return either a Bibkey object, or a BibkeyError object to indicate a parsing error.
+    Single-key counterpart of `classify_bibkeys`.
     """
 
-    try:
-        parts = text.split(":")
-        if len(parts) != 2:
-            raise ValueError(f"Unexpected number of bibkey parts for '{text}': '{parts}'")
-
-        author_parts = parts[0].split("-")
-        year_parts = parts[1]
-
-        if len(author_parts) == 1:
-            first_author = author_parts[0]
-            other_authors = None
-        elif len(author_parts) == 2:
-            first_author = author_parts[0]
-            other_authors = author_parts[1]
-        else:
-            raise ValueError(f"Unexpected bibkey author parts for '{text}': '{author_parts}'")
-
-        char_index_type_d = {i: (char, char.isdigit()) for i, char in enumerate(year_parts)}
-
-        year_l: list[str] = []
-        int_breakpoint = None
-        for value in char_index_type_d.items():
-            i, (char, is_digit) = value
-            if is_digit:
-                year_l.append(char)
-                int_breakpoint = i
-            else:
-                break
-
-        if year_l != []:
-            year_int = int(f"{''.join(year_l)}")
-        else:
-            year_int = None
-
-        if int_breakpoint is not None:
-            year_suffix = year_parts[int_breakpoint + 1 :]
-
-        else:
-            # all characters are non-digits
-            year_suffix = "".join(year_parts)
-
-        if year_suffix != "" and year_suffix not in ["unpub", "forthcoming"]:
-            if len(year_suffix) > 1:
-                if "unpub" not in year_suffix and "forthcoming" not in year_suffix:
-                    lgr.warning(f"Unexpected year suffix for '{text}': '{year_suffix}'")
-            elif len(year_suffix) == 1:
-                if year_suffix.isdigit():
-                    lgr.warning(f"Unexpected year suffix for '{text}': '{year_suffix}'")
-
-        if year_int is None and year_suffix is None:
-            raise ValueError(f"Could not parse year for '{text}': '{year_parts}'")
-
-        if year_int is None:
-            return Bibkey(first_author=first_author, other_authors=other_authors, year=year_suffix, year_suffix="")
-
-        else:
-            return Bibkey(
-                first_author=first_author, other_authors=other_authors, year=year_int, year_suffix=year_suffix
-            )
-
-    except ValueError as e:
-        return BibkeyError(text, text_position_d[text] + 1, str(e))
+    bibkey = split_bibkey(text)
+    if bibkey is None:
+        return BibkeyError(text, text_position_d[text] + 1, _bibkey_error_message(text))
+
+    # Without digits, the suffix was taken as the year
+    year_suffix = bibkey.year if isinstance(bibkey.year, str) else bibkey.year_suffix
+    if _is_unexpected_year_suffix(year_suffix):
+        lgr.warning(f"Unexpected year suffix for '{text}': '{year_suffix}'")
+
+    return bibkey
+
+
+def classify_bibkeys(bibkeys: pl.Series | Sequence[str], lines: pl.Series | Sequence[int]) -> pl.DataFrame:
+    """
+    Check the structure of all the bibkeys in one vectorized pass, given the (1-based) line number of each of them.
+
+    Returns the table of the problems found, in the order of the input, with the columns:
+    - 'line': line number of the bibkey.
+    - 'bibkey': the bibkey.
+    - 'severity': 'error' for bibkeys without the standard structure (see `BIBKEY_PATTERN`), 'warning' for bibkeys with an unexpected year suffix.
+    - 'message': description of the problem, as in `parse_bibkey`.
+    """
+
+    table = pl.DataFrame(
+        {"line": pl.Series(lines, dtype=pl.Int64), "bibkey": pl.Series(bibkeys, dtype=pl.String)}
+    ).with_columns(
+        valid=pl.col("bibkey").str.contains(_BIBKEY_STRUCTURE_PATTERN),
+    )
+
+    invalid = table.filter(~pl.col("valid"))
+    errors = invalid.select(
+        "line",
+        "bibkey",
+        severity=pl.lit("error"),
+        message=pl.Series([_bibkey_error_message(bibkey) for bibkey in invalid["bibkey"]], dtype=pl.String),
+    )
+
+    year_suffix = pl.col("bibkey").str.replace(_YEAR_SUFFIX_PREFIX_PATTERN, "")
+    warnings = (
+        table.filter(pl.col("valid") & pl.col("bibkey").str.contains(_LONG_YEAR_SUFFIX_PATTERN))
+        .filter(
+            ~year_suffix.str.contains("unpub", literal=True) & ~year_suffix.str.contains("forthcoming", literal=True)
+        )
+        .select(
+            "line",
+            "bibkey",
+            severity=pl.lit("warning"),
+            message=pl.format("Unexpected year suffix for '{}': '{}'", "bibkey", year_suffix),
+        )
+    )
+
+    return pl.concat([errors, warnings]).sort("line", maintain_order=True)
+
+
+def _warn_unexpected_year_suffixes(problems: pl.DataFrame) -> None:
+    """
+    Log a single warning for all the bibkeys with an unexpected year suffix.
+    """
+    warnings = problems.filter(pl.col("severity") == "warning")
+    if warnings.height == 0:
+        return None
+
+    listed = "\n".join(
+        f"line {line}: {message}"
+        for line, message in warnings.head(MAX_LISTED_WARNINGS).select("line", "message").iter_rows()
+    )
+    more = f"\n... and {warnings.height - MAX_LISTED_WARNINGS} more." if warnings.height > MAX_LISTED_WARNINGS else ""
+    lgr.warning(f"Found {warnings.height} bibkeys with an unexpected year suffix:\n{listed}{more}")
+
+    return None
+
+
+def _bibkey_errors(problems: pl.DataFrame) -> tuple[BibkeyError, ...]:
+    return tuple(
+        BibkeyError(bibkey, line, message)
+        for line, bibkey, message in problems.filter(pl.col("severity") == "error")
+        .select("line", "bibkey", "message")
+        .iter_rows()
+    )
 
 
 def validate_bibkeys(bibkeys: Iterable[str], bibkey_position_d: dict[str, int]) -> None:
     """
     Validates an array of bibkeys. Raises a ValueError if any of them is invalid.
+    Bibkeys without a position are reported at line 0.
     """
 
-    parse_result = tuple(parse_bibkey(bk, bibkey_position_d) for bk in bibkeys)
-    error_results = tuple(r for r in parse_result if isinstance(r, BibkeyError))
+    bibkeys = tuple(bibkeys)
+    problems = classify_bibkeys(bibkeys, [bibkey_position_d.get(bibkey, -1) + 1 for bibkey in bibkeys])
+    _warn_unexpected_year_suffixes(problems)
+
+    error_results = _bibkey_errors(problems)
 
     if error_results:
         error_results_str = "\n".join(str(error_result) for error_result in error_results)
@@ -106,37 +176,148 @@ def validate_bibkeys(bibkeys: Iterable[str], bibkey_position_d: dict[str, int])
         return None
 
 
-def _extract_bibkey(line: str) -> str:
-    bracket_split = line.split("{")
-    comma_split = bracket_split[1].split(",")
-    bibkey = comma_split[0]
-    return remove_extra_whitespace(bibkey)
+def _extract_bibkey(line: bytes) -> str:
+    """
+    Extract the bibkey of a line of the bib file, i.e. what comes between its first '{' and the next ',' (or '{').
+    """
+    start = line.index(b"{") + 1
+    end = len(line)
+    for separator in (b",", b"{"):
+        separator_pos = line.find(separator, start)
+        if separator_pos != -1:
+            end = min(end, separator_pos)
+
+    return remove_extra_whitespace(line[start:end].decode("utf-8"))
+
+
+# The content is indexed in chunks of about this size, cut at line ends
+INDEX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# What comes between the first '{' of a line and the next ',' (or '{'), as in `_extract_bibkey`
+_BIBKEY_EXTRACT_PATTERN = r"^[^{]*\{([^,{]*)"
+
+
+def _extract_bibkey_or_none(line: bytes) -> str | None:
+    try:
+        return _extract_bibkey(line)
+    except ValueError:
+        return None
+
+
+def _chunk_end(content: bytes | mmap.mmap, start: int) -> int:
+    end = start + INDEX_CHUNK_SIZE
+    if end >= len(content):
+        return len(content)
+
+    newline_pos = content.find(b"\n", end)
+    return len(content) if newline_pos == -1 else newline_pos + 1
+
+
+def _index_chunk(chunk: bytes, start: int) -> tuple[pl.Series, pl.Series]:
+    """
+    Byte offsets and bibkeys of the lines of a chunk of the content starting at the given offset.
+    """
+    lines = chunk.split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+
+    binary = pl.Series(lines, dtype=pl.Binary)
+    offsets = (binary.bin.size() + 1).cum_sum().shift(1, fill_value=0) + start
+
+    try:
+        text = binary.cast(pl.String)
+    except pl.exceptions.ComputeError:
+        # Some lines are not valid UTF-8 as a whole: only their bibkey has to be
+        return offsets.cast(pl.UInt64), pl.Series([_extract_bibkey_or_none(line) for line in lines], dtype=pl.String)
+
+    bibkeys = text.str.extract(_BIBKEY_EXTRACT_PATTERN, 1).str.replace_all(r"\s+", " ").str.strip_chars()
+
+    return offsets.cast(pl.UInt64), bibkeys
 
 
-def load_validate_bibliography_bibkeys(bibliography_file: str) -> tuple[frozenset[str], dict[str, int]]:
-    with open(bibliography_file, "r") as f:
-        bibkey_linenum_d = {_extract_bibkey(line): i for i, line in enumerate(f.readlines())}
+def _index_lines(content: bytes | mmap.mmap) -> tuple[pl.Series, pl.Series]:
+    """
+    Byte offsets and bibkeys (null for lines without a bibkey) of all the lines of the content.
+    """
+    offsets: list[pl.Series] = [pl.Series([], dtype=pl.UInt64)]
+    bibkeys: list[pl.Series] = [pl.Series([], dtype=pl.String)]
 
-    with open(bibliography_file, "r") as f:
-        bibkeys = frozenset({_extract_bibkey(line) for line in f.readlines()})
+    start = 0
+    while start < len(content):
+        end = _chunk_end(content, start)
+        chunk_offsets, chunk_bibkeys = _index_chunk(content[start:end], start)
+        offsets.append(chunk_offsets)
+        bibkeys.append(chunk_bibkeys)
+        start = end
 
-    with open(bibliography_file, "r") as f:
-        bibliography_len = len(f.readlines())
+    return pl.concat(offsets), pl.concat(bibkeys)
 
-    bibkeys_len = len(bibkeys)
+
+def index_validate_bibliography(
+    content: bytes | mmap.mmap,
+) -> tuple[frozenset[str], dict[str, int], array.array[int]]:
+    """
+    Index the content of a bib file: returns its bibkeys, the line number of each of them, and the byte offsets of the lines (followed by the size of the content).
+    The lines are split and their bibkeys extracted and validated as whole columns (see `classify_bibkeys`).
+
+    Raises a ValueError with all the problems found (lines without bibkey, duplicated bibkeys, bibkeys without the standard structure).
+    """
+
+    offsets, bibkeys = _index_lines(content)
+
+    line_offsets: array.array[int] = array.array("Q", offsets.to_list())
+    line_offsets.append(len(content))
+
+    lines = pl.int_range(1, bibkeys.len() + 1, dtype=pl.Int64, eager=True)
+    lines_without_bibkey: list[int] = lines.filter(bibkeys.is_null()).to_list() if bibkeys.has_nulls() else []
+
+    # Usually, every line has a new bibkey, and the lines are the bibkeys' as they are
+    is_first = bibkeys.is_first_distinct() & bibkeys.is_not_null()
+    first_found = pl.DataFrame({"line": lines, "bibkey": bibkeys})
+    duplicated = pl.DataFrame(schema={"line": pl.Int64, "bibkey": pl.String, "first_line": pl.Int64})
+    if not is_first.all():
+        table = first_found.with_columns(is_first=is_first)
+        first_found = table.filter(pl.col("is_first")).drop("is_first")
+        duplicated = (
+            table.filter(~pl.col("is_first") & pl.col("bibkey").is_not_null())
+            .drop("is_first")
+            .join(first_found.rename({"line": "first_line"}), on="bibkey", how="left")
+            .sort("line")
+        )
+
+    bibkey_linenum_d = dict(zip(first_found["bibkey"].to_list(), (first_found["line"] - 1).to_list()))
+
+    problems = classify_bibkeys(first_found["bibkey"], first_found["line"])
+    _warn_unexpected_year_suffixes(problems)
+
+    duplicated_bibkeys = tuple(
+        BibkeyError(bibkey, line, f"duplicated, first found at line {first_line}")
+        for line, bibkey, first_line in duplicated.select("line", "bibkey", "first_line").iter_rows()
+    )
+    parsing_errors = _bibkey_errors(problems)
 
     # Sanitize bibliography
-    if bibkeys_len != len(bibkey_linenum_d):
-        raise ValueError(
-            f"The number of bibkeys and the number of line numbers should be the same. This means that bibkeys are not unique. Found {len(bibkeys)} bibkeys but {len(bibkey_linenum_d)} line numbers in the bibliography. Fix the consistency of your bibliography and try again."
+    errors: list[str] = []
+
+    if duplicated_bibkeys:
+        errors.append(
+            f"Found {len(duplicated_bibkeys)} duplicated bibkeys. Bibkeys must be unique:\n"
+            + "\n".join(str(error) for error in duplicated_bibkeys)
         )
 
-    if bibkeys_len != bibliography_len:
-        raise ValueError(
-            f"The number of bibkeys ({bibkeys_len}) should be the same as the number of lines in the bibliography ({bibliography_len}). This means that some lines didn't contain bibkeys at all, or your bibliography file is not a valid bib file. Fix the consistency of your bibliography and try again."
+    if lines_without_bibkey:
+        errors.append(
+            f"Found {len(lines_without_bibkey)} lines without a bibkey, at lines: {', '.join(str(n) for n in lines_without_bibkey)}. Each line of the bibliography must be a single bib entry."
         )
 
     # Assert that all bibkeys have the standard structure
-    validate_bibkeys(bibkeys, bibkey_linenum_d)
+    if parsing_errors:
+        errors.append(
+            f"Found {len(parsing_errors)} errors while parsing bibkeys:\n"
+            + "\n".join(str(error) for error in parsing_errors)
+        )
+
+    if errors:
+        raise ValueError("\n".join(errors) + "\nFix the consistency of your bibliography and try again.")
 
-    return bibkeys, bibkey_linenum_d
+    return frozenset(bibkey_linenum_d.keys()), bibkey_linenum_d, line_offsets
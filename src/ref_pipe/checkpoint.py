@@ -0,0 +1,219 @@
+"""
+Crash-safe checkpointing of a run: every bibentity is appended to a journal (JSON lines) as soon as its result has been produced, and the journal is flushed to disk each time.
+
+Each record holds the bibentity's ID, key and URL endpoint, its status, its output files, a content hash of its inputs (its bibkey sets, their `.bib` lines, the CSL file and the container image, see `Manifest`), and a hash of its output files.
+When resuming, the bibentities with a successful record whose content hash is the same, and whose output files are unchanged, are skipped and their rows merged into the new report.
+"""
+
+import hashlib
+import json
+import os
+from typing import IO, Dict, NamedTuple, Tuple
+
+from src.sdk.ResultMonad import Err, Ok
+from src.sdk.utils import get_logger, lginf
+from src.ref_pipe.dedup import reference_set_key
+from src.ref_pipe.incremental import Manifest, TPreviousReportKey, hash_file
+from src.ref_pipe.models import BibEntity, BibEntityWithHTML, RefHTML, THTMLReport, TSupportedEntity
+
+
+lgr = get_logger("Checkpoint")
+
+
+class CheckpointRecord(NamedTuple):
+    id: str
+    entity_key: str
+    url_endpoint: str
+    status: str
+    references_html_file: str
+    further_references_html_file: str
+    content_hash: str
+    html_hash: str
+
+
+def checkpoint_filename(report_filename: str) -> str:
+    return f"{os.path.splitext(report_filename)[0]}-checkpoint.jsonl"
+
+
+def hash_content(bibentity: BibEntity, entity_type: TSupportedEntity, manifest: Manifest) -> str:
+    """
+    Hash of everything the HTML files of a bibentity depend on.
+    """
+    h = hashlib.sha256()
+    h.update(reference_set_key(bibentity, entity_type).encode("utf-8"))
+    h.update(manifest.csl_hash.encode("utf-8"))
+    h.update(manifest.image_id.encode("utf-8"))
+
+    for bibkey in sorted(bibentity.main_bibkeys | bibentity.further_references | bibentity.depends_on):
+        h.update(f"\0{bibkey}\0{manifest.bibkey_hashes.get(bibkey, '')}".encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def hash_html_files(html: RefHTML) -> str:
+    h = hashlib.sha256()
+    for html_file in html:
+        h.update(b"\0")
+        if html_file != "" and os.path.exists(html_file):
+            h.update(hash_file(html_file).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def truncate_partial_last_line(filename: str) -> None:
+    """
+    Cut off the last line of the file if it doesn't end with a newline (from a crash while it was being written), so that the next line appended starts on a line of its own.
+    """
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+
+        # Look for the last newline, reading the file backwards by blocks
+        keep = 0
+        block_end = end
+        while block_end > 0:
+            block_start = max(0, block_end - 4096)
+            f.seek(block_start)
+            newline = f.read(block_end - block_start).rfind(b"\n")
+            if newline != -1:
+                keep = block_start + newline + 1
+                break
+            block_end = block_start
+
+        if keep != end:
+            lgr.warning(f"Removing a truncated last line from the checkpoint journal '{filename}'.")
+            f.truncate(keep)
+
+    return None
+
+
+class CheckpointJournal:
+    """
+    Append-only journal of the results of a run. Every record is flushed and synced to disk before the next one is written.
+    """
+
+    def __init__(self, filename: str, entity_type: TSupportedEntity, manifest: Manifest, append: bool) -> None:
+        self.filename = filename
+        self.entity_type = entity_type
+        self.manifest = manifest
+        if append:
+            truncate_partial_last_line(filename)
+        self._f: IO[str] = open(filename, "a" if append else "w", encoding="utf-8")
+
+    def record(self, bibentity: BibEntity, result: Ok[BibEntityWithHTML] | Err) -> None:
+
+        html = RefHTML(references_filename="", further_references_filename="")
+        status = "error"
+        if isinstance(result, Ok) and result.out.entity_key == bibentity.entity_key:
+            html = result.out.html
+            status = "success"
+
+        record = CheckpointRecord(
+            id=bibentity.id,
+            entity_key=bibentity.entity_key,
+            url_endpoint=bibentity.url_endpoint,
+            status=status,
+            references_html_file=html.references_filename,
+            further_references_html_file=html.further_references_filename,
+            content_hash=hash_content(bibentity, self.entity_type, self.manifest),
+            html_hash=hash_html_files(html),
+        )
+
+        self._f.write(json.dumps(record._asdict()) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def checkpointed(
+    result: THTMLReport, filename: str, entity_type: TSupportedEntity, manifest: Manifest, append: bool
+) -> THTMLReport:
+    """
+    Yield the results of the pipeline, recording each of them in the journal first. The journal is only opened once the results start being consumed.
+    """
+    journal = CheckpointJournal(filename, entity_type, manifest, append)
+    try:
+        for bibentity, entity_result in result:
+            journal.record(bibentity, entity_result)
+            yield (bibentity, entity_result)
+
+    finally:
+        journal.close()
+
+
+def load_checkpoint(filename: str) -> Dict[TPreviousReportKey, CheckpointRecord]:
+    """
+    Load the records of a journal, the last record of each bibentity winning. A truncated last line (from a crash while it was being written) is ignored.
+    """
+
+    frame = f"load_checkpoint"
+
+    if not os.path.exists(filename):
+        lginf(frame, f"No checkpoint journal found at '{filename}'. Nothing to resume.", lgr)
+        return {}
+
+    records: Dict[TPreviousReportKey, CheckpointRecord] = {}
+
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = CheckpointRecord(**json.loads(line))
+            except (json.JSONDecodeError, TypeError):
+                lgr.warning(f"Ignoring a malformed line of the checkpoint journal '{filename}': {line!r}")
+                continue
+
+            records[(record.id, record.entity_key, record.url_endpoint)] = record
+
+    lginf(frame, f"Loaded {len(records)} records from the checkpoint journal '{filename}'.", lgr)
+
+    return records
+
+
+def find_completed_bibentities(
+    bibentities: Tuple[BibEntity, ...],
+    records: Dict[TPreviousReportKey, CheckpointRecord],
+    entity_type: TSupportedEntity,
+    manifest: Manifest,
+) -> Dict[int, Ok[BibEntityWithHTML]]:
+    """
+    Return the results of the bibentities completed in the checkpointed run, by their position in the input.
+    """
+
+    frame = f"find_completed_bibentities"
+
+    completed: Dict[int, Ok[BibEntityWithHTML]] = {}
+    for i, bibentity in enumerate(bibentities):
+        record = records.get((bibentity.id, bibentity.entity_key, bibentity.url_endpoint))
+        if record is None or record.status != "success":
+            continue
+
+        html = RefHTML(
+            references_filename=record.references_html_file,
+            further_references_filename=record.further_references_html_file,
+        )
+        if any(html_file != "" and not os.path.exists(html_file) for html_file in html):
+            continue
+
+        content_changed = record.content_hash != hash_content(bibentity, entity_type, manifest)
+        if content_changed or record.html_hash != hash_html_files(html):
+            continue
+
+        completed[i] = Ok(
+            out=BibEntityWithHTML(
+                id=bibentity.id,
+                entity_key=bibentity.entity_key,
+                url_endpoint=bibentity.url_endpoint,
+                main_bibkeys=bibentity.main_bibkeys,
+                further_references=bibentity.further_references,
+                depends_on=bibentity.depends_on,
+                html=html,
+            )
+        )
+
+    lginf(frame, f"{len(completed)} of {len(bibentities)} bibentities were completed in the checkpointed run.", lgr)
+
+    return completed
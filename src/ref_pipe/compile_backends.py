@@ -0,0 +1,238 @@
+"""
+Backends that compile the 'master.md' file of a working directory (and the markdown files it imports) into HTML files.
+
+- 'docker': `dltc-make` in the dltc container, with a `docker exec` per compilation, or through a compile server in the container.
+- 'local': a command run on the host, e.g. a local installation of `dltc-make`.
+- 'fake': no compilation at all. Writes deterministic, well-formed reference divs for the bibkeys of each markdown file, so that the Python side of the pipeline can be profiled and load-tested without Docker.
+"""
+
+from abc import ABC, abstractmethod
+import glob
+import hashlib
+import os
+import subprocess
+from typing import Tuple
+
+from src.sdk.utils import get_logger
+from src.ref_pipe.compile_server import (
+    DLTC_MAKE_COMMAND,
+    CompileResult,
+    CompileServer,
+    docker_compile_server_cmd,
+    local_compile_server_cmd,
+)
+from src.ref_pipe.models import SUPPORTED_COMPILE_BACKENDS, TCompileBackend
+
+
+lgr = get_logger("Compile Backends")
+
+
+MASTER_MD_NAME = "master.md"
+
+
+def _html_files(local_workdir: str) -> Tuple[str, ...]:
+    return tuple(sorted(glob.glob(os.path.join(glob.escape(local_workdir), "*.html"))))
+
+
+class CompileBackend(ABC):
+    """
+    Compiles the 'master.md' file of a working directory, given both as a path in the host system and in the container.
+    Backends can be shared between the threads of a worker pool, as long as each thread uses its own working directory.
+    """
+
+    name: TCompileBackend
+
+    @abstractmethod
+    def compile(self, local_workdir: str, container_workdir: str) -> CompileResult: ...
+
+    def close(self) -> None:
+        return None
+
+
+class DockerExecBackend(CompileBackend):
+    """
+    Runs the compile command in the container, with its own `docker exec`.
+    """
+
+    name: TCompileBackend = "docker"
+
+    def __init__(self, container_name: str, command: str = DLTC_MAKE_COMMAND) -> None:
+        self.container_name = container_name
+        self.command = command
+
+    def compile(self, local_workdir: str, container_workdir: str) -> CompileResult:
+        compilation_result = subprocess.run(
+            [
+                "docker",
+                "exec",
+                "--workdir",
+                container_workdir,
+                self.container_name,
+                "bash",
+                "-c",
+                self.command,
+            ],
+            capture_output=True,
+        )
+
+        stdout = compilation_result.stdout.decode("utf-8")
+        stderr = compilation_result.stderr.decode("utf-8")
+
+        return CompileResult(
+            returncode=compilation_result.returncode,
+            output=stderr or stdout if compilation_result.returncode != 0 else stdout,
+            html_files=_html_files(local_workdir),
+        )
+
+
+class LocalCommandBackend(CompileBackend):
+    """
+    Runs the compile command on the host, in the local working directory, with the name of the markdown file in `$REF_PIPE_MARKDOWN`.
+    """
+
+    name: TCompileBackend = "local"
+
+    def __init__(self, command: str) -> None:
+        self.command = command
+
+    def compile(self, local_workdir: str, container_workdir: str) -> CompileResult:
+        compilation_result = subprocess.run(
+            ["bash", "-c", self.command],
+            cwd=local_workdir,
+            env=os.environ | {"REF_PIPE_MARKDOWN": MASTER_MD_NAME},
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+
+        return CompileResult(
+            returncode=compilation_result.returncode,
+            output=compilation_result.stdout.decode("utf-8", errors="replace"),
+            html_files=_html_files(local_workdir),
+        )
+
+
+class CompileServerBackend(CompileBackend):
+    """
+    Sends the compilations to a compile server (see `compile_server`), running either in the container or on the host.
+    """
+
+    def __init__(self, compile_server: CompileServer, name: TCompileBackend) -> None:
+        self.compile_server = compile_server
+        self.name = name
+
+    def compile(self, local_workdir: str, container_workdir: str) -> CompileResult:
+        workdir = container_workdir if self.name == "docker" else local_workdir
+        return self.compile_server.compile(workdir, MASTER_MD_NAME)
+
+    def close(self) -> None:
+        self.compile_server.close()
+
+
+def _imported_markdown_files(master_md_content: str) -> Tuple[str, ...]:
+    """
+    Markdown files listed in the 'imports' of the YAML header of 'master.md'.
+    """
+    imports: list[str] = []
+    in_imports = False
+
+    for line in master_md_content.splitlines():
+        if line.strip() == "imports:":
+            in_imports = True
+        elif in_imports and line.startswith("- "):
+            imports.append(line[2:].strip())
+        else:
+            in_imports = False
+
+    return tuple(imports)
+
+
+def _markdown_bibkeys(markdown_content: str) -> Tuple[str, ...]:
+    return tuple(line[1:].strip() for line in markdown_content.splitlines() if line.startswith("@"))
+
+
+def fake_reference_div(namespace: str, bibkey: str) -> str:
+    """
+    Deterministic reference div of a bibkey, as it comes out of `extract_divs` (attributes in alphabetical order).
+    """
+    digest = hashlib.sha256(bibkey.encode("utf-8")).hexdigest()
+    year = 1900 + int(digest[:4], 16) % 125
+    first_page = int(digest[6:8], 16)
+
+    return (
+        f'<div class="csl-entry" id="ref-{namespace}-{bibkey}" role="listitem">\n'
+        f"Author, A. {year}. <em>Title {digest[:12]}</em>. Fake Journal {int(digest[4:6], 16)}: {first_page}–{first_page + 10}.\n"
+        f"</div>"
+    )
+
+
+class FakeBackend(CompileBackend):
+    """
+    Writes, for each markdown file imported by 'master.md', an HTML file with a reference div for each of its bibkeys, in the namespace of its position in the imports, as dltc-make does.
+    The divs only depend on the bibkeys, so that runs are reproducible.
+    """
+
+    name: TCompileBackend = "fake"
+
+    def compile(self, local_workdir: str, container_workdir: str) -> CompileResult:
+        master_md_file = os.path.join(local_workdir, MASTER_MD_NAME)
+        if not os.path.exists(master_md_file):
+            return CompileResult(returncode=1, output=f"'{master_md_file}' not found.", html_files=())
+
+        with open(master_md_file, "r") as f:
+            markdown_files = _imported_markdown_files(f.read())
+
+        for position, markdown_file in enumerate(markdown_files, start=1):
+            with open(os.path.join(local_workdir, markdown_file), "r") as f:
+                bibkeys = _markdown_bibkeys(f.read())
+
+            divs = "\n".join(fake_reference_div(f"c{position}", bibkey) for bibkey in bibkeys)
+            html = (
+                f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>HTML References Pipeline</title>\n</head>\n<body>\n'
+                f'<h1 id="references">References</h1>\n'
+                f'<div id="refs" class="references csl-bib-body hanging-indent" role="list">\n{divs}\n</div>\n'
+                f"</body>\n</html>\n"
+            )
+
+            with open(os.path.join(local_workdir, markdown_file.replace(".md", ".html")), "w") as f:
+                f.write(html)
+
+        return CompileResult(
+            returncode=0,
+            output=f"Compiled {len(markdown_files)} fake markdown files.",
+            html_files=_html_files(local_workdir),
+        )
+
+
+def load_compile_backend(
+    backend: TCompileBackend,
+    container_name: str,
+    local_command: str,
+    compile_server_processes: int = 0,
+) -> CompileBackend:
+    """
+    Set up the given compile backend. If `compile_server_processes` is positive, the 'docker' and 'local' backends go through a compile server with that many processes.
+    """
+
+    match backend:
+        case "docker":
+            if compile_server_processes > 0:
+                return CompileServerBackend(
+                    CompileServer(docker_compile_server_cmd(container_name), compile_server_processes), "docker"
+                )
+            return DockerExecBackend(container_name)
+
+        case "local":
+            if compile_server_processes > 0:
+                return CompileServerBackend(
+                    CompileServer(local_compile_server_cmd(local_command), compile_server_processes), "local"
+                )
+            return LocalCommandBackend(local_command)
+
+        case "fake":
+            return FakeBackend()
+
+        case _:
+            raise ValueError(
+                f"Unsupported compile backend '{backend}'. Supported backends are: {', '.join(SUPPORTED_COMPILE_BACKENDS)}"
+            )
@@ -0,0 +1,186 @@
+"""
+Long-lived compile server, so that compilations don't pay for a new `docker exec` (process and container overhead) each time.
+
+The server is a bash loop, started once per worker with `docker exec -i`, that reads compile jobs from its stdin and writes their results to its stdout. The same loop can be run directly on the host with any command, which makes the protocol testable without Docker.
+
+Protocol, one job at a time per server process:
+- Job: `<job_id>\t<workdir>\t<markdown>\n`. The compile command is run in `workdir`, with the name of the markdown file in `$REF_PIPE_MARKDOWN`.
+- Result: a header line `<job_id>\t<status>\t<output_size>[\t<html_file>...]\n`, with the exit status of the command, the size in bytes of its (merged stdout and stderr) output, and the HTML files found in `workdir` afterwards, followed by the output itself.
+"""
+
+import itertools
+import queue
+import subprocess
+import threading
+from typing import IO, NamedTuple, Tuple
+
+from src.sdk.utils import get_logger
+
+
+lgr = get_logger("Compile Server")
+
+
+DLTC_MAKE_COMMAND = "dltc-make offhtml"
+
+COMPILE_SERVER_SCRIPT = r"""
+export LC_ALL=C
+command="$1"
+while IFS=$'\t' read -r job_id workdir markdown; do
+    output=$( { cd "$workdir" && REF_PIPE_MARKDOWN="$markdown" bash -c "$command"; } 2>&1 < /dev/null )
+    status=$?
+    header="$job_id"$'\t'"$status"$'\t'"${#output}"
+    for html_file in "$workdir"/*.html; do
+        if [ -e "$html_file" ]; then
+            header="$header"$'\t'"$html_file"
+        fi
+    done
+    printf '%s\n%s' "$header" "$output"
+done
+"""
+
+
+class CompileResult(NamedTuple):
+    """
+    Result of a compile job.
+
+    Attributes:
+    ----------
+    `returncode`: int
+        Exit status of the compile command.
+    `output`: str
+        Merged stdout and stderr of the compile command.
+    `html_files`: Tuple[str, ...]
+        Paths of the HTML files in the working directory after the compilation (as seen by the compiler, e.g., in the container).
+    """
+
+    returncode: int
+    output: str
+    html_files: Tuple[str, ...]
+
+
+def docker_compile_server_cmd(container_name: str, command: str = DLTC_MAKE_COMMAND) -> Tuple[str, ...]:
+    return ("docker", "exec", "-i", container_name, "bash", "-c", COMPILE_SERVER_SCRIPT, "compile-server", command)
+
+
+def local_compile_server_cmd(command: str) -> Tuple[str, ...]:
+    """
+    Stand-in for the compile server of the container, running the given command on the host.
+    """
+    return ("bash", "-c", COMPILE_SERVER_SCRIPT, "compile-server", command)
+
+
+class _CompileProcess:
+
+    def __init__(self, cmd: Tuple[str, ...]) -> None:
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _pipes(self) -> Tuple[IO[bytes], IO[bytes]]:
+        if self.process.stdin is None or self.process.stdout is None:
+            raise RuntimeError("The compile server process has no pipes.")
+        return self.process.stdin, self.process.stdout
+
+    def _died(self) -> RuntimeError:
+        self.process.kill()
+        stderr = self.process.stderr.read().decode("utf-8", errors="replace") if self.process.stderr else ""
+        return RuntimeError(f"The compile server process exited unexpectedly:\n{stderr}")
+
+    def compile(self, job_id: str, workdir: str, markdown: str) -> CompileResult:
+        stdin, stdout = self._pipes()
+
+        try:
+            stdin.write(f"{job_id}\t{workdir}\t{markdown}\n".encode("utf-8"))
+            stdin.flush()
+        except BrokenPipeError:
+            raise self._died()
+
+        header = stdout.readline()
+        if not header.endswith(b"\n"):
+            raise self._died()
+
+        result_job_id, status, output_size, *html_files = header.decode("utf-8").rstrip("\n").split("\t")
+        if result_job_id != job_id:
+            raise RuntimeError(f"The compile server answered job '{result_job_id}' instead of job '{job_id}'.")
+
+        output = stdout.read(int(output_size))
+        if len(output) != int(output_size):
+            raise self._died()
+
+        return CompileResult(
+            returncode=int(status),
+            output=output.decode("utf-8", errors="replace"),
+            html_files=tuple(html_files),
+        )
+
+    def close(self) -> None:
+        if self.process.stdin is not None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                # The process is already gone, with unsent data left in the buffer
+                pass
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        if self.process.stdout is not None:
+            self.process.stdout.close()
+        if self.process.stderr is not None:
+            self.process.stderr.close()
+
+
+class CompileServer:
+    """
+    Pool of compile server processes, each running one job at a time. Can be shared between the threads of a worker pool: a job waits for a free process.
+    A process that dies or gets out of sync fails its job, and is replaced by a fresh one for the next jobs.
+    """
+
+    def __init__(self, cmd: Tuple[str, ...], processes: int = 1) -> None:
+
+        if processes < 1:
+            raise ValueError(f"The compile server needs at least one process, got '{processes}'.")
+
+        self.cmd = cmd
+        self._job_ids = itertools.count(1)
+        self._job_ids_lock = threading.Lock()
+        self._processes = [_CompileProcess(cmd) for _ in range(processes)]
+        self._processes_lock = threading.Lock()
+        self._free_processes: queue.Queue[_CompileProcess] = queue.Queue()
+        for process in self._processes:
+            self._free_processes.put(process)
+
+    def compile(self, workdir: str, markdown: str) -> CompileResult:
+
+        for field in (workdir, markdown):
+            if "\t" in field or "\n" in field:
+                raise ValueError(f"Tabs and newlines are not supported in compile jobs, got '{field}'.")
+
+        with self._job_ids_lock:
+            job_id = f"{next(self._job_ids)}"
+
+        process = self._free_processes.get()
+        try:
+            return process.compile(job_id, workdir, markdown)
+        except BaseException:
+            # After a failed job, the process may be dead, or its output out of sync with the jobs
+            process = self._replace(process)
+            raise
+        finally:
+            self._free_processes.put(process)
+
+    def _replace(self, process: _CompileProcess) -> _CompileProcess:
+        """
+        Kill and close the process, and start a fresh one in its place.
+        """
+        process.process.kill()
+        process.close()
+        fresh_process = _CompileProcess(self.cmd)
+        with self._processes_lock:
+            self._processes[self._processes.index(process)] = fresh_process
+        return fresh_process
+
+    def close(self) -> None:
+        with self._processes_lock:
+            processes = tuple(self._processes)
+        for process in processes:
+            process.close()
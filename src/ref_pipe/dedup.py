@@ -0,0 +1,156 @@
+"""
+Deduplication of identical reference sets: bibentities with the same main bibkeys, further references and dependencies (e.g., pages presenting the same journal, or translated variants of a page) get the same HTML files.
+
+Only the first bibentity of each set (its representative) is compiled and sorted. The HTML files of the others are copies of its files, named after their own URL endpoints.
+Journals are never deduplicated, as their HTML files are built from their own rows of the bibliography table.
+"""
+
+import hashlib
+import os
+from typing import Dict, List, Tuple
+
+from src.sdk.ResultMonad import Err, Ok, try_except_wrapper
+from src.sdk.utils import get_logger, lginf
+from src.ref_pipe.html_io import write_if_changed
+from src.ref_pipe.models import (
+    BibEntity,
+    BibEntityWithHTML,
+    HTMLFileChange,
+    RefHTML,
+    THTMLReport,
+    TSupportedEntity,
+)
+
+
+lgr = get_logger("Dedup")
+
+
+def reference_set_key(bibentity: BibEntity, entity_type: TSupportedEntity) -> str:
+    """
+    Canonical hash of the bibkey sets of a bibentity and of the entity type (and of the ID, for journals).
+    """
+    h = hashlib.sha256()
+    h.update(entity_type.encode("utf-8"))
+
+    if entity_type == "journal":
+        h.update(b"\0")
+        h.update(bibentity.id.encode("utf-8"))
+
+    for bibkeys in (bibentity.main_bibkeys, bibentity.further_references, bibentity.depends_on):
+        h.update(b"\1")
+        h.update("\0".join(sorted(bibkeys)).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def find_duplicate_bibentities(bibentities: Tuple[BibEntity, ...], entity_type: TSupportedEntity) -> Dict[int, int]:
+    """
+    Index of the representative of each bibentity whose reference set already appeared earlier in the input.
+    """
+    frame = f"find_duplicate_bibentities"
+
+    representatives: Dict[str, int] = {}
+    duplicates: Dict[int, int] = {}
+
+    for i, bibentity in enumerate(bibentities):
+        key = reference_set_key(bibentity, entity_type)
+        representative = representatives.setdefault(key, i)
+        if representative != i:
+            duplicates[i] = representative
+
+    lginf(
+        frame,
+        f"{len(duplicates)} of {len(bibentities)} bibentities share their references with another one, and won't be compiled.",
+        lgr,
+    )
+
+    return duplicates
+
+
+def _copied_html_file(
+    html_file: str, representative: BibEntity, bibentity: BibEntity, html_changes: List[HTMLFileChange]
+) -> str:
+    if html_file == "":
+        return ""
+
+    # The HTML files are named '<output dir>/<URL endpoint><suffix>', and URL endpoints may contain slashes
+    endpoint_start = html_file.rfind(f"/{representative.url_endpoint}") + 1
+    suffix = html_file[endpoint_start + len(representative.url_endpoint) :]
+    if endpoint_start == 0 or "/" in suffix:
+        raise ValueError(
+            f"The HTML file '{html_file}' is not named after the URL endpoint '{representative.url_endpoint}'."
+        )
+
+    copied_html_file = f"{html_file[:endpoint_start]}{bibentity.url_endpoint}{suffix}"
+    if copied_html_file != html_file:
+        os.makedirs(os.path.dirname(copied_html_file), exist_ok=True)
+        with open(html_file, "rb") as f:
+            html_changes.append(write_if_changed(copied_html_file, f.read()))
+
+    return copied_html_file
+
+
+@try_except_wrapper(lgr)
+def copy_html_files(bibentity: BibEntity, representative_with_html: BibEntityWithHTML) -> BibEntityWithHTML:
+    """
+    Copy the HTML files of the representative of a bibentity, naming them after the bibentity.
+    """
+    html = representative_with_html.html
+    html_changes: List[HTMLFileChange] = []
+
+    copied_html = RefHTML(
+        references_filename=_copied_html_file(
+            html.references_filename, representative_with_html, bibentity, html_changes
+        ),
+        further_references_filename=_copied_html_file(
+            html.further_references_filename, representative_with_html, bibentity, html_changes
+        ),
+    )
+
+    return BibEntityWithHTML(
+        id=bibentity.id,
+        entity_key=bibentity.entity_key,
+        url_endpoint=bibentity.url_endpoint,
+        main_bibkeys=bibentity.main_bibkeys,
+        further_references=bibentity.further_references,
+        depends_on=bibentity.depends_on,
+        html=copied_html,
+        html_changes=tuple(html_changes),
+    )
+
+
+def expand_duplicates(
+    bibentities: Tuple[BibEntity, ...],
+    duplicates: Dict[int, int],
+    representatives_results: THTMLReport,
+) -> THTMLReport:
+    """
+    Interleave the results of the duplicates with the ones of the representatives, which must come in input order, so that the report keeps the order of the input.
+    The result of a representative is only kept until its last duplicate has been copied.
+    """
+
+    last_duplicate: Dict[int, int] = {representative: i for i, representative in duplicates.items()}
+    pending: Dict[int, Ok[BibEntityWithHTML] | Err] = {}
+
+    for i, bibentity in enumerate(bibentities):
+        representative = duplicates.get(i)
+
+        if representative is None:
+            entity_result = next(representatives_results)
+            if i in last_duplicate:
+                pending[i] = entity_result[1]
+            yield entity_result
+            continue
+
+        result: Ok[BibEntityWithHTML] | Err
+        match pending[representative]:
+            case Ok(out=representative_with_html):
+                result = copy_html_files(bibentity, representative_with_html)
+            case Err(message=message, code=code):
+                representative_key = bibentities[representative].entity_key
+                result = Err(message=f"Same references as '{representative_key}', which failed:\n{message}", code=code)
+
+        if last_duplicate[representative] == i:
+            del pending[representative]
+
+        yield (bibentity, result)
@@ -0,0 +1,287 @@
+"""
+Persistent, content-addressed cache of rendered reference divs.
+
+A rendered div depends on the line of its bibkey in the bibliography, on the lines of its crossref parents (whose fields it inherits), on the CSL file, and on the toolchain in the container image. The cache key of a bibkey is a hash of all of them, so that any change in them makes the cached div unreachable.
+
+Not in the key: the other entries compiled alongside. With a CSL style that disambiguates the references (e.g., `disambiguate-add-year-suffix` in pipe.csl, which turns 'Smith 2020' into 'Smith 2020a'), the div of a bibkey depends on the other bibkeys with the same first author and year. Such bibkeys are never read from nor written to the cache: they are always rendered together (see `colliding_bibkeys`).
+"""
+
+from dataclasses import dataclass
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import FrozenSet, Generator
+
+from src.sdk.utils import get_logger, lginf
+from src.ref_pipe.bibkey_utils import split_bibkey
+from src.ref_pipe.models import SUPPORTED_DIV_CACHE_MODES, Bibliography, TBibDivDict, TDivCacheMode
+
+
+lgr = get_logger("Div Cache")
+
+
+DEFAULT_DIV_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "biblioUtils", "ref_pipe_divs.sqlite")
+
+# SQLite limits the number of parameters per statement
+SQL_PARAMETERS_CHUNK_SIZE = 500
+
+# Value of the crossref field of a bib line, e.g. 'crossref = {smith_j:2020}'
+_CROSSREF_RE = re.compile(rb"""\bcrossref\s*=\s*[{"]\s*([^}"\s]+)\s*[}"]""", re.IGNORECASE)
+
+# After an eviction, the cache is shrunk to this fraction of its maximum size, so that evictions don't happen on every write
+EVICTION_TARGET_RATIO = 0.9
+
+
+@dataclass(frozen=False, slots=True)
+class DivCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stored: int = 0
+    evicted: int = 0
+
+    def dump(self) -> dict[str, int]:
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_stored": self.stored,
+            "cache_evicted": self.evicted,
+        }
+
+
+def hash_cache_namespace(csl_file: str, image_id: str) -> str:
+    """
+    Hash of everything a rendered div depends on, apart from its bibliography line.
+    """
+    with open(csl_file, "rb") as f:
+        csl_content = f.read()
+
+    h = hashlib.sha256()
+    h.update(csl_content)
+    h.update(b"\0")
+    h.update(image_id.encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def crossref_parents(bibkey: str, bibliography: Bibliography) -> tuple[str, ...]:
+    """
+    Crossref parents of the bibkey in the bibliography, nearest first, following chains of crossrefs. Parents missing from the bibliography are left out.
+    """
+    parents: list[str] = []
+    current = bibkey
+    while (match := _CROSSREF_RE.search(bibliography.line_bytes(current))) is not None:
+        parent = match.group(1).decode("utf-8")
+        if parent == bibkey or parent in parents or parent not in bibliography.bibkey_index_dict:
+            break
+        parents.append(parent)
+        current = parent
+
+    return tuple(parents)
+
+
+def _chunks(keys: tuple[str, ...]) -> Generator[tuple[str, ...], None, None]:
+    for i in range(0, len(keys), SQL_PARAMETERS_CHUNK_SIZE):
+        yield keys[i : i + SQL_PARAMETERS_CHUNK_SIZE]
+
+
+class DivCache:
+    """
+    On-disk cache of rendered divs, keyed by a hash of the bibliography lines of each bibkey and of its crossref parents, and of the cache namespace (see `hash_cache_namespace`).
+
+    Stored in a single SQLite file. When the cached divs take more than `max_size_bytes`, the least recently used ones are evicted.
+    In 'rebuild' mode, the cache is never read from, but every freshly rendered div is (over)written into it.
+    Can be shared between the threads of a worker pool.
+    """
+
+    def __init__(
+        self,
+        cache_file: str,
+        namespace: str,
+        max_size_bytes: int,
+        mode: TDivCacheMode = "on",
+    ) -> None:
+
+        if mode not in SUPPORTED_DIV_CACHE_MODES:
+            raise ValueError(
+                f"Unsupported div cache mode '{mode}'. Supported modes are: {', '.join(SUPPORTED_DIV_CACHE_MODES)}"
+            )
+
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+
+        self.cache_file = cache_file
+        self.namespace = namespace
+        self.max_size_bytes = max_size_bytes
+        self.mode = mode
+        self.stats = DivCacheStats()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS divs (key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS divs_last_used ON divs (last_used)")
+        self._conn.commit()
+
+        self._size_bytes: int = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM divs").fetchone()[0]
+
+    def key(self, bibkey: str, bibliography: Bibliography) -> str:
+        h = hashlib.sha256()
+        h.update(self.namespace.encode("utf-8"))
+        h.update(b"\0")
+        h.update(bibliography.line_bytes(bibkey))
+        for parent in crossref_parents(bibkey, bibliography):
+            h.update(b"\0")
+            h.update(bibliography.line_bytes(parent))
+
+        return h.hexdigest()
+
+    def get_many(self, bibkeys: FrozenSet[str], bibliography: Bibliography) -> TBibDivDict:
+        """
+        Return the cached divs of the given bibkeys. Bibkeys not in the cache are simply absent from the output.
+        """
+        if self.mode != "on" or bibkeys == frozenset():
+            return {}
+
+        key_bibkey_d = {self.key(bibkey, bibliography): bibkey for bibkey in bibkeys}
+        keys = tuple(key_bibkey_d.keys())
+
+        with self._lock:
+            rows: list[tuple[str, str]] = []
+            for keys_chunk in _chunks(keys):
+                placeholders = ", ".join("?" for _ in keys_chunk)
+                rows += self._conn.execute(
+                    f"SELECT key, content FROM divs WHERE key IN ({placeholders})", keys_chunk
+                ).fetchall()
+
+            hits: TBibDivDict = {key_bibkey_d[key]: content for key, content in rows}
+
+            if rows:
+                now = time.time_ns()
+                self._conn.executemany("UPDATE divs SET last_used = ? WHERE key = ?", ((now, key) for key, _ in rows))
+                self._conn.commit()
+
+            self.stats.hits += len(hits)
+            self.stats.misses += len(bibkeys) - len(hits)
+
+        return hits
+
+    def put_many(self, bibdivs: TBibDivDict, bibliography: Bibliography) -> None:
+        if self.mode == "off" or bibdivs == {}:
+            return None
+
+        now = time.time_ns()
+        rows = tuple(
+            (self.key(bibkey, bibliography), content, len(content.encode("utf-8")), now)
+            for bibkey, content in bibdivs.items()
+        )
+        keys = tuple(row[0] for row in rows)
+
+        with self._lock:
+            # Replaced entries must not be counted twice in the size of the cache
+            replaced_size = 0
+            for keys_chunk in _chunks(keys):
+                placeholders = ", ".join("?" for _ in keys_chunk)
+                replaced_size += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM divs WHERE key IN ({placeholders})", keys_chunk
+                ).fetchone()[0]
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO divs (key, content, size, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+            self._size_bytes += sum(row[2] for row in rows) - replaced_size
+            self.stats.stored += len(rows)
+
+            if self._size_bytes > self.max_size_bytes:
+                self._evict()
+
+        return None
+
+    def evict(self) -> None:
+        """
+        Evict the least recently used divs until the cache is below its target size.
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        frame = f"DivCache.evict"
+
+        excess = self._size_bytes - int(self.max_size_bytes * EVICTION_TARGET_RATIO)
+        if excess <= 0:
+            return None
+
+        cursor = self._conn.execute(
+            """
+            DELETE FROM divs WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_used, key) - size AS size_before FROM divs
+                ) WHERE size_before < ?
+            )
+            """,
+            (excess,),
+        )
+        self._conn.commit()
+
+        self.stats.evicted += cursor.rowcount
+        self._size_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM divs").fetchone()[0]
+
+        lginf(frame, f"Evicted {cursor.rowcount} divs from the cache '{self.cache_file}'.", lgr)
+
+        return None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def load_div_cache(
+    cache_file: str,
+    csl_file: str,
+    image_id: str,
+    max_size_mb: int,
+    mode: TDivCacheMode,
+) -> DivCache | None:
+    """
+    Open the div cache for the given CSL file and container image, or return None if the cache is turned off.
+    """
+    frame = f"load_div_cache"
+
+    if mode == "off":
+        lginf(frame, f"The div cache is turned off.", lgr)
+        return None
+
+    namespace = hash_cache_namespace(csl_file, image_id)
+    lginf(frame, f"Opening the div cache '{cache_file}' in '{mode}' mode...", lgr)
+
+    return DivCache(cache_file, namespace, max_size_mb * 1024 * 1024, mode)
+
+
+def colliding_bibkeys(bibkeys: FrozenSet[str]) -> FrozenSet[str]:
+    """
+    Bibkeys sharing their first author and year with another one of the given bibkeys. Their divs may get a year suffix that depends on the set they are rendered in. Bibkeys without the standard structure collide with none.
+    """
+    author_years = {bibkey: (parts.first_author, parts.year) for bibkey in bibkeys if (parts := split_bibkey(bibkey))}
+    counts = Counter(author_years.values())
+
+    return frozenset(bibkey for bibkey, author_year in author_years.items() if counts[author_year] > 1)
+
+
+def split_cached_bibkeys(
+    bibkeys: FrozenSet[str], bibliography: Bibliography, div_cache: DivCache | None
+) -> tuple[TBibDivDict, FrozenSet[str]]:
+    """
+    Split the bibkeys into the divs found in the cache, and the bibkeys that still need to be rendered. Colliding bibkeys (see `colliding_bibkeys`) are always rendered.
+    """
+    if div_cache is None:
+        return {}, bibkeys
+
+    cached_divs = div_cache.get_many(bibkeys - colliding_bibkeys(bibkeys), bibliography)
+    missing_bibkeys = bibkeys - cached_divs.keys()
+
+    return cached_divs, missing_bibkeys
@@ -0,0 +1,413 @@
+"""
+Streaming extraction of the reference divs of a compiled HTML file.
+
+The file is read in chunks and scanned for `<div>` tags only, keeping in memory just the divs being extracted. The content of each div is its raw markup whenever that markup is already in the form BeautifulSoup (`html.parser`, minimal formatter) serializes it to, up to the order of the attributes, which BeautifulSoup sorts. That is the case for the HTML Pandoc produces. Otherwise, the div alone is serialized with BeautifulSoup.
+
+The output is the same as parsing the whole file with BeautifulSoup for the HTML Pandoc produces, and for the malformed markup covered by the tests (stray and bogus end tags, unclosed tags, scripts). It can differ on markup that `html.parser` tokenizes differently, e.g. a start tag with an attribute value whose quote is never closed.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+import html
+import re
+from typing import Deque, Dict, Generator, List, TextIO
+
+from bs4 import BeautifulSoup
+
+from src.sdk.utils import get_logger
+from src.ref_pipe.models import BibDiv
+
+
+lgr = get_logger("Div Extractor")
+
+
+CHUNK_SIZE = 1024 * 1024
+
+# Tags are tokenized as `html.parser` does. Comments, declarations, bogus end tags (`</` not followed by a letter) and the raw text of scripts and styles can't contain tags
+_SCAN_RE = re.compile(r"<(!--|[!?]|/?[a-zA-Z]|/)")
+_START_TAG_RE = re.compile(r"<([a-zA-Z][^\t\n\r\f />\x00]*)(?:[^>\"']|\"[^\"]*\"|'[^']*')*>")
+_END_TAG_RE = re.compile(r"</([a-zA-Z][^\t\n\r\f />\x00]*)[^>]*>")
+_COMMENT_END_RE = re.compile(r"-->")
+_DECLARATION_END_RE = re.compile(r">")
+_DIV_END_RE = re.compile(r"</div>")
+_RAW_TEXT_TAGS = frozenset({"script", "style"})
+_ATTR_RE = re.compile(r"([^\s/>=][^\s/=>]*)(?:\s*=\s*('[^']*'|\"[^\"]*\"|[^'\"\s>][^\s>]*))?")
+
+# Markup that BeautifulSoup serializes as is, apart from sorting the attributes: lowercase tags with double-quoted attributes separated by single spaces, and text and attribute values with no other character references than '&amp;', '&lt;' and '&gt;'
+_CANONICAL_TEXT = r"(?:[^<>&]++|&(?:amp|lt|gt);)++"
+_CANONICAL_ATTR_VALUE = r"(?:[^\"<>&]++|&(?:amp|lt|gt);)*+"
+_CANONICAL_START_TAG = rf"<[a-z][a-z0-9]*+(?: [a-z][a-z0-9_:.-]*+=\"{_CANONICAL_ATTR_VALUE}\")*+>"
+_CANONICAL_END_TAG = r"</[a-z][a-z0-9]*+>"
+_CANONICAL_MARKUP_RE = re.compile(rf"(?:{_CANONICAL_TEXT}|{_CANONICAL_START_TAG}|{_CANONICAL_END_TAG})*+")
+_CANONICAL_TAG_RE = re.compile(r"<(/?)([a-z][a-z0-9]*)((?: [a-z][a-z0-9_:.-]*=\"[^\"]*\")*)>")
+_CANONICAL_ATTR_RE = re.compile(r" ([a-z][a-z0-9_:.-]*)=\"([^\"]*)\"")
+_NON_WHITESPACE_RE = re.compile(r"\S+")
+# BeautifulSoup collapses strings made only of whitespace into a single newline (if they contain one) or space. These are the ones it changes
+_COLLAPSED_WHITESPACE_STRING_RE = re.compile(r">(?:[ \t\n\r\f]{2,}|[\t\r\f])<")
+# ... except inside these
+_PRESERVE_WHITESPACE_TAGS = frozenset({"pre", "textarea"})
+
+# Elements that can't have content
+_VOID_TAGS = frozenset(
+    {
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+        "basefont",
+        "bgsound",
+        "command",
+        "frame",
+        "image",
+        "isindex",
+        "nextid",
+        "spacer",
+    }
+)
+
+# Void elements, elements whose text isn't a plain string, and elements whose text the parser treats as raw: BeautifulSoup doesn't serialize them as they are written
+_NON_CANONICAL_TAGS = _VOID_TAGS | {"rt", "rp", "template"} | _RAW_TEXT_TAGS
+
+# Attributes whose value BeautifulSoup splits on whitespace, and joins back with single spaces
+_MULTI_VALUED_ATTRS = frozenset(
+    {"class", "accesskey", "dropzone", "rel", "rev", "headers", "accept-charset", "archive", "sizes", "sandbox", "for"}
+)
+
+
+def get_bibkey_from_div_id(div_id: str) -> str:
+    """
+    Extract the bibkey from the div ID. WARNING: if the HTML structure changes, this function will produce nonsense and will need update.
+
+    This assumes IDs of the shape:
+    `ref-<entity_key>-<bibkey>`, where <bibkey> can contain "-"
+
+    For example:
+    ref-c1-ashby_n:2002
+    ref-c1-caruso_em-etal:2008
+    """
+    try:
+        bibkey = "-".join(div_id.split('-')[2:])
+    except IndexError:
+        lgr.warning(f"Could not find bibkey in div ID '{div_id}'")
+        bibkey = ""
+
+    return bibkey
+
+
+def tag_attributes(tag: str) -> Dict[str, str]:
+    """
+    Attributes of a start tag, as `html.parser` reads them: lowercase names, unescaped values, and the last value of repeated attributes.
+    """
+    name_end = re.search(r"[\s/>]", tag[1:])
+    attrs_s = tag[1 + name_end.start() :] if name_end is not None else ""
+
+    attrs: Dict[str, str] = {}
+    for match in _ATTR_RE.finditer(attrs_s):
+        name, value = match.group(1), match.group(2)
+        if value is None:
+            value = ""
+        elif value[:1] in ("'", '"') and value[:1] == value[-1:] and len(value) > 1:
+            value = value[1:-1]
+        attrs[name.lower()] = html.unescape(value)
+
+    return attrs
+
+
+def serialize_canonical_markup(markup: str, preserve_whitespace: bool = False) -> str | None:
+    """
+    The element as BeautifulSoup serializes it, if its markup only needs its attributes sorted for that, or None otherwise. `preserve_whitespace` tells whether the element is inside a `<pre>` or `<textarea>`.
+    """
+    if _CANONICAL_MARKUP_RE.fullmatch(markup) is None:
+        return None
+
+    if not preserve_whitespace and _COLLAPSED_WHITESPACE_STRING_RE.search(markup) is not None:
+        return None
+
+    open_tags: List[str] = []
+    # Pieces of the output, as the markup with the tags whose attributes aren't sorted rewritten
+    pieces: List[str] = []
+    copied_up_to = 0
+    for tag in _CANONICAL_TAG_RE.finditer(markup):
+        is_end_tag, name, attrs_s = tag.group(1), tag.group(2), tag.group(3)
+
+        if name in _NON_CANONICAL_TAGS or (name in _PRESERVE_WHITESPACE_TAGS and not preserve_whitespace):
+            return None
+
+        if is_end_tag:
+            if not open_tags or open_tags.pop() != name:
+                return None
+            continue
+
+        open_tags.append(name)
+        if attrs_s == "":
+            continue
+
+        attrs = _CANONICAL_ATTR_RE.findall(attrs_s)
+        for attr_name, attr_value in attrs:
+            if attr_name in _MULTI_VALUED_ATTRS and attr_value != " ".join(_NON_WHITESPACE_RE.findall(attr_value)):
+                return None
+
+        if len(attrs) > 1:
+            sorted_attrs = sorted(attrs)
+            if any(sorted_attrs[i][0] == sorted_attrs[i + 1][0] for i in range(len(sorted_attrs) - 1)):
+                # Repeated attribute
+                return None
+
+            if sorted_attrs != attrs:
+                pieces.append(markup[copied_up_to : tag.start()])
+                pieces.append(
+                    f"<{name}{''.join(f' {attr_name}=\"{attr_value}\"' for attr_name, attr_value in sorted_attrs)}>"
+                )
+                copied_up_to = tag.end()
+
+    if open_tags != []:
+        return None
+
+    if copied_up_to == 0:
+        return markup
+
+    pieces.append(markup[copied_up_to:])
+    return "".join(pieces)
+
+
+def serialize_div(markup: str, preserve_whitespace: bool = False) -> str:
+    """
+    The div as BeautifulSoup serializes it. `preserve_whitespace` tells whether the div is inside a `<pre>` or `<textarea>`.
+    """
+    serialized_markup = serialize_canonical_markup(markup, preserve_whitespace)
+    if serialized_markup is not None:
+        return serialized_markup
+
+    div = BeautifulSoup(f"<pre>{markup}" if preserve_whitespace else markup, features="html.parser").find("div")
+
+    return div.__str__() if div is not None else ""
+
+
+@dataclass(frozen=False, slots=True)
+class _ExtractedDiv:
+    bibkey: str
+    content: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class _OpenTag:
+    name: str
+    # Offset of the start tag in the whole file
+    start: int
+    # Only for the divs to extract
+    extracted: _ExtractedDiv | None = None
+    preserve_whitespace: bool = False
+
+
+# Longest match of `_SCAN_RE`, which could be cut short at the end of a buffer
+_SCAN_TAIL = 4
+
+
+class _ChunkedText:
+    """
+    Sliding window over a text file, read in chunks. Offsets are relative to the start of the file.
+
+    Nothing from `keep_from` on is discarded, so that the divs being extracted can be sliced out of the window once they end.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.buffer_start = 0
+        self.keep_from = 0
+        self.eof = False
+
+    @property
+    def end(self) -> int:
+        return self.buffer_start + len(self.buffer)
+
+    def read_more(self, searched_up_to: int | None = None) -> bool:
+        """
+        Read the next chunk, discarding what is before `searched_up_to` (and `keep_from`).
+        """
+        if self.eof:
+            return False
+
+        discard_up_to = self.keep_from if searched_up_to is None else min(self.keep_from, searched_up_to)
+        if discard_up_to > self.buffer_start:
+            self.buffer = self.buffer[discard_up_to - self.buffer_start :]
+            self.buffer_start = discard_up_to
+
+        chunk = self.f.read(self.chunk_size)
+        if chunk == "":
+            self.eof = True
+            return False
+
+        self.buffer += chunk
+        return True
+
+    def find(self, pattern: re.Pattern[str], offset: int, tail: int = _SCAN_TAIL) -> re.Match[str] | None:
+        """
+        Search for the pattern from the offset on, reading more of the file until a match is found or the file ends. Offsets of the matches are relative to `buffer_start`.
+
+        Matches can't be longer than `tail` when they reach the end of what was read so far.
+        """
+        while True:
+            match = pattern.search(self.buffer, max(offset - self.buffer_start, 0))
+            # A match reaching the end of the buffer could be cut short
+            if match is not None and (match.end() < len(self.buffer) or self.eof):
+                return match
+
+            searched_up_to = max(offset, self.end - tail)
+            if not self.read_more(searched_up_to):
+                return match
+            offset = searched_up_to
+
+    def match(self, pattern: re.Pattern[str], offset: int) -> re.Match[str] | None:
+        """
+        Match the pattern at the offset, reading more of the file until it matches or the file ends. Offsets of the match are relative to `buffer_start`.
+        """
+        while True:
+            match = pattern.match(self.buffer, offset - self.buffer_start)
+            if match is not None:
+                return match
+            if not self.read_more(offset):
+                return None
+
+    def slice(self, start: int, end: int) -> str:
+        return self.buffer[start - self.buffer_start : end - self.buffer_start]
+
+
+def stream_divs(f: TextIO, namespace: str | None = None, chunk_size: int = CHUNK_SIZE) -> Generator[BibDiv, None, None]:
+    """
+    Yield the reference divs of an HTML file (those whose ID contains a bibkey, see `get_bibkey_from_div_id`) in the order in which they start, as BeautifulSoup's `find_all('div')` does (see the module docstring for the markup on which the two can differ). If a namespace is given, only the divs whose ID starts with `ref-<namespace>-` are yielded.
+    """
+    text = _ChunkedText(f, chunk_size)
+    text.read_more()
+
+    open_tags: List[_OpenTag] = []
+    # Divs to extract, in the order in which they start. Nested divs are held back until the ones around them are done
+    extracted: Deque[_ExtractedDiv] = deque()
+
+    offset = 0
+    while True:
+        while extracted and extracted[0].content is not None:
+            done = extracted.popleft()
+            yield BibDiv(div_id=done.bibkey, content=f"{done.content}")
+
+        # Keep in memory only what the divs being extracted still need
+        text.keep_from = min((tag.start for tag in open_tags if tag.extracted is not None), default=offset)
+
+        scan = text.find(_SCAN_RE, offset)
+        if scan is None:
+            break
+
+        tag_start = text.buffer_start + scan.start()
+        tag_open = scan.group(1)
+
+        if tag_open == "!--":
+            comment_end = text.find(_COMMENT_END_RE, tag_start + 4, tail=3)
+            offset = text.buffer_start + comment_end.end() if comment_end is not None else text.end
+
+        elif tag_open in ("!", "?", "/"):
+            declaration_end = text.find(_DECLARATION_END_RE, tag_start + 2, tail=1)
+            offset = text.buffer_start + declaration_end.end() if declaration_end is not None else text.end
+
+        elif tag_open.startswith("/"):
+            end_tag = text.match(_END_TAG_RE, tag_start)
+            if end_tag is None:
+                # Not a tag after all
+                offset = tag_start + 1
+                continue
+
+            offset = text.buffer_start + end_tag.end()
+            tag_name = end_tag.group(1).lower()
+
+            # As in BeautifulSoup, an end tag closes everything opened after the last tag of the same name, and is ignored if there is none
+            if any(open_tag.name == tag_name for open_tag in open_tags):
+                while True:
+                    closed_tag = open_tags.pop()
+                    if closed_tag.extracted is not None:
+                        # A div closed by the end tag of an element around it ends right before that tag
+                        closed_tag.extracted.content = serialize_div(
+                            (
+                                text.slice(closed_tag.start, offset)
+                                if closed_tag.name == tag_name
+                                else f"{text.slice(closed_tag.start, tag_start)}</div>"
+                            ),
+                            closed_tag.preserve_whitespace,
+                        )
+                    if closed_tag.name == tag_name:
+                        break
+
+        else:
+            start_tag = text.match(_START_TAG_RE, tag_start)
+            if start_tag is None:
+                # Not a tag after all
+                offset = tag_start + 1
+                continue
+
+            offset = text.buffer_start + start_tag.end()
+            tag_name = start_tag.group(1).lower()
+
+            if tag_name in _RAW_TEXT_TAGS:
+                raw_text_end = text.find(
+                    re.compile(rf"</{tag_name}\s*>", re.IGNORECASE), offset, tail=len(tag_name) + 3
+                )
+                offset = text.buffer_start + raw_text_end.end() if raw_text_end is not None else text.end
+                continue
+
+            preserve_whitespace = any(open_tag.name in _PRESERVE_WHITESPACE_TAGS for open_tag in open_tags)
+            extracted_div = None
+
+            if tag_name == "div":
+                div_id = tag_attributes(start_tag.group(0)).get("id")
+                bibkey = get_bibkey_from_div_id(div_id) if div_id is not None else ""
+                in_namespace = namespace is None or (div_id is not None and div_id.startswith(f"ref-{namespace}-"))
+
+                if bibkey != "" and in_namespace:
+                    extracted_div = _ExtractedDiv(bibkey=bibkey)
+                    extracted.append(extracted_div)
+
+            if start_tag.group(0).endswith("/>") or tag_name in _VOID_TAGS:
+                # Closed right away, e.g. '<div/>' is an empty div
+                if extracted_div is not None:
+                    extracted_div.content = serialize_div(start_tag.group(0), preserve_whitespace)
+                continue
+
+            if tag_name == "div":
+                # Fast path: if the markup up to the next '</div>' has no other div and is canonical, its tags are all balanced and can't change anything around it, so there is no need to scan them
+                div_end = text.find(_DIV_END_RE, offset, tail=len("</div>"))
+                if div_end is not None:
+                    div_end_offset = text.buffer_start + div_end.end()
+                    markup = text.slice(tag_start, div_end_offset)
+                    content = (
+                        serialize_canonical_markup(markup, preserve_whitespace)
+                        if markup.find("<div", offset - tag_start) == -1
+                        else None
+                    )
+                    if content is not None:
+                        if extracted_div is not None:
+                            extracted_div.content = content
+                        offset = div_end_offset
+                        continue
+
+            open_tags.append(_OpenTag(tag_name, tag_start, extracted_div, preserve_whitespace))
+
+    # Tags left open at the end of the file end with it
+    for open_tag in open_tags:
+        if open_tag.extracted is not None:
+            open_tag.extracted.content = serialize_div(
+                text.slice(open_tag.start, text.end), open_tag.preserve_whitespace
+            )
+
+    for done in extracted:
+        yield BibDiv(div_id=done.bibkey, content=f"{done.content}")
@@ -1,15 +1,25 @@
+import codecs
 import csv
+import io
+import json
+import mmap
 import os
 from pathlib import Path
-from typing import Dict, FrozenSet, Tuple
-from src.ref_pipe.bibkey_utils import load_validate_bibliography_bibkeys, validate_bibkeys
-from src.sdk.ResultMonad import Err, Ok, runwrap, runwrap_or, try_except_wrapper
-from src.sdk.utils import get_logger, lginf, remove_extra_whitespace, pretty_format_frozenset
+from typing import Dict, Iterable, List, Tuple, cast
+import polars as pl
+from src.ref_pipe.bibkey_utils import index_validate_bibliography
+from src.ref_pipe.profiling import PROFILE_COLUMNS, RunProfiler
+from src.sdk.ResultMonad import Err, Ok, try_except_wrapper
+from src.sdk.utils import get_logger, lginf, pretty_format_frozenset
 from src.ref_pipe.models import (
+    HTML_FILE_STATUSES,
     SUPPORTED_ENTITY_TYPES,
     BibEntity,
     Bibliography,
+    HTMLFileChange,
+    RunPlanEntry,
     THTMLReport,
+    TRunSummary,
     TSupportedEntity,
     TBibEntityAttribute,
 )
@@ -18,28 +28,6 @@ from src.ref_pipe.models import (
 lgr = get_logger("Filesystem I/O")
 
 
-@try_except_wrapper(lgr)
-def extract_bibkeys(bibkeys_s: str) -> FrozenSet[str]:
-
-    if bibkeys_s is None or bibkeys_s == "":
-        return frozenset()
-
-    # Skip truncated cells from Google Sheets compatibility
-    if bibkeys_s.strip() == "[TOO LONG]":
-        return frozenset()
-
-    return frozenset({remove_extra_whitespace(k) for k in bibkeys_s.split(",")})
-
-
-type RawBibEntity = Tuple[
-    str,  # id
-    str,  # entity_key
-    str,  # url_endpoint
-    FrozenSet[str],  # main_bibkeys
-    FrozenSet[str],  # further_references
-    FrozenSet[str],  # depends_on
-]
-
 """
 The following dictionary maps the attributes of the external CSV file to the attributes of the BibEntity class.
 """
@@ -87,7 +75,24 @@ EXTERNAL_COLUMN: Dict[TSupportedEntity, Dict[TBibEntityAttribute, str]] = {
 }
 
 
-def load_raw_bibentities_csv(input_file: str, encoding: str, entity_type: TSupportedEntity) -> list[RawBibEntity]:
+def _bibkeys_list(column: str) -> pl.Expr:
+    """
+    Split a column of comma-separated bibkeys into a list column.
+    Empty cells, and cells truncated for Google Sheets compatibility ('[TOO LONG]'), have no bibkeys.
+    """
+    cell = pl.col(column)
+
+    return (
+        pl.when((cell == "") | (cell.str.strip_chars() == "[TOO LONG]"))
+        .then(pl.lit([], dtype=pl.List(pl.String)))
+        .otherwise(cell.str.split(",").list.eval(pl.element().str.replace_all(r"\s+", " ").str.strip_chars()))
+    )
+
+
+def load_raw_bibentities_csv(input_file: str, encoding: str, entity_type: TSupportedEntity) -> pl.DataFrame:
+    """
+    Read the bibentities of a CSV file as a table with a column per attribute of the BibEntity class, the bibkeys being list columns.
+    """
 
     frame = f"load_bibentities_csv"
     lginf(frame, f"Reading CSV file '{input_file}' with encoding '{encoding}' for entity type '{entity_type}'...", lgr)
@@ -96,83 +101,84 @@ def load_raw_bibentities_csv(input_file: str, encoding: str, entity_type: TSuppo
         msg = f"The input file '{input_file}' does not exist."
         raise FileNotFoundError(msg)
 
-    with open(input_file, "r", encoding=encoding) as f:
-        reader = csv.DictReader(f)
-
-        required_columns = tuple(col for col in EXTERNAL_COLUMN[entity_type].values())
-
-        if reader.fieldnames is None or not all(col in reader.fieldnames for col in required_columns):
-            msg = f"The CSV file needs to have a header row with at least the following columns:\n\t{', '.join(required_columns)}."
-            raise ValueError(msg)
-
-        rows = tuple(reader)  # Read all rows into memory
-
-    output: list[RawBibEntity] = []
+    # Polars only reads UTF-8
+    source: str | io.BytesIO = input_file
+    if codecs.lookup(encoding).name != "utf-8":
+        with open(input_file, "r", encoding=encoding) as f:
+            source = io.BytesIO(f.read().encode("utf-8"))
 
-    id_column = EXTERNAL_COLUMN[entity_type]["id"]
-    entity_key_column = EXTERNAL_COLUMN[entity_type]["entity_key"]
-    url_endpoint_column = EXTERNAL_COLUMN[entity_type]["url_endpoint"]
-    main_bibkeys_column = EXTERNAL_COLUMN[entity_type]["main_bibkeys"]
-    further_references_column = EXTERNAL_COLUMN[entity_type]["further_references"]
-    depends_on_column = EXTERNAL_COLUMN[entity_type]["depends_on"]
+    raw_df = pl.read_csv(source, infer_schema=False, raise_if_empty=False).with_columns(pl.all().fill_null(""))
 
-    for row in rows:
-        output.append(
-            (
-                f"{row[id_column]}",
-                f"{row[entity_key_column]}",
-                f"{row[url_endpoint_column]}",
-                runwrap(extract_bibkeys(row[main_bibkeys_column])),
-                runwrap_or(extract_bibkeys(row[further_references_column]), frozenset()),
-                runwrap_or(extract_bibkeys(row[depends_on_column]), frozenset()),
-            )
-        )
+    column = EXTERNAL_COLUMN[entity_type]
+    required_columns = tuple(col for col in column.values())
 
-    return output
+    if not all(col in raw_df.columns for col in required_columns):
+        msg = f"The CSV file needs to have a header row with at least the following columns:\n\t{', '.join(required_columns)}."
+        raise ValueError(msg)
 
+    return raw_df.select(
+        pl.col(column["id"]).alias("id"),
+        pl.col(column["entity_key"]).alias("entity_key"),
+        pl.col(column["url_endpoint"]).alias("url_endpoint"),
+        _bibkeys_list(column["main_bibkeys"]).alias("main_bibkeys"),
+        _bibkeys_list(column["further_references"]).alias("further_references"),
+        _bibkeys_list(column["depends_on"]).alias("depends_on"),
+    )
 
-def process_raw_bibentity(raw_bibentity: RawBibEntity, bibliography: Bibliography) -> BibEntity:
-    (
-        bib_id,
-        entity_key,
-        url_endpoint,
-        main_bibkeys,
-        further_references_raw,
-        depends_on_raw,
-    ) = raw_bibentity
 
-    # lgr.info(f"main_bibkeys: {pretty_format_frozenset(main_bibkeys)}")
-    # lgr.info(f"further_references_raw: {pretty_format_frozenset(further_references_raw)}")
-    # lgr.info(f"depends_on_raw: {pretty_format_frozenset(depends_on_raw)}")
+def process_raw_bibentities(raw_bibentities: pl.DataFrame, bibliography: Bibliography) -> Tuple[BibEntity, ...]:
+    """
+    Make the sets of bibkeys of the bibentities disjoint, and check that all of their bibkeys are in the bibliography, reporting all the missing ones at once.
+    The bibkeys of the bibliography are validated when it is loaded, so the ones found in it need no further validation.
+    """
 
     # Force uniqueness of sets of bibkeys to prevent unnecessary processing
-    further_references = further_references_raw - main_bibkeys
-    _depends_on = depends_on_raw - main_bibkeys
-    depends_on = _depends_on - further_references
-
-    # lgr.info(f"further_references: {pretty_format_frozenset(further_references)}")
-    # lgr.info(f"depends_on: {pretty_format_frozenset(depends_on)}")
-
-    # Sanitize bibkeys
-    bibentity_bibkeys = main_bibkeys | further_references | depends_on
-
-    # Assert that all bibkeys have the standard structure
-    validate_bibkeys(bibentity_bibkeys, bibliography.bibkey_index_dict)
+    bibentities_df = raw_bibentities.with_columns(
+        main_bibkeys=pl.col("main_bibkeys").list.unique(),
+        further_references=pl.col("further_references").list.set_difference(pl.col("main_bibkeys")),
+        depends_on=pl.col("depends_on").list.set_difference(
+            pl.concat_list(pl.col("main_bibkeys"), pl.col("further_references"))
+        ),
+    )
 
     # Assert that all bibkeys are present in the bibliography
-    if not bibentity_bibkeys.issubset(bibliography.bibkeys):
-        missing_bibkeys = bibentity_bibkeys - bibliography.bibkeys
+    bibentity_bibkeys = (
+        bibentities_df.with_row_index("row")
+        .select(
+            "row",
+            "entity_key",
+            bibkey=pl.concat_list(pl.col("main_bibkeys"), pl.col("further_references"), pl.col("depends_on")),
+        )
+        .explode("bibkey")
+        .drop_nulls("bibkey")
+    )
+    bibliography_bibkeys = pl.DataFrame({"bibkey": pl.Series(tuple(bibliography.bibkeys), dtype=pl.String)})
+    missing = bibentity_bibkeys.join(bibliography_bibkeys, on="bibkey", how="anti")
+
+    if missing.height > 0:
+        missing_by_bibentity = missing.group_by("row", maintain_order=True).agg(
+            pl.col("entity_key").first(), pl.col("bibkey").unique().sort()
+        )
+        missing_str = "\n".join(
+            f"'{entity_key}': {', '.join(bibkeys)}"
+            for entity_key, bibkeys in missing_by_bibentity.select("entity_key", "bibkey").iter_rows()
+        )
         raise ValueError(
-            f"Missing bibkeys for '{entity_key}' in the bibliography: {', '.join(sorted(missing_bibkeys))}"
+            f"Missing bibkeys in the bibliography for {missing_by_bibentity.height} bibentities:\n{missing_str}"
         )
 
-    return BibEntity(
-        id=bib_id,
-        entity_key=entity_key,
-        url_endpoint=url_endpoint,
-        main_bibkeys=main_bibkeys,
-        further_references=further_references,
-        depends_on=depends_on,
+    return tuple(
+        BibEntity(
+            id=bib_id,
+            entity_key=entity_key,
+            url_endpoint=url_endpoint,
+            main_bibkeys=frozenset(main_bibkeys),
+            further_references=frozenset(further_references),
+            depends_on=frozenset(depends_on),
+        )
+        for bib_id, entity_key, url_endpoint, main_bibkeys, further_references, depends_on in bibentities_df.select(
+            "id", "entity_key", "url_endpoint", "main_bibkeys", "further_references", "depends_on"
+        ).iter_rows()
     )
 
 
@@ -205,7 +211,58 @@ def load_bibentities(
         case (_, _):
             raise ValueError(f"Unsupported file extension '{extension}'.")
 
-    return tuple(process_raw_bibentity(raw_bibentity, bibliography) for raw_bibentity in raw_bibentities)
+    return process_raw_bibentities(raw_bibentities, bibliography)
+
+
+RUN_PLAN_COLUMNS = ("input_csv", "entity_type", "output_report")
+
+
+@try_except_wrapper(lgr)
+def load_run_plan(plan_file: str) -> Tuple[RunPlanEntry, ...]:
+    """
+    Read a run plan: a CSV file with a row per entity type to process in the same run, and the columns 'input_csv', 'entity_type' and 'output_report' (and optionally 'previous_report').
+    """
+
+    frame = f"load_run_plan"
+    lginf(frame, f"Reading run plan '{plan_file}'...", lgr)
+
+    if not os.path.exists(plan_file):
+        raise FileNotFoundError(f"The run plan '{plan_file}' does not exist.")
+
+    with open(plan_file, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+
+        if reader.fieldnames is None or not all(col in reader.fieldnames for col in RUN_PLAN_COLUMNS):
+            msg = f"The run plan needs to have a header row with at least the following columns:\n\t{', '.join(RUN_PLAN_COLUMNS)}."
+            raise ValueError(msg)
+
+        rows = tuple(reader)
+
+    plan: list[RunPlanEntry] = []
+    for row in rows:
+        entity_type = row["entity_type"].strip()
+        if entity_type not in SUPPORTED_ENTITY_TYPES:
+            raise ValueError(
+                f"Unsupported entity type '{entity_type}' in the run plan. Must be one of: {', '.join(SUPPORTED_ENTITY_TYPES)}."
+            )
+
+        plan.append(
+            RunPlanEntry(
+                input_csv=row["input_csv"].strip(),
+                entity_type=cast(TSupportedEntity, entity_type),
+                output_report=row["output_report"].strip(),
+                previous_report=(row.get("previous_report") or "").strip(),
+            )
+        )
+
+    if not plan:
+        raise ValueError(f"The run plan '{plan_file}' has no entries.")
+
+    output_reports = tuple(entry.output_report for entry in plan)
+    if len(set(output_reports)) != len(output_reports):
+        raise ValueError(f"The entries of the run plan '{plan_file}' must have different output reports.")
+
+    return tuple(plan)
 
 
 @try_except_wrapper(lgr)
@@ -218,24 +275,101 @@ def load_bibliography(bibliography_file: str) -> Bibliography:
         msg = f"The bibliography file '{bibliography_file}' does not exist."
         raise FileNotFoundError(msg)
 
-    bibkeys, bibkey_linenum_d = load_validate_bibliography_bibkeys(bibliography_file)
+    with open(bibliography_file, "rb") as f:
+        # An empty file can't be memory-mapped
+        content: mmap.mmap | bytes = (
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size > 0 else b""
+        )
 
-    with open(bibliography_file, "r") as f:
-        content_tuple = tuple(f.readlines())
+    try:
+        bibkeys, bibkey_linenum_d, line_offsets = index_validate_bibliography(content)
+    except Exception:
+        if isinstance(content, mmap.mmap):
+            content.close()
+        raise
+
+    lginf(frame, f"Indexed {len(bibkeys)} bibkeys.", lgr)
 
     return Bibliography(
         bibkeys=bibkeys,
         bibkey_index_dict=bibkey_linenum_d,
-        content=content_tuple,
+        line_offsets=line_offsets,
+        content=content,
     )
 
 
+def run_summary_filename(report_filename: str) -> str:
+    return f"{os.path.splitext(report_filename)[0]}-summary.json"
+
+
+def write_run_summary(run_summary: TRunSummary, report_filename: str) -> None:
+
+    frame = f"write_run_summary"
+
+    summary_filename = run_summary_filename(report_filename)
+
+    with open(summary_filename, "w") as f:
+        json.dump(run_summary, f, indent=2)
+
+    summary_str = "\n\t".join(f"{key}: {value}" for key, value in run_summary.items())
+    lginf(frame, f"Run summary written to {summary_filename}:\n\t{summary_str}", lgr)
+
+    return None
+
+
+def html_changes_filename(report_filename: str) -> str:
+    return f"{os.path.splitext(report_filename)[0]}-changes.json"
+
+
+def write_html_changes(html_changes: Iterable[HTMLFileChange], report_filename: str) -> Dict[str, int]:
+    """
+    Write the change manifest of the run next to its report: the HTML files it created, changed, and left unchanged, with the SHA-256 of their content, so that only the created and changed files need to be uploaded.
+    Returns the number of files of each status.
+    """
+
+    frame = f"write_html_changes"
+
+    changes_filename = html_changes_filename(report_filename)
+
+    files: Dict[str, List[str]] = {status: [] for status in HTML_FILE_STATUSES}
+    content_hashes: Dict[str, str] = {}
+    for change in html_changes:
+        files[change.status].append(change.filename)
+        content_hashes[change.filename] = change.content_hash
+
+    with open(changes_filename, "w") as f:
+        json.dump({**files, "content_hashes": content_hashes}, f, indent=2)
+
+    counts = {status: len(filenames) for status, filenames in files.items()}
+    lginf(
+        frame,
+        f"Change manifest written to {changes_filename}: {', '.join(f'{count} {status}' for status, count in counts.items())}.",
+        lgr,
+    )
+
+    return counts
+
+
 @try_except_wrapper(lgr)
-def generate_report_for_html_files(main_output: THTMLReport, output_filename: str, encoding: str) -> None:
+def generate_report_for_html_files(
+    main_output: THTMLReport,
+    output_filename: str,
+    encoding: str,
+    run_summary: TRunSummary | None = None,
+    profiler: RunProfiler | None = None,
+) -> None:
+    """
+    Consume the output of the pipeline, writing one row per bibentity to the report.
+    If a run summary is given, it is written next to the report once the pipeline has been fully consumed.
+    If a profiler is given, the profile of each bibentity is added to its row (empty for the bibentities that were not processed, e.g., carried over from a previous run).
+    The HTML files written by the run are listed in a change manifest next to the report (see `write_html_changes`).
+    """
 
     frame = f"generate_report_for_html_files"
     lginf(frame, f"Generating report for the markdown file generation...", lgr)
 
+    html_changes: List[HTMLFileChange] = []
+
     with open(output_filename, "w", encoding=encoding) as f:
         writer = csv.writer(f, quotechar='"')
         writer.writerow(
@@ -251,6 +385,7 @@ def generate_report_for_html_files(main_output: THTMLReport, output_filename: st
                 "status",
                 "error_message",
                 "model_dump",
+                *(PROFILE_COLUMNS if profiler is not None else ()),
             ]
         )
 
@@ -270,6 +405,7 @@ def generate_report_for_html_files(main_output: THTMLReport, output_filename: st
                         status = "success"
                         references_html_file = out_e.html.references_filename
                         further_references_html_file = out_e.html.further_references_filename
+                        html_changes.extend(out_e.html_changes)
 
                 case Err(message=message, code=code):
                     status = "error"
@@ -277,6 +413,11 @@ def generate_report_for_html_files(main_output: THTMLReport, output_filename: st
 
             dump = entity.dump()
 
+            profile_row: list[str] = []
+            if profiler is not None:
+                profile = profiler.get(entity)
+                profile_row = list(profile.dump().values()) if profile is not None else [""] * len(PROFILE_COLUMNS)
+
             writer.writerow(
                 [
                     entity.id,
@@ -290,9 +431,16 @@ def generate_report_for_html_files(main_output: THTMLReport, output_filename: st
                     status,
                     err_msg,
                     dump,
+                    *profile_row,
                 ]
             )
 
     lginf(frame, f"Success! Report written to {output_filename}.", lgr)
 
+    html_changes_counts = write_html_changes(html_changes, output_filename)
+
+    if run_summary is not None:
+        run_summary.update({f"html_files_{status}": count for status, count in html_changes_counts.items()})
+        write_run_summary(run_summary, output_filename)
+
     return None
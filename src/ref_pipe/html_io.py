@@ -1,18 +1,26 @@
+import hashlib
 import os
-from typing import FrozenSet, Tuple
+import uuid
+from typing import BinaryIO, Callable, Dict, FrozenSet, List, Tuple
 from src.sdk.utils import get_logger, lginf
 from src.sdk.ResultMonad import try_except_wrapper
+from src.ref_pipe.incremental import hash_file
+from src.ref_pipe.profiling import profiled_stage
 from src.ref_pipe.models import (
     BibDiv,
     BibEntity,
     BibEntityWithHTML,
     Bibliography,
+    BibSortRanks,
+    HTMLFileChange,
     HTMLIssue,
     HTMLVolume,
     HTMLYear,
     RefHTML,
     TBibDivDict,
     THTMLCollapsible,
+    THTMLFileStatus,
+    TJournalIndex,
     TSupportedEntity,
     SUPPORTED_ENTITY_TYPES,
 )
@@ -27,76 +35,40 @@ lgr = get_logger("Generate HTMLs")
 # =============================================================================
 
 
-def _sort_for_profile(bibkeys: FrozenSet[str], bib_df: pl.DataFrame) -> tuple[str, ...]:
+def _sort_by_rank(bibkeys: FrozenSet[str], ranks: Dict[str, int]) -> tuple[str, ...]:
     """
-    Sort bibkeys for profile entities.
-    Sort order: date DESC (nulls first), title ASC.
+    Sort bibkeys by their precomputed global rank. Bibkeys without rank are left out, unless none of them has one.
     """
-    filtered = bib_df.filter(pl.col("bibkey").is_in(bibkeys))
-    if filtered.is_empty():
+    ranked_bibkeys = [bibkey for bibkey in bibkeys if bibkey in ranks]
+    if not ranked_bibkeys:
         return tuple(bibkeys)
 
-    # Sort with nulls first for date (descending), title ascending
-    sorted_df = filtered.sort(
-        by=["date", "_sort_title"],
-        descending=[True, False],
-        nulls_last=[False, True],
-    )
-    return tuple(sorted_df["bibkey"].to_list())
-
-
-def _sort_for_publisher(bibkeys: FrozenSet[str], bib_df: pl.DataFrame) -> tuple[str, ...]:
-    """
-    Sort bibkeys for publisher entities.
-    Sort order: last_name ASC, first_name ASC, title ASC (no author = end).
-    """
-    filtered = bib_df.filter(pl.col("bibkey").is_in(bibkeys))
-    if filtered.is_empty():
-        return tuple(bibkeys)
-
-    sorted_df = filtered.sort(
-        by=["_sort_last_name", "_sort_first_name", "_sort_title"],
-        descending=[False, False, False],
-    )
-    return tuple(sorted_df["bibkey"].to_list())
-
-
-def _sort_for_default(bibkeys: FrozenSet[str], bib_df: pl.DataFrame) -> tuple[str, ...]:
-    """
-    Sort bibkeys for default entities (article, page, etc.).
-    Sort order: last_name ASC, first_name ASC, date DESC, title ASC (no author = end).
-    """
-    filtered = bib_df.filter(pl.col("bibkey").is_in(bibkeys))
-    if filtered.is_empty():
-        return tuple(bibkeys)
-
-    sorted_df = filtered.sort(
-        by=["_sort_last_name", "_sort_first_name", "date", "_sort_title"],
-        descending=[False, False, True, False],
-        nulls_last=[True, True, True, True],
-    )
-    return tuple(sorted_df["bibkey"].to_list())
+    return tuple(sorted(ranked_bibkeys, key=ranks.__getitem__))
 
 
 def sort_bibkeys_for_entity(
     bibkeys: FrozenSet[str],
-    bib_df: pl.DataFrame | None,
+    sort_ranks: BibSortRanks | None,
     entity_type: TSupportedEntity,
 ) -> tuple[str, ...]:
     """
     Route to appropriate sorting based on entity type.
     Returns a tuple of bibkeys in sorted order.
+
+    - profile: date DESC (nulls first), title ASC.
+    - publisher: last_name ASC, first_name ASC, title ASC (no author = end).
+    - default (article, page, etc.): last_name ASC, first_name ASC, date DESC, title ASC (no author = end).
     """
-    if bib_df is None:
+    if sort_ranks is None:
         return tuple(bibkeys)  # Fallback: no sorting
 
     match entity_type:
         case "profile":
-            return _sort_for_profile(bibkeys, bib_df)
+            return _sort_by_rank(bibkeys, sort_ranks.profile)
         case "publisher":
-            return _sort_for_publisher(bibkeys, bib_df)
+            return _sort_by_rank(bibkeys, sort_ranks.publisher)
         case _:  # article, page, default
-            return _sort_for_default(bibkeys, bib_df)
+            return _sort_by_rank(bibkeys, sort_ranks.default)
 
 
 def get_bibdivs_ordered(bibdiv_dict: dict[str, str], bibkeys: tuple[str, ...]) -> Tuple[str, ...]:
@@ -113,12 +85,79 @@ def get_bibdivs(bibdiv_dict: dict[str, str], bibkeys: FrozenSet[str]) -> Tuple[s
     return tuple(bibdiv_dict.get(bibkey, "") for bibkey in bibkeys if bibdiv_dict.get(bibkey, "") != "")
 
 
+type TWrite = Callable[[str], object]
+
+
+def _replace_file(filename: str, write_content: Callable[[BinaryIO], object]) -> None:
+    """
+    Write the content into a temporary file next to `filename`, then move it over `filename`.
+    The move is atomic, so a crash mid-write leaves the previous file in place instead of a truncated one.
+    """
+    tmp_filename = f"{os.path.dirname(filename) or '.'}/.{os.path.basename(filename)}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_filename, "xb") as f:
+            write_content(f)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def _file_status(filename: str, content_size: int, content_hash: str) -> THTMLFileStatus:
+    if not os.path.exists(filename):
+        return "created"
+    if os.path.getsize(filename) != content_size or hash_file(filename) != content_hash:
+        return "changed"
+    return "unchanged"
+
+
+def write_if_changed(filename: str, content: bytes) -> HTMLFileChange:
+    """
+    Write the content to the file, unless the file already has exactly this content.
+    Identical files are left untouched, so that their modification time doesn't change, and the upload to the portal only transfers the files that did.
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    status = _file_status(filename, len(content), content_hash)
+    if status != "unchanged":
+        _replace_file(filename, lambda f: f.write(content))
+
+    return HTMLFileChange(filename=filename, status=status, content_hash=content_hash)
+
+
+type TRender = Callable[[TWrite], None]
+
+
+def write_stream_if_changed(filename: str, render: TRender) -> HTMLFileChange:
+    """
+    Same as `write_if_changed`, for content that `render` streams piece by piece to a `write` function.
+    A first pass only hashes the pieces; the content is rendered again, into the file, only if it changed.
+    """
+    content_hash = hashlib.sha256()
+    content_size = 0
+
+    def hash_piece(piece: str) -> None:
+        nonlocal content_size
+        encoded_piece = piece.encode("utf-8")
+        content_hash.update(encoded_piece)
+        content_size += len(encoded_piece)
+
+    render(hash_piece)
+
+    status = _file_status(filename, content_size, content_hash.hexdigest())
+    if status != "unchanged":
+        _replace_file(filename, lambda f: render(lambda piece: f.write(piece.encode("utf-8"))))
+
+    return HTMLFileChange(filename=filename, status=status, content_hash=content_hash.hexdigest())
+
+
 def gen_basic_html_files(
     bibentity: BibEntity,
     bibdiv_dict: TBibDivDict,
     output_basedir: str,
     entity_type: TSupportedEntity,
-    bib_df: pl.DataFrame,
+    sort_ranks: BibSortRanks | None,
 ) -> BibEntityWithHTML:
 
     frame = f"gen_basic_html_files"
@@ -127,16 +166,18 @@ def gen_basic_html_files(
 
     main_bibkeys = bibentity.main_bibkeys
     further_references = bibentity.further_references
+    html_changes: List[HTMLFileChange] = []
 
     # 1. Main references
     if main_bibkeys != frozenset():
         # Sort bibkeys according to entity type
-        sorted_main_bibkeys = sort_bibkeys_for_entity(main_bibkeys, bib_df, entity_type)
+        with profiled_stage("sort"):
+            sorted_main_bibkeys = sort_bibkeys_for_entity(main_bibkeys, sort_ranks, entity_type)
         main_bibkeys_divs = get_bibdivs_ordered(bibdiv_dict, sorted_main_bibkeys)
         main_bibkeys_filename = f"{output_basedir}/{bibentity.url_endpoint}-references.html"
 
-        with open(main_bibkeys_filename, "w") as f:
-            f.write("\n".join(main_bibkeys_divs))
+        with profiled_stage("html_write"):
+            html_changes.append(write_if_changed(main_bibkeys_filename, "\n".join(main_bibkeys_divs).encode("utf-8")))
 
         if not os.path.exists(main_bibkeys_filename):
             msg = f"The main references HTML file '{main_bibkeys_filename}' was not generated for '{bibentity.entity_key}'. Exiting."
@@ -161,12 +202,15 @@ def gen_basic_html_files(
     # 2. Further references and dependencies
     if further_references != frozenset():
         # Sort further references using the same entity type sorting
-        sorted_further_refs = sort_bibkeys_for_entity(further_references, bib_df, entity_type)
+        with profiled_stage("sort"):
+            sorted_further_refs = sort_bibkeys_for_entity(further_references, sort_ranks, entity_type)
         further_references_divs = get_bibdivs_ordered(bibdiv_dict, sorted_further_refs)
         further_references_filename = f"{output_basedir}/{bibentity.url_endpoint}-further-references.html"
 
-        with open(further_references_filename, "w") as f:
-            f.write("\n".join(further_references_divs))
+        with profiled_stage("html_write"):
+            html_changes.append(
+                write_if_changed(further_references_filename, "\n".join(further_references_divs).encode("utf-8"))
+            )
 
         if not os.path.exists(further_references_filename):
             msg = f"The further references HTML file '{further_references_filename}' was not generated for '{bibentity.entity_key}'. Exiting."
@@ -190,6 +234,7 @@ def gen_basic_html_files(
         further_references=bibentity.further_references,
         depends_on=bibentity.depends_on,
         html=ref_html,
+        html_changes=tuple(html_changes),
     )
 
 
@@ -273,81 +318,98 @@ COLLAPSIBLE_ISSUE_HTML_FORMAT = """
 """
 
 
-def generate_struct_html(
+def _split_collapsible_format(html_format: str) -> Tuple[str, str]:
+    """
+    Split a collapsible format at its `{contents}` placeholder, into the part that goes before the contents (still to be formatted with the name) and the one that goes after.
+    """
+    head, tail = html_format.split("{contents}")
+    return head, tail
+
+
+COLLAPSIBLE_YEAR_HTML_HEAD, COLLAPSIBLE_YEAR_HTML_TAIL = _split_collapsible_format(COLLAPSIBLE_YEAR_HTML_FORMAT)
+COLLAPSIBLE_VOLUME_HTML_HEAD, COLLAPSIBLE_VOLUME_HTML_TAIL = _split_collapsible_format(COLLAPSIBLE_VOLUME_HTML_FORMAT)
+COLLAPSIBLE_ISSUE_HTML_HEAD, COLLAPSIBLE_ISSUE_HTML_TAIL = _split_collapsible_format(COLLAPSIBLE_ISSUE_HTML_FORMAT)
+
+
+def _write_bibdiv(write: TWrite, bibkey: str, bibdiv_dict: TBibDivDict) -> None:
+    bibdiv = bibdiv_dict.get(bibkey, None)
+    if bibdiv is None:
+        lgr.warning(f"Bibkey {bibkey} not found in bibdiv_dict.")
+        return None
+
+    write(bibdiv)
+    write("\n")
+
+    return None
+
+
+def write_struct_html(
+    write: TWrite,
     struct: THTMLCollapsible,
     bibdiv_dict: TBibDivDict,
-) -> str:
-
-    main_html = f""
+) -> None:
+    """
+    Stream the HTML of a collapsible structure to `write`, piece by piece, without building the whole page in memory.
+    """
 
     for year in struct:
 
-        year_html_contents = f""
+        write(COLLAPSIBLE_YEAR_HTML_HEAD.format(name=year.name))
         for year_content in year.contents:
 
             if isinstance(year_content, str):
-                bibdiv = bibdiv_dict.get(year_content, None)
-                if bibdiv is None:
-                    lgr.warning(f"Bibkey {year_content} not found in bibdiv_dict.")
-                    continue
-                year_html_contents += bibdiv
-                year_html_contents += "\n"
+                _write_bibdiv(write, year_content, bibdiv_dict)
 
             elif isinstance(year_content, HTMLVolume):
 
-                vol_html_contents = f""
+                write(COLLAPSIBLE_VOLUME_HTML_HEAD.format(name=year_content.name))
                 for vol_content in year_content.contents:
 
                     if isinstance(vol_content, str):
-                        bibdiv = bibdiv_dict.get(vol_content, None)
-                        if bibdiv is None:
-                            lgr.warning(f"Bibkey {vol_content} not found in bibdiv_dict.")
-                            continue
-                        vol_html_contents += bibdiv
-                        vol_html_contents += "\n"
+                        _write_bibdiv(write, vol_content, bibdiv_dict)
 
                     elif isinstance(vol_content, HTMLIssue):
-                        issue_html_contents = f""
-
+                        write(COLLAPSIBLE_ISSUE_HTML_HEAD.format(name=vol_content.name))
                         for issue_content in vol_content.contents:
-                            bibdiv = bibdiv_dict.get(issue_content, None)
-                            if bibdiv is None:
-                                lgr.warning(f"Bibkey {issue_content} not found in bibdiv_dict.")
-                                continue
-                            issue_html_contents += bibdiv
-                            issue_html_contents += "\n"
-
-                        issue_html = COLLAPSIBLE_ISSUE_HTML_FORMAT.format(
-                            name=vol_content.name, contents=issue_html_contents
-                        )
-                        vol_html_contents += issue_html
-                        vol_html_contents += "\n"
+                            _write_bibdiv(write, issue_content, bibdiv_dict)
+                        write(COLLAPSIBLE_ISSUE_HTML_TAIL)
+                        write("\n")
+
                     else:
                         raise ValueError(f"Unknown content type for volume content: {type(vol_content)}")
 
-                volume_html = COLLAPSIBLE_VOLUME_HTML_FORMAT.format(name=year_content.name, contents=vol_html_contents)
-                year_html_contents += volume_html
-                year_html_contents += "\n"
+                write(COLLAPSIBLE_VOLUME_HTML_TAIL)
+                write("\n")
 
             else:
                 raise ValueError(f"Unknown content type for year content: {type(year_content)}")
 
-        year_html = COLLAPSIBLE_YEAR_HTML_FORMAT.format(name=year.name, contents=year_html_contents)
-        main_html += year_html
-        main_html += "\n"
+        write(COLLAPSIBLE_YEAR_HTML_TAIL)
+        write("\n")
 
-    return main_html
+    return None
+
+
+def generate_struct_html(
+    struct: THTMLCollapsible,
+    bibdiv_dict: TBibDivDict,
+) -> str:
+
+    chunks: List[str] = []
+    write_struct_html(chunks.append, struct, bibdiv_dict)
+
+    return "".join(chunks)
 
 
 def gen_journal_html_file(
     bibentity: BibEntity,
     bibdiv_dict: TBibDivDict,
     output_basedir: str,
-    bib_df: pl.DataFrame,
+    journal_df: pl.DataFrame,
 ) -> BibEntityWithHTML:
     """
     Generate the HTML file for a journal entity.
-    This function creates a collapsible HTML structure for the journal's articles.
+    This function creates a collapsible HTML structure for the journal's articles, from the rows of the journal in the journal index.
     """
     frame = f"gen_journal_html_file"
     lginf(frame, f"Generating HTML file for journal '{bibentity.entity_key}'...", lgr)
@@ -357,15 +419,17 @@ def gen_journal_html_file(
         msg = f"The output directory '{output_basedir}' does not exist and could not be created. Exiting."
         raise FileNotFoundError(msg)
 
-    journal_df = bib_df.filter(bib_df['journal-id'] == str(bibentity.id))
-    journal_structure = build_collapsible(journal_df)
-    journal_html = generate_struct_html(journal_structure, bibdiv_dict)
+    with profiled_stage("sort"):
+        journal_structure = build_collapsible(journal_df)
 
     journal_html_filename = f"{output_basedir}/{bibentity.url_endpoint}.html"
 
-    with open(journal_html_filename, "w") as f:
-        f.write(journal_html)
-        f.write("\n")
+    def render_journal_html(write: TWrite) -> None:
+        write_struct_html(write, journal_structure, bibdiv_dict)
+        write("\n")
+
+    with profiled_stage("html_write"):
+        html_change = write_stream_if_changed(journal_html_filename, render_journal_html)
 
     if not os.path.exists(journal_html_filename):
         msg = (
@@ -390,6 +454,7 @@ def gen_journal_html_file(
             references_filename=journal_html_filename,
             further_references_filename="",
         ),
+        html_changes=(html_change,),
     )
 
 
@@ -421,32 +486,38 @@ def build_publisher_collapsible(
     return tuple(years)
 
 
-def generate_publisher_struct_html(
+def write_publisher_struct_html(
+    write: TWrite,
     struct: Tuple[HTMLYear, ...],
     bibdiv_dict: TBibDivDict,
-) -> str:
+) -> None:
     """
-    Generate HTML for publisher collapsible structure (year-only nesting).
+    Stream the HTML of a publisher collapsible structure (year-only nesting) to `write`.
     Simpler than journal structure - only one level of collapsible.
     """
-    main_html = ""
 
     for year in struct:
-        year_html_contents = ""
+        write(COLLAPSIBLE_YEAR_HTML_HEAD.format(name=year.name))
         for bibkey in year.contents:
             if isinstance(bibkey, str):
-                bibdiv = bibdiv_dict.get(bibkey, None)
-                if bibdiv is None:
-                    lgr.warning(f"Bibkey {bibkey} not found in bibdiv_dict.")
-                    continue
-                year_html_contents += bibdiv
-                year_html_contents += "\n"
+                _write_bibdiv(write, bibkey, bibdiv_dict)
+        write(COLLAPSIBLE_YEAR_HTML_TAIL)
+        write("\n")
 
-        year_html = COLLAPSIBLE_YEAR_HTML_FORMAT.format(name=year.name, contents=year_html_contents)
-        main_html += year_html
-        main_html += "\n"
+    return None
 
-    return main_html
+
+def generate_publisher_struct_html(
+    struct: Tuple[HTMLYear, ...],
+    bibdiv_dict: TBibDivDict,
+) -> str:
+    """
+    Generate HTML for publisher collapsible structure (year-only nesting).
+    """
+    chunks: List[str] = []
+    write_publisher_struct_html(chunks.append, struct, bibdiv_dict)
+
+    return "".join(chunks)
 
 
 def gen_publisher_html_file(
@@ -467,14 +538,17 @@ def gen_publisher_html_file(
         msg = f"The output directory '{output_basedir}' does not exist and could not be created. Exiting."
         raise FileNotFoundError(msg)
 
-    publisher_structure = build_publisher_collapsible(bibentity.main_bibkeys, bib_df)
-    publisher_html = generate_publisher_struct_html(publisher_structure, bibdiv_dict)
+    with profiled_stage("sort"):
+        publisher_structure = build_publisher_collapsible(bibentity.main_bibkeys, bib_df)
 
     publisher_html_filename = f"{output_basedir}/{bibentity.url_endpoint}.html"
 
-    with open(publisher_html_filename, "w") as f:
-        f.write(publisher_html)
-        f.write("\n")
+    def render_publisher_html(write: TWrite) -> None:
+        write_publisher_struct_html(write, publisher_structure, bibdiv_dict)
+        write("\n")
+
+    with profiled_stage("html_write"):
+        html_change = write_stream_if_changed(publisher_html_filename, render_publisher_html)
 
     if not os.path.exists(publisher_html_filename):
         msg = f"The publisher HTML file '{publisher_html_filename}' was not generated for '{bibentity.entity_key}'. Exiting."
@@ -497,6 +571,7 @@ def gen_publisher_html_file(
             references_filename=publisher_html_filename,
             further_references_filename="",
         ),
+        html_changes=(html_change,),
     )
 
 
@@ -507,6 +582,8 @@ def gen_html_files(
     output_basedir: str,
     entity_type: TSupportedEntity,
     bib_df: pl.DataFrame,
+    sort_ranks: BibSortRanks,
+    journal_index: TJournalIndex,
     bibliography: Bibliography,
 ) -> BibEntityWithHTML:
 
@@ -516,7 +593,8 @@ def gen_html_files(
     match entity_type:
 
         case "journal":
-            return gen_journal_html_file(bibentity, bibdiv_dict, output_basedir, bib_df)
+            journal_df = journal_index.get(str(bibentity.id), bib_df.clear())
+            return gen_journal_html_file(bibentity, bibdiv_dict, output_basedir, journal_df)
 
         case "publisher":
             return gen_publisher_html_file(bibentity, bibdiv_dict, output_basedir, bib_df)
@@ -527,7 +605,7 @@ def gen_html_files(
                 bibdiv_dict,
                 output_basedir,
                 entity_type,
-                bib_df,
+                sort_ranks,
             )
 
         case "profile":
@@ -536,7 +614,7 @@ def gen_html_files(
                 bibdiv_dict,
                 output_basedir,
                 entity_type,
-                bib_df,
+                sort_ranks,
             )
 
         case "page":
@@ -545,7 +623,7 @@ def gen_html_files(
                 bibdiv_dict,
                 output_basedir,
                 entity_type,
-                bib_df,
+                sort_ranks,
             )
 
         case _:
@@ -0,0 +1,230 @@
+"""
+Incremental runs: skip the bibentities whose inputs didn't change since a previous run, carrying their HTML files over into the new report.
+
+Every run writes a manifest next to its report, with the hashes of the CSL file, of the container image, and of the `.bib` line of every bibkey it used.
+A bibentity is unchanged if it was successfully processed in the previous run, its three sets of bibkeys are the same, the hashes of all their `.bib` lines are the same, and the CSL file and image are the same.
+"""
+
+import csv
+import hashlib
+import json
+import os
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Tuple
+
+from src.sdk.ResultMonad import Err, Ok
+from src.sdk.utils import get_logger, lginf
+from src.ref_pipe.models import BibEntity, BibEntityWithHTML, Bibliography, RefHTML, THTMLReport
+
+
+lgr = get_logger("Incremental")
+
+
+type TPreviousReportKey = Tuple[str, str, str]  # id, entity_key, url_endpoint
+
+
+class Manifest(NamedTuple):
+    """
+    Hashes of everything the HTML files of a run depend on, apart from the bibentities themselves.
+
+    Attributes:
+    ----------
+    `csl_hash`: str
+        Hash of the CSL file.
+    `image_id`: str
+        ID of the container image.
+    `bibkey_hashes`: Dict[str, str]
+        Hash of the `.bib` line of each bibkey used in the run.
+    """
+
+    csl_hash: str
+    image_id: str
+    bibkey_hashes: Dict[str, str]
+
+
+class PreviousReportRow(NamedTuple):
+    main_bibkeys: FrozenSet[str]
+    further_references: FrozenSet[str]
+    depends_on: FrozenSet[str]
+    references_html_file: str
+    further_references_html_file: str
+
+
+def manifest_filename(report_filename: str) -> str:
+    return f"{os.path.splitext(report_filename)[0]}-manifest.json"
+
+
+def hash_file(filename: str) -> str:
+    with open(filename, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def hash_bib_line(bibkey: str, bibliography: Bibliography) -> str:
+    return hashlib.sha256(bibliography.line_bytes(bibkey)).hexdigest()
+
+
+def build_manifest(
+    bibentities: Iterable[BibEntity], bibliography: Bibliography, csl_file: str, image_id: str
+) -> Manifest:
+
+    bibkeys_used = frozenset(
+        bibkey
+        for bibentity in bibentities
+        for bibkey in bibentity.main_bibkeys | bibentity.further_references | bibentity.depends_on
+        if bibkey in bibliography.bibkeys
+    )
+
+    return Manifest(
+        csl_hash=hash_file(csl_file),
+        image_id=image_id,
+        bibkey_hashes={bibkey: hash_bib_line(bibkey, bibliography) for bibkey in sorted(bibkeys_used)},
+    )
+
+
+def write_manifest(manifest: Manifest, filename: str) -> None:
+
+    frame = f"write_manifest"
+
+    with open(filename, "w") as f:
+        json.dump(manifest._asdict(), f)
+
+    lginf(frame, f"Manifest of {len(manifest.bibkey_hashes)} bibkeys written to {filename}.", lgr)
+
+    return None
+
+
+def load_manifest(filename: str) -> Manifest:
+
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"The manifest file '{filename}' does not exist.")
+
+    with open(filename, "r") as f:
+        raw_manifest = json.load(f)
+
+    return Manifest(
+        csl_hash=f"{raw_manifest['csl_hash']}",
+        image_id=f"{raw_manifest['image_id']}",
+        bibkey_hashes={f"{k}": f"{v}" for k, v in raw_manifest["bibkey_hashes"].items()},
+    )
+
+
+def _parse_report_bibkeys(bibkeys_s: str) -> FrozenSet[str]:
+    return frozenset(bibkey.strip() for bibkey in bibkeys_s.split(",") if bibkey.strip() != "")
+
+
+def load_previous_report(filename: str, encoding: str) -> Dict[TPreviousReportKey, PreviousReportRow]:
+    """
+    Load the successful rows of a report written by `generate_report_for_html_files`.
+    """
+
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"The previous report '{filename}' does not exist.")
+
+    with open(filename, "r", encoding=encoding) as f:
+        reader = csv.DictReader(f, quotechar='"')
+
+        return {
+            (row["id"], row["entity_key"], row["url_endpoint"]): PreviousReportRow(
+                main_bibkeys=_parse_report_bibkeys(row["main_bibkeys"]),
+                further_references=_parse_report_bibkeys(row["further_references"]),
+                depends_on=_parse_report_bibkeys(row["depends_on"]),
+                references_html_file=row["references_html_file"],
+                further_references_html_file=row["further_references_html_file"],
+            )
+            for row in reader
+            if row["status"] == "success"
+        }
+
+
+def is_unchanged(
+    bibentity: BibEntity,
+    previous_row: PreviousReportRow | None,
+    previous_manifest: Manifest,
+    manifest: Manifest,
+) -> bool:
+
+    if previous_row is None:
+        return False
+
+    if (
+        previous_row.main_bibkeys != bibentity.main_bibkeys
+        or previous_row.further_references != bibentity.further_references
+        or previous_row.depends_on != bibentity.depends_on
+    ):
+        return False
+
+    bibkeys = bibentity.main_bibkeys | bibentity.further_references | bibentity.depends_on
+    if any(
+        bibkey not in previous_manifest.bibkey_hashes
+        or previous_manifest.bibkey_hashes[bibkey] != manifest.bibkey_hashes.get(bibkey)
+        for bibkey in bibkeys
+    ):
+        return False
+
+    # The files of the previous run must still be there to be carried over
+    for html_file in (previous_row.references_html_file, previous_row.further_references_html_file):
+        if html_file != "" and not os.path.exists(html_file):
+            return False
+
+    return True
+
+
+def carry_over(bibentity: BibEntity, previous_row: PreviousReportRow) -> Ok[BibEntityWithHTML]:
+    return Ok(
+        out=BibEntityWithHTML(
+            id=bibentity.id,
+            entity_key=bibentity.entity_key,
+            url_endpoint=bibentity.url_endpoint,
+            main_bibkeys=bibentity.main_bibkeys,
+            further_references=bibentity.further_references,
+            depends_on=bibentity.depends_on,
+            html=RefHTML(
+                references_filename=previous_row.references_html_file,
+                further_references_filename=previous_row.further_references_html_file,
+            ),
+        )
+    )
+
+
+def find_unchanged_bibentities(
+    bibentities: Tuple[BibEntity, ...],
+    previous_report: Dict[TPreviousReportKey, PreviousReportRow],
+    previous_manifest: Manifest,
+    manifest: Manifest,
+) -> Dict[int, Ok[BibEntityWithHTML]]:
+    """
+    Return the carried over results of the unchanged bibentities, by their position in the input.
+    """
+
+    frame = f"find_unchanged_bibentities"
+
+    if previous_manifest.csl_hash != manifest.csl_hash or previous_manifest.image_id != manifest.image_id:
+        lginf(frame, f"The CSL file or the container image changed since the previous run. Rebuilding everything.", lgr)
+        return {}
+
+    unchanged: Dict[int, Ok[BibEntityWithHTML]] = {}
+    for i, bibentity in enumerate(bibentities):
+        previous_row = previous_report.get((bibentity.id, bibentity.entity_key, bibentity.url_endpoint))
+        if previous_row is not None and is_unchanged(bibentity, previous_row, previous_manifest, manifest):
+            unchanged[i] = carry_over(bibentity, previous_row)
+
+    lginf(frame, f"{len(unchanged)} of {len(bibentities)} bibentities are unchanged since the previous run.", lgr)
+
+    return unchanged
+
+
+def merge_carried_over(
+    bibentities: Tuple[BibEntity, ...],
+    unchanged: Dict[int, Ok[BibEntityWithHTML]],
+    rebuilt: THTMLReport,
+) -> THTMLReport:
+    """
+    Interleave the carried over results with the rebuilt ones, which must come in input order, so that the report keeps the order of the input.
+    """
+
+    for i, bibentity in enumerate(bibentities):
+        carried = unchanged.get(i)
+        if carried is not None:
+            result: tuple[BibEntity, Ok[BibEntityWithHTML] | Err] = (bibentity, carried)
+            yield result
+        else:
+            yield next(rebuilt)
@@ -1,20 +1,63 @@
-from typing import Callable
-from src.ref_pipe.preprocessors import prepare_bib_df, preprocess_bibentities
+from typing import Callable, Dict, Generator, Iterable, NamedTuple, Tuple
+from src.ref_pipe.preprocessors import load_bibliography_table, preprocess_raw_bibentities
 from src.ref_pipe.html_io import gen_html_files
-from src.ref_pipe.prep_divs import gen_bib_html_divs
+from src.ref_pipe.compile_backends import CompileBackend
+from src.ref_pipe.checkpoint import checkpoint_filename, checkpointed, find_completed_bibentities, load_checkpoint
+from src.ref_pipe.dedup import expand_duplicates, find_duplicate_bibentities
+from src.ref_pipe.div_cache import DEFAULT_DIV_CACHE_FILE, DivCache, load_div_cache
+from src.ref_pipe.incremental import (
+    build_manifest,
+    find_unchanged_bibentities,
+    load_manifest,
+    load_previous_report,
+    manifest_filename,
+    merge_carried_over,
+    write_manifest,
+)
+from src.ref_pipe.profiling import EntityProfile, RunProfiler, profiling_entity
+from src.ref_pipe.prep_divs import chunk_bibentities, gen_bib_html_divs, gen_bib_html_divs_batch
+from src.ref_pipe.pipelined import (
+    compile_stage_workers,
+    parse_stage_workers,
+    pipeline_scratch_dirs,
+    ref_pipe_pipelined,
+)
 from src.ref_pipe.models import (
+    DEFAULT_DIV_CACHE_MAX_SIZE_MB,
+    DEFAULT_STAGE_QUEUE_SIZE,
+    PIPELINE_STAGES,
+    SUPPORTED_COMPILE_BACKENDS,
     SUPPORTED_ENTITY_TYPES,
     BibEntity,
     BibEntityWithHTML,
     Bibliography,
+    BibliographyTable,
+    BibSortRanks,
+    EnvVars,
+    RunOptions,
+    RunPlanEntry,
+    TJournalIndex,
     THTMLReport,
+    TRunSummary,
     TSupportedEntity,
 )
-from src.sdk.utils import get_logger
+from src.sdk.utils import get_logger, lginf
 from src.sdk.ResultMonad import Err, Ok, rbind, runwrap, try_except_wrapper
 
-from src.ref_pipe.setup import dltc_env_up, load_env_vars, override_csl_file, restore_csl_file
-from src.ref_pipe.filesystem_io import generate_report_for_html_files, load_bibentities, load_bibliography
+from src.ref_pipe.workers import make_scratch_dirs, ordered_parallel_map, remove_scratch_dirs, worker_scratch_dirs
+from src.ref_pipe.setup import (
+    compile_backend_up,
+    compile_toolchain_id,
+    load_env_vars,
+    override_csl_file,
+    restore_csl_file,
+)
+from src.ref_pipe.filesystem_io import (
+    generate_report_for_html_files,
+    load_bibentities,
+    load_bibliography,
+    load_run_plan,
+)
 import polars as pl
 
 
@@ -28,101 +71,476 @@ def ref_pipe(
     local_base_dir: str,
     container_base_dir: str,
     relative_output_dir: str,
-    container_name: str,
+    compile_backend: CompileBackend,
     entity_type: TSupportedEntity,
     bib_df: pl.DataFrame,
+    sort_ranks: BibSortRanks,
+    journal_index: TJournalIndex,
+    div_cache: DivCache | None = None,
+    scratch_relative_dir: str | None = None,
+    profiler: RunProfiler | None = None,
 ) -> BibEntityWithHTML:
+    """
+    Generate the HTML files of a bibentity. The intermediate compilation files go to `scratch_relative_dir` (by default, the output directory).
+    If a profiler is given, the stages of the bibentity are timed into it.
+    """
+
+    profile = profiler.new_profile(bibentity) if profiler is not None else None
+
+    with profiling_entity(profile):
+        # 1. Prepare divs for the bibentity
+        bibdiv_dict = runwrap(
+            gen_bib_html_divs(
+                bibentity,
+                bibliography,
+                local_base_dir,
+                container_base_dir,
+                scratch_relative_dir or relative_output_dir,
+                compile_backend,
+                div_cache,
+            )
+        )
 
-    # 1. Prepare divs for the bibentity
-    bibdiv_dict = runwrap(
-        gen_bib_html_divs(
-            bibentity,
+        # 2. Prepare html files per bibentity
+        bibentity_with_html = runwrap(
+            gen_html_files(
+                bibentity,
+                bibdiv_dict,
+                f"{local_base_dir}/{relative_output_dir}",
+                entity_type,
+                bib_df,
+                sort_ranks,
+                journal_index,
+                bibliography,
+            )
+        )
+
+    if profile is not None:
+        profile.record_output(len(bibdiv_dict), bibentity_with_html.html_changes)
+
+    return bibentity_with_html
+
+
+def ref_pipe_batch(
+    bibentities: Tuple[BibEntity, ...],
+    bibliography: Bibliography,
+    local_base_dir: str,
+    container_base_dir: str,
+    relative_output_dir: str,
+    compile_backend: CompileBackend,
+    entity_type: TSupportedEntity,
+    bib_df: pl.DataFrame,
+    sort_ranks: BibSortRanks,
+    journal_index: TJournalIndex,
+    div_cache: DivCache | None = None,
+    scratch_relative_dir: str | None = None,
+    profiler: RunProfiler | None = None,
+) -> Generator[tuple[BibEntity, Ok[BibEntityWithHTML] | Err], None, None]:
+    """
+    Batched version of `ref_pipe`: the divs of all the bibentities are compiled in a single job, then the HTML files are generated per bibentity.
+    If a profiler is given, the stages of the batch compilation are shared evenly between the bibentities of the batch.
+    """
+
+    batch_profile = EntityProfile() if profiler is not None else None
+
+    # 1. Prepare divs for all the bibentities at once
+    with profiling_entity(batch_profile):
+        bibdiv_dict_results = gen_bib_html_divs_batch(
+            bibentities,
             bibliography,
             local_base_dir,
             container_base_dir,
-            relative_output_dir,
-            container_name,
+            scratch_relative_dir or relative_output_dir,
+            compile_backend,
+            div_cache,
         )
-    )
 
     # 2. Prepare html files per bibentity
-    bibentity_with_html = runwrap(
-        gen_html_files(
-            bibentity,
-            bibdiv_dict,
-            f"{local_base_dir}/{relative_output_dir}",
-            entity_type,
-            bib_df,
-            bibliography,
+    for bibentity, bibdiv_dict_result in zip(bibentities, bibdiv_dict_results):
+        profile = profiler.new_profile(bibentity) if profiler is not None else None
+        if profile is not None and batch_profile is not None:
+            profile.add_share(batch_profile, len(bibentities))
+
+        with profiling_entity(profile):
+            html_result = rbind(
+                lambda bibdiv_dict: gen_html_files(
+                    bibentity,
+                    bibdiv_dict,
+                    f"{local_base_dir}/{relative_output_dir}",
+                    entity_type,
+                    bib_df,
+                    sort_ranks,
+                    journal_index,
+                    bibliography,
+                ),
+                bibdiv_dict_result,
+            )
+
+        if profile is not None and isinstance(bibdiv_dict_result, Ok) and isinstance(html_result, Ok):
+            profile.record_output(len(bibdiv_dict_result.out), html_result.out.html_changes)
+
+        yield (bibentity, html_result)
+
+
+class RunContext(NamedTuple):
+    """
+    What a run loads and sets up once, and shares between all the entity types processed in it.
+    """
+
+    v: EnvVars
+    compile_backend: CompileBackend
+    bibliography: Bibliography
+    bibliography_table: BibliographyTable
+    div_cache: DivCache | None
+    image_id: str
+
+
+@try_except_wrapper(lgr)
+def setup_run(env_file: str, options: RunOptions) -> RunContext:
+
+    # 1. Setup
+    ## 1.1 Load environment variables
+    v = runwrap(load_env_vars(env_file))
+
+    ## 1.2 Override the CSL file
+    runwrap(override_csl_file(v.CSL_FILE))
+
+    try:
+        ## 1.3 Set up the compile backend (starting the container if needed), with a compile server process per worker (of the compile stage, if pipelined) if asked for
+        if options.compile_backend:
+            v = v._replace(COMPILE_BACKEND=options.compile_backend)
+        compile_servers = compile_stage_workers(options.stage_workers) if options.stage_workers else options.workers
+        compile_backend = runwrap(compile_backend_up(v, compile_servers if options.compile_server else 0))
+
+        ## 1.4 Load the bibliography
+        local_bibliography_filepth = f"{v.DLTC_WORKHOUSE_DIRECTORY}/{v.BIBLIOGRAPHY_BASE_FILENAME}"
+        bibliography = runwrap(load_bibliography(local_bibliography_filepth))
+
+        ## 1.5 Load and prepare the bibliography table
+        bibliography_table = runwrap(load_bibliography_table(v.BIBLIOGRAPHY_TABLE_ODS))
+
+        ## 1.6 Open the rendered div cache, now that the CSL file used for the compilations is in place
+        image_id = compile_toolchain_id(v)
+        div_cache = load_div_cache(
+            options.div_cache_file or DEFAULT_DIV_CACHE_FILE,
+            v.CSL_FILE,
+            image_id,
+            options.div_cache_max_size_mb,
+            options.div_cache_mode,
         )
+
+    except Exception:
+        restore_csl_file(v.CSL_FILE)
+        raise
+
+    return RunContext(
+        v=v,
+        compile_backend=compile_backend,
+        bibliography=bibliography,
+        bibliography_table=bibliography_table,
+        div_cache=div_cache,
+        image_id=image_id,
     )
 
-    return bibentity_with_html
+
+def close_run(run: RunContext) -> None:
+    csl_cleanup_result = restore_csl_file(run.v.CSL_FILE)
+    if isinstance(csl_cleanup_result, Err):
+        lgr.warning(f"Error restoring the CSL file '{run.v.CSL_FILE}': {csl_cleanup_result.message}")
+
+    if run.div_cache is not None:
+        run.div_cache.close()
+
+    run.bibliography.close()
+
+    run.compile_backend.close()
+
+
+def summarize_after_consumption(
+    result: THTMLReport,
+    div_cache: DivCache | None,
+    run_summary: TRunSummary | None,
+    profiler: RunProfiler | None,
+    local_base_dir: str,
+    scratch_dirs: Tuple[str, ...],
+) -> THTMLReport:
+    """
+    Yield the results of an entity type, and once they have all been consumed (or their consumption was interrupted), add its cache statistics and profiles to the run summary, and remove its scratch directories.
+    """
+    cache_stats_before = div_cache.stats.dump() if div_cache is not None else {}
+    try:
+        yield from result
+
+    finally:
+        if div_cache is not None and run_summary is not None:
+            run_summary.update(
+                {name: count - cache_stats_before[name] for name, count in div_cache.stats.dump().items()}
+            )
+
+        if profiler is not None and run_summary is not None:
+            run_summary.update(profiler.summary())
+
+        remove_scratch_dirs(local_base_dir, scratch_dirs)
+
+
+def cleanup_after_consumption(result: THTMLReport, run: RunContext) -> THTMLReport:
+    """
+    Yield the results of the pipeline, and clean up once they have all been consumed (or their consumption was interrupted).
+    The pipeline is lazy, so cleaning up before that point would pull the CSL file, the bibliography and the cache from under the compilations.
+    """
+    try:
+        yield from result
+
+    finally:
+        close_run(run)
 
 
 @try_except_wrapper(lgr)
-def main_process_local(
+def process_entity_type(
+    run: RunContext,
     input_csv: str,
     encoding: str,
     entity_type: TSupportedEntity,
-    env_file: str,
+    options: RunOptions = RunOptions(),
+    run_summary: TRunSummary | None = None,
+    profiler: RunProfiler | None = None,
 ) -> THTMLReport:
 
-    # 1. Setup
-    ## 1.1 Load environment variables
-    v = runwrap(load_env_vars(env_file))
-
-    ## 1.2 Override the CSL file
-    runwrap(override_csl_file(v.CSL_FILE))
+    v, compile_backend, bibliography, bibliography_table, div_cache, image_id = run
 
-    ## 1.3 Start the container
-    runwrap(dltc_env_up(v))
+    if options.stage_workers and (options.batch_size > 1 or options.workers > 1):
+        raise ValueError(
+            "The pipelined processing has its own workers per stage, and compiles each bibentity on its own: it can't be combined with a batch size or a number of workers."
+        )
 
-    ## 1.4 Unpack environment variables for ref_pipe
-    local_base_dir, container_base_dir, relative_output_dir, container_name = (
+    ## 1.7 Unpack environment variables for ref_pipe
+    local_base_dir, container_base_dir, relative_output_dir = (
         v.DLTC_WORKHOUSE_DIRECTORY,
         v.CONTAINER_DLTC_WORKHOUSE_DIRECTORY,
         v.REF_PIPE_DIR_RELATIVE_PATH,
-        v.DOCKER_CONTAINER_NAME,
     )
 
-    ## 1.5 Load the bibliography
-    local_bibliography_filepth = f"{local_base_dir}/{v.BIBLIOGRAPHY_BASE_FILENAME}"
-    bibliography = runwrap(load_bibliography(local_bibliography_filepth))
-
-    ## 1.6 Load the bibentities
+    ## 1.8 Load the bibentities
     bibentities_raw = runwrap(load_bibentities(input_csv, encoding, entity_type, bibliography))
 
-    ## 1.7 Pre-process the bibentities
-    bibliography_table_file = v.BIBLIOGRAPHY_TABLE_ODS
-    bibentities, bib_df = runwrap(preprocess_bibentities(bibliography_table_file, bibentities_raw, entity_type))
+    ## 1.9 Pre-process the bibentities
+    bibentities = preprocess_raw_bibentities(
+        bibliography_table.df, bibliography_table.journal_index, bibentities_raw, entity_type
+    )
+    prepared_df, journal_index, sort_ranks = (
+        bibliography_table.prepared_df,
+        bibliography_table.journal_index,
+        bibliography_table.sort_ranks,
+    )
+
+    ## 1.10 Find the bibentities that didn't change since the previous run, if any
+    manifest = build_manifest(bibentities, bibliography, v.CSL_FILE, image_id)
+    if options.manifest_file:
+        write_manifest(manifest, options.manifest_file)
+
+    unchanged: Dict[int, Ok[BibEntityWithHTML]] = {}
+    if options.previous_report and not options.full_rebuild:
+        previous_report = load_previous_report(options.previous_report, encoding)
+        previous_manifest = load_manifest(options.previous_manifest or manifest_filename(options.previous_report))
+        unchanged = find_unchanged_bibentities(bibentities, previous_report, previous_manifest, manifest)
+
+    ## 1.11 Skip the bibentities completed before an interruption, if resuming
+    completed: Dict[int, Ok[BibEntityWithHTML]] = {}
+    if options.resume and options.checkpoint_file:
+        checkpoint = load_checkpoint(options.checkpoint_file)
+        completed = find_completed_bibentities(bibentities, checkpoint, entity_type, manifest)
+
+    if run_summary is not None:
+        run_summary["entities_total"] = len(bibentities)
+        run_summary["entities_unchanged"] = len(unchanged)
+        run_summary["entities_resumed"] = len(completed.keys() - unchanged.keys())
+
+    unchanged = completed | unchanged
+
+    bibentities_to_build = tuple(bibentity for i, bibentity in enumerate(bibentities) if i not in unchanged)
+
+    ## 1.12 Compile each distinct reference set only once, and copy the HTML files of the other bibentities that share it
+    duplicates = find_duplicate_bibentities(bibentities_to_build, entity_type)
+    representatives = tuple(bibentity for i, bibentity in enumerate(bibentities_to_build) if i not in duplicates)
 
-    prepared_df = prepare_bib_df(bib_df)
+    if run_summary is not None:
+        run_summary["compilations_saved"] = len(duplicates)
 
     ## 2. Main processing
-    result = (
-        (
-            bibentity,
-            ref_pipe(
+    def process_work_unit(
+        chunk: Tuple[BibEntity, ...], scratch_relative_dir: str
+    ) -> Tuple[tuple[BibEntity, Ok[BibEntityWithHTML] | Err], ...]:
+        if options.batch_size > 1:
+            return tuple(
+                ref_pipe_batch(
+                    chunk,
+                    bibliography,
+                    local_base_dir,
+                    container_base_dir,
+                    relative_output_dir,
+                    compile_backend,
+                    entity_type,
+                    prepared_df,
+                    sort_ranks,
+                    journal_index,
+                    div_cache,
+                    scratch_relative_dir,
+                    profiler,
+                )
+            )
+
+        return tuple(
+            (
                 bibentity,
-                bibliography,
-                local_base_dir,
-                container_base_dir,
-                relative_output_dir,
-                container_name,
-                entity_type,
-                prepared_df,
-            ),
+                ref_pipe(
+                    bibentity,
+                    bibliography,
+                    local_base_dir,
+                    container_base_dir,
+                    relative_output_dir,
+                    compile_backend,
+                    entity_type,
+                    prepared_df,
+                    sort_ranks,
+                    journal_index,
+                    div_cache,
+                    scratch_relative_dir,
+                    profiler,
+                ),
+            )
+            for bibentity in chunk
+        )
+
+    work_units = chunk_bibentities(representatives, options.batch_size)
+
+    scratch_dirs: Tuple[str, ...]
+    rebuilt_representatives: THTMLReport
+    if options.stage_workers:
+        ## Each stage runs on its own threads, and each bibentity being compiled holds a scratch directory until its divs are extracted
+        scratch_dirs = pipeline_scratch_dirs(relative_output_dir, options.stage_workers, options.stage_queue_size)
+        make_scratch_dirs(local_base_dir, scratch_dirs)
+        rebuilt_representatives = ref_pipe_pipelined(
+            representatives,
+            bibliography,
+            local_base_dir,
+            container_base_dir,
+            relative_output_dir,
+            compile_backend,
+            entity_type,
+            prepared_df,
+            sort_ranks,
+            journal_index,
+            div_cache,
+            scratch_dirs,
+            options.stage_workers,
+            options.stage_queue_size,
+            profiler,
+        )
+
+    else:
+        work_units_results: Iterable[Tuple[tuple[BibEntity, Ok[BibEntityWithHTML] | Err], ...]]
+        if options.workers > 1:
+            ## Each worker compiles in its own scratch directory, as the compilation files have fixed names
+            scratch_dirs = worker_scratch_dirs(relative_output_dir, options.workers)
+            make_scratch_dirs(local_base_dir, scratch_dirs)
+            work_units_results = ordered_parallel_map(process_work_unit, work_units, scratch_dirs)
+
+        else:
+            scratch_dirs = ()
+            work_units_results = (process_work_unit(chunk, relative_output_dir) for chunk in work_units)
+
+        rebuilt_representatives = (
+            entity_result for unit_results in work_units_results for entity_result in unit_results
         )
-        for bibentity in bibentities
+    rebuilt = (
+        expand_duplicates(bibentities_to_build, duplicates, rebuilt_representatives)
+        if duplicates
+        else rebuilt_representatives
     )
 
-    # 3. Cleanup
-    csl_cleanup_result = restore_csl_file(v.CSL_FILE)
-    if isinstance(csl_cleanup_result, Err):
-        lgr.warning(f"Error restoring the CSL file '{v.CSL_FILE}': {csl_cleanup_result.message}")
+    ## Record each rebuilt bibentity in the checkpoint journal as soon as it's done
+    if options.checkpoint_file:
+        rebuilt = checkpointed(rebuilt, options.checkpoint_file, entity_type, manifest, options.resume)
+    result = merge_carried_over(bibentities, unchanged, rebuilt) if unchanged else rebuilt
+
+    # 3. Summarize the entity type, once its results have been consumed
+    return summarize_after_consumption(result, div_cache, run_summary, profiler, local_base_dir, scratch_dirs)
+
+
+@try_except_wrapper(lgr)
+def main_process_local(
+    input_csv: str,
+    encoding: str,
+    entity_type: TSupportedEntity,
+    env_file: str,
+    options: RunOptions = RunOptions(),
+    run_summary: TRunSummary | None = None,
+    profiler: RunProfiler | None = None,
+) -> THTMLReport:
+
+    run = runwrap(setup_run(env_file, options))
 
-    return result
+    try:
+        result = runwrap(process_entity_type(run, input_csv, encoding, entity_type, options, run_summary, profiler))
+    except Exception:
+        close_run(run)
+        raise
+
+    # Clean up once the results have been consumed
+    return cleanup_after_consumption(result, run)
+
+
+@try_except_wrapper(lgr)
+def main_process_plan(
+    plan: Tuple[RunPlanEntry, ...],
+    encoding: str,
+    env_file: str,
+    options: RunOptions = RunOptions(),
+    profile: bool = False,
+) -> None:
+    """
+    Process the entity types of a run plan one after the other, loading the bibliography and its table, setting up the CSL file and the compile backend, and opening the div cache only once.
+    Each entry gets its own report, manifest, checkpoint journal and run summary. An entry that fails doesn't stop the others.
+    """
+
+    frame = f"main_process_plan"
+
+    run = runwrap(setup_run(env_file, options))
+
+    failed: list[str] = []
+    try:
+        for entry in plan:
+            lginf(frame, f"Processing the '{entry.entity_type}' entities of '{entry.input_csv}'...", lgr)
+
+            entry_options = options._replace(
+                previous_report=entry.previous_report,
+                previous_manifest="",
+                manifest_file=manifest_filename(entry.output_report),
+                checkpoint_file=checkpoint_filename(entry.output_report),
+            )
+            run_summary: TRunSummary = {}
+            profiler = RunProfiler() if profile else None
+
+            curried_gen_report: Callable[[THTMLReport], Ok[None] | Err] = lambda out: generate_report_for_html_files(
+                out, entry.output_report, encoding, run_summary, profiler
+            )
+
+            entry_result = rbind(
+                curried_gen_report,
+                process_entity_type(
+                    run, entry.input_csv, encoding, entry.entity_type, entry_options, run_summary, profiler
+                ),
+            )
+            if isinstance(entry_result, Err):
+                failed.append(f"'{entry.input_csv}' ({entry.entity_type}): {entry_result.message}")
+
+    finally:
+        close_run(run)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(plan)} entries of the run plan failed:\n" + "\n".join(failed))
+
+    return None
 
 
 def cli_main_process_local() -> None:
@@ -130,7 +548,9 @@ def cli_main_process_local() -> None:
 
     parser = argparse.ArgumentParser(description="Setup the dltc-env.")
 
-    parser.add_argument("-i", "--input-csv", type=str, help="Path to the CSV file.", required=True)
+    parser.add_argument(
+        "-i", "--input-csv", type=str, help="Path to the CSV file. Required without '--plan'.", default=""
+    )
 
     parser.add_argument(
         "-e", "--encoding", type=str, help="The encoding of the CSV file. 'utf-8' by default.", required=True
@@ -140,18 +560,173 @@ def cli_main_process_local() -> None:
         "-t",
         "--entity-type",
         type=str,
-        help=f"The type of the entity to process. Must be one of: {", ".join(SUPPORTED_ENTITY_TYPES)}.",
-        required=True,
+        help=f"The type of the entity to process. Must be one of: {", ".join(SUPPORTED_ENTITY_TYPES)}. Required without '--plan'.",
+        default="",
     )
 
     parser.add_argument("-v", "--env_file", type=str, help="Path to the environment file.", required=True)
 
-    parser.add_argument("-o", "--output-filename", type=str, help="Path to the output report file.", required=True)
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        type=str,
+        help="Path to the output report file. Required without '--plan'.",
+        default="",
+    )
+
+    parser.add_argument(
+        "--plan",
+        type=str,
+        help="Run plan: a CSV file with the columns 'input_csv', 'entity_type' and 'output_report' (and optionally 'previous_report'), with a row per entity type. All of them are processed in a single run, loading the bibliography and its table, and setting up the CSL file and the compile backend only once. Replaces '-i', '-t', '-o' and '-p'.",
+        default="",
+    )
+
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        help="Number of entities to compile together in a single job. 1 (default) compiles each entity on its own.",
+        default=1,
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of entities (or batches of entities) to process concurrently, each in its own scratch directory. 1 by default.",
+        default=1,
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        type=str,
+        help=f"Process the entities in a pipeline of stages ({", ".join(PIPELINE_STAGES)}) connected by bounded queues, with the given number of threads per stage, separated by commas (e.g., '1,4,1,1'). Can't be combined with '-b' nor '-w'.",
+        default="",
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        help=f"Number of entities waiting in front of each stage of the pipeline, at most. {DEFAULT_STAGE_QUEUE_SIZE} by default.",
+        default=DEFAULT_STAGE_QUEUE_SIZE,
+    )
+
+    cache_mode_group = parser.add_mutually_exclusive_group()
+
+    cache_mode_group.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read from nor write to the rendered div cache.",
+    )
+
+    cache_mode_group.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Render every div again, overwriting the rendered div cache.",
+    )
+
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        help=f"Path to the rendered div cache file. '{DEFAULT_DIV_CACHE_FILE}' by default.",
+        default=DEFAULT_DIV_CACHE_FILE,
+    )
+
+    parser.add_argument(
+        "--cache-max-size-mb",
+        type=int,
+        help=f"Maximum size of the rendered div cache, in MB. {DEFAULT_DIV_CACHE_MAX_SIZE_MB} by default.",
+        default=DEFAULT_DIV_CACHE_MAX_SIZE_MB,
+    )
+
+    parser.add_argument(
+        "--compile-server",
+        action="store_true",
+        help="Send the compilations to long-lived compile server processes (one per worker), instead of starting a new process (e.g., 'docker exec') for each of them.",
+    )
+
+    parser.add_argument(
+        "--compile-backend",
+        type=str,
+        choices=SUPPORTED_COMPILE_BACKENDS,
+        help="Compile backend, overriding the 'COMPILE_BACKEND' environment variable ('docker' by default). 'fake' writes deterministic divs without compiling anything, to benchmark the rest of the pipeline.",
+        default="",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--previous-report",
+        type=str,
+        help="Report of a previous run. Entities that were successfully processed in it, and whose bibkeys, bib lines, CSL file and container image didn't change since, are skipped and their HTML files carried over.",
+        default="",
+    )
+
+    parser.add_argument(
+        "--previous-manifest",
+        type=str,
+        help="Manifest of the bibkey hashes of the previous run. By default, the '-manifest.json' file next to the previous report.",
+        default="",
+    )
+
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="Process every entity, even if a previous report is given.",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted run with the same output report: skip the entities recorded as completed in its '-checkpoint.jsonl' journal (if their inputs and HTML files didn't change since), and merge their rows into the report.",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time the stages of each entity (small bib, markdown, compilation, div extraction, sorting, HTML writing), and add them to the report, with the bytes written and the number of divs. The run summary gets the p50, p95 and max of each stage.",
+    )
 
     args = parser.parse_args()
 
+    if not args.plan and not (args.input_csv and args.entity_type and args.output_filename):
+        parser.error(
+            "the following arguments are required without '--plan': -i/--input-csv, -t/--entity-type, -o/--output-filename"
+        )
+
+    stage_workers_result = parse_stage_workers(args.pipeline)
+    if isinstance(stage_workers_result, Err):
+        parser.error(stage_workers_result.message)
+
+    options = RunOptions(
+        batch_size=args.batch_size,
+        workers=args.workers,
+        div_cache_mode="off" if args.no_cache else "rebuild" if args.rebuild_cache else "on",
+        div_cache_file=args.cache_file,
+        div_cache_max_size_mb=args.cache_max_size_mb,
+        previous_report=args.previous_report,
+        previous_manifest=args.previous_manifest,
+        manifest_file=manifest_filename(args.output_filename),
+        full_rebuild=args.full_rebuild,
+        compile_server=args.compile_server,
+        compile_backend=args.compile_backend,
+        checkpoint_file=checkpoint_filename(args.output_filename),
+        resume=args.resume,
+        stage_workers=stage_workers_result.out,
+        stage_queue_size=args.queue_size,
+    )
+
+    if args.plan:
+        rbind(
+            lambda plan: main_process_plan(plan, args.encoding, args.env_file, options, args.profile),
+            load_run_plan(args.plan),
+        )
+        return None
+
+    run_summary: TRunSummary = {}
+    profiler = RunProfiler() if args.profile else None
+
     curried_gen_report: Callable[[THTMLReport], Ok[None] | Err] = lambda out: generate_report_for_html_files(
-        out, args.output_filename, args.encoding
+        out, args.output_filename, args.encoding, run_summary, profiler
     )
 
     rbind(
@@ -161,6 +736,9 @@ def cli_main_process_local() -> None:
             args.encoding,
             args.entity_type,
             args.env_file,
+            options,
+            run_summary,
+            profiler,
         ),
     )
 
@@ -1,9 +1,17 @@
+import array
 from dataclasses import dataclass
+import mmap
 import os
 from typing import Dict, FrozenSet, Generator, Literal, NamedTuple, Tuple
 
 from src.sdk.utils import dump_frozenset
 from src.sdk.ResultMonad import Err, Ok
+import polars as pl
+
+
+type TCompileBackend = Literal["docker", "local", "fake"]
+SUPPORTED_COMPILE_BACKENDS = ("docker", "local", "fake")
+DEFAULT_LOCAL_COMPILE_COMMAND = "dltc-make offhtml"
 
 
 class EnvVars(NamedTuple):
@@ -32,6 +40,10 @@ class EnvVars(NamedTuple):
         Path to the Docker Compose file.
     `CSL_FILE`: str
         Path to the CSL file used to compile the HTML files.
+    `COMPILE_BACKEND`: str
+        Backend that compiles the markdown files into HTML (see `SUPPORTED_COMPILE_BACKENDS`). Optional, 'docker' by default.
+    `LOCAL_COMPILE_COMMAND`: str
+        Command run on the host by the 'local' compile backend. Optional, 'dltc-make offhtml' by default.
     """
 
     ARCH: str
@@ -46,15 +58,102 @@ class EnvVars(NamedTuple):
     DOCKER_COMPOSE_FILE: str
     CSL_FILE: str
     BIBLIOGRAPHY_TABLE_ODS: str
+    COMPILE_BACKEND: TCompileBackend = "docker"
+    LOCAL_COMPILE_COMMAND: str = DEFAULT_LOCAL_COMPILE_COMMAND
 
     @classmethod
     def attribute_names(self) -> str:
-        return ", ".join(self.__annotations__.keys())
+        return ", ".join(k for k in self.__annotations__.keys() if k not in self._field_defaults)
+
+
+type TDivCacheMode = Literal["on", "off", "rebuild"]
+SUPPORTED_DIV_CACHE_MODES = ("on", "off", "rebuild")
+DEFAULT_DIV_CACHE_MAX_SIZE_MB = 512
+PIPELINE_STAGES = ("prepare", "compile", "extract", "write")
+DEFAULT_STAGE_QUEUE_SIZE = 2
+
+
+class RunOptions(NamedTuple):
+    """
+    Options of a ref_pipe run, on top of the environment variables.
+
+    Attributes:
+    ----------
+    `batch_size`: int
+        Number of bibentities compiled together in a single job. 1 compiles each bibentity on its own.
+    `workers`: int
+        Number of bibentities (or batches of bibentities) processed concurrently, each in its own scratch directory.
+    `div_cache_mode`: str
+        'on' to read and write the rendered div cache, 'off' to ignore it, 'rebuild' to only write to it.
+    `div_cache_file`: str
+        Path to the rendered div cache file. An empty string means the default location.
+    `div_cache_max_size_mb`: int
+        Size (in MB of rendered divs) above which the least recently used divs are evicted from the cache.
+    `previous_report`: str
+        Report of a previous run, to skip the bibentities that didn't change since. An empty string processes everything.
+    `previous_manifest`: str
+        Manifest of the previous run. An empty string means the manifest next to the previous report.
+    `manifest_file`: str
+        Where to write the manifest of this run. An empty string doesn't write it.
+    `full_rebuild`: bool
+        Process every bibentity, even if a previous report is given.
+    `compile_server`: bool
+        Send the compilations to long-lived compile server processes (one per worker), instead of starting a new process for each of them.
+    `compile_backend`: str
+        Compile backend to use instead of the one of the environment variables. An empty string keeps the latter.
+    `checkpoint_file`: str
+        Checkpoint journal, where the result of each bibentity is recorded as soon as it is produced. An empty string doesn't write it.
+    `resume`: bool
+        Skip the bibentities completed in the checkpoint journal (e.g., by an interrupted run), and append to it instead of starting it over.
+    `stage_workers`: Tuple[int, ...]
+        Number of threads of each stage of the pipelined processing (preparation, compilation, div extraction, HTML writing, see `pipelined.py`). Empty processes each bibentity (or batch) from start to end instead.
+    `stage_queue_size`: int
+        Number of bibentities waiting in front of each stage of the pipelined processing, at most.
+    """
+
+    batch_size: int = 1
+    workers: int = 1
+    div_cache_mode: TDivCacheMode = "on"
+    div_cache_file: str = ""
+    div_cache_max_size_mb: int = DEFAULT_DIV_CACHE_MAX_SIZE_MB
+    previous_report: str = ""
+    previous_manifest: str = ""
+    manifest_file: str = ""
+    full_rebuild: bool = False
+    compile_server: bool = False
+    compile_backend: TCompileBackend | Literal[""] = ""
+    checkpoint_file: str = ""
+    resume: bool = False
+    stage_workers: Tuple[int, ...] = ()
+    stage_queue_size: int = DEFAULT_STAGE_QUEUE_SIZE
 
 
 SUPPORTED_ENTITY_TYPES = ("profile", "article", "journal", "publisher", "page")
 type TSupportedEntity = Literal["profile", "article", "journal", "publisher", "page"]
 
+
+class RunPlanEntry(NamedTuple):
+    """
+    One entity type of a run plan, processed in the same run as the other entries of the plan.
+
+    Attributes:
+    ----------
+    `input_csv`: str
+        Path to the CSV file of the bibentities.
+    `entity_type`: TSupportedEntity
+        Type of the bibentities.
+    `output_report`: str
+        Path to the report of the entry. Its manifest, checkpoint journal and run summary are written next to it.
+    `previous_report`: str
+        Report of a previous run for the same entity type, to skip the bibentities that didn't change since. An empty string processes everything.
+    """
+
+    input_csv: str
+    entity_type: TSupportedEntity
+    output_report: str
+    previous_report: str = ""
+
+
 type TBibEntityAttribute = Literal[
     "id",
     "entity_key",
@@ -145,14 +244,63 @@ class Markdown(NamedTuple):
     master_file: File
 
 
+class MarkdownBatch(NamedTuple):
+    """
+    Markdown files for a batch of bibliographic entities, compiled together in a single job.
+
+    Attributes:
+    ----------
+    `local_base_dir`: str
+        Base directory for the markdown files in the host system.
+    `container_base_dir`: str
+        Base directory for the markdown files in the container.
+    `relative_output_dir`: str
+        Relative directory for the markdown files, inside the base directory (both in the host system and in the container).
+    `main_files`: Tuple[File, ...]
+        One markdown file per bibliographic entity, in the order in which they are imported by the master file.
+    `master_file`: File
+        'master.md' file importing all the main markdown files.
+    """
+
+    local_base_dir: str
+    container_base_dir: str
+    relative_output_dir: str
+    main_files: Tuple[File, ...]
+    master_file: File
+
+
 class RefHTML(NamedTuple):
     references_filename: str
     further_references_filename: str
 
 
+type THTMLFileStatus = Literal["created", "changed", "unchanged"]
+HTML_FILE_STATUSES = ("created", "changed", "unchanged")
+
+
+class HTMLFileChange(NamedTuple):
+    """
+    Outcome of writing an HTML file, for the change manifest of the run.
+
+    Attributes:
+    ----------
+    `filename`: str
+        Path to the HTML file.
+    `status`: str
+        'created' if the file didn't exist, 'changed' if its content was different, 'unchanged' if it already had the same content (and was left untouched).
+    `content_hash`: str
+        SHA-256 of the content of the file.
+    """
+
+    filename: str
+    status: THTMLFileStatus
+    content_hash: str
+
+
 @dataclass(frozen=True, slots=True)
 class BibEntityWithHTML(BibEntity):
     html: RefHTML
+    html_changes: Tuple[HTMLFileChange, ...] = ()
 
 
 class BibDiv(NamedTuple):
@@ -168,24 +316,92 @@ type TBibDivDict = Dict[TBibkey, TBibDiv]
 
 type THTMLReport = Generator[tuple[BibEntity, Ok[BibEntityWithHTML] | Err], None, None]
 
+"""
+Run-level figures (cache statistics, etc.), filled in while the report is being consumed and written next to it at the end.
+"""
+type TRunSummary = Dict[str, int | float | str]
+
 
 class Bibliography(NamedTuple):
     """
     Model representing the part of the bibliography we need for this project.
 
+    The bib file is memory-mapped rather than read into memory: only the byte offsets of its lines are kept, and the lines are sliced from the mapping when needed.
+
     Attributes:
     ----------
     `bibkeys`: FrozenSet[str]
         Set of bibliographic keys. Must be one per line of the bibliography bib file.
     `bibkey_index_dict`: Dict[str, int]
-        Dictionary with the index of each bibkey in the content tuple.
-    `content`: Tuple[str, ...]
-        Tuple in which each element is a line of the bibliography bib file.
+        Dictionary with the line number (starting at 0) of each bibkey in the bib file.
+    `line_offsets`: array.array[int]
+        Byte offset of the start of each line of the bib file, followed by the size of the file.
+    `content`: mmap.mmap | bytes
+        Memory-mapped content of the bib file (plain bytes for an empty file, which can't be mapped).
     """
 
     bibkeys: FrozenSet[str]
     bibkey_index_dict: Dict[str, int]
-    content: Tuple[str, ...]
+    line_offsets: array.array[int]
+    content: mmap.mmap | bytes
+
+    def line_bytes(self, bibkey: str) -> bytes:
+        """
+        The line of the bibkey in the bib file, including its line break.
+        """
+        i = self.bibkey_index_dict[bibkey]
+        return self.content[self.line_offsets[i] : self.line_offsets[i + 1]]
+
+    def close(self) -> None:
+        if isinstance(self.content, mmap.mmap):
+            self.content.close()
+
+
+class BibSortRanks(NamedTuple):
+    """
+    Global rank of each bibkey of the bibliography table in each of the entity orderings (see `SORT_ORDERINGS` in preprocessors). Bibkeys not in the table have no rank.
+
+    Attributes:
+    ----------
+    `profile`: Dict[str, int]
+        Rank in the profile ordering.
+    `publisher`: Dict[str, int]
+        Rank in the publisher ordering.
+    `default`: Dict[str, int]
+        Rank in the ordering of the other entities.
+    """
+
+    profile: Dict[str, int]
+    publisher: Dict[str, int]
+    default: Dict[str, int]
+
+
+"""
+Rows of the prepared bibliography table of each journal, by journal ID, in the order of the table.
+"""
+type TJournalIndex = Dict[str, pl.DataFrame]
+
+
+class BibliographyTable(NamedTuple):
+    """
+    The bibliography table, loaded and prepared once per run, and shared by all the entity types processed in it.
+
+    Attributes:
+    ----------
+    `df`: pl.DataFrame
+        The bibliography table, as loaded.
+    `prepared_df`: pl.DataFrame
+        The bibliography table prepared for sorting (see `prepare_bib_df` in preprocessors).
+    `journal_index`: TJournalIndex
+        Rows of the prepared table of each journal.
+    `sort_ranks`: BibSortRanks
+        Rank of each bibkey in each of the entity orderings.
+    """
+
+    df: pl.DataFrame
+    prepared_df: pl.DataFrame
+    journal_index: TJournalIndex
+    sort_ranks: BibSortRanks
 
 
 ### HTML Collapsible Structure
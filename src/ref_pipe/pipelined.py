@@ -0,0 +1,251 @@
+"""
+Pipelined processing of the bibentities: instead of running all the steps of a bibentity one after the other, the steps run as stages connected by bounded queues, each stage with its own threads (see `pipelined_map`):
+
+1. prepare: the small bib and the markdown files, in a scratch directory (only for the bibentities with divs missing from the cache).
+2. compile: the compilation of the markdown files with the compile backend.
+3. extract: the extraction of the divs from the compiled HTML file, after which the scratch directory is cleaned up and freed.
+4. write: the sorting of the divs and the writing of the HTML files.
+
+This way, Python prepares, parses and writes the files of some bibentities while others are being compiled.
+The scratch directories hold the files of a compilation from the prepare stage to the extract stage. There are enough of them for all the bibentities that can be between these stages at once.
+"""
+
+from dataclasses import dataclass, field
+import queue
+from typing import FrozenSet, Iterable, Tuple
+
+import polars as pl
+
+from src.sdk.ResultMonad import Err, Ok, runwrap, try_except_wrapper
+from src.sdk.utils import get_logger, lginf
+from src.ref_pipe.compile_backends import CompileBackend
+from src.ref_pipe.div_cache import DivCache, split_cached_bibkeys
+from src.ref_pipe.html_io import gen_html_files
+from src.ref_pipe.models import (
+    DEFAULT_STAGE_QUEUE_SIZE,
+    PIPELINE_STAGES,
+    BibEntity,
+    BibentityHTMLRawFile,
+    BibEntityWithHTML,
+    Bibliography,
+    BibSortRanks,
+    Markdown,
+    TBibDivDict,
+    THTMLReport,
+    TJournalIndex,
+    TSupportedEntity,
+)
+from src.ref_pipe.prep_divs import (
+    bibentity_to_render,
+    dltc_env_exec,
+    extract_divs,
+    merge_rendered_divs,
+    prepare_md,
+    prepare_small_bib,
+    remove_compilation_files,
+    write_bib_md_files,
+)
+from src.ref_pipe.profiling import EntityProfile, RunProfiler, profiled_stage, profiling_entity
+from src.ref_pipe.workers import PipelineStage, pipelined_map, worker_scratch_dirs
+
+
+lgr = get_logger("Pipelined")
+
+
+@try_except_wrapper(lgr)
+def parse_stage_workers(spec: str) -> Tuple[int, ...]:
+    """
+    Parse the number of workers of each stage of the pipeline, separated by commas (e.g., '1,4,1,1'). An empty string means no pipeline.
+    """
+    if spec == "":
+        return ()
+
+    try:
+        stage_workers = tuple(int(workers) for workers in spec.split(","))
+    except ValueError:
+        stage_workers = ()
+
+    if len(stage_workers) != len(PIPELINE_STAGES) or any(workers < 1 for workers in stage_workers):
+        raise ValueError(
+            f"Expected a positive number of workers for each of the stages of the pipeline ({', '.join(PIPELINE_STAGES)}), separated by commas. Got: '{spec}'."
+        )
+
+    return stage_workers
+
+
+def compile_stage_workers(stage_workers: Tuple[int, ...]) -> int:
+    return stage_workers[PIPELINE_STAGES.index("compile")]
+
+
+def pipeline_scratch_dirs(relative_output_dir: str, stage_workers: Tuple[int, ...], queue_size: int) -> Tuple[str, ...]:
+    """
+    One scratch directory per bibentity that can be between the prepare and the extract stages at once: one per worker of these stages, and one per place in the queues in front of the compile and extract stages.
+    """
+    prepare_workers, compile_workers, extract_workers, _ = stage_workers
+
+    return worker_scratch_dirs(
+        relative_output_dir, prepare_workers + compile_workers + extract_workers + 2 * queue_size
+    )
+
+
+@dataclass(frozen=False, slots=True)
+class EntityInProgress:
+    bibentity: BibEntity
+    profile: EntityProfile | None
+    cached_divs: TBibDivDict = field(default_factory=dict)
+    bibkeys_to_render: FrozenSet[str] = frozenset()
+    scratch_dir: str = ""
+    md: Markdown | None = None
+    raw_html_file: BibentityHTMLRawFile | None = None
+    bibdiv_dict: TBibDivDict = field(default_factory=dict)
+    bibentity_with_html: BibEntityWithHTML | None = None
+
+
+def ref_pipe_pipelined(
+    bibentities: Iterable[BibEntity],
+    bibliography: Bibliography,
+    local_base_dir: str,
+    container_base_dir: str,
+    relative_output_dir: str,
+    compile_backend: CompileBackend,
+    entity_type: TSupportedEntity,
+    bib_df: pl.DataFrame,
+    sort_ranks: BibSortRanks,
+    journal_index: TJournalIndex,
+    div_cache: DivCache | None,
+    scratch_dirs: Tuple[str, ...],
+    stage_workers: Tuple[int, ...],
+    queue_size: int = DEFAULT_STAGE_QUEUE_SIZE,
+    profiler: RunProfiler | None = None,
+) -> THTMLReport:
+    """
+    Generate the HTML files of the bibentities with the stages of `PIPELINE_STAGES`, with the given number of workers for each of them, and yield the results in the order of the input.
+    The scratch directories must be at least as many as `pipeline_scratch_dirs`.
+    """
+
+    if len(stage_workers) != len(PIPELINE_STAGES):
+        raise ValueError(f"Expected the number of workers of each of the stages: {', '.join(PIPELINE_STAGES)}.")
+
+    frame = f"ref_pipe_pipelined"
+
+    free_scratch_dirs: queue.Queue[str] = queue.Queue()
+    for scratch_dir in scratch_dirs:
+        free_scratch_dirs.put(scratch_dir)
+
+    def release_scratch_dir(entity: EntityInProgress) -> None:
+        if entity.scratch_dir == "":
+            return None
+
+        remove_compilation_files(entity.bibentity, local_base_dir, entity.scratch_dir)
+        free_scratch_dirs.put(entity.scratch_dir)
+        entity.scratch_dir = ""
+
+        return None
+
+    def prepare(entity: EntityInProgress) -> EntityInProgress:
+        bibentity = entity.bibentity
+        lginf(frame, f"Preparing the compilation of {bibentity.entity_key}...", lgr)
+
+        with profiling_entity(entity.profile):
+            if bibentity.main_bibkeys == frozenset():
+                # Skip if there are no main bibkeys
+                return entity
+
+            entity.cached_divs, entity.bibkeys_to_render = split_cached_bibkeys(
+                bibentity.main_bibkeys | bibentity.further_references, bibliography, div_cache
+            )
+            if entity.bibkeys_to_render == frozenset():
+                entity.bibdiv_dict = entity.cached_divs
+                return entity
+
+            try:
+                entity.scratch_dir = free_scratch_dirs.get_nowait()
+            except queue.Empty:
+                raise RuntimeError("No free scratch directory: there must be one per bibentity in flight.")
+
+            to_compile = bibentity_to_render(bibentity, entity.bibkeys_to_render) if entity.cached_divs else bibentity
+
+            with profiled_stage("small_bib"):
+                runwrap(prepare_small_bib(to_compile, bibliography, local_base_dir, entity.scratch_dir))
+
+            with profiled_stage("markdown"):
+                md = runwrap(
+                    prepare_md(
+                        markdown_basename=f"{bibentity.url_endpoint}",
+                        bibkeys=to_compile.main_bibkeys | to_compile.further_references,
+                        local_base_dir=local_base_dir,
+                        container_base_dir=container_base_dir,
+                        relative_output_dir=entity.scratch_dir,
+                    )
+                )
+                entity.md = runwrap(write_bib_md_files(md))
+
+        return entity
+
+    def compile_md(entity: EntityInProgress) -> EntityInProgress:
+        if entity.md is None:
+            return entity
+
+        with profiling_entity(entity.profile), profiled_stage("compile"):
+            entity.raw_html_file = runwrap(dltc_env_exec(entity.md, compile_backend))
+
+        return entity
+
+    def extract(entity: EntityInProgress) -> EntityInProgress:
+        if entity.raw_html_file is None:
+            return entity
+
+        try:
+            with profiling_entity(entity.profile), profiled_stage("extract"):
+                rendered_divs = {div.div_id: div.content for div in runwrap(extract_divs(entity.raw_html_file))}
+
+            entity.bibdiv_dict = merge_rendered_divs(
+                entity.cached_divs, rendered_divs, entity.bibkeys_to_render, bibliography, div_cache
+            )
+
+        finally:
+            release_scratch_dir(entity)
+
+        return entity
+
+    def write(entity: EntityInProgress) -> EntityInProgress:
+        with profiling_entity(entity.profile):
+            entity.bibentity_with_html = runwrap(
+                gen_html_files(
+                    entity.bibentity,
+                    entity.bibdiv_dict,
+                    f"{local_base_dir}/{relative_output_dir}",
+                    entity_type,
+                    bib_df,
+                    sort_ranks,
+                    journal_index,
+                    bibliography,
+                )
+            )
+
+        if entity.profile is not None:
+            entity.profile.record_output(len(entity.bibdiv_dict), entity.bibentity_with_html.html_changes)
+
+        return entity
+
+    stages = tuple(
+        PipelineStage(name=name, func=func, workers=workers)
+        for name, func, workers in zip(PIPELINE_STAGES, (prepare, compile_md, extract, write), stage_workers)
+    )
+
+    entities = (
+        EntityInProgress(bibentity, profiler.new_profile(bibentity) if profiler is not None else None)
+        for bibentity in bibentities
+    )
+
+    for entity, result in pipelined_map(entities, stages, queue_size, release_scratch_dir):
+        match result:
+            case Ok(out=EntityInProgress(bibentity_with_html=BibEntityWithHTML() as bibentity_with_html)):
+                yield (entity.bibentity, Ok(out=bibentity_with_html))
+            case Ok():
+                yield (
+                    entity.bibentity,
+                    Err(message="The bibentity went through the pipeline without HTML files.", code=-1),
+                )
+            case Err():
+                yield (entity.bibentity, result)
@@ -1,12 +1,22 @@
 import os
-import subprocess
-from typing import FrozenSet, Generator, Tuple
-
-from bs4 import BeautifulSoup, Tag
+from typing import Dict, FrozenSet, Generator, Iterable, Tuple
 
 from src.sdk.utils import get_logger, lginf
-from src.sdk.ResultMonad import runwrap, try_except_wrapper
-from src.ref_pipe.models import BibDiv, BibentityHTMLRawFile, Bibliography, File, BibEntity, Markdown, TBibDivDict
+from src.sdk.ResultMonad import Err, Ok, rmap, runwrap, try_except_wrapper
+from src.ref_pipe.div_extractor import stream_divs
+from src.ref_pipe.compile_backends import CompileBackend
+from src.ref_pipe.div_cache import DivCache, colliding_bibkeys, split_cached_bibkeys
+from src.ref_pipe.profiling import profiled_stage
+from src.ref_pipe.models import (
+    BibDiv,
+    BibentityHTMLRawFile,
+    Bibliography,
+    File,
+    BibEntity,
+    Markdown,
+    MarkdownBatch,
+    TBibDivDict,
+)
 
 
 lgr = get_logger("Prepare Divs")
@@ -36,40 +46,50 @@ first-page: 1
 """
 
 
-@try_except_wrapper(lgr)
-def prepare_small_bib(
-    bib_entity: BibEntity,
+def write_small_bib(
+    bibkeys_needed: FrozenSet[str],
     bibliography: Bibliography,
-    local_base_dir: str,
-    relative_output_dir: str,
+    small_bib_filename: str,
+    label: str,
 ) -> None:
     """
-    Generates a small bibliography file containing only the lines of the bibkeys in the bib_entity.
+    Writes the lines of the bibliography corresponding to the given bibkeys to the small bibliography file. The label is only used for error messages.
     """
-    bibkeys_needed = bib_entity.main_bibkeys | bib_entity.further_references | bib_entity.depends_on
 
-    # Assert all the bibentity bibkeys are in the bibliography
+    # Assert all the bibkeys are in the bibliography
     if not bibkeys_needed.issubset(bibliography.bibkeys):
         missing_bibkeys = bibkeys_needed - bibliography.bibkeys
-        raise ValueError(
-            f"Missing bibkeys for {bib_entity.entity_key} in the bibliography: {', '.join(sorted(missing_bibkeys))}"
+        raise ValueError(f"Missing bibkeys for {label} in the bibliography: {', '.join(sorted(missing_bibkeys))}")
+
+    # Slice the lines straight from the memory-mapped bibliography, in file order
+    bibkeys_in_file_order = sorted(bibkeys_needed, key=bibliography.bibkey_index_dict.__getitem__)
+
+    with open(small_bib_filename, "wb") as f:
+        f.write(b"".join(bibliography.line_bytes(bibkey) for bibkey in bibkeys_in_file_order))
+
+    if not os.path.exists(small_bib_filename):
+        raise FileNotFoundError(
+            f"The small bibliography file '{small_bib_filename}' was not generated successfully for {label}."
         )
 
-    bibkeys_index_dict = bibliography.bibkey_index_dict
+    return None
 
-    indexes_needed = tuple(bibkeys_index_dict[bibkey] for bibkey in bibkeys_needed)
 
-    small_bib_content = tuple(bibliography.content[i] for i in indexes_needed)
+@try_except_wrapper(lgr)
+def prepare_small_bib(
+    bib_entity: BibEntity,
+    bibliography: Bibliography,
+    local_base_dir: str,
+    relative_output_dir: str,
+) -> None:
+    """
+    Generates a small bibliography file containing only the lines of the bibkeys in the bib_entity.
+    """
+    bibkeys_needed = bib_entity.main_bibkeys | bib_entity.further_references | bib_entity.depends_on
 
     small_bib_filename = f"{local_base_dir}/{relative_output_dir}/{SMALL_BIB_NAME}"
 
-    with open(small_bib_filename, "w") as f:
-        f.write("".join(small_bib_content))
-
-    if not os.path.exists(small_bib_filename):
-        raise FileNotFoundError(
-            f"The small bibliography file '{small_bib_filename}' was not generated successfully for '{bib_entity.entity_key}'."
-        )
+    write_small_bib(bibkeys_needed, bibliography, small_bib_filename, f"'{bib_entity.entity_key}'")
 
     return None
 
@@ -102,6 +122,25 @@ def prepare_md(
     return md
 
 
+def write_md_file(file: File, output_local_dir: str) -> None:
+
+    if not file or not file.content or not file.basename:
+        raise ValueError(f"The markdown file '{file.basename}' does not have content or a name.")
+
+    file_path = file.full_file_path(output_local_dir)
+
+    with open(file_path, "w") as f:
+        f.write(file.content)
+
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"The markdown file '{file_path}' was not written successfully.")
+
+    # consume the contents to save memory
+    file.content = ""
+
+    return None
+
+
 @try_except_wrapper(lgr)
 def write_bib_md_files(prepared_md: Markdown) -> Markdown:
     refs_md = prepared_md
@@ -111,33 +150,42 @@ def write_bib_md_files(prepared_md: Markdown) -> Markdown:
         raise FileNotFoundError(f"The output directory '{output_local_dir}' does not exist.")
 
     for file in [refs_md.main_file, refs_md.master_file]:
-        if not file or not file.content or not file.basename:
-            raise ValueError(f"The markdown file '{file.basename}' does not have content or a name.")
+        write_md_file(file, output_local_dir)
 
-    main_file_path = refs_md.main_file.full_file_path(output_local_dir)
-    master_file_path = refs_md.master_file.full_file_path(output_local_dir)
+    return refs_md
 
-    with open(main_file_path, "w") as f:
-        f.write(refs_md.main_file.content)
 
-    if not os.path.exists(main_file_path):
-        raise FileNotFoundError(f"The markdown file '{main_file_path}' was not written successfully.")
+def run_dltc_make(
+    local_output_directory: str, container_output_directory: str, compile_backend: CompileBackend
+) -> None:
+    """
+    Compile the 'master.md' file of the output directory with the compile backend. Raises a RuntimeError with the output of the compilation if it fails.
+    """
 
-    with open(master_file_path, "w") as f:
-        f.write(refs_md.master_file.content)
+    frame = f"run_dltc_make"
 
-    if not os.path.exists(master_file_path):
-        raise FileNotFoundError(f"The markdown file '{master_file_path}' was not written successfully.")
+    lginf(
+        frame,
+        f"Compiling with the '{compile_backend.name}' compile backend:\n\tIn the directory '{local_output_directory}' (container directory '{container_output_directory}')",
+        lgr,
+    )
 
-    # consume the contents to save memory
-    refs_md.main_file.content = ""
-    refs_md.master_file.content = ""
+    compilation_result = compile_backend.compile(local_output_directory, container_output_directory)
 
-    return refs_md
+    if compilation_result.returncode != 0:
+        msg = compilation_result.output
+        if msg == "":
+            msg = f"An unknown error occurred while compiling with the '{compile_backend.name}' compile backend."
+
+        raise RuntimeError(msg)
+
+    lginf(frame, f"{compilation_result.output}", lgr)
+
+    return None
 
 
 @try_except_wrapper(lgr)
-def dltc_env_exec(prepared_md: Markdown, container_name: str) -> BibentityHTMLRawFile:
+def dltc_env_exec(prepared_md: Markdown, compile_backend: CompileBackend) -> BibentityHTMLRawFile:
 
     frame = f"dltc_env_exec"
     lginf(frame, f"Preparing compilation command to execute in the container...", lgr)
@@ -147,41 +195,11 @@ def dltc_env_exec(prepared_md: Markdown, container_name: str) -> BibentityHTMLRa
     relative_output_dir = bib_md.relative_output_dir
 
     container_output_directory = f"{container_base_dir}/{relative_output_dir}"
+    local_output_directory = f"{bib_md.local_base_dir}/{relative_output_dir}"
 
-    command = "dltc-make offhtml"
-    lginf(
-        frame,
-        f"Executing command within the container:\n\t`{command}`\n\tIn the container directory '{container_output_directory}'",
-        lgr,
-    )
-
-    compilation_result = subprocess.run(
-        [
-            "docker",
-            "exec",
-            "--workdir",
-            container_output_directory,
-            container_name,
-            "bash",
-            "-c",
-            command,
-        ],
-        capture_output=True,
-    )
-
-    if compilation_result.returncode != 0:
-        msg = f"{compilation_result.stderr.decode('utf-8')}"
-        if msg == "":
-            msg = f"{compilation_result.stdout.decode('utf-8')}"
-        if msg == "":
-            msg = f"An unknown error occurred while executing the command '{command}' in the container '{container_name}'."
-
-        raise RuntimeError(msg)
-
-    lginf(frame, f"{compilation_result.stdout.decode('utf-8')}", lgr)
+    run_dltc_make(local_output_directory, container_output_directory, compile_backend)
 
     html_basename = f"{bib_md.main_file.basename.replace('.md', '.html')}"
-    local_output_directory = f"{bib_md.local_base_dir}/{relative_output_dir}"
     html_filename = f"{local_output_directory}/{html_basename}"
 
     if not os.path.exists(html_filename):
@@ -193,35 +211,6 @@ def dltc_env_exec(prepared_md: Markdown, container_name: str) -> BibentityHTMLRa
     )
 
 
-def get_bibkey_from_div_id(div_id: str) -> str:
-    """
-    Extract the bibkey from the div ID. WARNING: if the HTML structure changes, this function will produce nonsense and will need update.
-
-    This assumes IDs of the shape:
-    `ref-<entity_key>-<bibkey>`, where <bibkey> can contain "-"
-
-    For example:
-    ref-c1-ashby_n:2002
-    ref-c1-caruso_em-etal:2008
-    """
-    try:
-        bibkey = "-".join(div_id.split('-')[2:])
-    except IndexError:
-        lgr.warning(f"Could not find bibkey in div ID '{div_id}'")
-        bibkey = ""
-
-    return bibkey
-
-
-def bs_get_div_bibkey(page_element: Tag) -> str:
-    bs_getter = page_element.get('id')
-    match bs_getter:
-        case None:
-            return ""
-        case _:
-            return get_bibkey_from_div_id(bs_getter.__str__())
-
-
 @try_except_wrapper(lgr)
 def gen_raw_html_file(
     bibentity: BibEntity,
@@ -229,7 +218,7 @@ def gen_raw_html_file(
     local_base_dir: str,
     container_base_dir: str,
     relative_output_dir: str,
-    container_name: str,
+    compile_backend: CompileBackend,
 ) -> BibentityHTMLRawFile:
 
     frame = f"gen_bib_html_file"
@@ -240,43 +229,90 @@ def gen_raw_html_file(
 
     files_basename = f"{bibentity.url_endpoint}"
 
-    runwrap(prepare_small_bib(bibentity, bibliography, local_base_dir, relative_output_dir))
-
-    md = runwrap(
-        prepare_md(
-            markdown_basename=files_basename,
-            bibkeys=bibkeys,
-            local_base_dir=local_base_dir,
-            container_base_dir=container_base_dir,
-            relative_output_dir=relative_output_dir,
+    with profiled_stage("small_bib"):
+        runwrap(prepare_small_bib(bibentity, bibliography, local_base_dir, relative_output_dir))
+
+    with profiled_stage("markdown"):
+        md = runwrap(
+            prepare_md(
+                markdown_basename=files_basename,
+                bibkeys=bibkeys,
+                local_base_dir=local_base_dir,
+                container_base_dir=container_base_dir,
+                relative_output_dir=relative_output_dir,
+            )
         )
-    )
-    md = runwrap(write_bib_md_files(md))
-    raw_html_file = runwrap(dltc_env_exec(md, container_name))
+        md = runwrap(write_bib_md_files(md))
+
+    with profiled_stage("compile"):
+        raw_html_file = runwrap(dltc_env_exec(md, compile_backend))
 
     lginf(frame, f"HTML file '{raw_html_file.local_path}' generated successfully.", lgr)
 
     return raw_html_file
 
 
+def div_namespace(position: int) -> str:
+    """
+    Div ID namespace of the markdown file at the given (1-based) position in the imports of 'master.md'.
+
+    dltc-make compiles every imported file as a chapter, and prefixes the IDs of its reference divs with the chapter number, as in
+    `ref-c1-ashby_n:2002` for the first import, `ref-c2-ashby_n:2002` for the second one, and so on.
+    """
+    return f"c{position}"
+
+
 @try_except_wrapper(lgr)
-def extract_divs(html_bib_file: BibentityHTMLRawFile) -> Generator[BibDiv, None, None]:
+def extract_divs(html_bib_file: BibentityHTMLRawFile, namespace: str | None = None) -> Generator[BibDiv, None, None]:
+    """
+    Extract the reference divs of a compiled HTML file. If a namespace is given (see `div_namespace`), only the divs whose ID belongs to it are extracted.
+    The file is streamed (see `div_extractor`), so the divs come out as it is read.
+    """
+
+    if not os.path.exists(html_bib_file.local_path):
+        raise FileNotFoundError(f"The raw HTML file '{html_bib_file.local_path}' does not exist.")
+
+    def bibdivs() -> Generator[BibDiv, None, None]:
+        with open(html_bib_file.local_path, "r") as f:
+            yield from stream_divs(f, namespace)
 
-    with open(html_bib_file.local_path, "r") as f:
-        bib_html_content = f.read()
+    return bibdivs()
 
-    # Parse the HTML content with extract div
-    ### NOTE: this is married to the external library BeautifulSoup
-    soup = BeautifulSoup(bib_html_content, features="html.parser")
-    divs_all = soup.find_all('div')
-    divs = (div for div in divs_all if isinstance(div, Tag))
 
-    bibdivs = (
-        BibDiv(div_id=bs_get_div_bibkey(div), content=div.__str__()) for div in divs if bs_get_div_bibkey(div) != ""
+def bibentity_to_render(bibentity: BibEntity, bibkeys_to_render: FrozenSet[str]) -> BibEntity:
+    """
+    Copy of the bibentity that only displays the given bibkeys. All its other bibkeys are kept as dependencies, so that the small bib stays complete (e.g., for crossrefs).
+    """
+    all_bibkeys = bibentity.main_bibkeys | bibentity.further_references | bibentity.depends_on
+
+    return BibEntity(
+        id=bibentity.id,
+        entity_key=bibentity.entity_key,
+        url_endpoint=bibentity.url_endpoint,
+        main_bibkeys=bibkeys_to_render,
+        further_references=frozenset(),
+        depends_on=all_bibkeys - bibkeys_to_render,
     )
-    ### NOTE: marriage to BeautifulSoup ends here
 
-    return bibdivs
+
+def merge_rendered_divs(
+    cached_divs: TBibDivDict,
+    rendered_divs: TBibDivDict,
+    bibkeys_to_render: FrozenSet[str],
+    bibliography: Bibliography,
+    div_cache: DivCache | None,
+) -> TBibDivDict:
+    """
+    Store the freshly rendered divs in the cache, apart from the colliding ones, and merge them with the ones that came from it.
+    """
+    if div_cache is None:
+        return rendered_divs
+
+    # Colliding bibkeys are all rendered, so they collide among the rendered ones too
+    bibkeys_to_store = bibkeys_to_render - colliding_bibkeys(bibkeys_to_render)
+    div_cache.put_many({k: v for k, v in rendered_divs.items() if k in bibkeys_to_store}, bibliography)
+
+    return cached_divs | rendered_divs
 
 
 @try_except_wrapper(lgr)
@@ -286,8 +322,12 @@ def gen_bib_html_divs(
     local_base_dir: str,
     container_base_dir: str,
     relative_output_dir: str,
-    container_name: str,
+    compile_backend: CompileBackend,
+    div_cache: DivCache | None = None,
 ) -> TBibDivDict:
+    """
+    Generate the divs of the main bibkeys and further references of the bibentity. If a div cache is given, only the divs missing from it are compiled.
+    """
 
     try:
         frame = f"gen_bib_html_divs"
@@ -299,34 +339,329 @@ def gen_bib_html_divs(
             # Skip if there are no main bibkeys
             return {}
 
+        cached_divs, bibkeys_to_render = split_cached_bibkeys(
+            main_bibkeys | bibentity.further_references, bibliography, div_cache
+        )
+
+        if bibkeys_to_render == frozenset():
+            lginf(frame, f"All divs for {bibentity.entity_key} found in the cache.", lgr)
+            return cached_divs
+
         html_bib_file = runwrap(
             gen_raw_html_file(
-                bibentity,
+                bibentity_to_render(bibentity, bibkeys_to_render) if cached_divs else bibentity,
                 bibliography,
                 local_base_dir,
                 container_base_dir,
                 relative_output_dir,
-                container_name,
+                compile_backend,
             )
         )
 
         # bibdivs = tuple(div for div in runwrap(extract_divs(html_bib_file)))
-        bibdivs_dict = {div.div_id: div.content for div in runwrap(extract_divs(html_bib_file))}
+        with profiled_stage("extract"):
+            bibdivs_dict = {div.div_id: div.content for div in runwrap(extract_divs(html_bib_file))}
 
         lginf(frame, f"Divs generated successfully for {bibentity.entity_key}.", lgr)
 
-        return bibdivs_dict
+        return merge_rendered_divs(cached_divs, bibdivs_dict, bibkeys_to_render, bibliography, div_cache)
+
+    finally:
+        remove_compilation_files(bibentity, local_base_dir, relative_output_dir)
+
+
+def remove_compilation_files(bibentity: BibEntity, local_base_dir: str, relative_output_dir: str) -> None:
+    """
+    Remove the files compiled for a bibentity, whether its compilation succeeded or not.
+    """
+    # re-craft filenames in case of error
+    base_filename = f"{bibentity.url_endpoint}"
+    md_file = f"{local_base_dir}/{relative_output_dir}/{base_filename}.md"
+    master_file = f"{local_base_dir}/{relative_output_dir}/master.md"
+    html_file = f"{local_base_dir}/{relative_output_dir}/{base_filename}.html"
+    bib_file = f"{local_base_dir}/{relative_output_dir}/{SMALL_BIB_NAME}"
+
+    for file in [md_file, master_file, html_file, bib_file]:
+        if os.path.exists(file):
+            os.remove(file)
+        if os.path.exists(file):
+            lgr.warning(f"Could not remove file '{file}'.")
+
+    return None
+
+
+def chunk_bibentities(
+    bibentities: Iterable[BibEntity], chunk_size: int
+) -> Generator[Tuple[BibEntity, ...], None, None]:
+    """
+    Split the bibentities into chunks of at most `chunk_size` elements, preserving their order.
+    A chunk is closed early if the next bibentity has the same URL endpoint as one already in it, as the files compiled for each bibentity are named after it.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"The chunk size must be a positive integer, got '{chunk_size}'.")
+
+    chunk: list[BibEntity] = []
+    url_endpoints: set[str] = set()
+
+    for bibentity in bibentities:
+        if len(chunk) >= chunk_size or bibentity.url_endpoint in url_endpoints:
+            yield tuple(chunk)
+            chunk = []
+            url_endpoints = set()
+
+        chunk.append(bibentity)
+        url_endpoints.add(bibentity.url_endpoint)
+
+    if chunk:
+        yield tuple(chunk)
+
+
+@try_except_wrapper(lgr)
+def prepare_md_batch(
+    bibentities: Tuple[BibEntity, ...],
+    local_base_dir: str,
+    container_base_dir: str,
+    relative_output_dir: str,
+) -> MarkdownBatch:
+    """
+    Prepare one markdown file per bibentity, all of them imported by a single 'master.md' file.
+    """
+
+    main_files: list[File] = []
+    for bibentity in bibentities:
+        # We need the main bibkeys and the further references in the final HTML, but not the dependencies
+        bibkeys = bibentity.main_bibkeys | bibentity.further_references
+        bibkeys_str = "\n\n".join(f"@{key}" for key in bibkeys)
+        main_content = MD_TEMPLATE.replace("~%~%~%PUT THE BIBKEYS HERE~%~%~%", bibkeys_str)
+        main_files.append(File(content=main_content, basename=f"{bibentity.url_endpoint}.md"))
+
+    imports_str = "\n- ".join(main_file.basename for main_file in main_files)
+    master_content = MASTER_MD_TEMPLATE.replace("~%~%~%md_filename~%~%~%", imports_str)
+    master_md = File(content=master_content, basename=f"master.md")
+
+    return MarkdownBatch(
+        local_base_dir=local_base_dir,
+        container_base_dir=container_base_dir,
+        relative_output_dir=relative_output_dir,
+        main_files=tuple(main_files),
+        master_file=master_md,
+    )
+
+
+@try_except_wrapper(lgr)
+def write_bib_md_batch_files(prepared_md_batch: MarkdownBatch) -> MarkdownBatch:
+
+    output_local_dir = f"{prepared_md_batch.local_base_dir}/{prepared_md_batch.relative_output_dir}"
+    if not os.path.exists(output_local_dir):
+        raise FileNotFoundError(f"The output directory '{output_local_dir}' does not exist.")
+
+    for file in [*prepared_md_batch.main_files, prepared_md_batch.master_file]:
+        write_md_file(file, output_local_dir)
+
+    return prepared_md_batch
+
+
+def extract_divs_batch_member(html_filename: str, position: int, bibentity: BibEntity) -> Ok[TBibDivDict] | Err:
+    """
+    Extract the divs of a single bibentity out of a batch compilation.
+    Finding no divs is not an error, as for a single compilation (see `gen_bib_html_divs`), but `gen_bib_html_divs_batch` compiles such bibentities again on their own, in case their divs were not in the expected namespace.
+    """
+
+    if not os.path.exists(html_filename):
+        msg = f"The raw HTML file '{html_filename}' was not generated for '{bibentity.entity_key}'."
+        lgr.error(msg)
+        return Err(message=msg, code=-1)
+
+    namespace = div_namespace(position)
+    bibdivs_result = extract_divs(BibentityHTMLRawFile(local_path=html_filename), namespace)
+
+    match bibdivs_result:
+        case Ok(out=bibdivs):
+            # Bring the divs back to the namespace of a single compilation, so that the output doesn't depend on the batch
+            single_namespace = div_namespace(1)
+            try:
+                bibdivs_dict = {
+                    div.div_id: div.content.replace(f'id="ref-{namespace}-', f'id="ref-{single_namespace}-', 1)
+                    for div in bibdivs
+                }
+            except Exception as e:
+                msg = f"Error extracting the divs of '{bibentity.entity_key}' from '{html_filename}': {e}"
+                lgr.error(msg)
+                return Err(message=msg, code=-1)
+
+        case Err():
+            return bibdivs_result
+
+    if bibdivs_dict == {}:
+        lgr.warning(f"No divs found in namespace '{namespace}' of '{html_filename}' for '{bibentity.entity_key}'.")
+
+    return Ok(out=bibdivs_dict)
+
+
+@try_except_wrapper(lgr)
+def compile_batch(
+    bibentities: Tuple[BibEntity, ...],
+    bibliography: Bibliography,
+    local_base_dir: str,
+    container_base_dir: str,
+    relative_output_dir: str,
+    compile_backend: CompileBackend,
+) -> Tuple[Ok[TBibDivDict] | Err, ...]:
+    """
+    Compile all the bibentities in a single job: one combined small bib, one markdown file per bibentity, and one call to dltc-make.
+    Returns the divs of each bibentity, in the same order as the input. An error in the compilation itself makes the whole batch fail.
+    """
+
+    frame = f"compile_batch"
+    lginf(frame, f"Compiling a batch of {len(bibentities)} bibentities...", lgr)
+
+    local_output_directory = f"{local_base_dir}/{relative_output_dir}"
+
+    try:
+        bibkeys_needed = frozenset().union(
+            *(bibentity.main_bibkeys | bibentity.further_references | bibentity.depends_on for bibentity in bibentities)
+        )
+        small_bib_filename = f"{local_output_directory}/{SMALL_BIB_NAME}"
+        with profiled_stage("small_bib"):
+            write_small_bib(bibkeys_needed, bibliography, small_bib_filename, f"the batch")
+
+        with profiled_stage("markdown"):
+            md_batch = runwrap(prepare_md_batch(bibentities, local_base_dir, container_base_dir, relative_output_dir))
+            md_batch = runwrap(write_bib_md_batch_files(md_batch))
+
+        with profiled_stage("compile"):
+            run_dltc_make(local_output_directory, f"{container_base_dir}/{relative_output_dir}", compile_backend)
+
+        with profiled_stage("extract"):
+            return tuple(
+                extract_divs_batch_member(
+                    f"{local_output_directory}/{bibentity.url_endpoint}.html", position, bibentity
+                )
+                for position, bibentity in enumerate(bibentities, start=1)
+            )
 
     finally:
         # re-craft filenames in case of error
-        base_filename = f"{bibentity.url_endpoint}"
-        md_file = f"{local_base_dir}/{relative_output_dir}/{base_filename}.md"
-        master_file = f"{local_base_dir}/{relative_output_dir}/master.md"
-        html_file = f"{local_base_dir}/{relative_output_dir}/{base_filename}.html"
-        bib_file = f"{local_base_dir}/{relative_output_dir}/{SMALL_BIB_NAME}"
+        files = [f"{local_output_directory}/master.md", f"{local_output_directory}/{SMALL_BIB_NAME}"]
+        for bibentity in bibentities:
+            files.append(f"{local_output_directory}/{bibentity.url_endpoint}.md")
+            files.append(f"{local_output_directory}/{bibentity.url_endpoint}.html")
 
-        for file in [md_file, master_file, html_file, bib_file]:
+        for file in files:
             if os.path.exists(file):
                 os.remove(file)
             if os.path.exists(file):
                 lgr.warning(f"Could not remove file '{file}'.")
+
+
+def gen_bib_html_divs_batch(
+    bibentities: Tuple[BibEntity, ...],
+    bibliography: Bibliography,
+    local_base_dir: str,
+    container_base_dir: str,
+    relative_output_dir: str,
+    compile_backend: CompileBackend,
+    div_cache: DivCache | None = None,
+) -> Tuple[Ok[TBibDivDict] | Err, ...]:
+    """
+    Batched version of `gen_bib_html_divs`. Returns the divs of each bibentity, in the same order as the input.
+
+    Errors are always attributed to individual bibentities: the ones that can be detected beforehand (e.g., missing bibkeys) are taken out of the batch, and if the batch compilation fails as a whole, its members are compiled one by one.
+    Members without any divs in the batch are compiled again on their own too, so that the results are always the same as with `gen_bib_html_divs`.
+    If a div cache is given, bibentities whose divs are all cached are taken out of the batch too, and only the missing divs of the others are compiled.
+    """
+
+    frame = f"gen_bib_html_divs_batch"
+
+    results: Dict[int, Ok[TBibDivDict] | Err] = {}
+    to_compile: list[Tuple[int, BibEntity]] = []
+    cached: Dict[int, Tuple[TBibDivDict, FrozenSet[str]]] = {}
+
+    for i, bibentity in enumerate(bibentities):
+        if bibentity.main_bibkeys == frozenset():
+            # Skip if there are no main bibkeys
+            results[i] = Ok(out={})
+            continue
+
+        bibkeys_needed = bibentity.main_bibkeys | bibentity.further_references | bibentity.depends_on
+        if not bibkeys_needed.issubset(bibliography.bibkeys):
+            missing_bibkeys = bibkeys_needed - bibliography.bibkeys
+            msg = f"Missing bibkeys for '{bibentity.entity_key}' in the bibliography: {', '.join(sorted(missing_bibkeys))}"
+            lgr.error(msg)
+            results[i] = Err(message=msg, code=-1)
+            continue
+
+        cached_divs, bibkeys_to_render = split_cached_bibkeys(
+            bibentity.main_bibkeys | bibentity.further_references, bibliography, div_cache
+        )
+
+        if bibkeys_to_render == frozenset():
+            results[i] = Ok(out=cached_divs)
+            continue
+
+        cached[i] = (cached_divs, bibkeys_to_render)
+        to_compile.append((i, bibentity_to_render(bibentity, bibkeys_to_render) if cached_divs else bibentity))
+
+    rendered: Dict[int, Ok[TBibDivDict] | Err] = {}
+
+    if len(to_compile) == 1:
+        i, bibentity = to_compile[0]
+        rendered[i] = gen_bib_html_divs(
+            bibentity,
+            bibliography,
+            local_base_dir,
+            container_base_dir,
+            relative_output_dir,
+            compile_backend,
+        )
+
+    elif len(to_compile) > 1:
+        batch_result = compile_batch(
+            tuple(bibentity for _, bibentity in to_compile),
+            bibliography,
+            local_base_dir,
+            container_base_dir,
+            relative_output_dir,
+            compile_backend,
+        )
+
+        match batch_result:
+            case Ok(out=batch_divs):
+                for (i, bibentity), divs_result in zip(to_compile, batch_divs):
+                    match divs_result:
+                        case Ok(out=divs) if divs == {}:
+                            rendered[i] = gen_bib_html_divs(
+                                bibentity,
+                                bibliography,
+                                local_base_dir,
+                                container_base_dir,
+                                relative_output_dir,
+                                compile_backend,
+                            )
+                        case _:
+                            rendered[i] = divs_result
+
+            case Err(message=message):
+                lgr.warning(
+                    f"{frame}\n\tThe batch compilation failed, compiling its {len(to_compile)} bibentities one by one to find the culprits. Detail:\n{message}"
+                )
+                for i, bibentity in to_compile:
+                    rendered[i] = gen_bib_html_divs(
+                        bibentity,
+                        bibliography,
+                        local_base_dir,
+                        container_base_dir,
+                        relative_output_dir,
+                        compile_backend,
+                    )
+
+    for i, rendered_result in rendered.items():
+        cached_divs, bibkeys_to_render = cached[i]
+        results[i] = rmap(
+            lambda rendered_divs: merge_rendered_divs(
+                cached_divs, rendered_divs, bibkeys_to_render, bibliography, div_cache
+            ),
+            rendered_result,
+        )
+
+    return tuple(results[i] for i in range(len(bibentities)))
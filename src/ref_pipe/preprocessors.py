@@ -1,8 +1,16 @@
-from typing import Tuple
+import os
+from typing import Dict, NamedTuple, Tuple
 
 from src.sdk.ResultMonad import try_except_wrapper
 from src.sdk.utils import get_logger
-from src.ref_pipe.models import BibEntity, TSupportedEntity, SUPPORTED_ENTITY_TYPES
+from src.ref_pipe.models import (
+    BibEntity,
+    BibliographyTable,
+    BibSortRanks,
+    TJournalIndex,
+    TSupportedEntity,
+    SUPPORTED_ENTITY_TYPES,
+)
 import polars as pl
 
 lgr = get_logger("Preprocess Bibentities")
@@ -12,7 +20,12 @@ def load_bibliography_dataframe(
     bibliography_file: str,
 ) -> pl.DataFrame:
 
-    df_raw = pl.read_ods(bibliography_file)
+    # The ODS export of the bibliography table, or a Parquet copy of it (much faster to read)
+    match os.path.splitext(bibliography_file)[1]:
+        case ".parquet":
+            df_raw = pl.read_parquet(bibliography_file)
+        case _:
+            df_raw = pl.read_ods(bibliography_file)
 
     # Remove duplicates on 'bibkey'
     df = df_raw.unique(subset=["bibkey"], keep="first")
@@ -20,11 +33,21 @@ def load_bibliography_dataframe(
     return df
 
 
-def _preprocess_journal(bib_df: pl.DataFrame, raw_journal: BibEntity) -> BibEntity:
+def build_journal_index(prepared_df: pl.DataFrame) -> TJournalIndex:
+    """
+    Partition the prepared bibliography table by journal, in a single pass. Rows without journal ID are left out.
+    """
+    partitions = prepared_df.partition_by("journal-id", as_dict=True, maintain_order=True)
+
+    return {f"{journal_id}": journal_df for (journal_id,), journal_df in partitions.items() if journal_id is not None}
+
+
+def _preprocess_journal(journal_index: TJournalIndex, raw_journal: BibEntity) -> BibEntity:
 
-    journal_df = bib_df.filter(bib_df['journal-id'] == str(raw_journal.id))
+    journal_df = journal_index.get(str(raw_journal.id))
+    journal_bibkeys = journal_df["bibkey"].to_list() if journal_df is not None else []
 
-    main_bibkeys = frozenset(f"{bibkey}" for bibkey in journal_df["bibkey"].to_list())
+    main_bibkeys = frozenset(f"{bibkey}" for bibkey in journal_bibkeys)
 
     return BibEntity(
         id=raw_journal.id,
@@ -45,40 +68,99 @@ def _preprocess_publisher(bib_df: pl.DataFrame, raw_publisher: BibEntity) -> Bib
     return raw_publisher
 
 
-@try_except_wrapper(lgr)
-def preprocess_bibentities(
-    bibliography_file: str, raw_bibentities: Tuple[BibEntity, ...], entity_type: TSupportedEntity
-) -> Tuple[Tuple[BibEntity, ...], pl.DataFrame]:
+def preprocess_raw_bibentities(
+    df: pl.DataFrame,
+    journal_index: TJournalIndex,
+    raw_bibentities: Tuple[BibEntity, ...],
+    entity_type: TSupportedEntity,
+) -> Tuple[BibEntity, ...]:
     """
-    Preprocess the raw bibentities to ensure they are in the correct format.
-    Always loads the bibliography DataFrame for sorting purposes.
+    Preprocess the raw bibentities to ensure they are in the correct format, given the bibliography table and its journal partitions.
     """
-    # Load the bibliography ODS file into a Polars DataFrame (needed for all entity types for sorting)
-    df: pl.DataFrame = load_bibliography_dataframe(bibliography_file)
-
-    # Preprocess the raw bibentities
     match entity_type:
         case "journal":
-            processed_bibentities = tuple(_preprocess_journal(df, raw_bibentity) for raw_bibentity in raw_bibentities)
+            return tuple(_preprocess_journal(journal_index, raw_bibentity) for raw_bibentity in raw_bibentities)
 
         case "publisher":
-            processed_bibentities = tuple(_preprocess_publisher(df, raw_bibentity) for raw_bibentity in raw_bibentities)
+            return tuple(_preprocess_publisher(df, raw_bibentity) for raw_bibentity in raw_bibentities)
 
         case "profile":
-            processed_bibentities = raw_bibentities
+            return raw_bibentities
 
         case "article":
-            processed_bibentities = raw_bibentities
+            return raw_bibentities
 
         case "page":
-            processed_bibentities = raw_bibentities
+            return raw_bibentities
 
         case _:
             raise ValueError(
                 f"Unsupported entity type: '{entity_type}'. Supported types are: {', '.join(SUPPORTED_ENTITY_TYPES)}"
             )
 
-    return processed_bibentities, df
+
+@try_except_wrapper(lgr)
+def preprocess_bibentities(
+    bibliography_file: str, raw_bibentities: Tuple[BibEntity, ...], entity_type: TSupportedEntity
+) -> Tuple[Tuple[BibEntity, ...], pl.DataFrame, TJournalIndex]:
+    """
+    Preprocess the raw bibentities to ensure they are in the correct format.
+    Always loads and prepares the bibliography DataFrame for sorting purposes, and partitions it by journal once.
+    """
+    # Load the bibliography ODS file into a Polars DataFrame (needed for all entity types for sorting)
+    df: pl.DataFrame = load_bibliography_dataframe(bibliography_file)
+    prepared_df = prepare_bib_df(df)
+    journal_index = build_journal_index(prepared_df)
+
+    # Preprocess the raw bibentities
+    processed_bibentities = preprocess_raw_bibentities(df, journal_index, raw_bibentities, entity_type)
+
+    return processed_bibentities, prepared_df, journal_index
+
+
+@try_except_wrapper(lgr)
+def load_bibliography_table(bibliography_file: str) -> BibliographyTable:
+    """
+    Load and prepare the bibliography table, partition it by journal, and rank its bibkeys, so that all the entity types processed in a run can share it.
+    """
+    df = load_bibliography_dataframe(bibliography_file)
+    prepared_df = prepare_bib_df(df)
+
+    return BibliographyTable(
+        df=df,
+        prepared_df=prepared_df,
+        journal_index=build_journal_index(prepared_df),
+        sort_ranks=build_sort_ranks(prepared_df),
+    )
+
+
+class SortOrdering(NamedTuple):
+    by: Tuple[str, ...]
+    descending: Tuple[bool, ...]
+    nulls_last: Tuple[bool, ...]
+
+
+# Rank column -> ordering, in the order of the fields of BibSortRanks
+SORT_ORDERINGS: Dict[str, SortOrdering] = {
+    # Profiles: date DESC (nulls first), title ASC
+    "_rank_profile": SortOrdering(
+        by=("date", "_sort_title"),
+        descending=(True, False),
+        nulls_last=(False, True),
+    ),
+    # Publishers: last_name ASC, first_name ASC, title ASC (no author = end)
+    "_rank_publisher": SortOrdering(
+        by=("_sort_last_name", "_sort_first_name", "_sort_title"),
+        descending=(False, False, False),
+        nulls_last=(False, False, False),
+    ),
+    # Default (article, page, etc.): last_name ASC, first_name ASC, date DESC, title ASC (no author = end)
+    "_rank_default": SortOrdering(
+        by=("_sort_last_name", "_sort_first_name", "date", "_sort_title"),
+        descending=(False, False, True, False),
+        nulls_last=(True, True, True, True),
+    ),
+}
 
 
 def prepare_bib_df(
@@ -86,7 +168,7 @@ def prepare_bib_df(
 ) -> pl.DataFrame:
     """
     Prepare the bibliography DataFrame for sorting operations.
-    Adds author parsing columns for sorting by last name and first name.
+    Adds author parsing columns for sorting by last name and first name, and the rank columns of `SORT_ORDERINGS`.
     """
     # Remove duplicates on 'bibkey'
     df = (
@@ -159,6 +241,21 @@ def prepare_bib_df(
         .drop('_first_author')
     )
 
+    # Global rank of each bibkey in each of the entity orderings, so that sorting the bibkeys of an entity is a lookup
+    df = df.with_columns(
+        [
+            pl.arg_sort_by(
+                [*ordering.by, "bibkey"],
+                descending=[*ordering.descending, False],
+                nulls_last=[*ordering.nulls_last, False],
+                maintain_order=True,
+            )
+            .arg_sort()
+            .alias(rank_column)
+            for rank_column, ordering in SORT_ORDERINGS.items()
+        ]
+    )
+
     # Sort for journals/publishers (default sort: date DESC, volume DESC, number DESC, start_int ASC)
     sorted_df = (
         df.sort('start_int', nulls_last=True)
@@ -168,3 +265,17 @@ def prepare_bib_df(
     )
 
     return sorted_df
+
+
+def build_sort_ranks(prepared_df: pl.DataFrame) -> BibSortRanks:
+    """
+    Extract the bibkey -> rank dictionaries of the rank columns added by `prepare_bib_df`.
+    """
+    bibkeys = prepared_df["bibkey"].to_list()
+
+    return BibSortRanks(
+        **{
+            ordering_name: dict(zip(bibkeys, prepared_df[rank_column].to_list()))
+            for ordering_name, rank_column in zip(BibSortRanks._fields, SORT_ORDERINGS.keys())
+        }
+    )
@@ -0,0 +1,177 @@
+"""
+Optional per-entity instrumentation of the pipeline: wall time of each stage, bytes of HTML written, and number of divs.
+
+The stages are timed where they happen (see `profiled_stage`), into the profile of the entity being processed by the current thread. Outside of `profiling_entity`, timing a stage does nothing, so that the instrumentation costs nothing when it is not asked for.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import math
+import os
+import threading
+import time
+from typing import Dict, Generator, Iterable, List, Literal, Tuple
+
+from src.ref_pipe.models import BibEntity, HTMLFileChange, TRunSummary
+
+
+type TStage = Literal["small_bib", "markdown", "compile", "extract", "sort", "html_write"]
+STAGES: Tuple[TStage, ...] = ("small_bib", "markdown", "compile", "extract", "sort", "html_write")
+
+# Number of entities listed in the run summary as the slowest ones
+SLOWEST_ENTITIES = 5
+
+
+@dataclass(frozen=False, slots=True)
+class EntityProfile:
+    stages_s: Dict[TStage, float] = field(default_factory=dict)
+    total_s: float = 0.0
+    bytes_written: int = 0
+    divs: int = 0
+
+    def add(self, stage: TStage, seconds: float) -> None:
+        self.stages_s[stage] = self.stages_s.get(stage, 0.0) + seconds
+
+    def add_share(self, shared: "EntityProfile", members: int) -> None:
+        """
+        Add an even share of the stages of a profile shared by several entities (e.g., a batch compilation).
+        """
+        for stage, seconds in shared.stages_s.items():
+            self.add(stage, seconds / members)
+        self.total_s += shared.total_s / members
+
+    def record_output(self, divs: int, html_changes: Iterable[HTMLFileChange]) -> None:
+        """
+        Record the number of divs, and the size of the HTML files actually written: the unchanged ones were left untouched.
+        """
+        self.divs = divs
+        self.bytes_written = sum(
+            os.path.getsize(change.filename)
+            for change in html_changes
+            if change.status in ("created", "changed") and os.path.exists(change.filename)
+        )
+
+    def dump(self) -> Dict[str, str]:
+        """
+        Columns of the profile in the report.
+        """
+        return {
+            **{f"time_{stage}_s": f"{self.stages_s.get(stage, 0.0):.6f}" for stage in STAGES},
+            "time_total_s": f"{self.total_s:.6f}",
+            "bytes_written": f"{self.bytes_written}",
+            "divs": f"{self.divs}",
+        }
+
+
+PROFILE_COLUMNS = tuple(EntityProfile().dump().keys())
+
+
+_current_profile: ContextVar[EntityProfile | None] = ContextVar("ref_pipe_entity_profile", default=None)
+
+
+@contextmanager
+def profiling_entity(profile: EntityProfile | None) -> Generator[EntityProfile | None, None, None]:
+    """
+    Time the stages run inside the block into the given profile, and add the wall time of the block to its total. Does nothing if no profile is given.
+    """
+    if profile is None:
+        yield None
+        return
+
+    token = _current_profile.set(profile)
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.total_s += time.perf_counter() - start
+        _current_profile.reset(token)
+
+
+@contextmanager
+def profiled_stage(stage: TStage) -> Generator[None, None, None]:
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(stage, time.perf_counter() - start)
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile.
+    """
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+class RunProfiler:
+    """
+    Profiles of the entities of a run. Shared by the workers, and read by the report once the results are consumed.
+    """
+
+    def __init__(self) -> None:
+        # Identical rows of the bibliography table give equal bibentities, so each bibentity has one profile per time it was processed
+        self._profiles: Dict[BibEntity, List[EntityProfile]] = {}
+        self._reads: Dict[BibEntity, int] = {}
+        self._lock = threading.Lock()
+
+    def new_profile(self, bibentity: BibEntity) -> EntityProfile:
+        profile = EntityProfile()
+        with self._lock:
+            self._profiles.setdefault(bibentity, []).append(profile)
+        return profile
+
+    def get(self, bibentity: BibEntity) -> EntityProfile | None:
+        """
+        Profile of the next row of the bibentity in the report. Equal bibentities get their profiles in turn.
+        """
+        with self._lock:
+            profiles = self._profiles.get(bibentity)
+            if not profiles:
+                return None
+
+            reads = self._reads.get(bibentity, 0)
+            self._reads[bibentity] = reads + 1
+            return profiles[reads % len(profiles)]
+
+    def summary(self) -> TRunSummary:
+        """
+        p50, p95 and max of each stage over the profiled entities, the totals of bytes written and divs, and the slowest entities.
+        """
+        with self._lock:
+            profiled = tuple(
+                (bibentity, profile) for bibentity, profiles in self._profiles.items() for profile in profiles
+            )
+        profiles = tuple(profile for _, profile in profiled)
+
+        summary: TRunSummary = {"profiled_entities": len(profiles)}
+        if not profiles:
+            return summary
+
+        series: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        series["total"] = []
+        for profile in profiles:
+            for stage in STAGES:
+                series[stage].append(profile.stages_s.get(stage, 0.0))
+            series["total"].append(profile.total_s)
+
+        for name, values in series.items():
+            values.sort()
+            summary[f"time_{name}_p50_s"] = round(_percentile(values, 50), 6)
+            summary[f"time_{name}_p95_s"] = round(_percentile(values, 95), 6)
+            summary[f"time_{name}_max_s"] = round(values[-1], 6)
+
+        summary["bytes_written"] = sum(profile.bytes_written for profile in profiles)
+        summary["divs"] = sum(profile.divs for profile in profiles)
+
+        slowest = sorted(profiled, key=lambda item: -item[1].total_s)[:SLOWEST_ENTITIES]
+        summary["slowest_entities"] = ", ".join(
+            f"{bibentity.entity_key} ({profile.total_s:.3f} s)" for bibentity, profile in slowest
+        )
+
+        return summary
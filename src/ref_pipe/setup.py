@@ -2,9 +2,11 @@ import os
 from pathlib import Path
 import shutil
 import subprocess
+from typing import cast
 from dotenv import load_dotenv
 
-from src.ref_pipe.models import EnvVars
+from src.ref_pipe.compile_backends import CompileBackend, load_compile_backend
+from src.ref_pipe.models import DEFAULT_LOCAL_COMPILE_COMMAND, SUPPORTED_COMPILE_BACKENDS, EnvVars, TCompileBackend
 from src.sdk.utils import lginf, get_logger
 from src.sdk.ResultMonad import Err, Ok, runwrap, try_except_wrapper
 
@@ -32,6 +34,8 @@ def load_env_vars(env_file: str) -> EnvVars:
     docker_compose_file = os.getenv("DOCKER_COMPOSE_FILE")
     csl_file = os.getenv("CSL_FILE")
     bibliography_table_ods = os.getenv("BIBLIOGRAPHY_TABLE_ODS")
+    compile_backend = os.getenv("COMPILE_BACKEND") or "docker"
+    local_compile_command = os.getenv("LOCAL_COMPILE_COMMAND") or DEFAULT_LOCAL_COMPILE_COMMAND
 
     if not (
         arch
@@ -56,6 +60,11 @@ def load_env_vars(env_file: str) -> EnvVars:
             f"Invalid value '{arch}' for the 'ARCH' environment variable. It must be either 'amd64' or 'arm64'."
         )
 
+    if compile_backend not in SUPPORTED_COMPILE_BACKENDS:
+        raise ValueError(
+            f"Invalid value '{compile_backend}' for the 'COMPILE_BACKEND' environment variable. It must be one of: {', '.join(SUPPORTED_COMPILE_BACKENDS)}."
+        )
+
     if not os.path.exists(dltc_workhouse_directory):
         raise FileNotFoundError(
             f"The workhouse directory '{dltc_workhouse_directory}' does not exist. Please provide a valid directory."
@@ -101,11 +110,36 @@ def load_env_vars(env_file: str) -> EnvVars:
         DOCKER_COMPOSE_FILE=docker_compose_file,
         CSL_FILE=csl_file,
         BIBLIOGRAPHY_TABLE_ODS=bibliography_table_ods,
+        COMPILE_BACKEND=cast(TCompileBackend, compile_backend),
+        LOCAL_COMPILE_COMMAND=local_compile_command,
     )
 
 
+def docker_image_tag(v: EnvVars) -> str:
+    return f"{v.DOCKERHUB_USERNAME}/{v.DOCKER_IMAGE_NAME}:latest-{v.ARCH}"
+
+
+def docker_image_id(v: EnvVars) -> str:
+    """
+    ID (content digest) of the local Docker image. Falls back to the image tag if the image can't be inspected, as the tag is the best we have then.
+    """
+    image_tag = docker_image_tag(v)
+
+    docker_inspect_cmd = ["docker", "inspect", "--type=image", "--format", "{{.Id}}", image_tag]
+    docker_inspect_r = subprocess.run(docker_inspect_cmd, capture_output=True, text=True)
+
+    if docker_inspect_r.returncode != 0 or docker_inspect_r.stdout.strip() == "":
+        lgr.warning(f"Could not get the ID of the Docker image '{image_tag}'. Using the tag instead.")
+        return image_tag
+
+    return docker_inspect_r.stdout.strip()
+
+
 @try_except_wrapper(lgr)
 def dltc_env_up(v: EnvVars) -> None:
+    """
+    Start the container, if it isn't running yet.
+    """
     try:
         frame = f"main"
 
@@ -117,7 +151,7 @@ def dltc_env_up(v: EnvVars) -> None:
             )
 
         # 1. Load environment variables
-        DOCKER_IMAGE_TAG = f"{v.DOCKERHUB_USERNAME}/{v.DOCKER_IMAGE_NAME}:latest-{v.ARCH}"
+        DOCKER_IMAGE_TAG = docker_image_tag(v)
 
         # If container is running, return early
         docker_ps_cmd = ["docker", "ps", "--format", "{{.Names}}"]
@@ -177,6 +211,37 @@ def dltc_env_up(v: EnvVars) -> None:
         raise ValueError(f"An error occurred while running a docker command:\n\t{e.stderr}")
 
 
+def compile_toolchain_id(v: EnvVars) -> str:
+    """
+    ID of everything the compiled divs depend on apart from the bibliography and the CSL file, for the div cache and the manifests.
+    """
+    match v.COMPILE_BACKEND:
+        case "docker":
+            return docker_image_id(v)
+        case "local":
+            return f"local:{v.LOCAL_COMPILE_COMMAND}"
+        case "fake":
+            return "fake"
+
+
+@try_except_wrapper(lgr)
+def compile_backend_up(v: EnvVars, compile_server_processes: int = 0) -> CompileBackend:
+    """
+    Set up the compile backend of the environment variables, starting the container first if it's the 'docker' one.
+    If `compile_server_processes` is positive, the compilations go through a compile server with that many processes (see `compile_server`).
+    """
+    frame = f"compile_backend_up"
+
+    if v.COMPILE_BACKEND == "docker":
+        runwrap(dltc_env_up(v))
+
+    lginf(frame, f"Setting up the '{v.COMPILE_BACKEND}' compile backend...", lgr)
+
+    return load_compile_backend(
+        v.COMPILE_BACKEND, v.DOCKER_CONTAINER_NAME, v.LOCAL_COMPILE_COMMAND, compile_server_processes
+    )
+
+
 if __name__ == "__main__":
     import argparse
 
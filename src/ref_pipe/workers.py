@@ -0,0 +1,240 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import queue
+import threading
+from typing import Callable, Deque, Dict, Generator, Generic, Iterable, List, NamedTuple, Tuple, TypeVar
+
+from src.sdk.ResultMonad import Err, Ok
+from src.sdk.utils import get_logger, lginf
+
+
+lgr = get_logger("Workers")
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+# Number of work units submitted in advance per worker. Bounds the memory used by results waiting to be consumed in order.
+IN_FLIGHT_PER_WORKER = 2
+
+# How long the threads of a pipeline wait on one of its queues before checking whether the pipeline was stopped
+PIPELINE_POLL_INTERVAL_S = 0.1
+
+
+def worker_scratch_dirs(relative_output_dir: str, workers: int) -> Tuple[str, ...]:
+    """
+    Relative paths (both in the host system and in the container) of the scratch directory of each worker.
+    """
+    return tuple(f"{relative_output_dir}/worker-{k}" for k in range(1, workers + 1))
+
+
+def make_scratch_dirs(local_base_dir: str, scratch_dirs: Tuple[str, ...]) -> None:
+    for scratch_dir in scratch_dirs:
+        local_scratch_dir = f"{local_base_dir}/{scratch_dir}"
+        os.makedirs(local_scratch_dir, exist_ok=True)
+        if not os.path.exists(local_scratch_dir):
+            raise FileNotFoundError(f"The scratch directory '{local_scratch_dir}' could not be created.")
+
+    return None
+
+
+def remove_scratch_dirs(local_base_dir: str, scratch_dirs: Tuple[str, ...]) -> None:
+    """
+    Remove the scratch directories if they are empty. Non-empty ones are left alone for inspection.
+    """
+    for scratch_dir in scratch_dirs:
+        local_scratch_dir = f"{local_base_dir}/{scratch_dir}"
+        if os.path.isdir(local_scratch_dir) and not os.listdir(local_scratch_dir):
+            os.rmdir(local_scratch_dir)
+        elif os.path.exists(local_scratch_dir):
+            lgr.warning(f"The scratch directory '{local_scratch_dir}' is not empty. Leaving it in place.")
+
+    return None
+
+
+def ordered_parallel_map(
+    func: Callable[[T, str], U],
+    items: Iterable[T],
+    scratch_dirs: Tuple[str, ...],
+) -> Generator[U, None, None]:
+    """
+    Apply `func(item, scratch_dir)` to the items on one thread per scratch directory, and yield the results in the order of the input.
+
+    A scratch directory is only ever used by one call at a time. The items are consumed lazily, with a bounded number of them in flight, so that a slow item only holds back the results that come after it.
+    """
+    frame = f"ordered_parallel_map"
+
+    workers = len(scratch_dirs)
+    if workers < 1:
+        raise ValueError("At least one scratch directory is needed.")
+
+    lginf(frame, f"Processing with {workers} workers...", lgr)
+
+    free_scratch_dirs: queue.Queue[str] = queue.Queue()
+    for scratch_dir in scratch_dirs:
+        free_scratch_dirs.put(scratch_dir)
+
+    def run(item: T) -> U:
+        scratch_dir = free_scratch_dirs.get()
+        try:
+            return func(item, scratch_dir)
+        finally:
+            free_scratch_dirs.put(scratch_dir)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ref_pipe_worker")
+    pending: Deque[Future[U]] = deque()
+
+    try:
+        for item in items:
+            pending.append(executor.submit(run, item))
+
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    finally:
+        # If the consumer stops early, don't start the work units that are still waiting
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class PipelineStage(NamedTuple, Generic[T]):
+    """
+    A stage of `pipelined_map`: `func` is applied to the items by `workers` threads.
+    """
+
+    name: str
+    func: Callable[[T], T]
+    workers: int
+
+
+type TPipelineEntry[T] = Tuple[int, T, Err | None]
+
+
+def pipeline_capacity(stages: Tuple[PipelineStage[T], ...], queue_size: int) -> int:
+    """
+    Maximum number of items in a pipeline at once: one per worker, and `queue_size` per queue in front of a stage.
+    """
+    return sum(stage.workers for stage in stages) + queue_size * len(stages)
+
+
+def pipelined_map(
+    items: Iterable[T],
+    stages: Tuple[PipelineStage[T], ...],
+    queue_size: int,
+    on_error: Callable[[T], None] | None = None,
+) -> Generator[Tuple[T, Ok[T] | Err], None, None]:
+    """
+    Pass the items through the stages, each stage on its own threads, and yield them in the order of the input.
+
+    Consecutive stages are connected by queues of `queue_size` items, so that a stage works on an item while the previous one works on the next items, and a slow stage holds back the ones before it (backpressure).
+    The items are consumed lazily, and at most `pipeline_capacity` of them are in flight, including the ones done but waiting for an earlier item to be yielded.
+
+    Each item is yielded with its result: Ok with the item as returned by the last stage, or, if a stage raised on it, an Err. In the latter case, the item skips the remaining stages and is yielded as it was before the failing stage, after `on_error` was called on it (e.g., to release what the earlier stages acquired for it).
+    """
+    frame = f"pipelined_map"
+
+    if queue_size < 1 or any(stage.workers < 1 for stage in stages):
+        raise ValueError("The queue size and the number of workers of each stage must be positive integers.")
+
+    lginf(
+        frame,
+        f"Processing with the stages: {', '.join(f'{stage.name} ({stage.workers} workers)' for stage in stages)}...",
+        lgr,
+    )
+
+    queues: List[queue.Queue[TPipelineEntry[T]]] = [queue.Queue(maxsize=queue_size) for _ in stages]
+    done: queue.Queue[TPipelineEntry[T]] = queue.Queue()
+    admitted = threading.Semaphore(pipeline_capacity(stages, queue_size))
+    stopped = threading.Event()
+
+    fed: List[int] = []
+    feed_errors: List[BaseException] = []
+
+    def put(q: queue.Queue[TPipelineEntry[T]], entry: TPipelineEntry[T]) -> bool:
+        while not stopped.is_set():
+            try:
+                q.put(entry, timeout=PIPELINE_POLL_INTERVAL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue[TPipelineEntry[T]]) -> TPipelineEntry[T] | None:
+        while not stopped.is_set():
+            try:
+                return q.get(timeout=PIPELINE_POLL_INTERVAL_S)
+            except queue.Empty:
+                continue
+        return None
+
+    def feed() -> None:
+        count = 0
+        try:
+            for item in items:
+                while not admitted.acquire(timeout=PIPELINE_POLL_INTERVAL_S):
+                    if stopped.is_set():
+                        return
+                if not put(queues[0], (count, item, None)):
+                    return
+                count += 1
+        except BaseException as e:
+            feed_errors.append(e)
+        finally:
+            fed.append(count)
+
+    def work(k: int) -> None:
+        stage = stages[k]
+        next_queue = queues[k + 1] if k + 1 < len(stages) else done
+
+        while (entry := get(queues[k])) is not None:
+            index, item, err = entry
+
+            if err is None:
+                try:
+                    item = stage.func(item)
+                except Exception as e:
+                    lgr.error(f"An error occurred in the '{stage.name}' stage. Detail:\n{e}")
+                    err = Err(message=f"An error occurred in the '{stage.name}' stage. Detail: {e}", code=-1)
+                    if on_error is not None:
+                        on_error(item)
+
+            if not put(next_queue, (index, item, err)):
+                return
+
+    threads = [threading.Thread(target=feed, name="ref_pipe_pipeline_feed", daemon=True)]
+    threads.extend(
+        threading.Thread(target=work, args=(k,), name=f"ref_pipe_pipeline_{stage.name}_{w}", daemon=True)
+        for k, stage in enumerate(stages)
+        for w in range(1, stage.workers + 1)
+    )
+    for thread in threads:
+        thread.start()
+
+    pending: Dict[int, Tuple[T, Ok[T] | Err]] = {}
+    next_index = 0
+
+    try:
+        while not (fed and next_index == fed[0]):
+            if feed_errors:
+                raise feed_errors[0]
+
+            try:
+                index, item, err = done.get(timeout=PIPELINE_POLL_INTERVAL_S)
+            except queue.Empty:
+                continue
+
+            pending[index] = (item, Ok(out=item) if err is None else err)
+
+            while next_index in pending:
+                yield pending.pop(next_index)
+                admitted.release()
+                next_index += 1
+
+    finally:
+        # If the consumer stops early, the items still in the pipeline are dropped once their current stage is done
+        stopped.set()
+        for thread in threads:
+            thread.join()
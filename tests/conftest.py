@@ -3,3 +3,76 @@ import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import array
+import itertools
+import random
+
+import polars as pl
+
+from src.ref_pipe.models import BibEntity, BibEntityWithHTML, Bibliography, BibSortRanks, RefHTML
+
+
+# Shared factories for the ref_pipe tests
+
+
+def make_bibliography(lines: dict[str, str]) -> Bibliography:
+    bibkeys = tuple(lines.keys())
+    content = "".join(lines.values()).encode("utf-8")
+    line_offsets = array.array(
+        "Q", itertools.accumulate((len(line.encode("utf-8")) for line in lines.values()), initial=0)
+    )
+    return Bibliography(
+        bibkeys=frozenset(bibkeys),
+        bibkey_index_dict={bibkey: i for i, bibkey in enumerate(bibkeys)},
+        line_offsets=line_offsets,
+        content=content,
+    )
+
+
+def make_bibentity(i: int, main_bibkeys: frozenset[str], further_references: frozenset[str] = frozenset()) -> BibEntity:
+    return BibEntity(
+        id=f"{i}",
+        entity_key=f"key-{i}",
+        url_endpoint=f"endpoint-{i}",
+        main_bibkeys=main_bibkeys,
+        further_references=further_references,
+        depends_on=frozenset(),
+    )
+
+
+def with_html(bibentity: BibEntity, references_filename: str) -> BibEntityWithHTML:
+    return BibEntityWithHTML(
+        id=bibentity.id,
+        entity_key=bibentity.entity_key,
+        url_endpoint=bibentity.url_endpoint,
+        main_bibkeys=bibentity.main_bibkeys,
+        further_references=bibentity.further_references,
+        depends_on=bibentity.depends_on,
+        html=RefHTML(references_filename=references_filename, further_references_filename=""),
+    )
+
+
+def make_bib_df(n: int) -> pl.DataFrame:
+    rng = random.Random(0)
+    authors = [None, "Smith, John", "Doe, Jane and Roe, Richard", "Doe, Alice", "Roe", "zeta, Bob"]
+    return pl.DataFrame(
+        {
+            "bibkey": [f"author_{i}:2000" for i in range(n)],
+            # Unique titles, so that the orderings are total
+            "title": [f"Title {rng.random()}" for _ in range(n)],
+            "author": [rng.choice(authors) for _ in range(n)],
+            "journal": [None] * n,
+            "journal-id": [rng.choice([None, "1", "2", "3"]) for _ in range(n)],
+            "date": [rng.choice([None, "1999", "2000", "2021"]) for _ in range(n)],
+            "volume": [rng.choice([None, "1", "2"]) for _ in range(n)],
+            "number": [rng.choice([None, "1", "2"]) for _ in range(n)],
+            "pages": [rng.choice([None, "1--10", "20--30"]) for _ in range(n)],
+        },
+        schema_overrides={"journal": pl.String},
+    )
+
+
+BIBKEYS = ("smith_j:2020", "doe_j-etal:2019", "roe_r:2001")
+BIBLIOGRAPHY = make_bibliography({bibkey: f"@book{{{bibkey}, title={{T}}}}\n" for bibkey in BIBKEYS})
+SORT_RANKS = BibSortRanks(profile={}, publisher={}, default={})
@@ -0,0 +1,70 @@
+import csv
+from pathlib import Path
+
+from src.bib_deps.bib_deps_bootstrap import (
+    bootstrap_bibentries,
+    get_all_bibkeys,
+    main_bootstrap,
+    parse_bibentry,
+    process_bibentry,
+)
+from src.bib_deps.models import BaseBibEntry
+from src.sdk.ResultMonad import Ok
+
+
+def _bibentry(bibkey: str, notes: str = "", crossref: str = "", further_note: str = "") -> BaseBibEntry:
+    return BaseBibEntry(
+        bibkey=bibkey, title=f"Title of {bibkey}", notes=notes, crossref=crossref, further_note=further_note
+    )
+
+
+def test_process_bibentry_splits_good_and_bad_bibkeys() -> None:
+
+    rows = [
+        _bibentry(
+            "smith_j:2020",
+            notes="See \\citet{doe_j:2019, missing:2000} and \\citet{roe_r:2001}.",
+            crossref="roe_r:2001",
+            further_note="\\citet{other:1999}",
+        ),
+        _bibentry("doe_j:2019"),
+        _bibentry("roe_r:2001"),
+    ]
+    all_bibkeys = get_all_bibkeys(rows)
+    assert all_bibkeys == frozenset({"smith_j:2020", "doe_j:2019", "roe_r:2001"})
+
+    processed = process_bibentry(parse_bibentry(rows[0]), all_bibkeys)
+
+    assert processed.status == "success"
+    assert processed.further_references_good == "doe_j:2019,roe_r:2001"
+    assert processed.further_references_bad == "missing:2000"
+    assert processed.depends_on_good == "doe_j:2019,roe_r:2001,roe_r:2001"
+    assert processed.depends_on_bad == "missing:2000,other:1999"
+
+
+def test_bootstrap_bibentries_in_parallel_keeps_the_order(tmp_path: Path) -> None:
+
+    rows = [
+        _bibentry(f"author{i}:2000", notes=f"\\citet{{author{(i * 7) % 50}:2000, missing{i}:2000}}", crossref="")
+        for i in range(50)
+    ]
+    all_bibkeys = get_all_bibkeys(rows)
+
+    expected = list(bootstrap_bibentries(rows, all_bibkeys))
+    assert [processed.bibkey for processed in expected] == [row.bibkey for row in rows]
+    assert list(bootstrap_bibentries(rows, all_bibkeys, jobs=2, chunk_size=3)) == expected
+
+    input_file = tmp_path / "bibliography.csv"
+    with open(input_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["bibkey", "title", "note", "crossref", "further_note"])
+        writer.writeheader()
+        writer.writerows(
+            {"bibkey": row.bibkey, "title": row.title, "note": row.notes, "crossref": "", "further_note": ""}
+            for row in rows
+        )
+
+    for jobs in (1, 2):
+        output_file = tmp_path / f"output-{jobs}.csv"
+        assert isinstance(main_bootstrap(f"{input_file}", "utf-8", f"{output_file}", jobs, 7), Ok)
+        with open(output_file, "r", encoding="utf-8") as f:
+            assert list(csv.DictReader(f)) == [processed.dict_dump() for processed in expected]
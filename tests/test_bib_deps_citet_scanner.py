@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from src.bib_deps.bib_deps_bootstrap import texsoup_cite_bibkeys
+from src.bib_deps.citet_scanner import CITE_COMMANDS, scan_cite_bibkeys
+
+CASES = [
+    ("See \\citet{a, b} and \\citet{c}.", ["a", "b", "c"]),
+    ("\\citet[see][p. 3]{a}", ["a"]),
+    ("\\citet[see also \\citealt{x}]{y}", ["x", "y"]),
+    ("\\citet {a}{b}\n{c}\n\n{d}", ["a", "b", "c"]),
+    ("\\citet{a} text {b}", ["a"]),
+    ("\\citet{a{b}c} \\citet{a\\}b}", ["a{b}c", "a\\}b"]),
+    ("\\citet{} \\citet{a,,b}", ["", "a", "", "b"]),
+    ("\\citep{a} \\citealt{b} \\citeauthor{c} \\citeyear{d}", ["a", "b", "c", "d"]),
+    ("\\citet*{a} \\citetalias{b} \\\\citet{c}", []),
+    ("100% sure \\citet{a}\n\\citet{b}", ["b"]),
+    ("\\emph{\\citet{a}} $\\citet{b}$", ["a", "b"]),
+    ("\\( \\citet{a}", ["a"]),
+    ("No citation at all", []),
+]
+
+
+@pytest.mark.parametrize("text, expected", CASES)
+def test_scan_cite_bibkeys(text: str, expected: list[str]) -> None:
+    assert scan_cite_bibkeys(text) == expected
+
+
+@pytest.mark.parametrize("text", ["\\citet{a", "\\citet{a % comment\n}", "\\citet[a[b]c]{d}", "\\verb|\\citet{a}|"])
+def test_ambiguous_latex_is_left_to_texsoup(text: str) -> None:
+    assert scan_cite_bibkeys(text) is None
+
+
+FRAGMENTS = (
+    "Reprinted in ",
+    "See ",
+    "the second edition of ",
+    ", pp. 12--34. ",
+    "\\citet{smith_j:2020}",
+    "\\citep[p.~3]{doe_j:2019, roe_r:2001}",
+    "\\citet[see][12]{roe_r:2001a}",
+    "\\citealt{doe_j-roe_r:2019}",
+    "\\citeauthor{smith_j:2020} ",
+    "\\citeyear{roe_r:forthcoming}",
+    "\\citet {a:1999}\n{b:2000}",
+    "\\citet*{smith_j:2020}",
+    "\\emph{Title \\citet{e:2001}}",
+    "\\textit{Title}",
+    "$x^2$ ",
+    "\\%",
+    "% a comment\n",
+    "\n",
+    "\n\n",
+    "\\'e",
+    "\\\\",
+    "~",
+    "{",
+    "}",
+    "[",
+    "]",
+)
+WEIGHTS = (4, 4, 2, 2, 4, 3, 2, 2, 1, 1, 1, 1, 1, 2, 1, 1, 1, 2, 1, 1, 1, 1, 0.2, 0.2, 0.2, 0.2)
+
+
+def _corpus(n: int) -> list[str]:
+    rng = random.Random(0)
+    return ["".join(rng.choices(FRAGMENTS, WEIGHTS, k=rng.randint(1, 15))) for _ in range(n)]
+
+
+@pytest.mark.parametrize("commands", [CITE_COMMANDS, frozenset({"citet"})])
+def test_scanner_agrees_with_texsoup_on_a_corpus(commands: frozenset[str]) -> None:
+
+    compared = ambiguous = 0
+    for text in _corpus(500):
+        try:
+            expected = texsoup_cite_bibkeys(text, commands)
+        except Exception:
+            # TexSoup can't read it (e.g., unbalanced braces), while the scanner may
+            continue
+
+        bibkeys = scan_cite_bibkeys(text, commands)
+        if bibkeys is None:
+            ambiguous += 1
+            continue
+
+        compared += 1
+        # TexSoup gives the citations nested in groups last, the scanner gives them in the order of the text
+        assert sorted(bibkeys) == sorted(expected), text
+
+    assert compared > 250
+    assert ambiguous < compared / 20
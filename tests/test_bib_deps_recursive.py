@@ -1,4 +1,11 @@
-from rust_crate import RustedBibEntry, compute_transitive_closures, TransitivelyClosedBibEntry
+import random
+
+from rust_crate import (
+    RustedBibEntry,
+    compute_transitive_closures,
+    compute_transitive_closures_scc,
+    TransitivelyClosedBibEntry,
+)
 
 from src.sdk.ResultMonad import Ok
 
@@ -150,3 +157,71 @@ def test_bib_deps_recursion_for_transitive_cycles_is_not_infinite() -> None:
     )
     assert bibkey_to_entry["2"].depends_on == "3"
     assert bibkey_to_entry["2"].depends_on_closed == "1,3" or bibkey_to_entry["2"].depends_on_closed == "3,1"
+
+
+def test_scc_transitive_closures_match_the_bfs_ones() -> None:
+
+    rng = random.Random(0)
+    bibkeys = [f"{i}" for i in range(300)]
+
+    def references() -> list[str]:
+        # A few bibkeys not in the bibliography, and the empty bibkey of an empty list of references
+        return [rng.choice(bibkeys + ["missing", ""]) for _ in range(rng.choice((0, 1, 1, 2, 3)))]
+
+    rusted_bibentries = [
+        RustedBibEntry(
+            bibkey=bibkey,
+            title=f"Title {bibkey}",
+            notes="",
+            crossref="",
+            further_note="",
+            further_references=references(),
+            depends_on=references(),
+        )
+        for bibkey in bibkeys[:250]
+    ]
+
+    def closed_bibkeys(closed: str) -> list[str]:
+        return sorted(closed.split(",")) if closed else []
+
+    for entry, expected in zip(
+        compute_transitive_closures_scc(rusted_bibentries), compute_transitive_closures(rusted_bibentries)
+    ):
+        assert entry.to_dict() | {"further_references_closed": "", "depends_on_closed": ""} == expected.to_dict() | {
+            "further_references_closed": "",
+            "depends_on_closed": "",
+        }
+        assert closed_bibkeys(entry.further_references_closed) == closed_bibkeys(expected.further_references_closed)
+        assert closed_bibkeys(entry.depends_on_closed) == closed_bibkeys(expected.depends_on_closed)
+
+
+def test_transitive_closures_on_threads_report_their_progress() -> None:
+
+    rusted_bibentries = [
+        RustedBibEntry(
+            bibkey=f"{i}",
+            title=f"Title {i}",
+            notes="",
+            crossref="",
+            further_note="",
+            further_references=[f"{i // 2}"],
+            depends_on=[f"{i // 3}"],
+        )
+        for i in range(2000)
+    ]
+
+    for compute in (compute_transitive_closures, compute_transitive_closures_scc):
+        reported: list[tuple[int, int]] = []
+        expected = compute(rusted_bibentries, threads=1)
+
+        entries = compute(rusted_bibentries, threads=4, progress=lambda done, total: reported.append((done, total)))
+
+        # The closures of the 'bfs' engine come in no particular order
+        def normalized(entry: TransitivelyClosedBibEntry) -> dict[str, str]:
+            closed = entry.to_dict()
+            for field in ("further_references_closed", "depends_on_closed"):
+                closed[field] = ",".join(sorted(closed[field].split(",")))
+            return closed
+
+        assert [normalized(entry) for entry in entries] == [normalized(entry) for entry in expected]
+        assert reported[-1] == (2000, 2000)
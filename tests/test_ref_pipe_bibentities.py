@@ -0,0 +1,86 @@
+import array
+from pathlib import Path
+
+from src.ref_pipe.filesystem_io import load_bibentities
+from src.ref_pipe.models import BibEntity, Bibliography
+from src.sdk.ResultMonad import Err, Ok
+
+
+BIBKEYS = ("smith_j:2020", "doe_j-roe_r:2019a", "roe_r:forthcoming", "roe_r:2001")
+BIBLIOGRAPHY = Bibliography(
+    bibkeys=frozenset(BIBKEYS),
+    bibkey_index_dict={bibkey: i for i, bibkey in enumerate(BIBKEYS)},
+    line_offsets=array.array("Q", [0]),
+    content=b"",
+)
+
+HEADER = "id,slug,urlname,ref_bib_keys,_further_refs,_depends_on\n"
+
+
+def test_load_bibentities(tmp_path: Path) -> None:
+
+    input_file = tmp_path / "pages.csv"
+    input_file.write_text(
+        HEADER
+        + '1,page-1,page-1-url,"smith_j:2020,  doe_j-roe_r:2019a ","doe_j-roe_r:2019a, roe_r:forthcoming","roe_r:2001, smith_j:2020, roe_r:forthcoming"\n'
+        + "2,page-2,page-2-url,[TOO LONG],,\n"
+        + "3,pagé-3,page-3-url,roe_r:2001,,\n",
+        encoding="latin-1",
+    )
+
+    bibentities_result = load_bibentities(f"{input_file}", "latin-1", "page", BIBLIOGRAPHY)
+    assert isinstance(bibentities_result, Ok)
+
+    assert bibentities_result.out == (
+        BibEntity(
+            id="1",
+            entity_key="page-1",
+            url_endpoint="page-1-url",
+            main_bibkeys=frozenset({"smith_j:2020", "doe_j-roe_r:2019a"}),
+            further_references=frozenset({"roe_r:forthcoming"}),
+            depends_on=frozenset({"roe_r:2001"}),
+        ),
+        BibEntity(
+            id="2",
+            entity_key="page-2",
+            url_endpoint="page-2-url",
+            main_bibkeys=frozenset(),
+            further_references=frozenset(),
+            depends_on=frozenset(),
+        ),
+        BibEntity(
+            id="3",
+            entity_key="pagé-3",
+            url_endpoint="page-3-url",
+            main_bibkeys=frozenset({"roe_r:2001"}),
+            further_references=frozenset(),
+            depends_on=frozenset(),
+        ),
+    )
+
+
+def test_load_bibentities_reports_all_missing_bibkeys(tmp_path: Path) -> None:
+
+    input_file = tmp_path / "pages.csv"
+    input_file.write_text(
+        HEADER
+        + '1,page-1,page-1-url,"smith_j:2020, missing:2000",,other:2001\n'
+        + "2,page-2,page-2-url,smith_j:2020,,\n"
+        + "3,page-3,page-3-url,,missing:2000,\n"
+    )
+
+    bibentities_result = load_bibentities(f"{input_file}", "utf-8", "page", BIBLIOGRAPHY)
+    assert isinstance(bibentities_result, Err)
+    assert "Missing bibkeys in the bibliography for 2 bibentities" in bibentities_result.message
+    assert "'page-1': missing:2000, other:2001" in bibentities_result.message
+    assert "'page-3': missing:2000" in bibentities_result.message
+
+
+def test_load_bibentities_requires_the_columns_of_the_entity_type(tmp_path: Path) -> None:
+
+    input_file = tmp_path / "pages.csv"
+    input_file.write_text("id,slug\n1,page-1\n")
+
+    bibentities_result = load_bibentities(f"{input_file}", "utf-8", "page", BIBLIOGRAPHY)
+    assert isinstance(bibentities_result, Err)
+    assert "at least the following columns" in bibentities_result.message
@@ -0,0 +1,121 @@
+import pytest
+
+from src.ref_pipe import bibkey_utils
+from src.ref_pipe.bibkey_utils import (
+    Bibkey,
+    BibkeyError,
+    classify_bibkeys,
+    index_validate_bibliography,
+    parse_bibkey,
+    validate_bibkeys,
+)
+
+
+BIBKEYS = (
+    "smith_j:2020",
+    "doe_j-roe_r:2019a",
+    "roe_r:forthcoming",
+    "roe_r:2021forthcoming",
+    "roe_r:unpub",
+    "roe_r:",
+    "roe_r:2020ab",
+    "roe_r:draft",
+    "smith:j:2020",
+    "a-b-c:2020",
+    "no_colon",
+    "",
+)
+
+
+def test_parse_bibkey() -> None:
+
+    position_d = {bibkey: i for i, bibkey in enumerate(BIBKEYS)}
+
+    assert parse_bibkey("doe_j-roe_r:2019a", position_d) == Bibkey("doe_j", "roe_r", 2019, "a")
+    assert parse_bibkey("roe_r:forthcoming", position_d) == Bibkey("roe_r", None, "forthcoming", "")
+    assert parse_bibkey("roe_r:", position_d) == Bibkey("roe_r", None, "", "")
+    assert parse_bibkey("smith:j:2020", position_d) == BibkeyError(
+        "smith:j:2020", 9, "Unexpected number of bibkey parts for 'smith:j:2020': '['smith', 'j', '2020']'"
+    )
+    assert parse_bibkey("a-b-c:2020", position_d) == BibkeyError(
+        "a-b-c:2020", 10, "Unexpected bibkey author parts for 'a-b-c:2020': '['a', 'b', 'c']'"
+    )
+
+
+def test_classify_bibkeys_agrees_with_parse_bibkey() -> None:
+
+    problems = classify_bibkeys(BIBKEYS, range(1, len(BIBKEYS) + 1))
+
+    position_d = {bibkey: i for i, bibkey in enumerate(BIBKEYS)}
+    expected_errors = [
+        (result.position, result.text, result.error)
+        for result in (parse_bibkey(bibkey, position_d) for bibkey in BIBKEYS)
+        if isinstance(result, BibkeyError)
+    ]
+    errors = problems.filter(severity="error").select("line", "bibkey", "message").rows()
+    assert errors == expected_errors
+
+    warnings = problems.filter(severity="warning")
+    assert warnings["bibkey"].to_list() == ["roe_r:2020ab", "roe_r:draft"]
+    assert warnings["message"].to_list() == [
+        "Unexpected year suffix for 'roe_r:2020ab': 'ab'",
+        "Unexpected year suffix for 'roe_r:draft': 'draft'",
+    ]
+
+
+def test_validate_bibkeys() -> None:
+
+    validate_bibkeys(BIBKEYS[:8], {bibkey: i for i, bibkey in enumerate(BIBKEYS)})
+
+    with pytest.raises(ValueError, match="Found 4 errors while parsing bibkeys"):
+        validate_bibkeys(BIBKEYS, {bibkey: i for i, bibkey in enumerate(BIBKEYS)})
+
+
+@pytest.mark.parametrize("chunk_size", [16 * 1024 * 1024, 40])
+def test_index_validate_bibliography(monkeypatch: pytest.MonkeyPatch, chunk_size: int) -> None:
+
+    monkeypatch.setattr(bibkey_utils, "INDEX_CHUNK_SIZE", chunk_size)
+    lines = (
+        b"@book{smith_j:2020, title={A}}\n",
+        b"@article{ doe_j-roe_r:2019a ,title={\xc3\x9cn\xc3\xafcode}}\n",
+        b"@book{roe_r:2001, title={Not UTF-8 \xff}}\n",
+        b"@book{roe_r:forthcoming, title={D}}",
+    )
+    content = b"".join(lines)
+
+    bibkeys, bibkey_linenum_d, line_offsets = index_validate_bibliography(content)
+
+    assert bibkeys == frozenset({"smith_j:2020", "doe_j-roe_r:2019a", "roe_r:2001", "roe_r:forthcoming"})
+    assert bibkey_linenum_d == {"smith_j:2020": 0, "doe_j-roe_r:2019a": 1, "roe_r:2001": 2, "roe_r:forthcoming": 3}
+    assert [content[line_offsets[i] : line_offsets[i + 1]] for i in range(len(lines))] == list(lines)
+    assert line_offsets[-1] == len(content)
+
+
+def test_index_validate_bibliography_reports_all_errors() -> None:
+
+    content = (
+        b"@book{smith_j:2020, title={A}}\n"
+        b"no bibkey\n"
+        b"@book{smith_j:2020, title={B}}\n"
+        b"@book{smith:j:2020, title={C}}\n"
+        b"@book{smith_j:2020, title={D}}\n"
+    )
+
+    with pytest.raises(ValueError) as e:
+        index_validate_bibliography(content)
+
+    message = str(e.value)
+    assert "Found 2 duplicated bibkeys" in message
+    assert "'smith_j:2020' at line 3 --- 'duplicated, first found at line 1'" in message
+    assert "'smith_j:2020' at line 5 --- 'duplicated, first found at line 1'" in message
+    assert "lines without a bibkey, at lines: 2." in message
+    assert "Found 1 errors while parsing bibkeys" in message
+    assert "'smith:j:2020' at line 4" in message
+
+
+def test_index_validate_empty_bibliography() -> None:
+
+    bibkeys, bibkey_linenum_d, line_offsets = index_validate_bibliography(b"")
+
+    assert bibkeys == frozenset() and bibkey_linenum_d == {}
+    assert line_offsets.tolist() == [0]
@@ -0,0 +1,48 @@
+from pathlib import Path
+
+from src.ref_pipe.filesystem_io import load_bibliography
+from src.ref_pipe.prep_divs import write_small_bib
+from src.sdk.ResultMonad import Err, Ok
+
+
+BIB_LINES = (
+    "@book{smith_j:2020, title={A}}\n",
+    "@article{doe_j-roe_r:2019a, title={Ünïcode}}\n",
+    "@book{roe_r:forthcoming, title={C}}",
+)
+
+
+def test_load_bibliography_indexes_lines(tmp_path: Path) -> None:
+
+    bib_file = tmp_path / "bibliography.bib"
+    bib_file.write_text("".join(BIB_LINES), encoding="utf-8")
+
+    bibliography_result = load_bibliography(str(bib_file))
+    assert isinstance(bibliography_result, Ok)
+    bibliography = bibliography_result.out
+
+    assert bibliography.bibkeys == frozenset({"smith_j:2020", "doe_j-roe_r:2019a", "roe_r:forthcoming"})
+    assert bibliography.bibkey_index_dict["roe_r:forthcoming"] == 2
+    assert bibliography.line_bytes("doe_j-roe_r:2019a") == BIB_LINES[1].encode("utf-8")
+    assert bibliography.line_bytes("roe_r:forthcoming") == BIB_LINES[2].encode("utf-8")
+
+    small_bib_file = tmp_path / "small.bib"
+    write_small_bib(frozenset({"roe_r:forthcoming", "smith_j:2020"}), bibliography, str(small_bib_file), "test")
+    assert small_bib_file.read_text(encoding="utf-8") == BIB_LINES[0] + BIB_LINES[2]
+
+    bibliography.close()
+
+
+def test_load_bibliography_reports_all_errors(tmp_path: Path) -> None:
+
+    bib_file = tmp_path / "bibliography.bib"
+    bib_file.write_text(
+        "".join(BIB_LINES) + "\n@book{smith_j:2020, title={D}}\nno bibkey\n@book{smith:j:2020, title={E}}\n"
+    )
+
+    bibliography_result = load_bibliography(str(bib_file))
+    assert isinstance(bibliography_result, Err)
+    assert "1 duplicated bibkeys" in bibliography_result.message
+    assert "'smith_j:2020' at line 4" in bibliography_result.message
+    assert "lines without a bibkey, at lines: 5" in bibliography_result.message
+    assert "'smith:j:2020' at line 6" in bibliography_result.message
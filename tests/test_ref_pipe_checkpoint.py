@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+from src.ref_pipe.checkpoint import checkpointed, find_completed_bibentities, load_checkpoint
+from src.ref_pipe.incremental import Manifest
+from src.ref_pipe.models import BibEntity, THTMLReport
+from src.sdk.ResultMonad import Err, Ok
+from tests.conftest import make_bibentity, with_html
+
+
+MANIFEST = Manifest(csl_hash="csl", image_id="image", bibkey_hashes={"a:2000": "1", "b:2001": "2", "c:2002": "3"})
+
+
+def test_interrupted_run_is_resumed_from_the_checkpoint(tmp_path: Path) -> None:
+
+    bibentities = tuple(
+        make_bibentity(i, frozenset({bibkey})) for i, bibkey in enumerate(("a:2000", "b:2001", "c:2002"))
+    )
+    checkpoint_file = f"{tmp_path / 'report-checkpoint.jsonl'}"
+
+    def interrupted_run() -> THTMLReport:
+        (tmp_path / "0.html").write_text("<div>key-0</div>")
+        yield (bibentities[0], Ok(out=with_html(bibentities[0], f"{tmp_path / '0.html'}")))
+        yield (bibentities[1], Err(message="Compilation failed.", code=-1))
+        raise KeyboardInterrupt
+
+    try:
+        for _ in checkpointed(interrupted_run(), checkpoint_file, "article", MANIFEST, append=False):
+            pass
+    except KeyboardInterrupt:
+        pass
+
+    # A crash while writing a record leaves a truncated line behind
+    with open(checkpoint_file, "a") as f:
+        f.write('{"id": "2", "entity_ke')
+
+    records = load_checkpoint(checkpoint_file)
+    assert {key: record.status for key, record in records.items()} == {
+        ("0", "key-0", "endpoint-0"): "success",
+        ("1", "key-1", "endpoint-1"): "error",
+    }
+
+    completed = find_completed_bibentities(bibentities, records, "article", MANIFEST)
+    assert tuple(completed.keys()) == (0,)
+    assert completed[0].out.html.references_filename == f"{tmp_path / '0.html'}"
+
+    # Changes to the inputs or to the output files are not resumed
+    other_manifest = MANIFEST._replace(bibkey_hashes=MANIFEST.bibkey_hashes | {"a:2000": "changed"})
+    assert find_completed_bibentities(bibentities, records, "article", other_manifest) == {}
+
+    (tmp_path / "0.html").write_text("<div>edited</div>")
+    assert find_completed_bibentities(bibentities, records, "article", MANIFEST) == {}
+
+
+def test_resuming_after_a_truncated_last_line(tmp_path: Path) -> None:
+
+    bibentities = tuple(
+        make_bibentity(i, frozenset({bibkey})) for i, bibkey in enumerate(("a:2000", "b:2001", "c:2002"))
+    )
+    checkpoint_file = f"{tmp_path / 'report-checkpoint.jsonl'}"
+
+    def run(bibentity: BibEntity) -> THTMLReport:
+        yield (bibentity, Err(message="Compilation failed.", code=-1))
+
+    for _ in checkpointed(run(bibentities[0]), checkpoint_file, "article", MANIFEST, append=False):
+        pass
+
+    with open(checkpoint_file, "a") as f:
+        f.write('{"id": "1", "entity_ke')
+
+    for _ in checkpointed(run(bibentities[2]), checkpoint_file, "article", MANIFEST, append=True):
+        pass
+
+    # The record appended when resuming is on a line of its own
+    lines = Path(checkpoint_file).read_text().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["0", "2"]
+    assert set(load_checkpoint(checkpoint_file).keys()) == {("0", "key-0", "endpoint-0"), ("2", "key-2", "endpoint-2")}
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from src.ref_pipe.compile_backends import FakeBackend, LocalCommandBackend, fake_reference_div
+from src.ref_pipe.prep_divs import gen_bib_html_divs, gen_bib_html_divs_batch
+from src.sdk.ResultMonad import Err, Ok
+from tests.conftest import BIBKEYS, BIBLIOGRAPHY, make_bibentity
+
+
+def test_fake_backend_divs_go_through_the_pipeline(tmp_path: Path) -> None:
+
+    bibentities = (
+        make_bibentity(0, frozenset(BIBKEYS[:2])),
+        make_bibentity(1, frozenset(BIBKEYS[1:])),
+        make_bibentity(2, frozenset({"missing:2000"})),
+    )
+
+    results = gen_bib_html_divs_batch(bibentities, BIBLIOGRAPHY, f"{tmp_path}", "/container", ".", FakeBackend())
+
+    match results:
+        case (Ok(out=divs_0), Ok(out=divs_1), Err()):
+            assert divs_0 == {bibkey: fake_reference_div("c1", bibkey) for bibkey in BIBKEYS[:2]}
+            assert divs_1 == {bibkey: fake_reference_div("c1", bibkey) for bibkey in BIBKEYS[1:]}
+        case _:
+            assert False, results
+
+    # The divs don't depend on the batch
+    single_result = gen_bib_html_divs(bibentities[1], BIBLIOGRAPHY, f"{tmp_path}", "/container", ".", FakeBackend())
+    assert single_result == results[1]
+
+    # The compilation files are cleaned up
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_local_backend_runs_command_in_local_workdir(tmp_path: Path) -> None:
+
+    result = LocalCommandBackend('echo "$REF_PIPE_MARKDOWN in $PWD" && touch master.html').compile(
+        f"{tmp_path}", "/container"
+    )
+
+    assert result.returncode == 0
+    assert result.output == f"master.md in {tmp_path}\n"
+    assert result.html_files == (f"{tmp_path / 'master.html'}",)
+
+    failed_result = LocalCommandBackend("echo 'pandoc error' >&2; exit 3").compile(f"{tmp_path}", "/container")
+    assert (failed_result.returncode, failed_result.output) == (3, "pandoc error\n")
@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from src.ref_pipe.compile_backends import CompileServerBackend
+from src.ref_pipe.compile_server import CompileServer, local_compile_server_cmd
+from src.ref_pipe.prep_divs import run_dltc_make
+
+
+# Stand-in for dltc-make: "compiles" the markdown file into an HTML file next to it
+COMPILE_COMMAND = 'cp "$REF_PIPE_MARKDOWN" "${REF_PIPE_MARKDOWN%.md}.html" && echo "compiled $REF_PIPE_MARKDOWN"'
+
+
+def test_compile_server_runs_jobs(tmp_path: Path) -> None:
+
+    (tmp_path / "master.md").write_text("# Références\n")
+
+    compile_server = CompileServer(local_compile_server_cmd(COMPILE_COMMAND))
+    try:
+        result = compile_server.compile(f"{tmp_path}", "master.md")
+
+        assert result.returncode == 0
+        assert result.output == "compiled master.md"
+        assert result.html_files == (f"{tmp_path / 'master.html'}",)
+        assert (tmp_path / "master.html").read_text() == "# Références\n"
+
+        # Failures are reported, and the server keeps accepting jobs
+        failed_result = compile_server.compile(f"{tmp_path}", "missing.md")
+        assert failed_result.returncode != 0
+        assert "missing.md" in failed_result.output
+
+        assert compile_server.compile(f"{tmp_path}", "master.md").returncode == 0
+
+    finally:
+        compile_server.close()
+
+
+def test_compile_server_replaces_a_dead_process(tmp_path: Path) -> None:
+
+    (tmp_path / "master.md").write_text("")
+
+    compile_server = CompileServer(local_compile_server_cmd(COMPILE_COMMAND))
+    try:
+        assert compile_server.compile(f"{tmp_path}", "master.md").returncode == 0
+
+        # Killed between two jobs, e.g., with its container
+        process = compile_server._processes[0].process
+        process.kill()
+        process.wait()
+
+        with pytest.raises(RuntimeError, match="exited unexpectedly"):
+            compile_server.compile(f"{tmp_path}", "master.md")
+
+        assert compile_server.compile(f"{tmp_path}", "master.md").returncode == 0
+
+    finally:
+        compile_server.close()
+
+
+def test_compile_server_shared_between_threads(tmp_path: Path) -> None:
+
+    workdirs = []
+    for k in range(8):
+        workdir = tmp_path / f"worker-{k}"
+        workdir.mkdir()
+        (workdir / "master.md").write_text(f"{k}\n" * 10_000)
+        workdirs.append(f"{workdir}")
+
+    compile_server = CompileServer(local_compile_server_cmd(COMPILE_COMMAND + " && cat master.html"), processes=3)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = tuple(executor.map(lambda workdir: compile_server.compile(workdir, "master.md"), workdirs * 3))
+
+    finally:
+        compile_server.close()
+
+    for k, result in enumerate(results):
+        assert result.returncode == 0
+        assert result.output == f"compiled master.md\n" + "\n".join([f"{k % 8}"] * 10_000)
+
+
+def test_run_dltc_make_through_compile_server(tmp_path: Path) -> None:
+
+    (tmp_path / "master.md").write_text("")
+
+    compile_server = CompileServer(local_compile_server_cmd(COMPILE_COMMAND))
+    failing_compile_server = CompileServer(local_compile_server_cmd("echo 'pandoc error' >&2; exit 2"))
+    try:
+        run_dltc_make(f"{tmp_path}", "/unused/container/dir", CompileServerBackend(compile_server, "local"))
+        assert (tmp_path / "master.html").exists()
+
+        with pytest.raises(RuntimeError, match="pandoc error"):
+            run_dltc_make(f"{tmp_path}", "/unused/container/dir", CompileServerBackend(failing_compile_server, "local"))
+
+    finally:
+        compile_server.close()
+        failing_compile_server.close()
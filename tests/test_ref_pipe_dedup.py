@@ -0,0 +1,76 @@
+from dataclasses import replace
+from pathlib import Path
+
+from src.ref_pipe.dedup import copy_html_files, expand_duplicates, find_duplicate_bibentities
+from src.ref_pipe.models import THTMLReport
+from src.sdk.ResultMonad import Err, Ok
+from tests.conftest import make_bibentity, with_html
+
+
+def test_duplicates_are_found_by_reference_set() -> None:
+
+    bibentities = (
+        make_bibentity(0, frozenset({"a:2000", "b:2001"})),
+        make_bibentity(1, frozenset({"b:2001", "a:2000"})),
+        make_bibentity(2, frozenset({"a:2000"}), frozenset({"b:2001"})),
+        make_bibentity(3, frozenset({"a:2000", "b:2001"})),
+        make_bibentity(4, frozenset({"a:2000"}), frozenset({"b:2001"})),
+    )
+
+    assert find_duplicate_bibentities(bibentities, "page") == {1: 0, 3: 0, 4: 2}
+
+    # The HTML files of journals depend on their own rows of the bibliography table
+    assert find_duplicate_bibentities(bibentities, "journal") == {}
+
+
+def test_duplicates_get_copies_of_the_html_files_in_input_order(tmp_path: Path) -> None:
+
+    bibentities = (
+        make_bibentity(0, frozenset({"a:2000"})),
+        make_bibentity(1, frozenset({"b:2001"})),
+        make_bibentity(2, frozenset({"a:2000"})),
+        make_bibentity(3, frozenset({"b:2001"})),
+    )
+    duplicates = find_duplicate_bibentities(bibentities, "page")
+
+    def representatives_results() -> THTMLReport:
+        (tmp_path / "endpoint-0-references.html").write_text("<div>a:2000</div>")
+        yield (bibentities[0], Ok(out=with_html(bibentities[0], f"{tmp_path / 'endpoint-0-references.html'}")))
+        yield (bibentities[1], Err(message="Compilation failed.", code=-1))
+
+    results = tuple(expand_duplicates(bibentities, duplicates, representatives_results()))
+
+    assert [bibentity for bibentity, _ in results] == list(bibentities)
+
+    match results[2][1]:
+        case Ok(out=copied):
+            assert copied.entity_key == "key-2"
+            assert copied.html.references_filename == f"{tmp_path / 'endpoint-2-references.html'}"
+            assert (tmp_path / "endpoint-2-references.html").read_text() == "<div>a:2000</div>"
+        case _:
+            assert False, results[2]
+
+    match results[3][1]:
+        case Err(message=message):
+            assert "key-1" in message and "Compilation failed." in message
+        case _:
+            assert False, results[3]
+
+
+def test_duplicates_with_nested_url_endpoints(tmp_path: Path) -> None:
+
+    representative = replace(make_bibentity(0, frozenset({"a:2000"})), url_endpoint="journals/a")
+    duplicate = replace(make_bibentity(1, frozenset({"a:2000"})), url_endpoint="pages/b/c")
+    html_file = tmp_path / "journals" / "a-references.html"
+    html_file.parent.mkdir()
+    html_file.write_text("<div>a:2000</div>")
+
+    result = copy_html_files(duplicate, with_html(representative, f"{html_file}"))
+
+    match result:
+        case Ok(out=copied):
+            assert copied.html.references_filename == f"{tmp_path / 'pages' / 'b' / 'c-references.html'}"
+            assert (tmp_path / "pages" / "b" / "c-references.html").read_text() == "<div>a:2000</div>"
+            assert [change.status for change in copied.html_changes] == ["created"]
+        case _:
+            assert False, result
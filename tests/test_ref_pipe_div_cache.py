@@ -0,0 +1,91 @@
+from pathlib import Path
+
+from src.ref_pipe.div_cache import DivCache, crossref_parents
+from tests.conftest import make_bibliography
+
+
+def test_div_cache_hits_and_misses(tmp_path: Path) -> None:
+
+    bibliography = make_bibliography(
+        {"smith_j:2020": "@book{smith_j:2020, title={A}}\n", "doe_j:2019": "@book{doe_j:2019}\n"}
+    )
+    cache = DivCache(str(tmp_path / "cache.sqlite"), "namespace", 1024 * 1024)
+
+    assert cache.get_many(frozenset({"smith_j:2020", "doe_j:2019"}), bibliography) == {}
+
+    cache.put_many({"smith_j:2020": "<div>smith</div>"}, bibliography)
+    hits = cache.get_many(frozenset({"smith_j:2020", "doe_j:2019"}), bibliography)
+
+    assert hits == {"smith_j:2020": "<div>smith</div>"}
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.stored) == (1, 3, 1)
+
+    cache.close()
+
+
+def test_div_cache_key_depends_on_bib_line_and_namespace(tmp_path: Path) -> None:
+
+    cache_file = str(tmp_path / "cache.sqlite")
+    old_bibliography = make_bibliography({"smith_j:2020": "@book{smith_j:2020, title={A}}\n"})
+    new_bibliography = make_bibliography({"smith_j:2020": "@book{smith_j:2020, title={B}}\n"})
+
+    cache = DivCache(cache_file, "namespace", 1024 * 1024)
+    cache.put_many({"smith_j:2020": "<div>A</div>"}, old_bibliography)
+
+    assert cache.get_many(frozenset({"smith_j:2020"}), new_bibliography) == {}
+    cache.close()
+
+    other_csl_cache = DivCache(cache_file, "other-namespace", 1024 * 1024)
+    assert other_csl_cache.get_many(frozenset({"smith_j:2020"}), old_bibliography) == {}
+    other_csl_cache.close()
+
+
+def test_div_cache_key_depends_on_crossref_parents(tmp_path: Path) -> None:
+
+    child = "@incollection{doe_j:2019, crossref = {roe_r:2001}}\n"
+    old_bibliography = make_bibliography({"doe_j:2019": child, "roe_r:2001": "@book{roe_r:2001, title={A}}\n"})
+    new_bibliography = make_bibliography({"doe_j:2019": child, "roe_r:2001": "@book{roe_r:2001, title={B}}\n"})
+
+    assert crossref_parents("doe_j:2019", old_bibliography) == ("roe_r:2001",)
+    assert crossref_parents("roe_r:2001", old_bibliography) == ()
+
+    cache = DivCache(str(tmp_path / "cache.sqlite"), "namespace", 1024 * 1024)
+    cache.put_many({"doe_j:2019": "<div>A</div>"}, old_bibliography)
+
+    assert cache.get_many(frozenset({"doe_j:2019"}), old_bibliography) == {"doe_j:2019": "<div>A</div>"}
+    assert cache.get_many(frozenset({"doe_j:2019"}), new_bibliography) == {}
+    cache.close()
+
+
+def test_div_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+
+    bibliography = make_bibliography({f"author_{i}:2000": f"@book{{author_{i}:2000}}\n" for i in range(3)})
+    cache = DivCache(str(tmp_path / "cache.sqlite"), "namespace", 250)
+
+    cache.put_many({"author_0:2000": "0" * 100}, bibliography)
+    cache.put_many({"author_1:2000": "1" * 100}, bibliography)
+    # Touch the first one, so that the second one becomes the least recently used
+    cache.get_many(frozenset({"author_0:2000"}), bibliography)
+    cache.put_many({"author_2:2000": "2" * 100}, bibliography)
+
+    hits = cache.get_many(frozenset({"author_0:2000", "author_1:2000", "author_2:2000"}), bibliography)
+
+    assert set(hits.keys()) == {"author_0:2000", "author_2:2000"}
+    assert cache.stats.evicted == 1
+
+    cache.close()
+
+
+def test_div_cache_rebuild_mode_only_writes(tmp_path: Path) -> None:
+
+    cache_file = str(tmp_path / "cache.sqlite")
+    bibliography = make_bibliography({"smith_j:2020": "@book{smith_j:2020}\n"})
+
+    rebuild_cache = DivCache(cache_file, "namespace", 1024 * 1024, mode="rebuild")
+    rebuild_cache.put_many({"smith_j:2020": "<div>smith</div>"}, bibliography)
+
+    assert rebuild_cache.get_many(frozenset({"smith_j:2020"}), bibliography) == {}
+    rebuild_cache.close()
+
+    cache = DivCache(cache_file, "namespace", 1024 * 1024)
+    assert cache.get_many(frozenset({"smith_j:2020"}), bibliography) == {"smith_j:2020": "<div>smith</div>"}
+    cache.close()
@@ -0,0 +1,142 @@
+import io
+import random
+
+from bs4 import BeautifulSoup, Tag
+
+from src.ref_pipe.div_extractor import get_bibkey_from_div_id, serialize_canonical_markup, stream_divs
+from src.ref_pipe.models import BibDiv
+
+
+def _bs_extract_divs(html: str, namespace: str | None = None) -> list[BibDiv]:
+    """
+    The BeautifulSoup implementation `stream_divs` replaces.
+    """
+    soup = BeautifulSoup(html, features="html.parser")
+    bibdivs = []
+    for div in soup.find_all("div"):
+        if not isinstance(div, Tag):
+            continue
+        div_id = div.get("id")
+        if div_id is None:
+            continue
+        if namespace is not None and not f"{div_id}".startswith(f"ref-{namespace}-"):
+            continue
+        bibkey = get_bibkey_from_div_id(f"{div_id}")
+        if bibkey != "":
+            bibdivs.append(BibDiv(div_id=bibkey, content=div.__str__()))
+    return bibdivs
+
+
+def _stream_extract_divs(html: str, namespace: str | None = None, chunk_size: int = 1024) -> list[BibDiv]:
+    return list(stream_divs(io.StringIO(html), namespace, chunk_size))
+
+
+PANDOC_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>HTML References Pipeline</title>
+<style>div.csl-entry { clear: both; } /* <div id="ref-c1-fake:2000"> */</style>
+<script>var s = "<div id='ref-c1-fake:2001'></div>";</script>
+</head>
+<body>
+<!-- <div id="ref-c1-commented:2000">x</div> -->
+<div id="header-title-x">Header</div>
+<div id="refs" class="references csl-bib-body hanging-indent" role="list">
+<div id="ref-c1-ashby_n:2002" class="csl-entry" role="listitem">
+Ashby, Neil. 2002. <span>“Relativity in the Global Positioning System.”</span> <em>Living Reviews in Relativity</em> 6 (1): 1–42. <a href="https://doi.org/10.12942/lrr-2003-1">https://doi.org/10.12942/lrr-2003-1</a>.
+</div>
+<div id="ref-c1-caruso_em-etal:2008" class="csl-entry" role="listitem">
+Caruso, Eugene M. &amp; al. 2008. <span class="nocase">A &lt;wager&gt;</span>.
+</div>
+<div id="ref-c2-doe_j:2019" class="csl-entry" role="listitem">
+<div class="csl-left-margin">[1] </div><div class="csl-right-inline">Doe, Jane.&nbsp;2019.<br>Untitled.</div>
+</div>
+<DIV ID='ref-c2-roe_r:2001'  class="csl-entry  extra" hidden>Roe &#8220;R&#x27;s&#8221; book &copy; 2001 &unknown; a < b > c</DIV>
+<div id="ref-c1-empty:2000"/>
+<div id="ref-c1-nested:2000" class="csl-entry"><div id="ref-c1-inner:2000" class="csl-entry">Inner</div> outer <img src="x.png"></div>
+<div id="ref-c1-unclosed:2000"><span>Unclosed <em>tags</div>
+<div id="ref-c1-title:2000" title='say "hi"' data-x="a&quot;b">Quoted</div>
+</div>
+</body>
+</html>
+"""
+
+
+def test_stream_divs_matches_beautifulsoup() -> None:
+
+    expected = _bs_extract_divs(PANDOC_HTML)
+    assert len(expected) > 8
+
+    for chunk_size in (1, 3, 7, 64, 1024 * 1024):
+        assert _stream_extract_divs(PANDOC_HTML, chunk_size=chunk_size) == expected
+
+    for namespace in ("c1", "c2", "c3"):
+        assert _stream_extract_divs(PANDOC_HTML, namespace, chunk_size=5) == _bs_extract_divs(PANDOC_HTML, namespace)
+
+
+def test_stream_divs_matches_beautifulsoup_on_random_markup() -> None:
+
+    rng = random.Random(0)
+    texts = [
+        "Smith, J. ",
+        "&amp;",
+        "&amp",
+        "&lt;x&gt;",
+        "“quoted”",
+        "&nbsp;",
+        "&#233;",
+        "&#150;",
+        "&bogus;",
+        "a < b",
+        "x > y",
+    ]
+    texts += ["&", "'", '"', "\n", " ", "\t", "  ", "\r\n", "\n\n"]
+    inline_tags = ["span", "em", "i", "b", "a", "SPAN", "Em", "sup", "p", "pre", "textarea"]
+    attrs = [
+        '',
+        ' class="csl-entry"',
+        ' class=" a  b "',
+        " rel='x  y'",
+        " title='x'",
+        ' title="&quot;"',
+        ' title="a&lt;b"',
+    ]
+    attrs += [' href="https://example.org/?a=1&amp;b=2"', " hidden", ' data-a="1" data-a="2"', " z='1' a=\"2\""]
+    attrs += [' id="ref-c1-dup:2000"', ' ID="x"', " title=unquoted", '  role="listitem"', ' role = "x"']
+    stray_tags = ["<br>", "<br/>", "<img src='x'>", "<hr>", "<!-- c -->", "<span/>", "</span>", "</p>"]
+    stray_tags += ["</<", "</ ", "</1", "</>", "<script>var s = '<div id=\"ref-c1-script:2000\">';</script>"]
+
+    def element(depth: int) -> str:
+        parts = []
+        for _ in range(rng.randint(0, 4)):
+            roll = rng.random()
+            if roll < 0.45 or depth > 4:
+                parts.append(rng.choice(texts))
+            elif roll < 0.62:
+                bibkey = f"author{rng.randint(0, 20)}_x:{rng.randint(1990, 2020)}"
+                namespace = rng.choice(["c1", "c2"])
+                parts.append(f'<div id="ref-{namespace}-{bibkey}"{rng.choice(attrs)}>{element(depth + 1)}</div>')
+            elif roll < 0.7:
+                parts.append(f"<div{rng.choice(attrs)}>{element(depth + 1)}</div>")
+            elif roll < 0.75:
+                parts.append(rng.choice(stray_tags))
+            else:
+                tag = rng.choice(inline_tags)
+                parts.append(f"<{tag}{rng.choice(attrs)}>{element(depth + 1)}</{tag}>")
+        return "".join(parts)
+
+    for _ in range(300):
+        html = f'<html><body><div id="refs">{element(0)}</div></body></html>'
+        chunk_size = rng.choice([1, 2, 5, 16, 4096])
+        assert _stream_extract_divs(html, chunk_size=chunk_size) == _bs_extract_divs(html), html
+        assert _stream_extract_divs(html, "c2", chunk_size=chunk_size) == _bs_extract_divs(html, "c2"), html
+
+
+def test_pandoc_divs_are_not_reparsed() -> None:
+
+    markup = '<div id="ref-c1-ashby_n:2002" class="csl-entry" role="listitem">\nAshby, N. <em>Title</em> &amp; <a href="https://doi.org/x">x</a>.\n</div>'
+
+    assert (
+        serialize_canonical_markup(markup)
+        == '<div class="csl-entry" id="ref-c1-ashby_n:2002" role="listitem">\nAshby, N. <em>Title</em> &amp; <a href="https://doi.org/x">x</a>.\n</div>'
+    )
+    assert serialize_canonical_markup('<div id="ref-c1-x:2000">Line<br>break</div>') is None
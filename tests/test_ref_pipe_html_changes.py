@@ -0,0 +1,129 @@
+import array
+import json
+import os
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+from src.ref_pipe.filesystem_io import generate_report_for_html_files, html_changes_filename
+from src.ref_pipe.html_io import TRender, TWrite, gen_html_files, write_if_changed, write_stream_if_changed
+from src.ref_pipe.models import BibEntity, Bibliography, BibSortRanks, TBibDivDict, TRunSummary
+from src.sdk.ResultMonad import Ok
+
+
+BIBENTITY = BibEntity(
+    id="1",
+    entity_key="key-1",
+    url_endpoint="endpoint-1",
+    main_bibkeys=frozenset({"smith_j:2020", "roe_r:2001"}),
+    further_references=frozenset({"doe_j:2019"}),
+    depends_on=frozenset(),
+)
+BIBDIV_DICT = {
+    bibkey: f'<div id="ref-{bibkey}">{bibkey}</div>' for bibkey in ("smith_j:2020", "roe_r:2001", "doe_j:2019")
+}
+SORT_RANKS = BibSortRanks(profile={}, publisher={}, default={})
+BIBLIOGRAPHY = Bibliography(bibkeys=frozenset(), bibkey_index_dict={}, line_offsets=array.array("Q", [0]), content=b"")
+
+
+def test_write_if_changed(tmp_path: Path) -> None:
+
+    html_file = f"{tmp_path / 'a.html'}"
+
+    assert write_if_changed(html_file, b"<div>a</div>").status == "created"
+
+    os.utime(html_file, (0, 0))
+    change = write_if_changed(html_file, b"<div>a</div>")
+    assert change.status == "unchanged"
+    assert os.path.getmtime(html_file) == 0
+
+    change = write_if_changed(html_file, b"<div>b</div>")
+    assert change.status == "changed"
+    assert Path(html_file).read_bytes() == b"<div>b</div>"
+    assert os.path.getmtime(html_file) > 0
+
+
+def test_write_stream_if_changed(tmp_path: Path) -> None:
+
+    html_file = f"{tmp_path / 'a.html'}"
+    rendered: list[int] = []
+
+    def render(divs: tuple[str, ...]) -> TRender:
+        def render_divs(write: TWrite) -> None:
+            rendered.append(len(divs))
+            for div in divs:
+                write(div)
+                write("\n")
+
+        return render_divs
+
+    assert write_stream_if_changed(html_file, render(("<div>ä</div>",))).status == "created"
+    assert Path(html_file).read_text(encoding="utf-8") == "<div>ä</div>\n"
+
+    # Unchanged content is only hashed, not rendered a second time into the file
+    rendered.clear()
+    os.utime(html_file, (0, 0))
+    change = write_stream_if_changed(html_file, render(("<div>ä</div>",)))
+    assert change == write_if_changed(html_file, "<div>ä</div>\n".encode("utf-8"))
+    assert change.status == "unchanged"
+    assert rendered == [1]
+    assert os.path.getmtime(html_file) == 0
+
+    rendered.clear()
+    change = write_stream_if_changed(html_file, render(("<div>a</div>", "<div>b</div>")))
+    assert change.status == "changed"
+    assert rendered == [2, 2]
+    assert Path(html_file).read_text(encoding="utf-8") == "<div>a</div>\n<div>b</div>\n"
+
+
+def test_failed_writes_leave_the_previous_file_in_place(tmp_path: Path) -> None:
+
+    html_file = f"{tmp_path / 'a.html'}"
+    write_if_changed(html_file, b"<div>a</div>")
+    passes = 0
+
+    def failing_render(write: TWrite) -> None:
+        nonlocal passes
+        passes += 1
+        write("<div>b</div>")
+        if passes == 2:
+            raise OSError("No space left on device")
+
+    with pytest.raises(OSError):
+        write_stream_if_changed(html_file, failing_render)
+
+    assert Path(html_file).read_bytes() == b"<div>a</div>"
+    assert os.listdir(tmp_path) == ["a.html"]
+
+
+def test_report_lists_the_html_changes(tmp_path: Path) -> None:
+
+    def run(bibdiv_dict: TBibDivDict, report_file: Path) -> TRunSummary:
+        result = gen_html_files(
+            BIBENTITY, bibdiv_dict, f"{tmp_path / 'html'}", "article", pl.DataFrame(), SORT_RANKS, {}, BIBLIOGRAPHY
+        )
+        assert isinstance(result, Ok)
+
+        run_summary: TRunSummary = {}
+        assert isinstance(
+            generate_report_for_html_files(iter([(BIBENTITY, result)]), f"{report_file}", "utf-8", run_summary), Ok
+        )
+        return run_summary
+
+    references_file = f"{tmp_path / 'html' / 'endpoint-1-references.html'}"
+    further_references_file = f"{tmp_path / 'html' / 'endpoint-1-further-references.html'}"
+
+    summary = run(BIBDIV_DICT, tmp_path / "first.csv")
+    assert (summary["html_files_created"], summary["html_files_changed"], summary["html_files_unchanged"]) == (2, 0, 0)
+
+    summary = run(BIBDIV_DICT | {"doe_j:2019": "<div>updated</div>"}, tmp_path / "second.csv")
+    assert (summary["html_files_created"], summary["html_files_changed"], summary["html_files_unchanged"]) == (0, 1, 1)
+
+    with open(html_changes_filename(f"{tmp_path / 'second.csv'}"), "r") as f:
+        changes = json.load(f)
+
+    assert changes["created"] == []
+    assert changes["changed"] == [further_references_file]
+    assert changes["unchanged"] == [references_file]
+    assert set(changes["content_hashes"]) == {references_file, further_references_file}
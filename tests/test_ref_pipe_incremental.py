@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from src.ref_pipe.filesystem_io import generate_report_for_html_files
+from src.ref_pipe.incremental import (
+    Manifest,
+    find_unchanged_bibentities,
+    load_previous_report,
+    merge_carried_over,
+)
+from src.ref_pipe.models import THTMLReport
+from src.sdk.ResultMonad import Err, Ok
+from tests.conftest import make_bibentity, with_html
+
+
+def test_unchanged_bibentities_are_carried_over(tmp_path: Path) -> None:
+
+    bibentities = (
+        make_bibentity(0, frozenset({"smith_j:2020", "doe_j:2019"})),
+        make_bibentity(1, frozenset({"doe_j:2019"})),
+        make_bibentity(2, frozenset({"roe_r:2001"})),
+        make_bibentity(3, frozenset({"smith_j:2020"})),
+    )
+
+    html_files = []
+    for bibentity in bibentities:
+        html_file = tmp_path / f"{bibentity.url_endpoint}-references.html"
+        html_file.write_text("<div></div>")
+        html_files.append(f"{html_file}")
+
+    previous_results: THTMLReport = (
+        (bibentity, Err(message="failed", code=-1) if i == 3 else Ok(out=with_html(bibentity, html_files[i])))
+        for i, bibentity in enumerate(bibentities)
+    )
+    report_file = f"{tmp_path / 'report.csv'}"
+    generate_report_for_html_files(previous_results, report_file, "utf-8")
+
+    previous_manifest = Manifest(
+        csl_hash="csl",
+        image_id="image",
+        bibkey_hashes={"smith_j:2020": "a", "doe_j:2019": "b", "roe_r:2001": "c"},
+    )
+    # 'roe_r:2001' changed since the previous run
+    manifest = previous_manifest._replace(bibkey_hashes={"smith_j:2020": "a", "doe_j:2019": "b", "roe_r:2001": "d"})
+
+    current_bibentities = (
+        bibentities[0],
+        # Bibkeys changed
+        make_bibentity(1, frozenset({"doe_j:2019", "smith_j:2020"})),
+        bibentities[2],
+        # Failed in the previous run
+        bibentities[3],
+    )
+
+    previous_report = load_previous_report(report_file, "utf-8")
+    unchanged = find_unchanged_bibentities(current_bibentities, previous_report, previous_manifest, manifest)
+
+    assert set(unchanged.keys()) == {0}
+    assert unchanged[0].out.html.references_filename == html_files[0]
+
+    other_csl_manifest = manifest._replace(csl_hash="other-csl")
+    assert find_unchanged_bibentities(current_bibentities, previous_report, previous_manifest, other_csl_manifest) == {}
+
+    rebuilt: THTMLReport = (
+        (bibentity, Ok(out=with_html(bibentity, "")))
+        for i, bibentity in enumerate(current_bibentities)
+        if i not in unchanged
+    )
+    merged = tuple(merge_carried_over(current_bibentities, unchanged, rebuilt))
+
+    assert tuple(bibentity for bibentity, _ in merged) == current_bibentities
+    assert merged[0][1] == unchanged[0]
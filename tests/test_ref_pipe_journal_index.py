@@ -0,0 +1,15 @@
+from src.ref_pipe.preprocessors import build_journal_index, prepare_bib_df
+from tests.conftest import make_bib_df
+
+
+def test_journal_index_matches_filter() -> None:
+
+    prepared_df = prepare_bib_df(make_bib_df(200))
+    journal_index = build_journal_index(prepared_df)
+
+    assert set(journal_index.keys()) == {"1", "2", "3"}
+
+    for journal_id, journal_df in journal_index.items():
+        filtered_df = prepared_df.filter(prepared_df["journal-id"] == journal_id)
+
+        assert journal_df.equals(filtered_df)
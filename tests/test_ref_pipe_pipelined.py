@@ -0,0 +1,129 @@
+import itertools
+import threading
+import time
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+from src.ref_pipe.compile_backends import FakeBackend
+from src.ref_pipe.main_local import ref_pipe
+from src.ref_pipe.pipelined import parse_stage_workers, pipeline_scratch_dirs, ref_pipe_pipelined
+from src.ref_pipe.profiling import STAGES, RunProfiler
+from src.ref_pipe.workers import PipelineStage, make_scratch_dirs, pipeline_capacity, pipelined_map
+from src.sdk.ResultMonad import Err, Ok
+from tests.conftest import BIBKEYS, BIBLIOGRAPHY, SORT_RANKS, make_bibentity
+
+
+def test_pipelined_map_keeps_the_order_and_reports_errors() -> None:
+
+    released: list[int] = []
+
+    def slow_when_even(i: int) -> int:
+        time.sleep(0.01 if i % 2 == 0 else 0)
+        return i
+
+    def fail_on_three(i: int) -> int:
+        if i == 3:
+            raise RuntimeError("three")
+        return i * 10
+
+    stages = (
+        PipelineStage(name="first", func=slow_when_even, workers=3),
+        PipelineStage(name="second", func=fail_on_three, workers=2),
+        PipelineStage(name="third", func=lambda i: i + 1, workers=1),
+    )
+
+    results = tuple(pipelined_map(range(10), stages, 1, released.append))
+
+    assert [result.out for _, result in results if isinstance(result, Ok)] == [1, 11, 21, 41, 51, 61, 71, 81, 91]
+
+    # A failed item is yielded as it was before the stage that failed
+    item, error = results[3]
+    assert item == 3
+    assert isinstance(error, Err)
+    assert "'second' stage" in error.message and "three" in error.message
+    assert released == [3]
+
+
+def test_pipelined_map_bounds_the_items_in_flight() -> None:
+
+    consumed: list[int] = []
+    lock = threading.Lock()
+
+    def record(i: int) -> int:
+        with lock:
+            consumed.append(i)
+        return i
+
+    stages = (PipelineStage(name="record", func=record, workers=2), PipelineStage(name="same", func=record, workers=1))
+    capacity = pipeline_capacity(stages, 2)
+
+    results = pipelined_map(itertools.count(), stages, 2)
+    assert next(results)[0] == 0
+    time.sleep(0.2)
+    results.close()
+
+    # The pipeline stops reading the input once it holds as many items as it can, and stops its threads when closed
+    assert len(set(consumed)) <= capacity + 1
+    assert not any(thread.name.startswith("ref_pipe_pipeline") for thread in threading.enumerate())
+
+
+def test_parse_stage_workers() -> None:
+
+    assert parse_stage_workers("") == Ok(out=())
+    assert parse_stage_workers("1,4,1,1") == Ok(out=(1, 4, 1, 1))
+    for spec in ("1,4,1", "1,0,1,1", "a,b,c,d"):
+        assert isinstance(parse_stage_workers(spec), Err)
+
+
+@pytest.mark.parametrize("stage_workers", [(1, 1, 1, 1), (2, 3, 1, 2)])
+def test_ref_pipe_pipelined_matches_ref_pipe(tmp_path: Path, stage_workers: tuple[int, ...]) -> None:
+
+    bibentities = tuple(make_bibentity(i, frozenset(BIBKEYS[: i % 3 + 1]) if i != 4 else frozenset()) for i in range(8))
+    bib_df = pl.DataFrame()
+    backend = FakeBackend()
+
+    (tmp_path / "sequential").mkdir()
+    expected = tuple(
+        ref_pipe(bibentity, BIBLIOGRAPHY, f"{tmp_path}", "/c", "sequential", backend, "article", bib_df, SORT_RANKS, {})
+        for bibentity in bibentities
+    )
+
+    (tmp_path / "pipelined").mkdir()
+    scratch_dirs = pipeline_scratch_dirs("pipelined", stage_workers, 1)
+    make_scratch_dirs(f"{tmp_path}", scratch_dirs)
+    profiler = RunProfiler()
+
+    results = tuple(
+        ref_pipe_pipelined(
+            bibentities,
+            BIBLIOGRAPHY,
+            f"{tmp_path}",
+            "/c",
+            "pipelined",
+            backend,
+            "article",
+            bib_df,
+            SORT_RANKS,
+            {},
+            None,
+            scratch_dirs,
+            stage_workers,
+            1,
+            profiler,
+        )
+    )
+
+    assert tuple(bibentity for bibentity, _ in results) == bibentities
+    for (_, result), expected_result in zip(results, expected):
+        assert isinstance(result, Ok) and isinstance(expected_result, Ok)
+        for html_file, expected_html_file in zip(result.out.html, expected_result.out.html):
+            assert bool(html_file) == bool(expected_html_file)
+            if html_file:
+                assert Path(html_file).read_text() == Path(expected_html_file).read_text()
+
+    # The scratch directories are left empty, and the stages are profiled as without the pipeline
+    assert all(not any((tmp_path / scratch_dir).iterdir()) for scratch_dir in scratch_dirs)
+    profile = profiler.get(bibentities[0])
+    assert profile is not None and set(profile.stages_s) == set(STAGES)
@@ -0,0 +1,136 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from src.ref_pipe.compile_backends import MASTER_MD_NAME, FakeBackend, _imported_markdown_files, fake_reference_div
+from src.ref_pipe.compile_server import CompileResult
+from src.ref_pipe.div_cache import DivCache
+from src.ref_pipe.prep_divs import (
+    chunk_bibentities,
+    extract_divs_batch_member,
+    gen_bib_html_divs,
+    gen_bib_html_divs_batch,
+)
+from src.sdk.ResultMonad import Ok
+from tests.conftest import BIBKEYS, BIBLIOGRAPHY, make_bibentity, make_bibliography
+
+
+class RecordingBackend(FakeBackend):
+    """
+    Fake backend that records the number of markdown files of each compilation, and can break the batch ones.
+    """
+
+    def __init__(self, fail_batches: bool = False, drop_divs_of: int | None = None) -> None:
+        self.fail_batches = fail_batches
+        self.drop_divs_of = drop_divs_of
+        self.compilations: list[int] = []
+
+    def compile(self, local_workdir: str, container_workdir: str) -> CompileResult:
+        with open(os.path.join(local_workdir, MASTER_MD_NAME), "r") as f:
+            markdown_files = _imported_markdown_files(f.read())
+        self.compilations.append(len(markdown_files))
+
+        if len(markdown_files) > 1 and self.fail_batches:
+            return CompileResult(returncode=1, output="pandoc error", html_files=())
+
+        result = super().compile(local_workdir, container_workdir)
+
+        if len(markdown_files) > 1 and self.drop_divs_of is not None:
+            html_file = os.path.join(local_workdir, markdown_files[self.drop_divs_of].replace(".md", ".html"))
+            with open(html_file, "w") as f:
+                f.write("<html>\n<body>\n</body>\n</html>\n")
+
+        return result
+
+
+def test_chunks_respect_the_size_and_the_url_endpoints() -> None:
+
+    bibentities = tuple(make_bibentity(i, frozenset({BIBKEYS[0]})) for i in range(7))
+
+    assert [len(chunk) for chunk in chunk_bibentities(bibentities, 3)] == [3, 3, 1]
+    assert [len(chunk) for chunk in chunk_bibentities(bibentities, 7)] == [7]
+    assert [len(chunk) for chunk in chunk_bibentities(bibentities, 100)] == [7]
+    assert list(chunk_bibentities((), 3)) == []
+    assert tuple(bibentity for chunk in chunk_bibentities(bibentities, 2) for bibentity in chunk) == bibentities
+
+    # Their compilation files would overwrite each other
+    same_endpoint = bibentities[:2] + (bibentities[0],) + bibentities[2:4]
+    assert [len(chunk) for chunk in chunk_bibentities(same_endpoint, 4)] == [2, 3]
+
+    with pytest.raises(ValueError):
+        list(chunk_bibentities(bibentities, 0))
+
+
+def test_failed_batches_are_compiled_one_by_one(tmp_path: Path) -> None:
+
+    bibentities = tuple(make_bibentity(i, frozenset({bibkey})) for i, bibkey in enumerate(BIBKEYS))
+    backend = RecordingBackend(fail_batches=True)
+
+    results = gen_bib_html_divs_batch(bibentities, BIBLIOGRAPHY, f"{tmp_path}", "/container", ".", backend)
+
+    assert backend.compilations == [3, 1, 1, 1]
+    assert results == tuple(
+        gen_bib_html_divs(bibentity, BIBLIOGRAPHY, f"{tmp_path}", "/container", ".", FakeBackend())
+        for bibentity in bibentities
+    )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_batch_members_without_divs_are_compiled_alone(tmp_path: Path) -> None:
+
+    bibentities = (make_bibentity(0, frozenset(BIBKEYS[:2])), make_bibentity(1, frozenset(BIBKEYS[2:])))
+    backend = RecordingBackend(drop_divs_of=1)
+
+    results = gen_bib_html_divs_batch(bibentities, BIBLIOGRAPHY, f"{tmp_path}", "/container", ".", backend)
+
+    assert backend.compilations == [2, 1]
+    assert results == (
+        Ok(out={bibkey: fake_reference_div("c1", bibkey) for bibkey in BIBKEYS[:2]}),
+        Ok(out={BIBKEYS[2]: fake_reference_div("c1", BIBKEYS[2])}),
+    )
+
+
+def test_batch_member_divs_are_moved_back_to_the_single_namespace(tmp_path: Path) -> None:
+
+    html_file = tmp_path / "endpoint-1.html"
+    html_file.write_text(
+        "<html>\n<body>\n"
+        f"{fake_reference_div('c1', BIBKEYS[0])}\n"
+        f"{fake_reference_div('c2', BIBKEYS[1])}\n"
+        f"{fake_reference_div('c2', BIBKEYS[2])}\n"
+        "</body>\n</html>\n"
+    )
+    bibentity = make_bibentity(1, frozenset(BIBKEYS[1:]))
+
+    assert extract_divs_batch_member(f"{html_file}", 2, bibentity) == Ok(
+        out={bibkey: fake_reference_div("c1", bibkey) for bibkey in BIBKEYS[1:]}
+    )
+
+    # As in a single compilation, no divs is not an error
+    assert extract_divs_batch_member(f"{html_file}", 3, bibentity) == Ok(out={})
+
+
+def test_bibkeys_with_the_same_author_and_year_are_rendered_together(tmp_path: Path) -> None:
+
+    twins = ("smith_j:2020a", "smith_j:2020b")
+    bibliography = make_bibliography({bibkey: f"@book{{{bibkey}, title={{T}}}}\n" for bibkey in twins + BIBKEYS[1:]})
+    cache = DivCache(f"{tmp_path / 'cache.sqlite'}", "namespace", 1024 * 1024)
+    # Rendered alone, in an earlier set: no year suffix
+    cache.put_many({twins[0]: "<div>Smith 2020</div>", BIBKEYS[1]: "<div>cached</div>"}, bibliography)
+    backend = RecordingBackend()
+
+    bibentity = make_bibentity(0, frozenset(twins + BIBKEYS[1:]))
+    result = gen_bib_html_divs(bibentity, bibliography, f"{tmp_path}", "/container", ".", backend, cache)
+
+    assert backend.compilations == [1]
+    assert result == Ok(
+        out={bibkey: fake_reference_div("c1", bibkey) for bibkey in twins + BIBKEYS[2:]}
+        | {BIBKEYS[1]: "<div>cached</div>"}
+    )
+    # The fresh div of the other twin, which depends on the first one, is not stored either
+    assert cache.get_many(frozenset({twins[1], BIBKEYS[2]}), bibliography) == {
+        BIBKEYS[2]: fake_reference_div("c1", BIBKEYS[2])
+    }
+
+    cache.close()
@@ -0,0 +1,149 @@
+import csv
+from pathlib import Path
+
+import polars as pl
+
+from src.ref_pipe.compile_backends import FakeBackend
+from src.ref_pipe.filesystem_io import generate_report_for_html_files
+from src.ref_pipe.main_local import ref_pipe, ref_pipe_batch
+from src.ref_pipe.profiling import PROFILE_COLUMNS, STAGES, RunProfiler, profiled_stage, profiling_entity
+from src.sdk.ResultMonad import Ok
+from tests.conftest import BIBKEYS, BIBLIOGRAPHY, SORT_RANKS, make_bibentity
+
+
+def test_stages_are_only_timed_inside_a_profiled_entity() -> None:
+
+    with profiled_stage("compile"):
+        pass
+
+    with profiling_entity(None), profiled_stage("compile"):
+        pass
+
+    profiler = RunProfiler()
+    profile = profiler.new_profile(make_bibentity(0, frozenset(BIBKEYS)))
+    with profiling_entity(profile):
+        with profiled_stage("compile"):
+            pass
+        with profiled_stage("compile"):
+            pass
+
+    assert tuple(profile.stages_s.keys()) == ("compile",)
+    assert profile.total_s >= profile.stages_s["compile"] > 0
+
+
+def test_identical_rows_keep_their_own_profiles() -> None:
+
+    profiler = RunProfiler()
+    bibentity = make_bibentity(0, frozenset(BIBKEYS))
+
+    first, second = profiler.new_profile(bibentity), profiler.new_profile(make_bibentity(0, frozenset(BIBKEYS)))
+    first.total_s, second.total_s = 1.0, 3.0
+
+    assert profiler.summary()["profiled_entities"] == 2
+    assert profiler.summary()["time_total_max_s"] == 3.0
+    assert [profiler.get(bibentity) for _ in range(2)] == [first, second]
+    assert profiler.get(make_bibentity(1, frozenset(BIBKEYS))) is None
+
+
+def test_profiles_go_to_the_report_and_the_summary(tmp_path: Path) -> None:
+
+    single = make_bibentity(0, frozenset(BIBKEYS))
+    batch = (make_bibentity(1, frozenset(BIBKEYS[:2])), make_bibentity(2, frozenset(BIBKEYS[1:])))
+    (tmp_path / "work").mkdir()
+
+    profiler = RunProfiler()
+    backend = FakeBackend()
+    bib_df = pl.DataFrame()
+
+    single_result = ref_pipe(
+        single, BIBLIOGRAPHY, f"{tmp_path}", "/c", "work", backend, "article", bib_df, SORT_RANKS, {}, profiler=profiler
+    )
+    batch_results = ref_pipe_batch(
+        batch, BIBLIOGRAPHY, f"{tmp_path}", "/c", "work", backend, "article", bib_df, SORT_RANKS, {}, profiler=profiler
+    )
+    results = ((single, single_result), *batch_results)
+    assert all(isinstance(result, Ok) for _, result in results)
+
+    for bibentity, n_divs in ((single, 3), (batch[0], 2), (batch[1], 2)):
+        profile = profiler.get(bibentity)
+        assert profile is not None
+        assert profile.divs == n_divs
+        assert profile.bytes_written > 0
+        assert set(profile.stages_s) == set(STAGES)
+
+    # The batch compilation is shared between its members
+    profile_1, profile_2 = profiler.get(batch[0]), profiler.get(batch[1])
+    assert profile_1 is not None and profile_2 is not None
+    assert profile_1.stages_s["compile"] == profile_2.stages_s["compile"]
+
+    # Entities that were not processed (e.g., carried over from a previous run) have no profile
+    carried_over = make_bibentity(3, frozenset(BIBKEYS))
+    report_file = tmp_path / "report.csv"
+    generate_report_for_html_files(
+        (result for result in (*results, (carried_over, single_result))), f"{report_file}", "utf-8", None, profiler
+    )
+
+    with open(report_file, "r", encoding="utf-8") as f:
+        rows = tuple(csv.DictReader(f))
+
+    assert set(PROFILE_COLUMNS) <= set(rows[0].keys())
+    assert [row["divs"] for row in rows] == ["3", "2", "2", ""]
+    assert all(float(row["time_compile_s"]) > 0 for row in rows[:3])
+
+    summary = profiler.summary()
+    assert summary["profiled_entities"] == 3
+    assert summary["divs"] == 7
+    for stage in (*STAGES, "total"):
+        p50, p95, p_max = (float(summary[f"time_{stage}_{p}_s"]) for p in ("p50", "p95", "max"))
+        assert p50 <= p95 <= p_max
+
+
+def test_unchanged_html_files_are_not_counted_as_written(tmp_path: Path) -> None:
+
+    single = make_bibentity(0, frozenset(BIBKEYS))
+    batch = (make_bibentity(1, frozenset(BIBKEYS[:2])), make_bibentity(2, frozenset(BIBKEYS[1:])))
+    (tmp_path / "work").mkdir()
+
+    def run() -> RunProfiler:
+        profiler = RunProfiler()
+        backend = FakeBackend()
+        bib_df = pl.DataFrame()
+        ref_pipe(
+            single,
+            BIBLIOGRAPHY,
+            f"{tmp_path}",
+            "/c",
+            "work",
+            backend,
+            "article",
+            bib_df,
+            SORT_RANKS,
+            {},
+            profiler=profiler,
+        )
+        for _ in ref_pipe_batch(
+            batch,
+            BIBLIOGRAPHY,
+            f"{tmp_path}",
+            "/c",
+            "work",
+            backend,
+            "article",
+            bib_df,
+            SORT_RANKS,
+            {},
+            profiler=profiler,
+        ):
+            pass
+        return profiler
+
+    assert run().summary()["bytes_written"] != 0
+
+    # Same content, so the second run writes nothing
+    second_run = run()
+    assert second_run.summary()["bytes_written"] == 0
+    for bibentity in (single, *batch):
+        profile = second_run.get(bibentity)
+        assert profile is not None
+        assert profile.bytes_written == 0
+        assert profile.divs > 0
@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from benchmarks.synthetic_bibliography import ENCODING, ENTITY_TYPES, write_synthetic_inputs
+from src.ref_pipe import main_local, preprocessors
+from src.ref_pipe.filesystem_io import load_run_plan
+from src.ref_pipe.main_local import main_process_plan
+from src.ref_pipe.models import BibliographyTable, RunOptions
+from src.sdk.ResultMonad import Err, Ok
+
+
+def _set_env_vars(monkeypatch: pytest.MonkeyPatch, workhouse_dir: Path, bib_file: str, table_file: str) -> Path:
+    env_vars = {
+        "ARCH": "amd64",
+        "BIBLIOGRAPHY_BASE_FILENAME": os.path.basename(bib_file),
+        "DOCKERHUB_TOKEN": "token",
+        "DOCKERHUB_USERNAME": "user",
+        "DLTC_WORKHOUSE_DIRECTORY": f"{workhouse_dir}",
+        "CONTAINER_DLTC_WORKHOUSE_DIRECTORY": "/container",
+        "REF_PIPE_DIR_RELATIVE_PATH": "ref_pipe",
+        "DOCKER_IMAGE_NAME": "image",
+        "DOCKER_CONTAINER_NAME": "container",
+        "DOCKER_COMPOSE_FILE": "docker-compose.yml",
+        "CSL_FILE": f"{workhouse_dir / 'csl' / 'pipe.csl'}",
+        "BIBLIOGRAPHY_TABLE_ODS": table_file,
+        "COMPILE_BACKEND": "fake",
+    }
+    for name, value in env_vars.items():
+        monkeypatch.setenv(name, value)
+
+    (workhouse_dir / "csl").mkdir()
+    (workhouse_dir / "csl" / "pipe.csl").write_text("original")
+
+    env_file = workhouse_dir / ".env"
+    env_file.write_text("")
+    return env_file
+
+
+def test_run_plan_processes_all_entity_types_in_one_run(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+
+    workhouse_dir = tmp_path / "workhouse"
+    inputs = write_synthetic_inputs(300, f"{workhouse_dir}", n_entities=4)
+    env_file = _set_env_vars(monkeypatch, workhouse_dir, inputs.bib_file, inputs.table_file)
+
+    plan_file = tmp_path / "plan.csv"
+    with open(plan_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("input_csv", "entity_type", "output_report"))
+        writer.writerows(
+            (inputs.entity_files[entity_type], entity_type, f"{tmp_path / f'{entity_type}-report.csv'}")
+            for entity_type in ENTITY_TYPES
+        )
+
+    plan_result = load_run_plan(f"{plan_file}")
+    assert isinstance(plan_result, Ok)
+    assert tuple(entry.entity_type for entry in plan_result.out) == ENTITY_TYPES
+
+    table_loads: list[str] = []
+    load_bibliography_table = preprocessors.load_bibliography_table
+
+    def counted_load_bibliography_table(table_file: str) -> Ok[BibliographyTable] | Err:
+        table_loads.append(table_file)
+        return load_bibliography_table(table_file)
+
+    monkeypatch.setattr(main_local, "load_bibliography_table", counted_load_bibliography_table)
+
+    result = main_process_plan(plan_result.out, ENCODING, f"{env_file}", RunOptions(div_cache_mode="off"))
+    assert isinstance(result, Ok), result
+
+    assert table_loads == [inputs.table_file]
+    assert (workhouse_dir / "csl" / "pipe.csl").read_text() == "original"
+
+    for entity_type in ENTITY_TYPES:
+        with open(tmp_path / f"{entity_type}-report.csv", "r", encoding=ENCODING) as f:
+            rows = tuple(csv.DictReader(f))
+        assert len(rows) == 4
+        assert all(row["status"] == "success" for row in rows), rows
+
+        with open(tmp_path / f"{entity_type}-report-summary.json", "r") as f:
+            assert json.load(f)["entities_total"] == 4
+
+        assert (tmp_path / f"{entity_type}-report-manifest.json").exists()
+
+
+def test_failed_entries_dont_stop_the_run_plan(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+
+    workhouse_dir = tmp_path / "workhouse"
+    inputs = write_synthetic_inputs(300, f"{workhouse_dir}", n_entities=2)
+    env_file = _set_env_vars(monkeypatch, workhouse_dir, inputs.bib_file, inputs.table_file)
+
+    plan_file = tmp_path / "plan.csv"
+    plan_file.write_text(
+        "input_csv,entity_type,output_report\n"
+        f"{tmp_path / 'missing.csv'},article,{tmp_path / 'missing-report.csv'}\n"
+        f"{inputs.entity_files['page']},page,{tmp_path / 'page-report.csv'}\n"
+    )
+
+    plan_result = load_run_plan(f"{plan_file}")
+    assert isinstance(plan_result, Ok)
+
+    result = main_process_plan(plan_result.out, ENCODING, f"{env_file}", RunOptions(div_cache_mode="off"))
+    assert isinstance(result, Err)
+    assert "1 of 2 entries of the run plan failed" in result.message
+    assert "missing.csv" in result.message
+
+    assert (tmp_path / "page-report.csv").exists()
+    assert (workhouse_dir / "csl" / "pipe.csl").read_text() == "original"
+
+
+def test_run_plan_entries_need_different_reports(tmp_path: Path) -> None:
+
+    plan_file = tmp_path / "plan.csv"
+    plan_file.write_text("input_csv,entity_type,output_report\na.csv,article,report.csv\nb.csv,page,report.csv\n")
+    assert isinstance(load_run_plan(f"{plan_file}"), Err)
+
+    plan_file.write_text("input_csv,entity_type,output_report\na.csv,book,report.csv\n")
+    assert isinstance(load_run_plan(f"{plan_file}"), Err)
@@ -0,0 +1,46 @@
+import random
+
+import polars as pl
+
+from src.ref_pipe.html_io import sort_bibkeys_for_entity
+from src.ref_pipe.models import TSupportedEntity
+from src.ref_pipe.preprocessors import SORT_ORDERINGS, build_sort_ranks, prepare_bib_df
+from tests.conftest import make_bib_df
+
+
+def test_sort_ranks_match_dataframe_sort() -> None:
+
+    prepared_df = prepare_bib_df(make_bib_df(300))
+    sort_ranks = build_sort_ranks(prepared_df)
+
+    rng = random.Random(1)
+    all_bibkeys = prepared_df["bibkey"].to_list()
+
+    entity_types: tuple[tuple[TSupportedEntity, str], ...] = (
+        ("profile", "_rank_profile"),
+        ("publisher", "_rank_publisher"),
+        ("article", "_rank_default"),
+    )
+    for entity_type, rank_column in entity_types:
+        ordering = SORT_ORDERINGS[rank_column]
+        for _ in range(20):
+            bibkeys = frozenset(rng.sample(all_bibkeys, 25))
+            expected = tuple(
+                prepared_df.filter(pl.col("bibkey").is_in(bibkeys))
+                .sort(by=list(ordering.by), descending=list(ordering.descending), nulls_last=list(ordering.nulls_last))[
+                    "bibkey"
+                ]
+                .to_list()
+            )
+
+            assert sort_bibkeys_for_entity(bibkeys, sort_ranks, entity_type) == expected
+
+
+def test_sort_ranks_leave_out_unknown_bibkeys() -> None:
+
+    sort_ranks = build_sort_ranks(prepare_bib_df(make_bib_df(10)))
+
+    assert set(sort_bibkeys_for_entity(frozenset({"author_1:2000", "unknown:2000"}), sort_ranks, "page")) == {
+        "author_1:2000"
+    }
+    assert sort_bibkeys_for_entity(frozenset({"unknown:2000"}), sort_ranks, "page") == ("unknown:2000",)
@@ -0,0 +1,92 @@
+import io
+import random
+
+from src.ref_pipe.html_io import (
+    COLLAPSIBLE_ISSUE_HTML_FORMAT,
+    COLLAPSIBLE_VOLUME_HTML_FORMAT,
+    COLLAPSIBLE_YEAR_HTML_FORMAT,
+    generate_publisher_struct_html,
+    generate_struct_html,
+    write_struct_html,
+)
+from src.ref_pipe.models import HTMLIssue, HTMLVolume, HTMLYear, TBibDivDict, THTMLCollapsible
+
+
+def _concatenated_struct_html(struct: THTMLCollapsible, bibdiv_dict: TBibDivDict) -> str:
+    """
+    Rendering by string concatenation, as it was done before the streaming writer.
+    """
+
+    def divs(bibkeys: tuple[str, ...]) -> str:
+        return "".join(f"{bibdiv_dict[bibkey]}\n" for bibkey in bibkeys if bibkey in bibdiv_dict)
+
+    main_html = ""
+    for year in struct:
+        year_html_contents = ""
+        for year_content in year.contents:
+            if isinstance(year_content, str):
+                year_html_contents += divs((year_content,))
+            elif isinstance(year_content, HTMLVolume):
+                vol_html_contents = ""
+                for vol_content in year_content.contents:
+                    if isinstance(vol_content, str):
+                        vol_html_contents += divs((vol_content,))
+                    else:
+                        issue_html_contents = divs(vol_content.contents)
+                        vol_html_contents += COLLAPSIBLE_ISSUE_HTML_FORMAT.format(
+                            name=vol_content.name, contents=issue_html_contents
+                        )
+                        vol_html_contents += "\n"
+                year_html_contents += COLLAPSIBLE_VOLUME_HTML_FORMAT.format(
+                    name=year_content.name, contents=vol_html_contents
+                )
+                year_html_contents += "\n"
+        main_html += COLLAPSIBLE_YEAR_HTML_FORMAT.format(name=year.name, contents=year_html_contents)
+        main_html += "\n"
+
+    return main_html
+
+
+def _random_struct(rng: random.Random) -> tuple[THTMLCollapsible, TBibDivDict]:
+    bibkeys = iter(f"author_{i}:2000" for i in range(10_000))
+    years = []
+    for y in range(rng.randint(0, 6)):
+        year_contents: list[str | HTMLVolume] = [next(bibkeys) for _ in range(rng.randint(0, 2))]
+        for v in range(rng.randint(0, 3)):
+            volume_contents: list[str | HTMLIssue] = [next(bibkeys) for _ in range(rng.randint(0, 2))]
+            for i in range(rng.randint(0, 3)):
+                issue_bibkeys = tuple(next(bibkeys) for _ in range(rng.randint(0, 4)))
+                volume_contents.append(HTMLIssue(name=f"issue {{{i}}}", contents=issue_bibkeys))
+            year_contents.append(HTMLVolume(name=f"{v}", contents=tuple(volume_contents)))
+        years.append(HTMLYear(name=f"{1970 + y} :: vol. {{x}}", contents=tuple(year_contents)))
+
+    struct = tuple(years)
+    # Some bibkeys have no div, and are left out
+    bibdiv_dict = {f"author_{i}:2000": f'<div id="ref-c1-author_{i}:2000">{i}</div>' for i in range(200) if i % 7}
+
+    return struct, bibdiv_dict
+
+
+def test_streamed_struct_html_is_identical() -> None:
+
+    rng = random.Random(0)
+    for _ in range(200):
+        struct, bibdiv_dict = _random_struct(rng)
+        expected = _concatenated_struct_html(struct, bibdiv_dict)
+
+        assert generate_struct_html(struct, bibdiv_dict) == expected
+
+        f = io.StringIO()
+        write_struct_html(f.write, struct, bibdiv_dict)
+        assert f.getvalue() == expected
+
+
+def test_streamed_publisher_struct_html_is_identical() -> None:
+
+    struct = (
+        HTMLYear(name="2021", contents=("a:2021", "b:2021", "missing:2021")),
+        HTMLYear(name="No date", contents=()),
+    )
+    bibdiv_dict = {"a:2021": "<div>a</div>", "b:2021": "<div>b</div>"}
+
+    assert generate_publisher_struct_html(struct, bibdiv_dict) == _concatenated_struct_html(struct, bibdiv_dict)
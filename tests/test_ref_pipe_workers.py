@@ -0,0 +1,102 @@
+import threading
+import time
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+from src.ref_pipe.main_local import summarize_after_consumption
+from src.ref_pipe.models import THTMLReport
+from src.ref_pipe.workers import (
+    IN_FLIGHT_PER_WORKER,
+    make_scratch_dirs,
+    ordered_parallel_map,
+    remove_scratch_dirs,
+    worker_scratch_dirs,
+)
+from src.sdk.ResultMonad import Err
+from tests.conftest import make_bibentity
+
+
+def test_results_keep_the_input_order() -> None:
+
+    finished: list[int] = []
+
+    def slower_first(i: int, scratch_dir: str) -> int:
+        time.sleep(0.01 * (10 - i))
+        finished.append(i)
+        return i
+
+    results = list(ordered_parallel_map(slower_first, range(10), worker_scratch_dirs(".", 4)))
+
+    assert results == list(range(10))
+    assert finished != sorted(finished)
+
+
+def test_items_in_flight_are_bounded() -> None:
+
+    workers = 3
+    pulled = 0
+
+    def items() -> Generator[int, None, None]:
+        nonlocal pulled
+        for i in range(50):
+            pulled += 1
+            yield i
+
+    for consumed, result in enumerate(ordered_parallel_map(lambda i, _: i, items(), worker_scratch_dirs(".", workers))):
+        assert result == consumed
+        assert pulled - consumed <= workers * IN_FLIGHT_PER_WORKER
+
+
+def test_each_scratch_dir_is_used_by_one_task_at_a_time() -> None:
+
+    lock = threading.Lock()
+    in_use: set[str] = set()
+    used: set[str] = set()
+    overlaps: list[str] = []
+
+    def use(i: int, scratch_dir: str) -> int:
+        with lock:
+            if scratch_dir in in_use:
+                overlaps.append(scratch_dir)
+            in_use.add(scratch_dir)
+            used.add(scratch_dir)
+        time.sleep(0.002)
+        with lock:
+            in_use.remove(scratch_dir)
+        return i
+
+    scratch_dirs = worker_scratch_dirs("out", 4)
+    assert scratch_dirs == ("out/worker-1", "out/worker-2", "out/worker-3", "out/worker-4")
+
+    assert list(ordered_parallel_map(use, range(100), scratch_dirs)) == list(range(100))
+    assert overlaps == []
+    assert used == set(scratch_dirs)
+
+
+def test_scratch_dirs_are_removed_after_an_exception(tmp_path: Path) -> None:
+
+    scratch_dirs = worker_scratch_dirs("out", 3)
+    make_scratch_dirs(f"{tmp_path}", scratch_dirs)
+
+    def fail_on_five(i: int, scratch_dir: str) -> int:
+        if i == 5:
+            raise RuntimeError("Compilation crashed")
+        return i
+
+    def results() -> THTMLReport:
+        for i in ordered_parallel_map(fail_on_five, range(10), scratch_dirs):
+            yield (make_bibentity(i, frozenset()), Err(message="not compiled", code=-1))
+
+    with pytest.raises(RuntimeError):
+        for _ in summarize_after_consumption(results(), None, None, None, f"{tmp_path}", scratch_dirs):
+            pass
+
+    assert list((tmp_path / "out").iterdir()) == []
+
+    # Non-empty scratch directories are left for inspection
+    make_scratch_dirs(f"{tmp_path}", scratch_dirs)
+    (tmp_path / "out" / "worker-2" / "master.md").write_text("")
+    remove_scratch_dirs(f"{tmp_path}", scratch_dirs)
+    assert [path.name for path in (tmp_path / "out").iterdir()] == ["worker-2"]